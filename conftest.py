@@ -97,6 +97,14 @@ def _generate_full_thread_trace():
 last_test_name = None
 known_leaks = []
 
+# Workers of process-wide executors. They are started on first use and live
+# until the process exits.
+allowed_thread_name_prefixes = (
+    "FleetspeakSend_",
+    "BlobHandler_",
+    "GCSBlobStore_",
+)
+
 
 @pytest.fixture(scope="function", autouse=True)
 def thread_leak_check(request):
@@ -130,7 +138,9 @@ def thread_leak_check(request):
   # impossible to detect the termination of alien threads, hence we have to
   # ignore them.
   thread_names = [
-      thread.name for thread in threads if not thread.name.startswith("Dummy-")
+      thread.name
+      for thread in threads
+      if not thread.name.startswith(("Dummy-",) + allowed_thread_name_prefixes)
   ]
 
   allowed_thread_names = [
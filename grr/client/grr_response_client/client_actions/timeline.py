@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 """A module with a client action for timeline collection."""
 
+import collections
 from collections.abc import Iterator
+from concurrent import futures
 import hashlib
 import os
 import stat as stat_mode
@@ -10,12 +12,13 @@ from typing import Optional
 import psutil
 
 from grr_response_client import actions
+from grr_response_core import config
 from grr_response_core.lib import rdfvalue
-from grr_response_core.lib.rdfvalues import mig_timeline
 from grr_response_core.lib.rdfvalues import protodict as rdf_protodict
 from grr_response_core.lib.rdfvalues import timeline as rdf_timeline
 from grr_response_core.lib.util import iterator
 from grr_response_core.lib.util import statx
+from grr_response_proto import timeline_pb2
 
 
 # Indicates whether the timeline action will also collect file birth time.
@@ -33,11 +36,12 @@ class Timeline(actions.ActionPlugin):
   def Run(self, args: rdf_timeline.TimelineArgs) -> None:
     """Executes the client action."""
     fstype = GetFilesystemType(args.root)
-    entries = iterator.Counted(Walk(args.root))
-    proto_entries = (
-        mig_timeline.ToProtoTimelineEntry(entry) for entry in entries
+    stat_threads = config.CONFIG["Client.timeline_stat_threads"]
+    stats = _Walk(args.root, stat_threads=stat_threads)
+    entries = iterator.Counted(
+        _ToProtoTimelineEntry(path, stat) for path, stat in stats
     )
-    for entry_batch in rdf_timeline.SerializeTimelineEntryStream(proto_entries):
+    for entry_batch in rdf_timeline.SerializeTimelineEntryStream(entries):
       entry_batch_blob = rdf_protodict.DataBlob(data=entry_batch)
       self.SendReply(entry_batch_blob, session_id=self._TRANSFER_STORE_ID)
 
@@ -55,7 +59,10 @@ class Timeline(actions.ActionPlugin):
       entries.Reset()
 
 
-def Walk(root: bytes) -> Iterator[rdf_timeline.TimelineEntry]:
+def Walk(
+    root: bytes,
+    stat_threads: int = 0,
+) -> Iterator[rdf_timeline.TimelineEntry]:
   """Walks the filesystem collecting stat information.
 
   This method will recursively descend to all sub-folders and sub-sub-folders
@@ -65,10 +72,43 @@ def Walk(root: bytes) -> Iterator[rdf_timeline.TimelineEntry]:
 
   Args:
     root: A path to the root folder at which the recursion should start.
+    stat_threads: The number of threads listing and stating folders in parallel.
+      If 0, everything is done in the calling thread.
 
   Returns:
     An iterator over timeline entries with stat information about each file.
 
+  Raises:
+    OSError: If it is not possible to collect information about the root folder.
+    ValueError: If the specified root path is not absolute.
+  """
+  stats = _Walk(root, stat_threads=stat_threads)
+  return (
+      rdf_timeline.TimelineEntry.FromStatx(path, stat) for path, stat in stats
+  )
+
+
+def _Walk(
+    root: bytes,
+    stat_threads: int = 0,
+) -> Iterator[tuple[bytes, statx.Result]]:
+  """Walks the filesystem yielding paths with their stat information.
+
+  See `Walk` for details. The walk is iterative: folders waiting to be listed
+  are kept on an explicit stack, so the depth of the hierarchy doesn't matter.
+  Every folder is listed with `os.scandir` and all its children are stated in
+  one go, either inline or, if `stat_threads` is set, as a task of a thread pool
+  that works on up to `_MAX_PENDING_FOLDERS_PER_THREAD` folders per thread from
+  different subtrees at the same time. The output is a depth-first traversal
+  that lists all children of a folder before descending into them.
+
+  Args:
+    root: A path to the root folder at which the recursion should start.
+    stat_threads: The number of threads listing and stating folders in parallel.
+
+  Returns:
+    An iterator over (path, stat) tuples.
+
   Raises:
     OSError: If it is not possible to collect information about the root folder.
     ValueError: If the specified root path is not absolute.
@@ -88,31 +128,107 @@ def Walk(root: bytes) -> Iterator[rdf_timeline.TimelineEntry]:
   # flow should fail, giving the user a meaningful error message.
   dev = os.lstat(root).st_dev
 
-  def Recurse(path: bytes) -> Iterator[rdf_timeline.TimelineEntry]:
-    """Performs the recursive walk over the file hierarchy."""
+  def Generate() -> Iterator[tuple[bytes, statx.Result]]:
     try:
-      stat = statx.Get(path)
+      stat = statx.Get(root)
     except OSError:
       return
 
-    yield rdf_timeline.TimelineEntry.FromStatx(path, stat)
+    yield root, stat
 
     # We want to recurse only to folders on the same device.
-    if not stat_mode.S_ISDIR(stat.mode) or stat.dev != dev:
+    if not _IsWalkable(stat, dev):
       return
 
+    if stat_threads > 0:
+      yield from _WalkParallel(root, dev, stat_threads)
+    else:
+      yield from _WalkSequential(root, dev)
+
+  return Generate()
+
+
+# How many folders per thread are listed and stated ahead of the consumer of a
+# parallel walk. This bounds the memory used by results that were not consumed
+# yet while still keeping all threads busy.
+_MAX_PENDING_FOLDERS_PER_THREAD = 4
+
+
+def _WalkSequential(
+    root: bytes, dev: int
+) -> Iterator[tuple[bytes, statx.Result]]:
+  """Walks children of the root folder in the calling thread."""
+  folders = [root]
+  while folders:
+    for path, stat in _ListFolder(folders.pop()):
+      yield path, stat
+      if _IsWalkable(stat, dev):
+        folders.append(path)
+
+
+def _WalkParallel(
+    root: bytes, dev: int, stat_threads: int
+) -> Iterator[tuple[bytes, statx.Result]]:
+  """Walks children of the root folder using a pool of threads."""
+  max_pending = stat_threads * _MAX_PENDING_FOLDERS_PER_THREAD
+
+  with futures.ThreadPoolExecutor(
+      max_workers=stat_threads, thread_name_prefix="TimelineWalk"
+  ) as executor:
+    folders = [root]
+    pending = collections.deque()
+    while folders or pending:
+      while folders and len(pending) < max_pending:
+        pending.append(executor.submit(_ListFolder, folders.pop()))
+
+      for path, stat in pending.popleft().result():
+        yield path, stat
+        if _IsWalkable(stat, dev):
+          folders.append(path)
+
+
+def _ListFolder(path: bytes) -> list[tuple[bytes, statx.Result]]:
+  """Lists the folder and stats all its children, ignoring errors."""
+  try:
+    with os.scandir(path) as dir_entries:
+      # `DirEntry.path` is already joined with the folder path and doesn't
+      # require another Python-level path operation per child.
+      childpaths = [dir_entry.path for dir_entry in dir_entries]
+  except OSError:
+    return []
+
+  result = []
+  for childpath in childpaths:
     try:
-      childnames = os.listdir(path)
+      result.append((childpath, statx.Get(childpath)))
     except OSError:
-      childnames = []
-
-    # TODO(hanuszczak): Implement more efficient auto-batcher instead of having
-    # multi-level iterators.
-    for childname in childnames:
-      for entry in Recurse(os.path.join(path, childname)):
-        yield entry
+      continue
 
-  return Recurse(root)
+  return result
+
+
+def _IsWalkable(stat: statx.Result, dev: int) -> bool:
+  return stat_mode.S_ISDIR(stat.mode) and stat.dev == dev
+
+
+def _ToProtoTimelineEntry(
+    path: bytes, stat: statx.Result
+) -> timeline_pb2.TimelineEntry:
+  """Creates a timeline entry proto without going through an RDF value."""
+  return timeline_pb2.TimelineEntry(
+      path=path,
+      mode=stat.mode,
+      size=stat.size,
+      dev=stat.dev,
+      ino=stat.ino,
+      uid=stat.uid,
+      gid=stat.gid,
+      attributes=stat.attributes,
+      atime_ns=stat.atime_ns,
+      btime_ns=stat.btime_ns,
+      mtime_ns=stat.mtime_ns,
+      ctime_ns=stat.ctime_ns,
+  )
 
 
 def GetFilesystemType(root: bytes) -> Optional[str]:
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""Benchmarks for the timeline filesystem walker."""
+
+from collections.abc import Iterator
+import os
+import shutil
+import stat as stat_mode
+
+from absl import app
+
+from grr_response_client.client_actions import timeline
+from grr_response_core.lib.rdfvalues import mig_timeline
+from grr_response_core.lib.rdfvalues import timeline as rdf_timeline
+from grr_response_core.lib.util import statx
+from grr_response_core.lib.util import temp
+from grr.test_lib import benchmark_test_lib
+from grr.test_lib import test_lib
+
+
+def _RecursiveWalk(root: bytes) -> Iterator[rdf_timeline.TimelineEntry]:
+  """Walks the filesystem the way `timeline.Walk` used to."""
+  dev = os.lstat(root).st_dev
+
+  def Recurse(path: bytes) -> Iterator[rdf_timeline.TimelineEntry]:
+    try:
+      stat = statx.Get(path)
+    except OSError:
+      return
+
+    yield rdf_timeline.TimelineEntry.FromStatx(path, stat)
+
+    if not stat_mode.S_ISDIR(stat.mode) or stat.dev != dev:
+      return
+
+    try:
+      childnames = os.listdir(path)
+    except OSError:
+      childnames = []
+
+    for childname in childnames:
+      for entry in Recurse(os.path.join(path, childname)):
+        yield entry
+
+  return Recurse(root)
+
+
+class TimelineWalkBenchmark(benchmark_test_lib.AverageMicroBenchmarks):
+  """Compares the old recursive walker with the scandir-based one."""
+
+  REPEATS = 5
+
+  # A synthetic tree of 3 levels of 10 folders each with 10 files in every
+  # leaf folder, i.e. 11110 entries in total.
+  FANOUT = 10
+  DEPTH = 3
+  FILES_PER_FOLDER = 10
+
+  def setUp(self):
+    super().setUp()
+
+    dirpath = temp.TempDirPath()
+    self.addCleanup(shutil.rmtree, dirpath)
+    self.root = dirpath.encode("utf-8")
+
+    folders = [dirpath]
+    for _ in range(self.DEPTH):
+      subfolders = []
+      for folder in folders:
+        for idx in range(self.FANOUT):
+          subfolder = os.path.join(folder, f"folder{idx}")
+          os.mkdir(subfolder)
+          subfolders.append(subfolder)
+      folders = subfolders
+
+    for folder in folders:
+      for idx in range(self.FILES_PER_FOLDER):
+        with open(os.path.join(folder, f"file{idx}"), mode="wb") as filedesc:
+          filedesc.write(b"x" * idx)
+
+  def testWalk(self):
+    """Walks the synthetic tree collecting RDF timeline entries."""
+    self.TimeIt(
+        lambda: list(_RecursiveWalk(self.root)), name="Recursive listdir"
+    )
+    self.TimeIt(lambda: list(timeline.Walk(self.root)), name="Scandir")
+    for stat_threads in [2, 4, 8]:
+      self.TimeIt(
+          lambda: list(timeline.Walk(self.root, stat_threads=stat_threads)),  # pylint: disable=cell-var-from-loop
+          name=f"Scandir, {stat_threads} threads",
+      )
+
+  def testSerialize(self):
+    """Walks the synthetic tree and serializes entries as the action does."""
+
+    def Recursive():
+      entries = _RecursiveWalk(self.root)
+      proto_entries = map(mig_timeline.ToProtoTimelineEntry, entries)
+      return list(rdf_timeline.SerializeTimelineEntryStream(proto_entries))
+
+    def Scandir(stat_threads=0):
+      stats = timeline._Walk(self.root, stat_threads=stat_threads)  # pylint: disable=protected-access
+      proto_entries = (
+          timeline._ToProtoTimelineEntry(path, stat)  # pylint: disable=protected-access
+          for path, stat in stats
+      )
+      return list(rdf_timeline.SerializeTimelineEntryStream(proto_entries))
+
+    self.TimeIt(Recursive, name="Recursive listdir via RDF")
+    self.TimeIt(Scandir, name="Scandir via proto")
+    self.TimeIt(lambda: Scandir(4), name="Scandir via proto, 4 threads")
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -16,6 +16,7 @@ from grr_response_core.lib.rdfvalues import timeline as rdf_timeline
 from grr_response_core.lib.util import temp
 from grr.test_lib import client_test_lib
 from grr.test_lib import skip
+from grr.test_lib import test_lib
 from grr.test_lib import testing_startup
 
 
@@ -73,6 +74,32 @@ class TimelineTest(client_test_lib.EmptyActionTest):
         # The filesystem type should be the same for every result.
         self.assertEqual(result.filesystem_type, results[0].filesystem_type)
 
+  def testRunWithStatThreads(self):
+    with temp.AutoTempDirPath(remove_non_empty=True) as temp_dirpath:
+      for idx in range(8):
+        os.mkdir(os.path.join(temp_dirpath, "foo{}".format(idx)))
+        _Touch(os.path.join(temp_dirpath, "foo{}".format(idx), "bar"))
+
+      args = rdf_timeline.TimelineArgs()
+      args.root = temp_dirpath.encode("utf-8")
+
+      with test_lib.ConfigOverrider({"Client.timeline_stat_threads": 4}):
+        responses = self.RunAction(timeline.Timeline, args)
+
+      blobs = [_ for _ in responses if isinstance(_, rdf_protodict.DataBlob)]
+      entries = list(
+          rdf_timeline.DeserializeTimelineEntryStream(
+              iter(blob.data for blob in blobs)
+          )
+      )
+
+      paths = [entry.path for entry in entries]
+      self.assertLen(paths, 1 + 8 * 2)
+      self.assertEqual(paths[0], temp_dirpath.encode("utf-8"))
+      self.assertIn(
+          os.path.join(temp_dirpath, "foo3", "bar").encode("utf-8"), paths
+      )
+
 
 class WalkTest(absltest.TestCase):
 
@@ -140,6 +167,51 @@ class WalkTest(absltest.TestCase):
       for entry in entries:
         self.assertTrue(stat_mode.S_ISDIR(entry.mode))
 
+  def testParallel(self):
+    with temp.AutoTempDirPath(remove_non_empty=True) as root_dirpath:
+      for dirname in ["foo", "bar", "baz"]:
+        dirpath = os.path.join(root_dirpath, dirname)
+        for subdirname in ["quux", "norf"]:
+          os.makedirs(os.path.join(dirpath, subdirname))
+          for idx in range(8):
+            _Touch(os.path.join(dirpath, subdirname, f"file{idx}"))
+
+      root = root_dirpath.encode("utf-8")
+      entries = list(timeline.Walk(root))
+      parallel_entries = list(timeline.Walk(root, stat_threads=2))
+
+      # Access times of folders change as they are listed, so only paths and
+      # sizes are compared.
+      self.assertLen(entries, 1 + 3 + 3 * 2 + 3 * 2 * 8)
+      self.assertCountEqual(
+          [(entry.path, entry.size) for entry in parallel_entries],
+          [(entry.path, entry.size) for entry in entries],
+      )
+      self.assertEqual(parallel_entries[0].path, root)
+
+  @skip.If(
+      platform.system() == "Windows",
+      reason="Paths are too long for Windows.",
+  )
+  def testDeepHierarchy(self):
+    with temp.AutoTempDirPath(remove_non_empty=True) as root_dirpath:
+      # Deeper than the default recursion limit of Python.
+      depth = 1200
+      dirpath = root_dirpath
+      for _ in range(depth):
+        # `os.makedirs` is recursive itself, so it can't be used here.
+        dirpath = os.path.join(dirpath, "d")
+        os.mkdir(dirpath)
+
+      try:
+        entries = list(timeline.Walk(root_dirpath.encode("utf-8")))
+        self.assertLen(entries, depth + 1)
+      finally:
+        # Recursive removal of the temporary folder would fail as well.
+        while dirpath != root_dirpath:
+          os.rmdir(dirpath)
+          dirpath = os.path.dirname(dirpath)
+
   @skip.If(
       platform.system() == "Windows",
       reason="Symlinks are not supported on Windows.",
@@ -20,6 +20,7 @@ from grr_response_core import config
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.rdfvalues import flows as rdf_flows
 from grr_response_core.lib.rdfvalues import protodict as rdf_protodict
+from grr_response_core.lib.rdfvalues import structs as rdf_structs
 from grr_response_proto import jobs_pb2
 from fleetspeak.src.common.proto.fleetspeak import common_pb2 as fs_common_pb2
 from fleetspeak.client_connector import connector as fs_client
@@ -39,6 +40,13 @@ _MAX_MSG_LIST_BYTES = 1 << 20  # 1 MiB
 # Maximum number of GrrMessages to put in one PackedMessageList.
 _MAX_MSG_LIST_MSG_COUNT = 100
 
+# Maximum time (in seconds) to wait for more GrrMessages after the first
+# message of a PackedMessageList has been queued.
+_MAX_MSG_LIST_LINGER = 0.2
+
+# Maximum number of encoded message lists waiting to be compressed and sent.
+_BATCH_QUEUE_MAXSIZE = 2
+
 # Maximum size of annotations to add for a Fleetspeak message.
 _MAX_ANNOTATIONS_BYTES = 3 << 10  # 3 KiB
 
@@ -53,24 +61,76 @@ class BrokenFSConnectionError(Exception):
   pass
 
 
-def _EncodeMessageList(
-    message_list: rdf_flows.MessageList,
-    packed_message_list: rdf_flows.PackedMessageList,
-) -> None:
-  """Encode the MessageList into the packed_message_list rdfvalue."""
-  # By default uncompress
-  uncompressed_data = message_list.SerializeToBytes()
-  packed_message_list.message_list = uncompressed_data
+# Serialized tag of the `MessageList.job` field. Message lists are assembled
+# from already serialized messages by prefixing each of them with this tag and
+# its length, which is exactly how the field is encoded on the wire.
+_MESSAGE_LIST_JOB_TAG = rdf_structs.VarintEncode(
+    jobs_pb2.MessageList.DESCRIPTOR.fields_by_name["job"].number << 3
+    | rdf_structs.WIRETYPE_LENGTH_DELIMITED
+)
 
-  compressed_data = zlib.compress(uncompressed_data)
 
-  # Only compress if it buys us something.
-  if len(compressed_data) < len(uncompressed_data):
-    packed_message_list.compression = (
-        rdf_flows.PackedMessageList.CompressionType.ZCOMPRESSION
+class _MessageBatch(object):
+  """GrrMessages serialized into a single MessageList, ready to be packed."""
+
+  def __init__(self):
+    self.count = 0
+    self.size = 0
+    self.data_ids = []
+    self._chunks = []
+
+  def Add(self, grr_msg: rdf_flows.GrrMessage) -> None:
+    """Serializes the message and appends it to the batch."""
+    data = grr_msg.SerializeToBytes()
+    self._chunks.append(_MESSAGE_LIST_JOB_TAG)
+    self._chunks.append(rdf_structs.VarintEncode(len(data)))
+    self._chunks.append(data)
+
+    self.count += 1
+    self.size += len(data)
+
+    if (
+        grr_msg.session_id is None
+        or grr_msg.request_id is None
+        or grr_msg.response_id is None
+    ):
+      return
+    # Place all ids in a single annotation, instead of having separate
+    # annotations for the flow-id, request-id and response-id. This reduces
+    # overall size of the annotations by half (~60 bytes to ~30 bytes).
+    self.data_ids.append(
+        "%s:%d:%d"
+        % (
+            grr_msg.session_id.Basename(),
+            grr_msg.request_id,
+            grr_msg.response_id,
+        )
     )
+
+  def Full(self) -> bool:
+    return (
+        self.count >= _MAX_MSG_LIST_MSG_COUNT
+        or self.size >= _MAX_MSG_LIST_BYTES
+    )
+
+  def SerializeToBytes(self) -> bytes:
+    """Returns the serialized MessageList with all the batched messages."""
+    return b"".join(self._chunks)
+
+
+def _EncodeMessageList(message_list: bytes) -> jobs_pb2.PackedMessageList:
+  """Packs the serialized MessageList into a PackedMessageList proto."""
+  packed_message_list = jobs_pb2.PackedMessageList(message_list=message_list)
+
+  compressed_data = zlib.compress(message_list)
+
+  # Only compress if it buys us something.
+  if len(compressed_data) < len(message_list):
+    packed_message_list.compression = jobs_pb2.PackedMessageList.ZCOMPRESSION
     packed_message_list.message_list = compressed_data
 
+  return packed_message_list
+
 
 class GRRFleetspeakClient(object):
   """A Fleetspeak enabled client implementation."""
@@ -88,6 +148,9 @@ class GRRFleetspeakClient(object):
     self._sender_queue = queue.Queue(
         maxsize=GRRFleetspeakClient._SENDER_QUEUE_MAXSIZE
     )
+    # Batches of serialized messages are compressed and sent on a separate
+    # thread, so that the next batch can be collected in the meantime.
+    self._batch_queue = queue.Queue(maxsize=_BATCH_QUEUE_MAXSIZE)
 
     self._threads = {}
 
@@ -104,6 +167,7 @@ class GRRFleetspeakClient(object):
     out_queue.heart_beat_cb = worker.Heartbeat
 
     self._threads["Foreman"] = self._CreateThread(self._ForemanOp)
+    self._threads["Batcher"] = self._CreateThread(self._BatchOp)
     self._threads["Sender"] = self._CreateThread(self._SendOp)
     self._threads["Receiver"] = self._CreateThread(self._ReceiveOp)
 
@@ -153,34 +217,20 @@ class GRRFleetspeakClient(object):
     )
     time.sleep(period)
 
-  def _SendMessages(self, grr_msgs, background=False):
+  def _SendMessages(self, batch: _MessageBatch, background=False):
     """Sends a block of messages through Fleetspeak."""
-    message_list = rdf_flows.PackedMessageList()
-    _EncodeMessageList(rdf_flows.MessageList(job=grr_msgs), message_list)
+    message_list = _EncodeMessageList(batch.SerializeToBytes())
     fs_msg = fs_common_pb2.Message(
         message_type="MessageList",
         destination=fs_common_pb2.Address(service_name="GRR"),
         background=background,
     )
-    fs_msg.data.Pack(message_list.AsPrimitiveProto())
-
-    for grr_msg in grr_msgs:
-      if (
-          grr_msg.session_id is None
-          or grr_msg.request_id is None
-          or grr_msg.response_id is None
-      ):
-        continue
-      # Place all ids in a single annotation, instead of having separate
-      # annotations for the flow-id, request-id and response-id. This reduces
-      # overall size of the annotations by half (~60 bytes to ~30 bytes).
+    fs_msg.data.Pack(message_list)
+
+    for data_id in batch.data_ids:
       annotation = fs_msg.annotations.entries.add()
       annotation.key = _DATA_IDS_ANNOTATION_KEY
-      annotation.value = "%s:%d:%d" % (
-          grr_msg.session_id.Basename(),
-          grr_msg.request_id,
-          grr_msg.response_id,
-      )
+      annotation.value = data_id
       if fs_msg.annotations.ByteSize() >= _MAX_ANNOTATIONS_BYTES:
         break
 
@@ -190,26 +240,33 @@ class GRRFleetspeakClient(object):
       logging.critical("Broken local Fleetspeak connection (write end): %s", e)
       raise
 
-  def _SendOp(self):
-    """Sends messages through Fleetspeak."""
-    msg = self._sender_queue.get()
-    msgs = []
-    msgs.append(msg)
+  def _BatchOp(self):
+    """Collects queued messages into a batch to be sent through Fleetspeak.
 
-    count = 1
-    size = len(msg.SerializeToBytes())
+    Every message is serialized exactly once. After the first message arrives,
+    more messages are added to the batch until it is full or until
+    `_MAX_MSG_LIST_LINGER` seconds have passed.
+    """
+    batch = _MessageBatch()
+    batch.Add(self._sender_queue.get())
 
-    while count < _MAX_MSG_LIST_MSG_COUNT and size < _MAX_MSG_LIST_BYTES:
+    deadline = time.monotonic() + _MAX_MSG_LIST_LINGER
+    while not batch.Full():
+      timeout = deadline - time.monotonic()
       try:
-        msg = self._sender_queue.get(timeout=1)
-        msgs.append(msg)
-        count += 1
-        size += len(msg.SerializeToBytes())
+        if timeout > 0:
+          msg = self._sender_queue.get(timeout=timeout)
+        else:
+          msg = self._sender_queue.get(block=False)
       except queue.Empty:
         break
+      batch.Add(msg)
 
-    if msgs:
-      self._SendMessages(msgs)
+    self._batch_queue.put(batch)
+
+  def _SendOp(self):
+    """Compresses and sends a single batch of messages through Fleetspeak."""
+    self._SendMessages(self._batch_queue.get())
 
   def _ReceiveOp(self):
     """Receives a single message through Fleetspeak."""
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import logging
+import threading
 from unittest import mock
 import zlib
 
@@ -90,6 +91,7 @@ class FleetspeakClientTest(absltest.TestCase):
         fleetspeak_client._MAX_MSG_LIST_BYTES,
     )
 
+    client._BatchOp()
     client._SendOp()
 
     mock_conn.Send.assert_called_once()
@@ -105,6 +107,68 @@ class FleetspeakClientTest(absltest.TestCase):
     self.assertListEqual(list(message_list.job), grr_messages)
     self.assertEqual(fs_message.annotations, expected_annotations)
 
+  @mock.patch.object(fs_client, "FleetspeakConnection")
+  @mock.patch.object(comms, "GRRClientWorker")
+  def testBatchIsLimitedByMessageCount(self, mock_worker_class, _):
+    del mock_worker_class  # Unused
+
+    client = fleetspeak_client.GRRFleetspeakClient()
+    grr_messages = [
+        rdf_flows.GrrMessage(
+            session_id="C.0123456789abcdef/01234567",
+            request_id=1,
+            response_id=i,
+        )
+        for i in range(fleetspeak_client._MAX_MSG_LIST_MSG_COUNT + 10)
+    ]
+
+    # Queue the messages from a separate thread, as there are more of them
+    # than the sender queue can hold.
+    def PutMessages():
+      for grr_message in grr_messages:
+        client._sender_queue.put(grr_message)
+
+    putter = threading.Thread(target=PutMessages)
+    putter.start()
+    client._BatchOp()
+    client._BatchOp()
+    putter.join()
+
+    first_batch = client._batch_queue.get_nowait()
+    second_batch = client._batch_queue.get_nowait()
+    self.assertEqual(
+        first_batch.count, fleetspeak_client._MAX_MSG_LIST_MSG_COUNT
+    )
+    self.assertEqual(second_batch.count, 10)
+
+    message_list = rdf_flows.MessageList.FromSerializedBytes(
+        first_batch.SerializeToBytes() + second_batch.SerializeToBytes()
+    )
+    self.assertListEqual(list(message_list.job), grr_messages)
+
+  @mock.patch.object(fs_client, "FleetspeakConnection")
+  @mock.patch.object(comms, "GRRClientWorker")
+  @mock.patch.object(fleetspeak_client, "_MAX_MSG_LIST_LINGER", 0)
+  def testBatchDoesNotWaitLongerThanLinger(self, mock_worker_class, _):
+    del mock_worker_class  # Unused
+
+    client = fleetspeak_client.GRRFleetspeakClient()
+    grr_message = rdf_flows.GrrMessage(
+        session_id="C.0123456789abcdef/01234567", request_id=1, response_id=1
+    )
+    client._sender_queue.put(grr_message)
+
+    with mock.patch.object(
+        client._sender_queue, "get", wraps=client._sender_queue.get
+    ) as get:
+      client._BatchOp()
+
+    # Only the first call should block, the following ones must not wait for
+    # more messages once the linger time has passed.
+    self.assertEqual(get.call_count, 2)
+    self.assertEqual(get.call_args, mock.call(block=False))
+    self.assertEqual(client._batch_queue.get_nowait().count, 1)
+
   @mock.patch.object(fs_client, "FleetspeakConnection")
   @mock.patch.object(comms, "GRRClientWorker")
   def testBrokenFSConnection(self, mock_worker_class, mock_con_class):
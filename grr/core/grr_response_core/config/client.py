@@ -193,6 +193,13 @@ config_lib.DEFINE_string(
     "every startup and, if the file is present, will remove it and trigger "
     "an interrogate on the server.")
 
+config_lib.DEFINE_integer(
+    "Client.timeline_stat_threads",
+    default=0,
+    help="The number of threads that list and stat folders in parallel when "
+    "collecting a timeline. Helps on filesystems with high stat latency (e.g. "
+    "network shares). If 0, the timeline is collected in a single thread.")
+
 # osquery options.
 
 config_lib.DEFINE_string(
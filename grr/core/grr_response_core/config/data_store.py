@@ -3,6 +3,7 @@
 
 
 from grr_response_core.lib import config_lib
+from grr_response_core.lib import rdfvalue
 
 config_lib.DEFINE_integer("Datastore.maximum_blob_size", 512 * 1024,
                           "Maximum blob size we may store in the datastore.")
@@ -38,6 +39,82 @@ config_lib.DEFINE_integer(
     help="The maximum number of open connections to keep available in the pool."
 )
 
+config_lib.DEFINE_integer(
+    "Mysql.conn_pool_min_idle",
+    default=0,
+    help="The number of idle connections the pool keeps open and ready.",
+)
+
+config_lib.DEFINE_integer(
+    "Mysql.conn_pool_max_idle",
+    default=0,
+    help=(
+        "The maximum number of idle connections in the pool. Connections "
+        "returned to a pool that has that many idle ones are closed. 0 means "
+        "the size of the pool, i.e. idle connections are never closed "
+        "because of their number."
+    ),
+)
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration,
+    "Mysql.conn_max_age",
+    default=rdfvalue.Duration.From(0, rdfvalue.SECONDS),
+    help=(
+        "Connections older than this are closed instead of being reused. "
+        "0 means connections are reused for as long as they are healthy."
+    ),
+)
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration,
+    "Mysql.conn_idle_timeout",
+    default=rdfvalue.Duration.From(0, rdfvalue.SECONDS),
+    help=(
+        "Connections that have been idle for longer than this are closed "
+        "(keeping Mysql.conn_pool_min_idle of them). 0 disables eviction."
+    ),
+)
+
+config_lib.DEFINE_bool(
+    "Mysql.conn_validate_on_borrow",
+    default=False,
+    help="Ping idle connections before reusing them.",
+)
+
+config_lib.DEFINE_integer(
+    "Mysql.read_pool_max",
+    default=0,
+    help=(
+        "The maximum number of open connections in a separate pool used for "
+        "read-only transactions. 0 means read-only transactions share the "
+        "main pool."
+    ),
+)
+
+config_lib.DEFINE_list(
+    "Mysql.replicas",
+    default=[],
+    help=(
+        "Read replicas (as host or host:port) that read-only transactions "
+        "which tolerate stale data are routed to. Replicas use the same "
+        "database, credentials and SSL settings as the primary."
+    ),
+)
+
+config_lib.DEFINE_integer(
+    "Mysql.replica_pool_max",
+    default=10,
+    help="The maximum number of open connections to each read replica.",
+)
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration,
+    "Mysql.replica_lag_check_interval",
+    default=rdfvalue.Duration.From(1, rdfvalue.SECONDS),
+    help="How often the replication lag of read replicas is checked.",
+)
+
 config_lib.DEFINE_integer(
     "Mysql.flow_processing_threads_min",
     default=1,
@@ -50,6 +127,19 @@ config_lib.DEFINE_integer(
     help="The maximum number of flow-processing worker threads.",
 )
 
+config_lib.DEFINE_integer(
+    "Mysql.flow_processing_lane_queue_size",
+    default=0,
+    help=(
+        "If non-zero, leased flow processing requests are queued in two "
+        "priority lanes of this size each: requests of hunt flows are only "
+        "processed when no requests of other flows are waiting. Requests "
+        "are only leased while both lanes have room for them, so the lanes "
+        "should be small enough to be processed well within the lease time. "
+        "If zero, requests are processed in the order they are leased."
+    ),
+)
+
 config_lib.DEFINE_string(
     "Mysql.migrations_dir", "%(grr_response_server/databases/mysql_migrations@"
     "grr-response-server|resource)", "Folder with MySQL migrations files.")
@@ -121,3 +211,63 @@ config_lib.DEFINE_string(
         "Only used when Blobstore.implementation is GCSBlobStore."
     ),
 )
+config_lib.DEFINE_integer(
+    "Blobstore.gcs.max_concurrency",
+    default=16,
+    help=(
+        "Maximum number of concurrent GCS requests issued by the process for "
+        "blob reads, writes and existence checks. This sizes both the shared "
+        "executor running these requests and the HTTP connection pool they "
+        "use."
+    ),
+)
+config_lib.DEFINE_integer(
+    "Blobstore.gcs.batch_deadline_seconds",
+    default=300,
+    help=(
+        "Maximum time a single batch of GCS blob store operations (e.g. a "
+        "ReadBlobs call) may take."
+    ),
+)
+config_lib.DEFINE_integer(
+    "Blobstore.gcs.existence_cache_size",
+    default=100000,
+    help=(
+        "Number of blob ids remembered by GCSBlobStore as present (or recently "
+        "absent) to avoid redundant existence checks before uploads."
+    ),
+)
+config_lib.DEFINE_integer(
+    "Blobstore.gcs.negative_existence_cache_ttl_seconds",
+    default=60,
+    help=(
+        "For how long GCSBlobStore remembers that a blob was absent. Absent "
+        "blobs may be written by other processes, so this should be short."
+    ),
+)
+
+# Filesystem blobstore configuration.
+config_lib.DEFINE_string(
+    "Blobstore.filesystem.path",
+    default=None,
+    help=(
+        "Root directory for blobs stored on the local filesystem. Only used "
+        "when Blobstore.implementation is FilesystemBlobStore."
+    ),
+)
+config_lib.DEFINE_integer(
+    "Blobstore.filesystem.shard_levels",
+    default=2,
+    help=(
+        "Number of nested directory levels (of 256 entries each) the blobs "
+        "stored by FilesystemBlobStore are sharded into."
+    ),
+)
+config_lib.DEFINE_bool(
+    "Blobstore.filesystem.fsync",
+    default=True,
+    help=(
+        "If true, FilesystemBlobStore syncs every blob to disk before moving "
+        "it into place."
+    ),
+)
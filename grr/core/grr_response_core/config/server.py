@@ -38,6 +38,22 @@ config_lib.DEFINE_integer(
     "Worker.queue_shards", 5, "Queue notifications will be sharded across "
     "this number of datastore subjects.")
 
+config_lib.DEFINE_integer(
+    "Worker.message_handler_threads", 4,
+    "Maximum number of message handlers (e.g. BlobHandler, ForemanHandler) "
+    "that a worker runs in parallel on a single leased batch.")
+
+config_lib.DEFINE_integer(
+    "Worker.message_handler_lease_limit", 100,
+    "Maximum number of message handler requests leased in a single batch.")
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration, "Worker.foreman_rules_cache_ttl",
+    rdfvalue.Duration.From(10, rdfvalue.SECONDS),
+    "For how long the foreman reuses foreman rules read from the database. "
+    "Rules modified in the same process are picked up immediately, rules "
+    "modified by other processes after at most this long.")
+
 config_lib.DEFINE_list("Frontend.well_known_flows", [], "Unused, Deprecated.")
 
 # Smtp settings.
@@ -102,6 +118,39 @@ config_lib.DEFINE_integer(
     "Maximum time messages remain valid within the "
     "system.")
 
+config_lib.DEFINE_integer(
+    "Frontend.client_metadata_cache_size", 10000,
+    "Maximum number of client metadata records the frontend keeps in memory "
+    "to avoid reading them from the database for every incoming message. "
+    "Setting it to 0 disables the cache.")
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration, "Frontend.client_metadata_cache_ttl",
+    rdfvalue.Duration.From(60, rdfvalue.SECONDS),
+    "For how long the frontend reuses client metadata read from the database. "
+    "Metadata written by the same process is picked up immediately, metadata "
+    "written by other processes after at most this long.")
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration, "Frontend.client_ping_flush_interval",
+    rdfvalue.Duration.From(0, rdfvalue.SECONDS),
+    "If set, last-ping updates of clients are buffered and written to the "
+    "database in bulk at most this often. By default, every update is written "
+    "right away.")
+
+config_lib.DEFINE_semantic_value(
+    rdfvalue.Duration, "Server.client_index_cache_ttl",
+    rdfvalue.Duration.From(0, rdfvalue.SECONDS),
+    "If set, client searches are answered from keyword posting lists kept in "
+    "memory. Lists are re-read from the database once they are older than "
+    "this, so changes made by other processes show up after at most this "
+    "long. By default, every search reads the lists from the database.")
+
+config_lib.DEFINE_integer(
+    "Server.client_index_cache_size", 10000,
+    "Maximum number of keyword posting lists kept in memory for client "
+    "searches.")
+
 config_lib.DEFINE_bool(
     "Server.initialized", False, "True once config_updater initialize has been "
     "run at least once.")
@@ -172,6 +221,71 @@ config_lib.DEFINE_integer(
     10000000,
     help="The number of bytes allowed for unbounded reads from a file object")
 
+config_lib.DEFINE_integer(
+    "Server.blob_stream_read_batch_size",
+    50,
+    help="The maximum number of blobs fetched from the blob store in a single "
+    "call when reading files from the file store.")
+
+config_lib.DEFINE_integer(
+    "Server.blob_stream_read_ahead_bytes",
+    64 * 1024 * 1024,
+    help="The maximum number of bytes a single file store stream keeps in "
+    "memory, including data prefetched for sequential readers.")
+
+config_lib.DEFINE_bool(
+    "Server.blob_stream_background_prefetch",
+    True,
+    help="If True, file store streams read sequentially prefetch the next "
+    "batch of blobs on a background thread.")
+
+config_lib.DEFINE_bool(
+    "Server.file_store_trust_client_hashes",
+    False,
+    help="If True, files fetched by MultiGetFile are added to the file store "
+    "under the SHA-256 hash reported by the client, without reading all "
+    "their blobs back to hash them on the server. The client hash is only "
+    "used if the file's size, modification and change times are the same "
+    "after the fetch as when it was hashed. Only enable this if clients are "
+    "trusted: a client reporting a wrong hash can make other files with the "
+    "same hash resolve to its content.")
+
+config_lib.DEFINE_float(
+    "Server.file_store_blob_verification_rate",
+    0.01,
+    help="Fraction of the blobs of files added under a client reported hash "
+    "that are still read back to check that their size matches the blob "
+    "reference. This does not verify the reported hash, see "
+    "Server.file_store_hash_verification_rate.")
+
+config_lib.DEFINE_float(
+    "Server.file_store_hash_verification_rate",
+    0.01,
+    help="Fraction of the files added under a client reported hash that are "
+    "still read back and hashed on the server. A file whose content does not "
+    "match the reported hash is stored under its actual hash instead.")
+
+config_lib.DEFINE_integer(
+    "Server.blob_handler_threads",
+    4,
+    help="Number of threads shared by all blob handler calls in the process to "
+    "decompress and hash the blobs uploaded by clients. Values of 1 or less "
+    "process the blobs sequentially.")
+
+config_lib.DEFINE_integer(
+    "Server.blob_handler_write_batch_bytes",
+    32 * 1024 * 1024,
+    help="Uploaded blobs are written to the blob store in batches of at most "
+    "this many (uncompressed) bytes, as soon as each batch is complete.")
+
+config_lib.DEFINE_integer(
+    "Server.blob_handler_known_blob_cache_size",
+    50000,
+    help="Number of recently written blob ids remembered by the blob handler. "
+    "Uploads of remembered blobs are only written again if the blob store "
+    "no longer has them, which is checked instead of writing them. Use 0 to "
+    "disable the cache.")
+
 # Data retention policies.
 config_lib.DEFINE_semantic_value(
     rdfvalue.Duration,
@@ -297,6 +411,13 @@ config_lib.DEFINE_integer(
     help="Maximum number of client ids to place in a single Fleetspeak "
     "ListClients() API request.")
 
+config_lib.DEFINE_integer(
+    "Server.fleetspeak_send_parallelism",
+    default=8,
+    help="Maximum number of concurrent Fleetspeak InsertMessage() API calls "
+    "used to send the messages flows queued for their clients. The calls are "
+    "made on a pool of this many threads shared by the whole process.")
+
 config_lib.DEFINE_bool(
     "Server.fleetspeak_cps_enabled",
     default=False,
@@ -11,7 +11,9 @@ def ToProtoGrrMessage(rdf: rdf_flows.GrrMessage) -> jobs_pb2.GrrMessage:
 
 
 def ToRDFGrrMessage(proto: jobs_pb2.GrrMessage) -> rdf_flows.GrrMessage:
-  return rdf_flows.GrrMessage.FromSerializedBytes(proto.SerializeToString())
+  return rdf_flows.GrrMessage.FromSerializedBytesLazy(
+      proto.SerializeToString()
+  )
 
 
 def ToProtoGrrStatus(rdf: rdf_flows.GrrStatus) -> jobs_pb2.GrrStatus:
@@ -31,7 +33,7 @@ def ToProtoFlowProcessingRequest(
 def ToRDFFlowProcessingRequest(
     proto: flows_pb2.FlowProcessingRequest,
 ) -> rdf_flows.FlowProcessingRequest:
-  return rdf_flows.FlowProcessingRequest.FromSerializedBytes(
+  return rdf_flows.FlowProcessingRequest.FromSerializedBytesLazy(
       proto.SerializeToString()
   )
 
@@ -8,6 +8,7 @@ import copy
 import functools
 import logging
 import struct
+import threading
 from typing import Optional, TypeVar, cast
 
 from google.protobuf import any_pb2
@@ -112,6 +113,45 @@ def _SerializeEntries(entries):
 def ReadIntoObject(buff, index, value_obj, length=0):
   """Reads all tags until the next end group and store in the value_obj."""
   raw_data = value_obj.GetRawData()
+  _ReadIntoRawData(buff, index, value_obj, raw_data, length=length)
+  value_obj.SetRawData(raw_data)
+
+
+def _GetRepeatedField(value_obj, raw_data, type_info_obj):
+  """Returns the repeated field helper stored in the raw data of value_obj."""
+  entry = raw_data.get(type_info_obj.name)
+  if entry is None:
+    # Same as what `RDFStruct.Get` stores for an unset repeated field.
+    python_format = type_info_obj.Validate(
+        type_info_obj.GetDefault(container=value_obj), container=value_obj
+    )
+    raw_data[type_info_obj.name] = (python_format, None, type_info_obj)
+    return python_format
+
+  python_format, wire_format, _ = entry
+  if python_format is None:
+    python_format = type_info_obj.ConvertFromWireFormat(
+        wire_format, container=value_obj
+    )
+    raw_data[type_info_obj.name] = (python_format, wire_format, type_info_obj)
+
+  return python_format
+
+
+def _ReadIntoRawData(buff, index, value_obj, raw_data, length=0):
+  """Reads all tags until the next end group into the raw_data of value_obj.
+
+  Unlike `ReadIntoObject` this doesn't access the raw data of `value_obj`, so
+  the fields can be collected in a dict that isn't visible to other threads
+  yet.
+
+  Args:
+    buff: The buffer to read from.
+    index: Index of the first byte to read.
+    value_obj: The RDFStruct the fields belong to.
+    raw_data: The raw data dict to store the fields in.
+    length: Number of bytes to read (0 means until the end of the buffer).
+  """
   count = 0
 
   # Split the buffer into tags and wire_format representations, then collect
@@ -147,14 +187,14 @@ def ReadIntoObject(buff, index, value_obj, length=0):
 
     # Repeated fields are handled especially.
     elif type_info_obj.__class__ is ProtoList:
-      value_obj.Get(type_info_obj.name).wrapped_list.append((None, wire_format))
+      _GetRepeatedField(value_obj, raw_data, type_info_obj).wrapped_list.append(
+          (None, wire_format)
+      )
 
     else:
       # Set the python_format as None so it gets converted lazily on access.
       raw_data[type_info_obj.name] = (None, wire_format, type_info_obj)
 
-  value_obj.SetRawData(raw_data)
-
 
 class ProtoType(type_info.TypeInfoObject):
   """A specific type descriptor for protobuf fields.
@@ -1628,6 +1668,54 @@ class RDFStructMetaclass(rdfvalue.RDFValueMetaclass):
 T = TypeVar("T")
 
 
+class _LazyRawData:
+  """Descriptor parsing the raw data of a lazily deserialized RDFStruct.
+
+  Structs created with `RDFStruct.FromSerializedBytesLazy` keep the serialized
+  bytes around instead of the raw data. The bytes are split into fields only
+  when the raw data is accessed for the first time. This is a non-data
+  descriptor, so once the raw data is stored in the instance dict it shadows
+  the descriptor and accessing it costs as much as accessing a plain attribute.
+
+  The fields are collected in a local dict that is only stored in the instance
+  dict once complete, so other threads never see partially parsed raw data.
+  Parsing happens under a lock, so all threads get the same dict.
+  """
+
+  _lock = threading.Lock()
+
+  def __get__(self, instance, owner=None):
+    if instance is None:
+      return None
+
+    with self._lock:
+      # Another thread might have parsed the data while we were waiting.
+      data = instance.__dict__.get("_data")
+      if data is not None:
+        return data
+
+      serialized = instance.__dict__.get("_serialized")
+      if serialized is None:
+        return None
+
+      data = {}
+      try:
+        _ReadIntoRawData(serialized, 0, instance, data)
+      except ValueError:
+        logging.error(
+            "Error in ReadIntoObject. %d bytes, extract: %r",
+            len(serialized),
+            serialized[:1000],
+        )
+        raise
+
+      # Readers that find neither attribute end up waiting for the lock above.
+      del instance._serialized  # pylint: disable=protected-access
+      instance._data = data  # pylint: disable=protected-access
+
+    return data
+
+
 class RDFStruct(rdfvalue.RDFValue, metaclass=RDFStructMetaclass):  # pylint: disable=invalid-metaclass
   """An RDFValue object which contains fields like a struct.
 
@@ -1673,8 +1761,9 @@ class RDFStruct(rdfvalue.RDFValue, metaclass=RDFStructMetaclass):  # pylint: dis
   # Mark as dirty each time we modify this object.
   dirty = False
 
-  # Stores the raw data here.
-  _data = None
+  # Stores the raw data here. Lazily deserialized structs have no raw data
+  # until it is accessed for the first time.
+  _data = _LazyRawData()
 
   def __init__(self, initializer=None, **kwargs):
     super().__init__()
@@ -1802,6 +1891,12 @@ class RDFStruct(rdfvalue.RDFValue, metaclass=RDFStructMetaclass):  # pylint: dis
     self.dirty = True
 
   def SerializeToBytes(self):
+    # Lazily deserialized structs that were never accessed are serialized back
+    # into exactly the bytes they were created from.
+    serialized = self.__dict__.get("_serialized")
+    if serialized is not None:
+      return serialized
+
     return _SerializeEntries(_GetOrderedEntries(self._data))
 
   @classmethod
@@ -1822,6 +1917,36 @@ class RDFStruct(rdfvalue.RDFValue, metaclass=RDFStructMetaclass):  # pylint: dis
     instance.dirty = True
     return instance
 
+  @classmethod
+  def FromSerializedBytesLazy(cls, value: bytes):
+    """Creates a struct that is deserialized only when it is first accessed.
+
+    This is cheaper than `FromSerializedBytes` for structs that are only passed
+    around or serialized again, e.g. when converting protos to RDF values that
+    are then written back to the database. Parsing errors are raised on first
+    access, so the bytes should come from a trusted source (e.g. a serialized
+    proto).
+
+    Args:
+      value: A serialized struct.
+
+    Returns:
+      A struct backed by the given bytes.
+    """
+    precondition.AssertType(value, bytes)
+    instance = cls()
+
+    # Some structs set default field values in their constructors. These have
+    # to be merged with the parsed fields, so they can't be parsed lazily.
+    if instance._data:  # pylint: disable=protected-access
+      ReadIntoObject(value, 0, instance)
+    else:
+      del instance._data  # pylint: disable=protected-access
+      instance._serialized = value  # pylint: disable=protected-access
+
+    instance.dirty = True
+    return instance
+
   @classmethod
   def FromWireFormat(cls, value):
     precondition.AssertType(value, bytes)
@@ -2,7 +2,10 @@
 """Test RDFStruct implementations."""
 
 import base64
+import copy
 import random
+import threading
+from unittest import mock
 
 from absl import app
 from absl.testing import absltest
@@ -891,6 +894,88 @@ message DynamicTypeTest {{
     self.assertEqual(a, b)
     self.assertEqual(b, a)
 
+  def testFromSerializedBytesLazy(self):
+    sample, _ = self._GenerateSampleWithManyFields()
+    serialized = sample.SerializeToBytes()
+
+    lazy = TestStructWithManyFields.FromSerializedBytesLazy(serialized)
+
+    self.assertEqual(lazy, sample)
+    self.assertEqual(lazy.SerializeToBytes(), serialized)
+
+  def testFromSerializedBytesLazyReturnsOriginalBytesIfNotAccessed(self):
+    serialized = TestStruct(foobar="foo", int=42).SerializeToBytes()
+
+    lazy = TestStruct.FromSerializedBytesLazy(serialized)
+
+    self.assertIs(lazy.SerializeToBytes(), serialized)
+
+  def testFromSerializedBytesLazyCanBeModified(self):
+    serialized = TestStruct(foobar="foo", int=42).SerializeToBytes()
+
+    lazy = TestStruct.FromSerializedBytesLazy(serialized)
+    lazy.int = 43
+
+    parsed = TestStruct.FromSerializedBytes(lazy.SerializeToBytes())
+    self.assertEqual(parsed.foobar, "foo")
+    self.assertEqual(parsed.int, 43)
+
+  def testFromSerializedBytesLazyCopy(self):
+    sample = TestStruct(foobar="foo", repeated=["bar", "baz"])
+
+    lazy = TestStruct.FromSerializedBytesLazy(sample.SerializeToBytes())
+
+    self.assertEqual(lazy.Copy(), sample)
+    self.assertEqual(copy.deepcopy(lazy), sample)
+
+  def testFromSerializedBytesLazyIsParsedOnceAcrossThreads(self):
+    serialized = TestStruct(foobar="foo", repeated=["bar"]).SerializeToBytes()
+    lazy = TestStruct.FromSerializedBytesLazy(serialized)
+
+    parsing = threading.Event()
+    proceed = threading.Event()
+    # pylint: disable=protected-access
+    read_into_raw_data = rdf_structs._ReadIntoRawData
+    # pylint: enable=protected-access
+
+    def BlockingReadIntoRawData(*args, **kwargs):
+      read_into_raw_data(*args, **kwargs)
+      parsing.set()
+      proceed.wait(5)
+
+    results = {}
+
+    def Read(name):
+      results[name] = (lazy.GetRawData(), lazy.foobar, list(lazy.repeated))
+
+    with mock.patch.object(
+        rdf_structs, "_ReadIntoRawData", side_effect=BlockingReadIntoRawData
+    ) as read_mock:
+      first = threading.Thread(target=Read, args=("first",))
+      first.start()
+      self.assertTrue(parsing.wait(5))
+
+      # The second reader must not see the partially parsed data.
+      second = threading.Thread(target=Read, args=("second",))
+      second.start()
+      second.join(0.1)
+      self.assertTrue(second.is_alive())
+
+      proceed.set()
+      first.join(5)
+      second.join(5)
+
+    self.assertEqual(read_mock.call_count, 1)
+    self.assertIs(results["first"][0], results["second"][0])
+    self.assertEqual(results["first"][1:], ("foo", ["bar"]))
+    self.assertEqual(results["second"][1:], ("foo", ["bar"]))
+
+  def testFromSerializedBytesLazyRaisesOnAccessToCorruptedData(self):
+    lazy = TestStruct.FromSerializedBytesLazy(b"\x03")
+
+    with self.assertRaises(ValueError):
+      _ = lazy.foobar
+
 
 class BooleanToEnumMigrationTest(test_lib.GRRBaseTest):
 
@@ -1,10 +1,15 @@
 #!/usr/bin/env python
 """A module with utilities for working with iterators."""
 
-from collections.abc import Iterator
+import collections
+from collections.abc import Callable, Iterable, Iterator
+from concurrent import futures
+import queue
+import threading
 from typing import Optional, TypeVar
 
 _T = TypeVar("_T")
+_U = TypeVar("_U")
 
 
 class NoYieldsError(ValueError):
@@ -129,3 +134,132 @@ class Lookahead(Iterator[_T]):
       self._item = next(self._inner)
     except StopIteration:
       self._done = True
+
+
+def ParallelMap(
+    func: Callable[[_T], _U],
+    items: Iterable[_T],
+    max_workers: int,
+) -> Iterator[_U]:
+  """Lazily maps items using a pool of threads, preserving their order.
+
+  Items are pulled from `items` only as the results are consumed: at most
+  `2 * max_workers` items are processed ahead of the consumer, so that the
+  workers have something to do while the consumer handles earlier results.
+
+  Args:
+    func: A function to apply to every item.
+    items: Items to apply the function to.
+    max_workers: A maximum number of threads to use.
+
+  Yields:
+    Results of applying the function to the items, in the order of the items.
+
+  Raises:
+    Exception: Any exception raised by the function (once the consumer gets to
+      the corresponding result).
+  """
+  if max_workers <= 1:
+    yield from map(func, items)
+    return
+
+  executor = futures.ThreadPoolExecutor(
+      max_workers=max_workers, thread_name_prefix="ParallelMap"
+  )
+  pending: collections.deque[futures.Future[_U]] = collections.deque()
+  try:
+    for item in items:
+      pending.append(executor.submit(func, item))
+      if len(pending) >= 2 * max_workers:
+        yield pending.popleft().result()
+
+    while pending:
+      yield pending.popleft().result()
+  finally:
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+class Prefetched(Iterator[_T]):
+  """An iterator wrapper that pulls items from a background thread.
+
+  Up to `max_buffered` items are pulled from the wrapped iterator before they
+  are consumed. The wrapped iterator is iterated (and eventually closed)
+  exclusively on the background thread.
+
+  Prefetched iterators that are not exhausted have to be closed explicitly
+  with `Close` to stop the background thread.
+  """
+
+  # How often the background thread checks if the iterator was closed while
+  # waiting for space in the buffer.
+  _PUT_POLL_INTERVAL_SECS = 0.1
+
+  def __init__(self, inner: Iterator[_T], max_buffered: int) -> None:
+    """Initializes the wrapper.
+
+    Args:
+      inner: An iterator to wrap.
+      max_buffered: A maximum number of items pulled ahead of the consumer.
+    """
+    super().__init__()
+
+    self._queue: queue.Queue[tuple[bool, _T]] = queue.Queue(
+        maxsize=max(1, max_buffered)
+    )
+    self._closed = threading.Event()
+    self._done = False
+    self._error: Optional[Exception] = None
+
+    self._thread = threading.Thread(
+        name="Prefetched", target=self._Pump, args=(inner,), daemon=True
+    )
+    self._thread.start()
+
+  def __iter__(self) -> Iterator[_T]:
+    return self
+
+  def __next__(self) -> _T:
+    if self._done:
+      raise StopIteration()
+
+    has_item, item = self._queue.get()
+    if has_item:
+      return item
+
+    self._done = True
+    self._thread.join()
+    if self._error is not None:
+      raise self._error
+    raise StopIteration()
+
+  def Close(self) -> None:
+    """Stops the background thread, discarding any prefetched items."""
+    self._done = True
+    self._closed.set()
+    self._thread.join()
+
+  def _Pump(self, inner: Iterator[_T]) -> None:
+    """Pulls items from the wrapped iterator into the buffer."""
+    try:
+      for item in inner:
+        if not self._Put((True, item)):
+          return
+    except Exception as e:  # pylint: disable=broad-except
+      self._error = e
+    finally:
+      close = getattr(inner, "close", None)
+      if close is not None:
+        close()
+
+    self._Put((False, None))
+
+  def _Put(self, entry: tuple[bool, _T]) -> bool:
+    """Puts an entry into the buffer, returns `False` if closed meanwhile."""
+    while not self._closed.is_set():
+      try:
+        self._queue.put(entry, timeout=self._PUT_POLL_INTERVAL_SECS)
+        return True
+      except queue.Full:
+        continue
+
+    return False
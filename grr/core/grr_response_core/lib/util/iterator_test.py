@@ -1,4 +1,6 @@
 #!/usr/bin/env python
+import threading
+
 from absl.testing import absltest
 
 from grr_response_core.lib.util import iterator
@@ -122,5 +124,110 @@ class LookaheadTest(absltest.TestCase):
     self.assertTrue(items.done)
 
 
+class ParallelMapTest(absltest.TestCase):
+
+  def testEmpty(self):
+    results = iterator.ParallelMap(lambda x: x, iter([]), max_workers=4)
+    self.assertEqual(list(results), [])
+
+  def testPreservesOrder(self):
+    results = iterator.ParallelMap(lambda x: x**2, range(100), max_workers=4)
+    self.assertEqual(list(results), [x**2 for x in range(100)])
+
+  def testSingleWorker(self):
+    results = iterator.ParallelMap(str, range(3), max_workers=1)
+    self.assertEqual(list(results), ["0", "1", "2"])
+
+  def testRunsConcurrently(self):
+    barrier = threading.Barrier(2, timeout=10)
+
+    def Func(x):
+      # Would time out if the items were processed one by one.
+      barrier.wait()
+      return x
+
+    results = iterator.ParallelMap(Func, range(2), max_workers=2)
+    self.assertEqual(list(results), [0, 1])
+
+  def testPullsItemsLazily(self):
+    pulled = []
+
+    def Items():
+      for i in range(100):
+        pulled.append(i)
+        yield i
+
+    results = iterator.ParallelMap(lambda x: x, Items(), max_workers=2)
+    self.assertEqual(next(results), 0)
+    self.assertLen(pulled, 4)
+
+    results.close()
+
+  def testRaisesErrors(self):
+
+    def Func(x):
+      if x == 2:
+        raise ValueError()
+      return x
+
+    results = iterator.ParallelMap(Func, range(5), max_workers=2)
+    self.assertEqual(next(results), 0)
+    self.assertEqual(next(results), 1)
+    with self.assertRaises(ValueError):
+      next(results)
+
+
+class PrefetchedTest(absltest.TestCase):
+
+  def testEmpty(self):
+    items = iterator.Prefetched(iter([]), max_buffered=4)
+    self.assertEqual(list(items), [])
+
+  def testIterate(self):
+    items = iterator.Prefetched(iter(range(100)), max_buffered=4)
+    self.assertEqual(list(items), list(range(100)))
+
+  def testPrefetchesInBackground(self):
+    pulled = threading.Event()
+
+    def Items():
+      yield "foo"
+      pulled.set()
+      yield "bar"
+
+    items = iterator.Prefetched(Items(), max_buffered=4)
+    self.assertTrue(pulled.wait(timeout=10))
+    self.assertEqual(list(items), ["foo", "bar"])
+
+  def testRaisesErrors(self):
+
+    def Items():
+      yield "foo"
+      raise ValueError()
+
+    items = iterator.Prefetched(Items(), max_buffered=4)
+    self.assertEqual(next(items), "foo")
+    with self.assertRaises(ValueError):
+      next(items)
+
+  def testCloseClosesInnerIterator(self):
+    closed = threading.Event()
+
+    def Items():
+      try:
+        while True:
+          yield "foo"
+      finally:
+        closed.set()
+
+    items = iterator.Prefetched(Items(), max_buffered=1)
+    self.assertEqual(next(items), "foo")
+    items.Close()
+
+    self.assertTrue(closed.is_set())
+    with self.assertRaises(StopIteration):
+      next(items)
+
+
 if __name__ == "__main__":
   absltest.main()
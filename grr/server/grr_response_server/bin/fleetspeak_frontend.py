@@ -44,6 +44,9 @@ def main(argv):
   fsd = fleetspeak_frontend_server.GRRFSServer()
 
   with contextlib.ExitStack() as exit_stack:
+    # Callbacks run in reverse order: buffered writes are flushed once no more
+    # messages are received.
+    exit_stack.callback(fsd.Flush)
 
     if config.CONFIG["Server.fleetspeak_cps_enabled"]:
       cps = fleetspeak_cps.Subscriber()
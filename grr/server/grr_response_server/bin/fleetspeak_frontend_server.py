@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 """This is the GRR frontend FS Server."""
 
-from collections.abc import Sequence
+import collections
+from collections.abc import Mapping, Sequence
 import logging
 import sys
+import threading
 from typing import Optional
 
 import grpc
@@ -11,16 +13,14 @@ import grpc
 from google.protobuf import message as proto2_message
 from grr_response_core import config
 from grr_response_core.lib import rdfvalue
-from grr_response_core.lib.rdfvalues import flows as rdf_flows
-from grr_response_core.lib.rdfvalues import mig_flows
 from grr_response_core.lib.util import cache
 from grr_response_core.stats import metrics
 from grr_response_proto import jobs_pb2
-from grr_response_server import communicator
 from grr_response_server import data_store
 from grr_response_server import fleetspeak
 from grr_response_server import fleetspeak_utils
 from grr_response_server import frontend_lib
+from grr_response_server.models import flows as models_flows
 from fleetspeak.src.common.proto.fleetspeak import common_pb2
 from grr_response_proto import rrg_pb2
 
@@ -71,6 +71,65 @@ def RateLimitedWriteClientMetadata(
   )
 
 
+class ClientPingBuffer:
+  """Coalesces last-ping updates of clients into bulk metadata writes.
+
+  Buffered updates are written once `flush_interval` passes since the previous
+  flush (checked whenever an update is added) or once `MAX_BUFFERED_CLIENTS`
+  clients have pending updates. The last ping of all the clients written
+  together is set to the time of the flush.
+  """
+
+  MAX_BUFFERED_CLIENTS = 1000
+
+  def __init__(self, flush_interval: rdfvalue.Duration) -> None:
+    self._flush_interval = flush_interval
+    self._lock = threading.Lock()
+    self._pending: dict[str, frozenset[tuple[str, str]]] = {}
+    self._last_flush_time = rdfvalue.RDFDatetime.Now()
+
+  def Add(
+      self,
+      client_id: str,
+      fleetspeak_validation_info: frozenset[tuple[str, str]],
+  ) -> None:
+    """Adds a last-ping update of the client to the buffer."""
+    with self._lock:
+      self._pending[client_id] = fleetspeak_validation_info
+      if (
+          len(self._pending) < self.MAX_BUFFERED_CLIENTS
+          and rdfvalue.RDFDatetime.Now() - self._last_flush_time
+          < self._flush_interval
+      ):
+        return
+
+    self.Flush()
+
+  def Flush(self) -> None:
+    """Writes all buffered updates to the database."""
+    with self._lock:
+      pending = self._pending
+      self._pending = {}
+      self._last_flush_time = rdfvalue.RDFDatetime.Now()
+
+    if not pending:
+      return
+
+    # `MultiWriteClientMetadata` writes the same values for all the clients,
+    # so the clients are grouped by their Fleetspeak validation info.
+    client_ids_by_validation_info = collections.defaultdict(list)
+    for client_id, validation_info in pending.items():
+      client_ids_by_validation_info[validation_info].append(client_id)
+
+    now = rdfvalue.RDFDatetime.Now()
+    for validation_info, client_ids in client_ids_by_validation_info.items():
+      data_store.REL_DB.MultiWriteClientMetadata(
+          client_ids,
+          last_ping=now,
+          fleetspeak_validation_info=dict(validation_info),
+      )
+
+
 class GRRFSServer:
   """The GRR FS frontend server.
 
@@ -87,6 +146,34 @@ class GRRFSServer:
         ],
     )
 
+    flush_interval = config.CONFIG["Frontend.client_ping_flush_interval"]
+    if flush_interval:
+      self._ping_buffer = ClientPingBuffer(flush_interval)
+    else:
+      self._ping_buffer = None
+
+  def Flush(self) -> None:
+    """Writes all buffered client metadata updates to the database."""
+    if self._ping_buffer is not None:
+      self._ping_buffer.Flush()
+
+  def _UpdateClientPing(
+      self,
+      client_id: str,
+      validation_info: Mapping[str, str],
+  ) -> None:
+    """Updates the last ping and the validation info of the client."""
+    if self._ping_buffer is not None:
+      self._ping_buffer.Add(client_id, frozenset(validation_info.items()))
+    else:
+      RateLimitedWriteClientMetadata(
+          client_id,
+          frozenset(validation_info.items()),
+      )
+    self.frontend.UpdateCachedClientPing(
+        client_id, rdfvalue.RDFDatetime.Now()
+    )
+
   def ProcessFromGRPC(
       self, fs_msg: common_pb2.Message, context: grpc.ServicerContext
   ) -> None:
@@ -121,10 +208,7 @@ class GRRFSServer:
 
         if elapsed_since_ping >= MIN_DELAY_BETWEEN_METADATA_UPDATES:
           logging.info("updating metadata for existing client: %r", client_id)
-          RateLimitedWriteClientMetadata(
-              client_id,
-              frozenset(batch.validation_info_tags.items()),
-          )
+          self._UpdateClientPing(client_id, batch.validation_info_tags)
 
       if batch.message_type == "GrrMessage":
         INCOMING_FLEETSPEAK_MESSAGES.Increment(
@@ -146,8 +230,7 @@ class GRRFSServer:
 
           grr_message_protos.append(grr_message_proto)
 
-        grr_messages = list(map(mig_flows.ToRDFGrrMessage, grr_message_protos))
-        self._ProcessGRRMessages(client_id, grr_messages)
+        self._ProcessGRRMessages(client_id, grr_message_protos)
 
       elif batch.message_type == "MessageList":
         INCOMING_FLEETSPEAK_MESSAGES.Increment(
@@ -167,16 +250,13 @@ class GRRFSServer:
             )
             continue
 
-          message_list_proto = mig_flows.ToProtoMessageList(
-              communicator.Communicator.DecompressMessageList(
-                  mig_flows.ToRDFPackedMessageList(packed_message_list_proto),
-              )
+          message_list_proto = models_flows.DecompressMessageList(
+              packed_message_list_proto
           )
 
           grr_message_protos.extend(message_list_proto.job)
 
-        grr_messages = list(map(mig_flows.ToRDFGrrMessage, grr_message_protos))
-        self._ProcessGRRMessages(client_id, grr_messages)
+        self._ProcessGRRMessages(client_id, grr_message_protos)
 
       elif batch.message_type == "rrg.Response":
         INCOMING_FLEETSPEAK_MESSAGES.Increment(
@@ -285,18 +365,13 @@ class GRRFSServer:
           # protect against the scenario of multiple GRR Fletspeak Frontend
           # processes receiving the messages at the same time, but such
           # protection currently is likely excessive.
-          RateLimitedWriteClientMetadata(
-              grr_client_id,
-              frozenset(validation_info.items()),
-          )
+          self._UpdateClientPing(grr_client_id, validation_info)
           _LogDelayed("Written client metadata for existing client")
 
       if fs_msg.message_type == "GrrMessage":
         INCOMING_FLEETSPEAK_MESSAGES.Increment(fields=["PROCESS_GRR"])
 
-        grr_message = rdf_flows.GrrMessage.FromSerializedBytes(
-            fs_msg.data.value
-        )
+        grr_message = jobs_pb2.GrrMessage.FromString(fs_msg.data.value)
         _LogDelayed("Starting processing GRR message")
         self._ProcessGRRMessages(grr_client_id, [grr_message])
         _LogDelayed("Finished processing GRR message")
@@ -305,12 +380,10 @@ class GRRFSServer:
             fields=["PROCESS_GRR_MESSAGE_LIST"]
         )
 
-        packed_messages = rdf_flows.PackedMessageList.FromSerializedBytes(
+        packed_messages = jobs_pb2.PackedMessageList.FromString(
             fs_msg.data.value
         )
-        message_list = communicator.Communicator.DecompressMessageList(
-            packed_messages
-        )
+        message_list = models_flows.DecompressMessageList(packed_messages)
         _LogDelayed("Starting processing GRR message list")
         self._ProcessGRRMessages(grr_client_id, message_list.job)
         _LogDelayed("Finished processing GRR message list")
@@ -360,7 +433,7 @@ class GRRFSServer:
   def _ProcessGRRMessages(
       self,
       grr_client_id: str,
-      grr_messages: Sequence[rdf_flows.GrrMessage],
+      grr_messages: Sequence[jobs_pb2.GrrMessage],
   ) -> None:
     """Handles messages from GRR clients received via Fleetspeak.
 
@@ -369,15 +442,13 @@ class GRRFSServer:
 
     Args:
       grr_client_id: The unique identifier of the GRR client.
-      grr_messages: A sequence of `GrrMessage`.
+      grr_messages: A sequence of `GrrMessage` protos.
     """
     try:
       for grr_message in grr_messages:
         grr_message.source = grr_client_id
-        grr_message.auth_state = (
-            rdf_flows.GrrMessage.AuthorizationState.AUTHENTICATED
-        )
-      self.frontend.ReceiveMessages(
+        grr_message.auth_state = jobs_pb2.GrrMessage.AUTHENTICATED
+      self.frontend.ReceiveMessageProtos(
           client_id=grr_client_id, messages=grr_messages
       )
     except Exception:
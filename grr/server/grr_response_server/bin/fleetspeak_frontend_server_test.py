@@ -414,6 +414,51 @@ class FleetspeakGRRFEServerTest(flow_test_lib.FlowTestsBaseclass):
     self.assertEqual(validation_info_tags[1].key, "tag-2")
     self.assertEqual(validation_info_tags[1].value, "value-2-new")
 
+  @db_test_lib.WithDatabase
+  def testProcessBatch_BufferedClientPings(self, db: abstract_db.Database):
+    old_ping = db.Now() - rdfvalue.Duration.From(12, rdfvalue.WEEKS)
+    client_ids = [db_test_utils.InitializeClient(db) for _ in range(3)]
+    for client_id in client_ids:
+      db.WriteClientMetadata(client_id, last_ping=old_ping)
+
+    with test_lib.ConfigOverrider({
+        "Frontend.client_ping_flush_interval": rdfvalue.Duration.From(
+            1, rdfvalue.HOURS
+        ),
+    }):
+      server = fleetspeak_frontend_server.GRRFSServer()
+
+    for client_id in client_ids:
+      server.ProcessBatch(
+          fleetspeak.MessageBatch(
+              client_id=client_id,
+              service="GRR-batched",
+              message_type="rrg.Parcel",
+              messages=[],
+              validation_info_tags={"tag": "value"},
+          )
+      )
+
+    # Updates are buffered until the flush interval passes.
+    for client_id in client_ids:
+      self.assertEqual(db.ReadClientMetadata(client_id).ping, old_ping)
+
+    time_before = db.Now()
+    with mock.patch.object(
+        db, "MultiWriteClientMetadata", wraps=db.MultiWriteClientMetadata
+    ) as write_metadata_fn:
+      server.Flush()
+
+    # All clients with the same validation info are written at once.
+    self.assertEqual(write_metadata_fn.call_count, 1)
+    for client_id in client_ids:
+      metadata = db.ReadClientMetadata(client_id)
+      self.assertGreater(metadata.ping, time_before)
+      tags = metadata.last_fleetspeak_validation_info.tags
+      self.assertLen(tags, 1)
+      self.assertEqual(tags[0].key, "tag")
+      self.assertEqual(tags[0].value, "value")
+
   @db_test_lib.WithDatabase
   def testProcessBatch_GrrMessage(self, db: abstract_db.Database):
     client_id = db_test_utils.InitializeClient(db)
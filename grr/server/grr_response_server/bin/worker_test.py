@@ -12,6 +12,9 @@ from grr_response_core.lib.rdfvalues import protodict as rdf_protodict
 from grr_response_proto import objects_pb2
 from grr_response_server import data_store
 from grr_response_server import foreman
+from grr_response_server import handler_registry
+from grr_response_server import message_handlers
+from grr_response_server import threadpool
 from grr_response_server import worker_lib
 from grr.test_lib import action_mocks
 from grr.test_lib import flow_test_lib
@@ -114,6 +117,55 @@ class GrrWorkerTest(flow_test_lib.FlowTestsBaseclass):
       finally:
         data_store.REL_DB.UnregisterMessageHandler(timeout=60)
 
+  def testMessageHandlersAreProcessedInParallelWithPool(self):
+    fast_handler_done = threading.Event()
+    slow_handler_results = []
+
+    class SlowHandler(message_handlers.MessageHandler):
+      handler_name = "SlowHandler"
+
+      def ProcessMessages(self, msgs):
+        del msgs  # Unused.
+        # Times out if the handlers are processed sequentially, since the slow
+        # one comes first.
+        slow_handler_results.append(fast_handler_done.wait(10))
+
+    class FastHandler(message_handlers.MessageHandler):
+      handler_name = "FastHandler"
+
+      def ProcessMessages(self, msgs):
+        del msgs  # Unused.
+        fast_handler_done.set()
+
+    pool = threadpool.ThreadPool.Factory(
+        "message_handler_test_pool", min_threads=2, max_threads=2
+    )
+    pool.Start()
+    self.addCleanup(pool.Stop)
+
+    requests = []
+    for i, handler_name in enumerate(["SlowHandler", "FastHandler"]):
+      requests.append(
+          objects_pb2.MessageHandlerRequest(
+              client_id="C.1100110011001100",
+              handler_name=handler_name,
+              request_id=i,
+              request=mig_protodict.ToProtoEmbeddedRDFValue(
+                  rdf_protodict.EmbeddedRDFValue(rdf_protodict.DataBlob())
+              ),
+          )
+      )
+    data_store.REL_DB.WriteMessageHandlerRequests(requests)
+
+    with mock.patch.dict(
+        handler_registry.handler_name_map,
+        {"SlowHandler": SlowHandler, "FastHandler": FastHandler},
+    ):
+      worker_lib.ProcessMessageHandlerRequests(requests, pool=pool)
+
+    self.assertEqual(slow_handler_results, [True])
+    self.assertEqual(data_store.REL_DB.ReadMessageHandlerRequests(), [])
+
 
 def main(argv):
   test_lib.main(argv)
@@ -2,8 +2,10 @@
 """The blob store abstraction."""
 
 import abc
+import random
+import threading
 import time
-from typing import Dict, Iterable, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, TypeVar
 
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.util import precondition
@@ -24,14 +26,63 @@ BLOB_STORE_POLL_HIT_ITERATION = metrics.Event(
     "blob_store_poll_hit_iteration", bins=[1, 2, 5, 10, 20, 50]
 )
 
+# Bounds of the truncated exponential backoff used when waiting for blobs. The
+# upper bound matches the fixed poll interval used previously, so waiting is
+# never slower than it used to be.
+_WAIT_MIN_BACKOFF_SECS = 0.05
+_WAIT_MAX_BACKOFF_SECS = 1
+
+_T = TypeVar("_T")
+
 
 class BlobStoreTimeoutError(Exception):
   """An exception class raised when certain blob store operation times out."""
 
 
+class BlobWriteNotifier:
+  """Wakes up threads waiting for blobs when blobs are written.
+
+  Only writes done in the same process (and through the same blob store) can be
+  signaled this way. Waiting for blobs written elsewhere still relies on
+  polling.
+  """
+
+  def __init__(self) -> None:
+    self._condition = threading.Condition()
+    self._generation = 0
+
+  @property
+  def generation(self) -> int:
+    """A number that changes every time blobs are written."""
+    with self._condition:
+      return self._generation
+
+  def Notify(self) -> None:
+    """Signals that blobs were written."""
+    with self._condition:
+      self._generation += 1
+      self._condition.notify_all()
+
+  def Wait(self, generation: int, timeout_secs: float) -> None:
+    """Waits until blobs are written after `generation` was read.
+
+    Args:
+      generation: Value of the `generation` property read before the blobs
+        were last checked for.
+      timeout_secs: Maximum number of seconds to wait.
+    """
+    with self._condition:
+      self._condition.wait_for(
+          lambda: self._generation != generation, timeout=timeout_secs
+      )
+
+
 class BlobStore(metaclass=abc.ABCMeta):
   """The blob store base class."""
 
+  # Optional notifier signaled on writes, used to cut waiting for blobs short.
+  _write_notifier: Optional[BlobWriteNotifier] = None
+
   def WriteBlobsWithUnknownHashes(
       self,
       blobs_data: Iterable[bytes],
@@ -139,6 +190,10 @@ class BlobStore(metaclass=abc.ABCMeta):
   ) -> Dict[models_blobs.BlobID, Optional[bytes]]:
     """Reads specified blobs, waiting and retrying if blobs do not exist yet.
 
+    The first attempt reads all the blobs right away, as in the common case they
+    are already present. Subsequent attempts only check for the existence of the
+    remaining blobs and read those that appeared.
+
     Args:
       blob_ids: An iterable of BlobIDs.
       timeout: A rdfvalue.Duration specifying the maximum time to pass until the
@@ -151,34 +206,29 @@ class BlobStore(metaclass=abc.ABCMeta):
       written with WriteBlobs. If a particular blob_id is not found, the
       corresponding blob_data will be None.
     """
-    remaining_ids = set(blob_ids)
-    results = {blob_id: None for blob_id in remaining_ids}
-    start = rdfvalue.RDFDatetime.Now()
-    # TODO: Implement truncated exponential backoff.
-    sleep_dur = rdfvalue.Duration.From(1, rdfvalue.SECONDS)
-    poll_num = 0
-
-    while remaining_ids:
-      cur_blobs = self.ReadBlobs(list(remaining_ids))
-      now = rdfvalue.RDFDatetime.Now()
-      elapsed = now - start
-      poll_num += 1
-
-      for blob_id, blob in cur_blobs.items():
-        if blob is None:
-          continue
-        results[blob_id] = blob
-        remaining_ids.remove(blob_id)
-        BLOB_STORE_POLL_HIT_LATENCY.RecordEvent(
-            elapsed.ToFractional(rdfvalue.SECONDS)
-        )
-        BLOB_STORE_POLL_HIT_ITERATION.RecordEvent(poll_num)
-
-      if not remaining_ids or elapsed + sleep_dur >= timeout:
-        break
-
-      time.sleep(sleep_dur.ToFractional(rdfvalue.SECONDS))
 
+    def Poll(
+        remaining_ids: Set[models_blobs.BlobID],
+        poll_num: int,
+    ) -> Dict[models_blobs.BlobID, Optional[bytes]]:
+      if poll_num == 1:
+        ids_to_read = list(remaining_ids)
+      else:
+        exists_by_id = self.CheckBlobsExist(list(remaining_ids))
+        ids_to_read = [
+            blob_id for blob_id, exists in exists_by_id.items() if exists
+        ]
+        if not ids_to_read:
+          return {}
+
+      blobs = self.ReadBlobs(ids_to_read)
+      return {
+          blob_id: blob for blob_id, blob in blobs.items() if blob is not None
+      }
+
+    blob_ids = set(blob_ids)
+    results = {blob_id: None for blob_id in blob_ids}
+    results.update(self._PollForBlobs(blob_ids, timeout, Poll))
     return results
 
   def ReadAndWaitForBlob(
@@ -212,60 +262,130 @@ class BlobStore(metaclass=abc.ABCMeta):
       BlobStoreTimeoutError: If the blobs are still not in the database after
         the specified timeout duration has elapsed.
     """
-    remaining_blob_ids = set(blob_ids)
 
-    # TODO: See a TODO comment in `RunAndWaitForBlobs`.
-    sleep_duration = rdfvalue.Duration.From(1, rdfvalue.SECONDS)
-
-    start_time = rdfvalue.RDFDatetime.Now()
-    ticks = 0
+    def Poll(
+        remaining_ids: Set[models_blobs.BlobID],
+        poll_num: int,
+    ) -> Dict[models_blobs.BlobID, bool]:
+      del poll_num  # Unused.
+      exists_by_id = self.CheckBlobsExist(list(remaining_ids))
+      return {
+          blob_id: True for blob_id, exists in exists_by_id.items() if exists
+      }
+
+    blob_ids = set(blob_ids)
+    found = self._PollForBlobs(blob_ids, timeout, Poll)
+    if len(found) < len(blob_ids):
+      raise BlobStoreTimeoutError()
+
+  def _PollForBlobs(
+      self,
+      blob_ids: Set[models_blobs.BlobID],
+      timeout: rdfvalue.Duration,
+      poll_fn: Callable[
+          [Set[models_blobs.BlobID], int], Dict[models_blobs.BlobID, _T]
+      ],
+  ) -> Dict[models_blobs.BlobID, _T]:
+    """Polls for blobs until all of them are found or the timeout is reached.
 
-    while True:
-      blob_id_exists = self.CheckBlobsExist(remaining_blob_ids)
+    Polls are spaced using truncated exponential backoff with jitter. If a
+    write notifier is set, waiting is cut short as soon as any blob is written
+    through this blob store.
 
-      elapsed = rdfvalue.RDFDatetime.Now() - start_time
-      elapsed_secs = elapsed.ToFractional(rdfvalue.SECONDS)
-      ticks += 1
+    Args:
+      blob_ids: Blob ids to poll for.
+      timeout: A duration after which no further polls are started.
+      poll_fn: A function called with the set of blob ids that are still
+        missing and the 1-based poll number. It returns a dictionary with
+        entries for the blobs that were found.
 
-      for blob_id, exists in blob_id_exists.items():
-        if not exists:
-          continue
+    Returns:
+      A dictionary with the values returned by `poll_fn` for all found blobs.
+    """
+    remaining_ids = set(blob_ids)
+    results = {}
+    start = rdfvalue.RDFDatetime.Now()
+    timeout_secs = timeout.ToFractional(rdfvalue.SECONDS)
+    backoff_secs = _WAIT_MIN_BACKOFF_SECS
+    poll_num = 0
+    notifier = self._write_notifier
+    generation = None
 
-        remaining_blob_ids.remove(blob_id)
+    while remaining_ids:
+      if notifier is not None:
+        # Read before polling, so that writes done during the poll are not
+        # missed.
+        generation = notifier.generation
+      polled = poll_fn(remaining_ids, poll_num + 1)
+      elapsed_secs = (rdfvalue.RDFDatetime.Now() - start).ToFractional(
+          rdfvalue.SECONDS
+      )
+      poll_num += 1
 
+      for blob_id, value in polled.items():
+        results[blob_id] = value
+        remaining_ids.remove(blob_id)
         BLOB_STORE_POLL_HIT_LATENCY.RecordEvent(elapsed_secs)
-        BLOB_STORE_POLL_HIT_ITERATION.RecordEvent(ticks)
+        BLOB_STORE_POLL_HIT_ITERATION.RecordEvent(poll_num)
 
-      if not remaining_blob_ids:
+      if not remaining_ids or elapsed_secs >= timeout_secs:
         break
 
-      if elapsed + sleep_duration >= timeout:
-        raise BlobStoreTimeoutError()
+      # "Equal jitter": waiters that started together don't poll in lockstep,
+      # but each of them still waits for at least half of the backoff.
+      sleep_secs = backoff_secs * random.uniform(0.5, 1.0)
+      sleep_secs = min(sleep_secs, timeout_secs - elapsed_secs)
+      backoff_secs = min(backoff_secs * 2, _WAIT_MAX_BACKOFF_SECS)
+
+      if notifier is None:
+        time.sleep(sleep_secs)
+      else:
+        notifier.Wait(generation, sleep_secs)
 
-      sleep_duration_secs = sleep_duration.ToFractional(rdfvalue.SECONDS)
-      time.sleep(sleep_duration_secs)
+    return results
 
 
 class BlobStoreValidationWrapper(BlobStore):
   """BlobStore wrapper that validates calls arguments."""
 
-  def __init__(self, delegate: BlobStore):
+  def __init__(
+      self,
+      delegate: BlobStore,
+      write_notifier: Optional[BlobWriteNotifier] = None,
+  ):
+    """Initializes the wrapper.
+
+    Args:
+      delegate: The blob store to wrap.
+      write_notifier: An optional notifier that is signaled whenever blobs are
+        written through this wrapper and that is used to wake up threads
+        waiting for blobs.
+    """
     super().__init__()
     self.delegate = delegate
+    self._write_notifier = write_notifier
+
+  def _NotifyWritten(self) -> None:
+    if self._write_notifier is not None:
+      self._write_notifier.Notify()
 
   def WriteBlobsWithUnknownHashes(
       self,
       blobs_data: Iterable[bytes],
   ) -> List[models_blobs.BlobID]:
     precondition.AssertIterableType(blobs_data, bytes)
-    return self.delegate.WriteBlobsWithUnknownHashes(blobs_data)
+    blob_ids = self.delegate.WriteBlobsWithUnknownHashes(blobs_data)
+    self._NotifyWritten()
+    return blob_ids
 
   def WriteBlobWithUnknownHash(
       self,
       blob_data: bytes,
   ) -> models_blobs.BlobID:
     precondition.AssertType(blob_data, bytes)
-    return self.delegate.WriteBlobWithUnknownHash(blob_data)
+    blob_id = self.delegate.WriteBlobWithUnknownHash(blob_data)
+    self._NotifyWritten()
+    return blob_id
 
   def ReadBlob(
       self,
@@ -286,7 +406,8 @@ class BlobStoreValidationWrapper(BlobStore):
       blob_id_data_map: Dict[models_blobs.BlobID, bytes],
   ) -> None:
     precondition.AssertDictType(blob_id_data_map, models_blobs.BlobID, bytes)
-    return self.delegate.WriteBlobs(blob_id_data_map)
+    self.delegate.WriteBlobs(blob_id_data_map)
+    self._NotifyWritten()
 
   def ReadBlobs(
       self, blob_ids: Iterable[models_blobs.BlobID]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Tests for the blob store abstraction."""
+
+import threading
+import time
+from unittest import mock
+
+from absl import app
+
+from grr_response_core.lib import rdfvalue
+from grr_response_server import blob_store
+from grr_response_server.databases import mem as mem_db
+from grr_response_server.models import blobs as models_blobs
+from grr.test_lib import test_lib
+
+
+class BlobWriteNotifierTest(test_lib.GRRBaseTest):
+
+  def testWaitReturnsAfterTimeoutWithoutNotification(self):
+    notifier = blob_store.BlobWriteNotifier()
+    generation = notifier.generation
+
+    notifier.Wait(generation, 0.01)
+
+    self.assertEqual(notifier.generation, generation)
+
+  def testWaitReturnsImmediatelyIfNotifiedBefore(self):
+    notifier = blob_store.BlobWriteNotifier()
+    generation = notifier.generation
+    notifier.Notify()
+
+    start = time.time()
+    notifier.Wait(generation, 60)
+
+    self.assertLess(time.time() - start, 10)
+
+
+class BlobStoreValidationWrapperTest(test_lib.GRRBaseTest):
+
+  def setUp(self):
+    super().setUp()
+    self.notifier = blob_store.BlobWriteNotifier()
+    self.blob_store = blob_store.BlobStoreValidationWrapper(
+        mem_db.InMemoryDB(), write_notifier=self.notifier
+    )
+
+  def testWritesNotify(self):
+    generation = self.notifier.generation
+
+    self.blob_store.WriteBlobs({models_blobs.BlobID(b"0" * 32): b"foo"})
+    self.assertGreater(self.notifier.generation, generation)
+
+    generation = self.notifier.generation
+    self.blob_store.WriteBlobWithUnknownHash(b"bar")
+    self.assertGreater(self.notifier.generation, generation)
+
+    generation = self.notifier.generation
+    self.blob_store.WriteBlobsWithUnknownHashes([b"baz"])
+    self.assertGreater(self.notifier.generation, generation)
+
+  def testWaitForBlobsIsWokenUpByWrite(self):
+    blob_id = models_blobs.BlobID.Of(b"foo")
+    waiting = threading.Event()
+    original_wait = self.notifier.Wait
+
+    def Wait(generation, timeout_secs):
+      waiting.set()
+      # Waiting is only cut short by a write, so a long backoff would make the
+      # test time out.
+      original_wait(generation, timeout_secs)
+
+    def WaitForBlobs():
+      self.blob_store.ReadAndWaitForBlobs(
+          [blob_id], timeout=rdfvalue.Duration.From(1, rdfvalue.MINUTES)
+      )
+
+    with mock.patch.object(self.notifier, "Wait", side_effect=Wait):
+      with mock.patch.object(blob_store, "_WAIT_MIN_BACKOFF_SECS", 60):
+        with mock.patch.object(blob_store, "_WAIT_MAX_BACKOFF_SECS", 60):
+          thread = threading.Thread(target=WaitForBlobs)
+          thread.start()
+          waiting.wait()
+
+          start = time.time()
+          self.blob_store.WriteBlobWithUnknownHash(b"foo")
+          thread.join()
+
+    self.assertLess(time.time() - start, 10)
+
+
+if __name__ == "__main__":
+  app.run(test_lib.main)
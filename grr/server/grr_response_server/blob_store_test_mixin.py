@@ -149,41 +149,83 @@ class BlobStoreTestMixin(stats_test_lib.StatsTestMixin, metaclass=abc.ABCMeta):
   def testReadAndWaitForBlobsPollsUntilResultsAreAvailable(self, sleep_mock):
     a_id = models_blobs.BlobID(b"0" * 32)
     b_id = models_blobs.BlobID(b"1" * 32)
-    effect = [
+    read_effect = [
         {a_id: None, b_id: None},
-        {a_id: b"aa", b_id: None},
-        {b_id: None},
+        {a_id: b"aa"},
         {b_id: b"bb"},
     ]
+    check_effect = [
+        {a_id: True, b_id: False},
+        {b_id: False},
+        {b_id: True},
+    ]
 
     with test_lib.FakeTime(rdfvalue.RDFDatetime.FromSecondsSinceEpoch(10)):
       with mock.patch.object(
-          self.blob_store, "ReadBlobs", side_effect=effect
+          self.blob_store, "ReadBlobs", side_effect=read_effect
       ) as read_mock:
-        results = self.blob_store.ReadAndWaitForBlobs(
-            [a_id, b_id], timeout=rdfvalue.Duration.From(10, rdfvalue.SECONDS)
-        )
+        with mock.patch.object(
+            self.blob_store, "CheckBlobsExist", side_effect=check_effect
+        ) as check_mock:
+          results = self.blob_store.ReadAndWaitForBlobs(
+              [a_id, b_id],
+              timeout=rdfvalue.Duration.From(10, rdfvalue.SECONDS),
+          )
 
     self.assertEqual({a_id: b"aa", b_id: b"bb"}, results)
-    self.assertEqual(read_mock.call_count, 4)
+    # Blobs are read right away, but afterwards only the blobs that are known
+    # to exist are read.
+    self.assertEqual(read_mock.call_count, 3)
     self.assertCountEqual(
         read_mock.call_args_list[0][POSITIONAL_ARGS][0], [a_id, b_id]
     )
     self.assertCountEqual(
-        read_mock.call_args_list[1][POSITIONAL_ARGS][0], [a_id, b_id]
+        read_mock.call_args_list[1][POSITIONAL_ARGS][0], [a_id]
     )
     self.assertCountEqual(
         read_mock.call_args_list[2][POSITIONAL_ARGS][0], [b_id]
     )
+    self.assertEqual(check_mock.call_count, 3)
+    self.assertCountEqual(
+        check_mock.call_args_list[0][POSITIONAL_ARGS][0], [a_id, b_id]
+    )
+    self.assertCountEqual(
+        check_mock.call_args_list[1][POSITIONAL_ARGS][0], [b_id]
+    )
     self.assertCountEqual(
-        read_mock.call_args_list[3][POSITIONAL_ARGS][0], [b_id]
+        check_mock.call_args_list[2][POSITIONAL_ARGS][0], [b_id]
     )
     self.assertEqual(sleep_mock.call_count, 3)
 
+  @mock.patch.object(time, "sleep")
+  def testReadAndWaitForBlobsBacksOffExponentially(self, sleep_mock):
+    a_id = models_blobs.BlobID(b"0" * 32)
+
+    with test_lib.FakeTime(rdfvalue.RDFDatetime.FromSecondsSinceEpoch(10)):
+      with mock.patch.object(
+          self.blob_store,
+          "ReadBlobs",
+          side_effect=[{a_id: None}, {a_id: b"aa"}],
+      ):
+        with mock.patch.object(
+            self.blob_store,
+            "CheckBlobsExist",
+            side_effect=[{a_id: False}] * 9 + [{a_id: True}],
+        ):
+          self.blob_store.ReadAndWaitForBlobs(
+              [a_id], timeout=rdfvalue.Duration.From(10, rdfvalue.SECONDS)
+          )
+
+    sleeps = [call[POSITIONAL_ARGS][0] for call in sleep_mock.call_args_list]
+    self.assertLen(sleeps, 10)
+    # Sleeps are jittered, but never drop below half of the backoff.
+    self.assertLess(sleeps[0], 0.1)
+    self.assertGreater(sleeps[5], sleeps[0])
+    self.assertBetween(sleeps[-1], 0.5, 1)
+
   def testReadAndWaitForBlobsStopsAfterTimeout(self):
     a_id = models_blobs.BlobID(b"0" * 32)
     b_id = models_blobs.BlobID(b"1" * 32)
-    effect = [{a_id: b"aa", b_id: None}] + [{b_id: None}] * 3
     time_mock = test_lib.FakeTime(10)
     sleep_call_count = [0]
 
@@ -193,22 +235,27 @@ class BlobStoreTestMixin(stats_test_lib.StatsTestMixin, metaclass=abc.ABCMeta):
 
     with time_mock, mock.patch.object(time, "sleep", sleep):
       with mock.patch.object(
-          self.blob_store, "ReadBlobs", side_effect=effect
+          self.blob_store,
+          "ReadBlobs",
+          return_value={a_id: b"aa", b_id: None},
       ) as read_mock:
-        results = self.blob_store.ReadAndWaitForBlobs(
-            [a_id, b_id], timeout=rdfvalue.Duration.From(3, rdfvalue.SECONDS)
-        )
+        with mock.patch.object(
+            self.blob_store, "CheckBlobsExist", return_value={b_id: False}
+        ) as check_mock:
+          results = self.blob_store.ReadAndWaitForBlobs(
+              [a_id, b_id], timeout=rdfvalue.Duration.From(3, rdfvalue.SECONDS)
+          )
 
     self.assertEqual({a_id: b"aa", b_id: None}, results)
-    self.assertGreaterEqual(read_mock.call_count, 3)
+    read_mock.assert_called_once()
     self.assertCountEqual(
         read_mock.call_args_list[0][POSITIONAL_ARGS][0], [a_id, b_id]
     )
-    for i in range(1, read_mock.call_count):
-      self.assertCountEqual(
-          read_mock.call_args_list[i][POSITIONAL_ARGS][0], [b_id]
-      )
-    self.assertEqual(read_mock.call_count, sleep_call_count[0] + 1)
+    self.assertGreaterEqual(check_mock.call_count, 3)
+    for call in check_mock.call_args_list:
+      self.assertCountEqual(call[POSITIONAL_ARGS][0], [b_id])
+    self.assertEqual(check_mock.call_count, sleep_call_count[0])
+    self.assertGreaterEqual(time_mock.time, 13)
 
   @mock.patch.object(time, "sleep")
   def testReadAndWaitForBlobsPopulatesStats(self, sleep_mock):
@@ -1,7 +1,15 @@
 #!/usr/bin/env python
-"""Benchmark to compare different BlobStore implementations."""
+"""Benchmark to compare different BlobStore implementations.
+
+For example, to compare the local filesystem blob store against the database
+one:
+
+  benchmark --target=DbBlobStore,FilesystemBlobStore --batch_size=10
+"""
 
 import io
+import shutil
+import tempfile
 import time
 from typing import IO
 
@@ -12,6 +20,7 @@ import numpy as np
 from grr_response_core.lib import rdfvalue
 from grr_response_server import blob_store
 from grr_response_server import server_startup
+from grr_response_server.blob_stores import filesystem_blob_store
 from grr_response_server.models import blobs as models_blobs
 
 
@@ -36,13 +45,36 @@ _PER_SIZE_DURATION_SECONDS = flags.DEFINE_integer(
     help="Benchmark duration per blob size in seconds.",
 )
 
+_BATCH_SIZE = flags.DEFINE_integer(
+    "batch_size",
+    default=1,
+    help=(
+        "Number of blobs written, read or checked in a single call. Batches "
+        "larger than 1 show the benefits of concurrent implementations."
+    ),
+)
+
+_FILESYSTEM_PATH = flags.DEFINE_string(
+    "filesystem_path",
+    default=None,
+    help=(
+        "Directory to store blobs in when benchmarking FilesystemBlobStore. "
+        "If not set, a temporary directory is used and removed afterwards."
+    ),
+)
+
 
-def _MakeBlobStore(blobstore_name):
+def _MakeBlobStore(blobstore_name, temp_dir):
   try:
     cls = blob_store.REGISTRY[blobstore_name]
   except KeyError:
     raise ValueError("No blob store %s found." % blobstore_name)
-  return blob_store.BlobStoreValidationWrapper(cls())
+
+  if cls is filesystem_blob_store.FilesystemBlobStore:
+    bs = cls(_FILESYSTEM_PATH.value or temp_dir)
+  else:
+    bs = cls()
+  return blob_store.BlobStoreValidationWrapper(bs)
 
 
 def _MakeRandomBlob(
@@ -60,16 +92,17 @@ def _Timed(fn, *args, **kwargs):
   return result, time.time() - start
 
 
-def _PrintStats(size, size_b, durations):
+def _PrintStats(operation, size, size_b, batch_size, durations):
   durations_ms = np.array(durations) * 1000
   total_s = sum(durations)
-  qps = len(durations) / total_s
+  qps = len(durations) * batch_size / total_s
   print(
-      "{size}\t{total:.1f}s\t{num}\t{qps:.2f}\t{bps: >7}\t{p50:.1f}\t{p90:.1f}"
-      "\t{p95:.1f}\t{p99:.1f}".format(
+      "{op}\t{size}\t{total:.1f}s\t{num}\t{qps:.2f}\t{bps: >7}\t{p50:.1f}"
+      "\t{p90:.1f}\t{p95:.1f}\t{p99:.1f}".format(
+          op=operation,
           size=size,
           total=total_s,
-          num=len(durations),
+          num=len(durations) * batch_size,
           qps=qps,
           bps=str(rdfvalue.ByteSize(int(size_b * qps))).replace("iB", ""),
           p50=np.percentile(durations_ms, 50),
@@ -80,17 +113,47 @@ def _PrintStats(size, size_b, durations):
   )
 
 
-def _RunBenchmark(bs, size_b, duration_sec, random_fd):
-  """Returns a list of runtimes for writes of the given size."""
+def _RunBenchmark(bs, size_b, batch_size, duration_sec, random_fd):
+  """Returns lists of per-call runtimes for each benchmarked operation.
+
+  Blobs of the given size are written in batches for the given duration. The
+  written blobs are then checked for existence and read back in batches of the
+  same size.
+
+  Args:
+    bs: The blob store to benchmark.
+    size_b: Size of a single blob.
+    batch_size: Number of blobs per call.
+    duration_sec: Duration of the write benchmark.
+    random_fd: File to read random blob contents from.
+
+  Returns:
+    A dictionary mapping operation names to lists of per-call durations.
+  """
   start_timestamp = time.time()
-  durations = []
+  write_durations = []
+  blob_id_batches = []
 
   # Monotonically increasing time would be nice, but is unavailable in Py2.
   while time.time() < start_timestamp + duration_sec:
-    blob_id, blob_data = _MakeRandomBlob(size_b, random_fd)
-    _, write_time = _Timed(bs.WriteBlobs, {blob_id: blob_data})
-    durations.append(write_time)
-  return durations
+    blobs = dict(_MakeRandomBlob(size_b, random_fd) for _ in range(batch_size))
+    _, write_time = _Timed(bs.WriteBlobs, blobs)
+    write_durations.append(write_time)
+    blob_id_batches.append(list(blobs))
+
+  check_durations = []
+  read_durations = []
+  for blob_ids in blob_id_batches:
+    _, check_time = _Timed(bs.CheckBlobsExist, blob_ids)
+    check_durations.append(check_time)
+    _, read_time = _Timed(bs.ReadBlobs, blob_ids)
+    read_durations.append(read_time)
+
+  return {
+      "write": write_durations,
+      "check": check_durations,
+      "read": read_durations,
+  }
 
 
 def main(argv):
@@ -105,19 +168,36 @@ def main(argv):
     print("Missing --target. Use one or multiple of: {}.".format(store_names))
     exit(1)
 
-  stores = [_MakeBlobStore(blobstore_name) for blobstore_name in _TARGET.value]
+  temp_dir = tempfile.mkdtemp(prefix="blob_store_benchmark")
+  try:
+    _RunBenchmarks(temp_dir)
+  finally:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _RunBenchmarks(temp_dir):
+  """Runs the benchmark for all blob stores given in --target."""
+  stores = [
+      _MakeBlobStore(blobstore_name, temp_dir)
+      for blobstore_name in _TARGET.value
+  ]
 
   with io.open("/dev/urandom", "rb") as random_fd:
     for blobstore_name, bs in zip(_TARGET.value, stores):
       print()
       print(blobstore_name)
-      print("size\ttotal\tnum\tqps\t  b/sec\tp50\tp90\tp95\tp99")
+      print("op\tsize\ttotal\tnum\tqps\t  b/sec\tp50\tp90\tp95\tp99")
       for size in _SIZES.value:
         size_b = rdfvalue.ByteSize(size)
-        durations = _RunBenchmark(
-            bs, size_b, _PER_SIZE_DURATION_SECONDS.value, random_fd
+        durations_by_op = _RunBenchmark(
+            bs,
+            size_b,
+            _BATCH_SIZE.value,
+            _PER_SIZE_DURATION_SECONDS.value,
+            random_fd,
         )
-        _PrintStats(size, size_b, durations)
+        for operation, durations in durations_by_op.items():
+          _PrintStats(operation, size, size_b, _BATCH_SIZE.value, durations)
 
 
 if __name__ == "__main__":
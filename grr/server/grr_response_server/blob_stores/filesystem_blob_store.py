@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""A BlobStore backed by a directory tree on the local filesystem."""
+
+import collections
+from collections.abc import Iterable
+import logging
+import os
+import tempfile
+from typing import Optional
+
+from grr_response_core import config
+from grr_response_server import blob_store
+from grr_response_server.models import blobs as models_blobs
+
+# Temporary files are created next to their final location (so that the rename
+# is atomic) and are never reported as blobs, since blob names are plain hex.
+_TEMP_FILE_PREFIX = ".tmp-"
+
+_MAX_SHARD_LEVELS = 4
+
+
+class ConfigError(Exception):
+  """Raised when the filesystem blob store config is invalid."""
+
+
+def _ReadFile(path: str) -> Optional[bytes]:
+  """Reads the whole file or returns None if it doesn't exist."""
+  try:
+    with open(path, "rb") as fd:
+      return fd.read()
+  except FileNotFoundError:
+    return None
+
+
+class FilesystemBlobStore(blob_store.BlobStore):
+  """A BlobStore implementation storing blobs as files in a directory tree.
+
+  Every blob is stored in a file named after the hex representation of its
+  id. Files are sharded into `Blobstore.filesystem.shard_levels` levels of
+  directories named after consecutive bytes of the blob id, e.g. blob
+  `0a1b2c...` is stored as `<path>/0a/1b/0a1b2c...` with the default of 2
+  levels. Since blob ids are hashes, the blobs are distributed evenly and each
+  directory stays small.
+
+  Blobs are written to a temporary file first and then renamed into place, so
+  concurrent readers (and writers, possibly in other processes sharing the
+  directory) never observe partially written blobs.
+  """
+
+  def __init__(self, path: Optional[str] = None) -> None:
+    """Instantiates a new FilesystemBlobStore.
+
+    Args:
+      path: Root directory of the blob store. If none is provided,
+        `Blobstore.filesystem.path` is used.
+
+    Raises:
+      ConfigError: if the configuration is invalid.
+    """
+    if path is None:
+      path = config.CONFIG["Blobstore.filesystem.path"]
+    if not path:
+      raise ConfigError("Missing config value for Blobstore.filesystem.path")
+
+    shard_levels = config.CONFIG["Blobstore.filesystem.shard_levels"]
+    if not 0 <= shard_levels <= _MAX_SHARD_LEVELS:
+      raise ConfigError(
+          "Blobstore.filesystem.shard_levels has to be between 0 and "
+          f"{_MAX_SHARD_LEVELS}, got {shard_levels}"
+      )
+
+    self._path = path
+    self._shard_levels = shard_levels
+    self._fsync = config.CONFIG["Blobstore.filesystem.fsync"]
+
+    os.makedirs(self._path, exist_ok=True)
+
+  def _GetDirAndFilename(self, blob_id: models_blobs.BlobID) -> tuple[str, str]:
+    hex_blob_id = bytes(blob_id).hex()
+    shards = [
+        hex_blob_id[2 * i : 2 * i + 2] for i in range(self._shard_levels)
+    ]
+    return os.path.join(self._path, *shards), hex_blob_id
+
+  def _GetPath(self, blob_id: models_blobs.BlobID) -> str:
+    return os.path.join(*self._GetDirAndFilename(blob_id))
+
+  def _WriteBlob(self, blob_id: models_blobs.BlobID, blob: bytes) -> None:
+    """Atomically writes a single blob unless it is already present."""
+    dirname, filename = self._GetDirAndFilename(blob_id)
+    path = os.path.join(dirname, filename)
+    # Blobs are content-addressed, so an existing file already has the right
+    # contents.
+    if os.path.exists(path):
+      return
+
+    os.makedirs(dirname, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=dirname, prefix=_TEMP_FILE_PREFIX)
+    try:
+      with os.fdopen(fd, "wb") as temp_file:
+        temp_file.write(blob)
+        if self._fsync:
+          temp_file.flush()
+          os.fsync(temp_file.fileno())
+      os.replace(temp_path, path)
+    except BaseException:
+      try:
+        os.remove(temp_path)
+      except OSError as e:
+        logging.error("Unable to remove temporary file %s: %s", temp_path, e)
+      raise
+
+    if self._fsync:
+      # Make sure the rename itself is persisted.
+      dir_fd = os.open(dirname, os.O_RDONLY)
+      try:
+        os.fsync(dir_fd)
+      finally:
+        os.close(dir_fd)
+
+  def WriteBlobs(
+      self, blob_id_data_map: dict[models_blobs.BlobID, bytes]
+  ) -> None:
+    """Creates or overwrites blobs."""
+    for blob_id, blob in blob_id_data_map.items():
+      self._WriteBlob(blob_id, blob)
+
+  def ReadBlob(self, blob_id: models_blobs.BlobID) -> Optional[bytes]:
+    """Reads the blob contents, identified by the given BlobID."""
+    return _ReadFile(self._GetPath(blob_id))
+
+  def ReadBlobs(
+      self, blob_ids: Iterable[models_blobs.BlobID]
+  ) -> dict[models_blobs.BlobID, Optional[bytes]]:
+    """Reads all blobs, specified by blob_ids, returning their contents."""
+    return {blob_id: self.ReadBlob(blob_id) for blob_id in blob_ids}
+
+  def CheckBlobExists(self, blob_id: models_blobs.BlobID) -> bool:
+    """Checks if a blob with a given BlobID exists."""
+    return os.path.exists(self._GetPath(blob_id))
+
+  def CheckBlobsExist(
+      self, blob_ids: Iterable[models_blobs.BlobID]
+  ) -> dict[models_blobs.BlobID, bool]:
+    """Checks if blobs for the given identifiers already exist.
+
+    The shard directories serve as an index: blobs falling into the same
+    directory are checked with a single directory listing instead of a `stat`
+    call per blob.
+
+    Args:
+      blob_ids: Blob ids to check.
+
+    Returns:
+      A dictionary mapping blob ids to booleans indicating their existence.
+    """
+    filenames_by_dir = collections.defaultdict(dict)
+    for blob_id in blob_ids:
+      dirname, filename = self._GetDirAndFilename(blob_id)
+      filenames_by_dir[dirname][blob_id] = filename
+
+    result = {}
+    for dirname, filenames in filenames_by_dir.items():
+      if len(filenames) == 1:
+        ((blob_id, filename),) = filenames.items()
+        result[blob_id] = os.path.exists(os.path.join(dirname, filename))
+        continue
+
+      try:
+        existing = set(os.listdir(dirname))
+      except FileNotFoundError:
+        existing = set()
+      for blob_id, filename in filenames.items():
+        result[blob_id] = filename in existing
+
+    return result
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Tests for the filesystem-based blob store."""
+
+import os
+
+from absl import app
+
+from grr_response_server import blob_store_test_mixin
+from grr_response_server.blob_stores import filesystem_blob_store
+from grr_response_server.models import blobs as models_blobs
+from grr.test_lib import test_lib
+
+
+class FilesystemBlobStoreTest(
+    blob_store_test_mixin.BlobStoreTestMixin, test_lib.GRRBaseTest
+):
+
+  def CreateBlobStore(self):
+    self.blob_store_path = os.path.join(self.temp_dir, "blobs")
+    return (
+        filesystem_blob_store.FilesystemBlobStore(self.blob_store_path),
+        lambda: None,
+    )
+
+  def testBlobsAreShardedIntoDirectories(self):
+    blob_id = models_blobs.BlobID(bytes(range(32)))
+    self.blob_store.WriteBlobs({blob_id: b"foo"})
+
+    path = os.path.join(self.blob_store_path, "00", "01", bytes(blob_id).hex())
+    with open(path, "rb") as fd:
+      self.assertEqual(fd.read(), b"foo")
+
+  def testShardLevelsAreConfigurable(self):
+    with test_lib.ConfigOverrider({"Blobstore.filesystem.shard_levels": 0}):
+      bs = filesystem_blob_store.FilesystemBlobStore(self.blob_store_path)
+
+    blob_id = models_blobs.BlobID(bytes(range(32)))
+    bs.WriteBlobs({blob_id: b"foo"})
+
+    self.assertEqual(os.listdir(self.blob_store_path), [bytes(blob_id).hex()])
+
+  def testInvalidShardLevelsRaise(self):
+    with test_lib.ConfigOverrider({"Blobstore.filesystem.shard_levels": 5}):
+      with self.assertRaises(filesystem_blob_store.ConfigError):
+        filesystem_blob_store.FilesystemBlobStore(self.blob_store_path)
+
+  def testMissingPathRaises(self):
+    with test_lib.ConfigOverrider({"Blobstore.filesystem.path": ""}):
+      with self.assertRaises(filesystem_blob_store.ConfigError):
+        filesystem_blob_store.FilesystemBlobStore()
+
+  def testEmptyBlobCanBeWrittenAndThenRead(self):
+    blob_id = models_blobs.BlobID(b"01234567" * 4)
+    self.blob_store.WriteBlobs({blob_id: b""})
+
+    self.assertEqual(self.blob_store.ReadBlob(blob_id), b"")
+
+  def testNoTemporaryFilesAreLeftBehind(self):
+    blob_ids = [models_blobs.BlobID(bytes([i]) * 32) for i in range(4)]
+    self.blob_store.WriteBlobs({blob_id: b"foo" for blob_id in blob_ids})
+
+    for _, _, filenames in os.walk(self.blob_store_path):
+      for filename in filenames:
+        self.assertFalse(filename.startswith("."), filename)
+
+  def testCheckBlobsExistWithManyBlobsInSameShard(self):
+    blob_ids = [
+        models_blobs.BlobID(b"\x00\x00" + bytes([i]) * 30) for i in range(3)
+    ]
+    self.blob_store.WriteBlobs({blob_ids[0]: b"foo", blob_ids[1]: b"bar"})
+
+    result = self.blob_store.CheckBlobsExist(blob_ids)
+    self.assertEqual(
+        result, {blob_ids[0]: True, blob_ids[1]: True, blob_ids[2]: False}
+    )
+
+
+if __name__ == "__main__":
+  app.run(test_lib.main)
@@ -1,25 +1,98 @@
 #!/usr/bin/env python
 """A BlobStore backed by Google Cloud Storage."""
 
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable
+from concurrent import futures
 import logging
-from typing import Optional
+import threading
+import time
+from typing import Optional, TypeVar
 
+import google.auth
+from google.auth.transport import requests as auth_requests
 from google.cloud import exceptions
 from google.cloud import storage
 from google.cloud.storage.retry import DEFAULT_RETRY
+from requests import adapters
 
 from grr_response_core import config
+from grr_response_core.lib import utils
 from grr_response_server import blob_store
 from grr_response_server.models import blobs as models_blobs
 
+_T = TypeVar("_T")
+
 
 class ConfigError(Exception):
   """Raised when the GCS blob store config is invalid."""
 
 
+class BatchDeadlineExceededError(Exception):
+  """Raised when a batch of GCS operations doesn't finish in time."""
+
+
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR: Optional[futures.ThreadPoolExecutor] = None
+_EXECUTOR_SIZE: Optional[int] = None
+
+
+def _Executor(size: int) -> futures.ThreadPoolExecutor:
+  """Returns the process-wide executor used to issue GCS requests."""
+  global _EXECUTOR, _EXECUTOR_SIZE
+
+  with _EXECUTOR_LOCK:
+    if _EXECUTOR is None or _EXECUTOR_SIZE != size:
+      if _EXECUTOR is not None:
+        # Only happens if the config changes (e.g. in tests). Calls already
+        # submitted to the old executor still complete.
+        _EXECUTOR.shutdown(wait=False)
+      _EXECUTOR = futures.ThreadPoolExecutor(
+          max_workers=size, thread_name_prefix="GCSBlobStore"
+      )
+      _EXECUTOR_SIZE = size
+
+    return _EXECUTOR
+
+
+class _BlobExistenceCache:
+  """Remembers which blobs are known to be present or absent in the bucket.
+
+  Blobs are immutable and never deleted, so a blob that was seen once is
+  considered present forever (until evicted from the cache). Blobs seen as
+  absent may be written by other processes at any time, so the negative
+  entries expire after a short TTL and are only used as a hint to skip the
+  existence check before an upload.
+  """
+
+  def __init__(self, max_size: int, negative_ttl: float) -> None:
+    self._present = utils.FastStore(max_size=max_size)
+    self._absent = utils.FastStore(max_size=max_size)
+    self._negative_ttl = negative_ttl
+
+  def IsKnownPresent(self, blob_id: models_blobs.BlobID) -> bool:
+    return blob_id in self._present
+
+  def IsKnownAbsent(self, blob_id: models_blobs.BlobID) -> bool:
+    try:
+      return self._absent.Get(blob_id) > time.time()
+    except KeyError:
+      return False
+
+  def MarkPresent(self, blob_id: models_blobs.BlobID) -> None:
+    self._absent.Pop(blob_id)
+    self._present.Put(blob_id, True)
+
+  def MarkAbsent(self, blob_id: models_blobs.BlobID) -> None:
+    self._absent.Put(blob_id, time.time() + self._negative_ttl)
+
+
 class GCSBlobStore(blob_store.BlobStore):
-  """A BlobStore implementation backed by Google Cloud Storage."""
+  """A BlobStore implementation backed by Google Cloud Storage.
+
+  Requests for the blobs of a batch are issued on a process-wide executor (at
+  most `Blobstore.gcs.max_concurrency` at a time across all callers) over an
+  HTTP connection pool of the same size.
+  """
 
   def __init__(self):
     """Instantiates a new GCSBlobStore."""
@@ -31,82 +104,178 @@ class GCSBlobStore(blob_store.BlobStore):
     project = config.CONFIG["Blobstore.gcs.project"]
     bucket_name = config.CONFIG["Blobstore.gcs.bucket"]
     blob_prefix = config.CONFIG["Blobstore.gcs.blob_prefix"]
+    max_concurrency = config.CONFIG["Blobstore.gcs.max_concurrency"]
+
+    credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+    # By default `requests` keeps at most 10 connections per host, which would
+    # make the concurrent requests below contend for (or churn) connections.
+    # The pool is as large as the executor, so it never overflows.
+    adapter = adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_concurrency
+    )
+    session = auth_requests.AuthorizedSession(credentials)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
-    self._client = storage.Client(project=project)
+    self._client = storage.Client(
+        project=project, credentials=credentials, _http=session
+    )
 
     self._bucket = self._client.bucket(bucket_name)
     self._blob_prefix = blob_prefix
 
+    self._max_concurrency = max_concurrency
+    self._batch_deadline = config.CONFIG["Blobstore.gcs.batch_deadline_seconds"]
+    self._existence_cache = _BlobExistenceCache(
+        max_size=config.CONFIG["Blobstore.gcs.existence_cache_size"],
+        negative_ttl=config.CONFIG[
+            "Blobstore.gcs.negative_existence_cache_ttl_seconds"
+        ],
+    )
+
   def _GetFilename(self, blob_id: models_blobs.BlobID) -> str:
     hex_blob_id = bytes(blob_id).hex()
     return f"{self._blob_prefix}{hex_blob_id}"
 
-  def WriteBlobs(
-      self, blob_id_data_map: dict[models_blobs.BlobID, bytes]
-  ) -> None:
-    """Creates or overwrites blobs."""
-    for blob_id, blob in blob_id_data_map.items():
-      filename = self._GetFilename(blob_id)
+  def _RunConcurrently(
+      self,
+      fn: Callable[[models_blobs.BlobID], _T],
+      blob_ids: Iterable[models_blobs.BlobID],
+  ) -> dict[models_blobs.BlobID, _T]:
+    """Runs `fn` concurrently for every blob id and collects the results.
+
+    All calls share one process-wide executor, so concurrent batches together
+    never issue more than `Blobstore.gcs.max_concurrency` requests at a time.
+
+    Args:
+      fn: A function to call for every blob id.
+      blob_ids: Blob ids to run the function for.
+
+    Returns:
+      A dictionary mapping blob ids to results of the corresponding calls.
+
+    Raises:
+      BatchDeadlineExceededError: if not all calls finished within the batch
+        deadline.
+      Exception: any exception raised by one of the calls.
+    """
+    blob_ids = list(blob_ids)
+    if not blob_ids:
+      return {}
 
-      try:
-        b = self._bucket.blob(filename)
+    executor = _Executor(self._max_concurrency)
+    fs = {blob_id: executor.submit(fn, blob_id) for blob_id in blob_ids}
+    _, not_done = futures.wait(fs.values(), timeout=self._batch_deadline)
+
+    if not_done:
+      # Operations that are already running are left to finish in the
+      # background, the queued ones are dropped.
+      for f in not_done:
+        f.cancel()
+      raise BatchDeadlineExceededError(
+          f"{len(not_done)} out of {len(fs)} GCS operations did not finish "
+          f"within {self._batch_deadline} seconds."
+      )
+
+    return {blob_id: f.result() for blob_id, f in fs.items()}
+
+  def _WriteBlob(self, blob_id: models_blobs.BlobID, blob: bytes) -> None:
+    """Uploads a single blob unless it is already present."""
+    filename = self._GetFilename(blob_id)
+
+    try:
+      b = self._bucket.blob(filename)
+      # Overwriting existing blobs may cause GCS to throttle our requests.
+      # That is particularly bad, since write requests run on the
+      # (Fleetspeak) message receipt hot path, but will thus get semi-stuck
+      # in a throttling-induced-error/retry cycle. To mitigate that, we'll
+      # only go ahead with the upload if we couldn't successfully determine
+      # that the blob was already present in the blob store bucket. Blobs that
+      # were recently found to be absent are uploaded right away.
+      if not self._existence_cache.IsKnownAbsent(blob_id):
+        # Note: using a try/catch-all block here because we only care if the
+        # blob existence check is successful or not; on any error, we'll just
+        # proceed with the upload.
         try:
-          # Overwriting existing blobs may cause GCS to throttle our requests.
-          # That is particularly bad, since write requests run on the
-          # (Fleetspeak) message receipt hot path, but will thus get semi-stuck
-          # in a throttling-induced-error/retry cycle. To mitigate that, we'll
-          # only go ahead with the upload if we couldn't successfully determine
-          # that the blob was already present in the blob store bucket.
-          # Note: using a try/catch-all block here because we only care if the
-          # blob existence check is successful or not; on any error, we'll just
-          # proceed with the upload.
           if b.exists():
-            continue
+            self._existence_cache.MarkPresent(blob_id)
+            return
         except Exception as e:  # pylint: disable=broad-exception-caught
           logging.error(
               "Error while checking if blob %s exists: %s", blob_id, e
           )
-        logging.debug("Writing blob '%s' as '%s'", blob_id, filename)
-        b.upload_from_string(
-            data=blob,
-            content_type="application/octet-stream",
-            retry=DEFAULT_RETRY,
-        )
-      except Exception as e:  # pylint: disable=broad-exception-caught
-        logging.exception(
-            "Unable to write blob %s to datastore, %s", blob_id, e
-        )
+      logging.debug("Writing blob '%s' as '%s'", blob_id, filename)
+      b.upload_from_string(
+          data=blob,
+          content_type="application/octet-stream",
+          retry=DEFAULT_RETRY,
+      )
+      self._existence_cache.MarkPresent(blob_id)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+      logging.exception("Unable to write blob %s to datastore, %s", blob_id, e)
+
+  def WriteBlobs(
+      self, blob_id_data_map: dict[models_blobs.BlobID, bytes]
+  ) -> None:
+    """Creates or overwrites blobs."""
+    blob_ids = [
+        blob_id
+        for blob_id in blob_id_data_map
+        if not self._existence_cache.IsKnownPresent(blob_id)
+    ]
+
+    try:
+      self._RunConcurrently(
+          lambda blob_id: self._WriteBlob(blob_id, blob_id_data_map[blob_id]),
+          blob_ids,
+      )
+    except BatchDeadlineExceededError as e:
+      # Write errors are only logged (see `_WriteBlob`), a missed deadline is
+      # not different.
+      logging.error("Unable to write blobs to datastore: %s", e)
 
   def ReadBlob(self, blob_id: models_blobs.BlobID) -> Optional[bytes]:
     """Reads the blob contexts, identified by the given BlobID."""
     filename = self._GetFilename(blob_id)
     try:
       b = self._bucket.blob(filename)
-      return b.download_as_bytes(retry=DEFAULT_RETRY)
+      data = b.download_as_bytes(retry=DEFAULT_RETRY)
     except exceptions.NotFound:
       return None
     except Exception as e:
       logging.error("Unable to read blob %s, %s", blob_id, e)
       raise
 
+    self._existence_cache.MarkPresent(blob_id)
+    return data
+
   def ReadBlobs(
       self, blob_ids: Iterable[models_blobs.BlobID]
   ) -> dict[models_blobs.BlobID, Optional[bytes]]:
     """Reads all blobs, specified by blob_ids, returning their contents."""
-    return {blob_id: self.ReadBlob(blob_id) for blob_id in blob_ids}
+    return self._RunConcurrently(self.ReadBlob, blob_ids)
 
   def CheckBlobExists(self, blob_id: models_blobs.BlobID) -> bool:
     """Checks if a blob with a given BlobID exists."""
+    if self._existence_cache.IsKnownPresent(blob_id):
+      return True
+
     filename = self._GetFilename(blob_id)
     try:
       b = self._bucket.blob(filename)
-      return b.exists(retry=DEFAULT_RETRY)
+      exists = b.exists(retry=DEFAULT_RETRY)
     except Exception as e:
       logging.error("Unable to check for blob %s, %s", blob_id, e)
       raise
 
+    if exists:
+      self._existence_cache.MarkPresent(blob_id)
+    else:
+      self._existence_cache.MarkAbsent(blob_id)
+    return exists
+
   def CheckBlobsExist(
       self, blob_ids: Iterable[models_blobs.BlobID]
   ) -> dict[models_blobs.BlobID, bool]:
     """Checks if blobs for the given identifiers already exist."""
-    return {blob_id: self.CheckBlobExists(blob_id) for blob_id in blob_ids}
+    return self._RunConcurrently(self.CheckBlobExists, blob_ids)
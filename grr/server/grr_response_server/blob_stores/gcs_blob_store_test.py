@@ -2,12 +2,17 @@
 """Tests for the GCS Blobstore implementation."""
 
 import os
+import threading
 import unittest
+from unittest import mock
 import uuid
 
 from absl import app
+import google.auth
+from google.auth import credentials as auth_credentials
 from google.cloud import storage
 
+from grr_response_core import config
 from grr_response_server import blob_store_test_mixin
 from grr_response_server.blob_stores import gcs_blob_store
 from grr_response_server.models import blobs as models_blobs
@@ -31,6 +36,14 @@ class GCSBlobStoreTest(
     project = "test-project"
     bucket_name = f"test-bucket-{uuid.uuid4()}"
 
+    # The emulator doesn't need (nor check) any credentials.
+    cls._auth_patcher = mock.patch.object(
+        google.auth,
+        "default",
+        return_value=(auth_credentials.AnonymousCredentials(), project),
+    )
+    cls._auth_patcher.start()
+
     cls._gcs_bucket = storage.Client(project=project).bucket(bucket_name)
     cls._gcs_config_overrider = test_lib.ConfigOverrider({
         "Blobstore.gcs.project": project,
@@ -41,6 +54,7 @@ class GCSBlobStoreTest(
   @classmethod
   def tearDownClass(cls):
     cls._gcs_config_overrider.Stop()
+    cls._auth_patcher.stop()
     super().tearDownClass()
 
   def setUp(self):
@@ -76,5 +90,137 @@ class GCSBlobStoreTest(
       self.assertTrue(expected_blob.exists())
 
 
+class GCSBlobStoreWithFakeClientTest(test_lib.GRRBaseTest):
+  """Tests of GCSBlobStore request handling that don't need GCS emulation."""
+
+  def setUp(self):
+    super().setUp()
+
+    config_overrider = test_lib.ConfigOverrider({
+        "Blobstore.gcs.project": "test-project",
+        "Blobstore.gcs.bucket": "test-bucket",
+        "Blobstore.gcs.batch_deadline_seconds": 5,
+    })
+    config_overrider.Start()
+    self.addCleanup(config_overrider.Stop)
+
+    auth_patcher = mock.patch.object(
+        google.auth,
+        "default",
+        return_value=(auth_credentials.AnonymousCredentials(), "test-project"),
+    )
+    auth_patcher.start()
+    self.addCleanup(auth_patcher.stop)
+
+    client_patcher = mock.patch.object(storage, "Client")
+    client_cls = client_patcher.start()
+    self.addCleanup(client_patcher.stop)
+
+    self.blobs = {}
+    bucket = client_cls.return_value.bucket.return_value
+    bucket.blob.side_effect = lambda name: self.blobs.setdefault(
+        name, mock.MagicMock()
+    )
+
+    self.client_cls = client_cls
+    self.blob_store = gcs_blob_store.GCSBlobStore()
+
+  def testClientUsesSessionWithPoolOfMaxConcurrencySize(self):
+    _, kwargs = self.client_cls.call_args
+    session = kwargs["_http"]
+    adapter = session.get_adapter("https://storage.googleapis.com")
+    self.assertEqual(
+        adapter._pool_maxsize,  # pylint: disable=protected-access
+        config.CONFIG["Blobstore.gcs.max_concurrency"],
+    )
+
+  def testBlobStoresShareExecutor(self):
+    blob_id = models_blobs.BlobID(b"0123" * 8)
+    self.blobs[bytes(blob_id).hex()] = mock.MagicMock()
+
+    self.blob_store.CheckBlobsExist([blob_id])
+    executor = gcs_blob_store._EXECUTOR  # pylint: disable=protected-access
+    self.assertIsNotNone(executor)
+
+    gcs_blob_store.GCSBlobStore().CheckBlobsExist([blob_id])
+    # pylint: disable=protected-access
+    self.assertIs(gcs_blob_store._EXECUTOR, executor)
+
+  def testWriteBlobsSkipsBlobsKnownToExist(self):
+    blob_id = models_blobs.BlobID(b"0123" * 8)
+    blob = self.blobs[bytes(blob_id).hex()] = mock.MagicMock()
+    blob.exists.return_value = False
+
+    self.blob_store.WriteBlobs({blob_id: b"foo"})
+    self.assertEqual(blob.exists.call_count, 1)
+    self.assertEqual(blob.upload_from_string.call_count, 1)
+
+    self.blob_store.WriteBlobs({blob_id: b"foo"})
+    self.assertTrue(self.blob_store.CheckBlobExists(blob_id))
+
+    self.assertEqual(blob.exists.call_count, 1)
+    self.assertEqual(blob.upload_from_string.call_count, 1)
+
+  def testWriteBlobsSkipsExistenceCheckForBlobsKnownToBeAbsent(self):
+    blob_id = models_blobs.BlobID(b"0123" * 8)
+    blob = self.blobs[bytes(blob_id).hex()] = mock.MagicMock()
+    blob.exists.return_value = False
+
+    self.assertFalse(self.blob_store.CheckBlobExists(blob_id))
+    self.blob_store.WriteBlobs({blob_id: b"foo"})
+
+    self.assertEqual(blob.exists.call_count, 1)
+    blob.upload_from_string.assert_called_once()
+
+  def testReadBlobsReadsConcurrently(self):
+    blob_ids = [models_blobs.BlobID(bytes([i]) * 32) for i in range(4)]
+    barrier = threading.Barrier(len(blob_ids), timeout=5)
+
+    def MakeDownload(data):
+
+      def Download(*args, **kwargs):
+        del args, kwargs  # Unused.
+        # Raises unless all the reads are running at the same time.
+        barrier.wait()
+        return data
+
+      return Download
+
+    for blob_id in blob_ids:
+      blob = self.blobs[bytes(blob_id).hex()] = mock.MagicMock()
+      blob.download_as_bytes.side_effect = MakeDownload(bytes(blob_id))
+
+    result = self.blob_store.ReadBlobs(blob_ids)
+    self.assertEqual(result, {blob_id: bytes(blob_id) for blob_id in blob_ids})
+
+  def testCheckBlobsExistRaisesWhenBatchDeadlineIsExceeded(self):
+    blob_id = models_blobs.BlobID(b"0123" * 8)
+    blob = self.blobs[bytes(blob_id).hex()] = mock.MagicMock()
+
+    released = threading.Event()
+    finished = threading.Event()
+
+    def Exists(*args, **kwargs):
+      del args, kwargs  # Unused.
+      released.wait()
+      finished.set()
+      return True
+
+    blob.exists.side_effect = Exists
+
+    with test_lib.ConfigOverrider(
+        {"Blobstore.gcs.batch_deadline_seconds": 1}
+    ):
+      blob_store = gcs_blob_store.GCSBlobStore()
+
+    with self.assertRaises(gcs_blob_store.BatchDeadlineExceededError):
+      blob_store.CheckBlobsExist([blob_id])
+
+    # The call that missed the deadline keeps running in the background.
+    self.assertFalse(finished.is_set())
+    released.set()
+    self.assertTrue(finished.wait(5))
+
+
 if __name__ == "__main__":
   app.run(test_lib.main)
@@ -3,6 +3,7 @@
 
 from grr_response_server import blob_store
 from grr_response_server.blob_stores import db_blob_store
+from grr_response_server.blob_stores import filesystem_blob_store
 from grr_response_server.blob_stores import gcs_blob_store
 
 
@@ -14,3 +15,6 @@ def RegisterBlobStores():
   blob_store.REGISTRY[gcs_blob_store.GCSBlobStore.__name__] = (
       gcs_blob_store.GCSBlobStore
   )
+  blob_store.REGISTRY[filesystem_blob_store.FilesystemBlobStore.__name__] = (
+      filesystem_blob_store.FilesystemBlobStore
+  )
@@ -4,10 +4,16 @@
 An index of client machines, associating likely identifiers to client IDs.
 """
 
+import array
+import bisect
+import collections
 import functools
 import operator
-from typing import Collection, Iterable, Mapping, Sequence
+import re
+import threading
+from typing import Collection, Iterable, Mapping, Optional, Sequence
 
+from grr_response_core import config
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.util import precondition
 from grr_response_server import data_store
@@ -42,6 +48,177 @@ def GetClientIDsForHostnames(
   return result
 
 
+_CLIENT_ID_RE = re.compile(r"^C\.[0-9a-f]{16}$")
+
+
+def _PostingList(client_ids: Iterable[str]) -> Optional[array.array]:
+  """Packs client ids into a sorted array of integers.
+
+  Args:
+    client_ids: Client ids to pack.
+
+  Returns:
+    A sorted array of client ids as integers or `None` if some of the ids are
+    not in the canonical form (and thus can't be packed without changing their
+    sort order).
+  """
+  values = set()
+  for client_id in client_ids:
+    if not _CLIENT_ID_RE.match(client_id):
+      return None
+    values.add(int(client_id[2:], 16))
+  return array.array("Q", sorted(values))
+
+
+def _ClientID(value: int) -> str:
+  return "C.%016x" % value
+
+
+def _Contains(posting_list: array.array, value: int) -> bool:
+  i = bisect.bisect_left(posting_list, value)
+  return i < len(posting_list) and posting_list[i] == value
+
+
+def _Intersect(posting_lists: Sequence[array.array]) -> Sequence[int]:
+  """Intersects sorted posting lists, keeping the result sorted."""
+  posting_lists = sorted(posting_lists, key=len)
+  result = posting_lists[0]
+  for posting_list in posting_lists[1:]:
+    result = [value for value in result if _Contains(posting_list, value)]
+  return result
+
+
+class _KeywordIndex(object):
+  """An in-memory cache of keyword posting lists.
+
+  Posting lists are read from the database on first use and kept as sorted
+  arrays of integers, so that searches can be intersected and paginated without
+  going to the database. Changes made through `ClientIndex` in this process are
+  applied to the cached lists right away. Changes made by other processes are
+  picked up when a list is re-read from the database, which happens once it is
+  older than `max_age`.
+  """
+
+  def __init__(self, max_keywords: int, max_age: rdfvalue.Duration):
+    self._max_keywords = max_keywords
+    self._max_age = max_age
+    self._lock = threading.Lock()
+    # Maps keywords to (read time, posting list) pairs in LRU order. Posting
+    # lists are never modified in place, updates replace them with new arrays,
+    # so they can be used after the lock is released.
+    self._entries: collections.OrderedDict[
+        str, tuple[rdfvalue.RDFDatetime, array.array]
+    ] = collections.OrderedDict()
+
+  def Read(
+      self,
+      keywords: Collection[str],
+      start_time: rdfvalue.RDFDatetime,
+  ) -> Optional[Sequence[array.array]]:
+    """Returns posting lists for the given keywords.
+
+    Args:
+      keywords: Normalized keywords to read posting lists for.
+      start_time: Only clients that got a keyword after this time are included
+        in posting lists read from the database.
+
+    Returns:
+      A posting list for each of the keywords or `None` if some of the posting
+      lists can't be represented in memory.
+    """
+    now = rdfvalue.RDFDatetime.Now()
+    result = {}
+
+    with self._lock:
+      for keyword in keywords:
+        entry = self._entries.get(keyword)
+        if entry is not None and now - entry[0] < self._max_age:
+          self._entries.move_to_end(keyword)
+          result[keyword] = entry[1]
+
+    missing = [keyword for keyword in keywords if keyword not in result]
+    if missing:
+      keyword_map = data_store.REL_DB.ListClientsForKeywords(
+          missing, start_time=start_time
+      )
+      for keyword in missing:
+        posting_list = _PostingList(keyword_map.get(keyword, []))
+        if posting_list is None:
+          return None
+        result[keyword] = posting_list
+
+      with self._lock:
+        for keyword in missing:
+          self._entries[keyword] = (now, result[keyword])
+          self._entries.move_to_end(keyword)
+        while len(self._entries) > self._max_keywords:
+          self._entries.popitem(last=False)
+
+    return [result[keyword] for keyword in keywords]
+
+  def Add(self, client_ids: Iterable[str], keywords: Iterable[str]) -> None:
+    """Adds clients to cached posting lists of the given keywords."""
+    self._Update(client_ids, keywords, add=True)
+
+  def Remove(self, client_ids: Iterable[str], keywords: Iterable[str]) -> None:
+    """Removes clients from cached posting lists of the given keywords."""
+    self._Update(client_ids, keywords, add=False)
+
+  def _Update(
+      self,
+      client_ids: Iterable[str],
+      keywords: Iterable[str],
+      add: bool,
+  ) -> None:
+    """Adds or removes clients to or from the cached posting lists."""
+    client_ids = list(client_ids)
+    with self._lock:
+      for keyword in keywords:
+        entry = self._entries.get(keyword)
+        if entry is None:
+          continue
+
+        read_time, posting_list = entry
+        # Copying an array is cheap, inserting and deleting elements only moves
+        # memory around.
+        posting_list = array.array("Q", posting_list)
+        for client_id in client_ids:
+          if not _CLIENT_ID_RE.match(client_id):
+            # The posting list can't hold this client, it has to be re-read
+            # from the database.
+            del self._entries[keyword]
+            break
+
+          value = int(client_id[2:], 16)
+          i = bisect.bisect_left(posting_list, value)
+          present = i < len(posting_list) and posting_list[i] == value
+          if add and not present:
+            posting_list.insert(i, value)
+          elif not add and present:
+            del posting_list[i]
+        else:
+          self._entries[keyword] = (read_time, posting_list)
+
+
+_keyword_index_lock = threading.Lock()
+_keyword_index: Optional[_KeywordIndex] = None
+
+
+def _GetKeywordIndex() -> Optional[_KeywordIndex]:
+  """Returns the in-memory keyword index or `None` if it is disabled."""
+  global _keyword_index
+
+  max_age = config.CONFIG["Server.client_index_cache_ttl"]
+  max_keywords = config.CONFIG["Server.client_index_cache_size"]
+  if not max_age or not max_keywords:
+    return None
+
+  with _keyword_index_lock:
+    if _keyword_index is None:
+      _keyword_index = _KeywordIndex(max_keywords, max_age)
+    return _keyword_index
+
+
 class ClientIndex(object):
   """An index of client machines."""
 
@@ -75,14 +252,22 @@ class ClientIndex(object):
 
     return start_time, filtered_keywords
 
-  def LookupClients(self, keywords: Iterable[str]) -> Sequence[str]:
+  def LookupClients(
+      self,
+      keywords: Iterable[str],
+      offset: int = 0,
+      count: Optional[int] = None,
+  ) -> Sequence[str]:
     """Returns a list of client URNs associated with keywords.
 
     Args:
       keywords: The list of keywords to search by.
+      offset: The number of matching clients to skip.
+      count: The maximum number of clients to return. All matching clients are
+        returned if not set.
 
     Returns:
-      A list of client URNs.
+      A sorted list of client URNs.
 
     Raises:
       ValueError: A string (single keyword) was passed instead of an iterable.
@@ -92,17 +277,32 @@ class ClientIndex(object):
           "Keywords should be an iterable, not a string (got %s)." % keywords
       )
 
+    keywords = list(keywords)
     start_time, filtered_keywords = self._AnalyzeKeywords(keywords)
+    normalized_keywords = list(map(self._NormalizeKeyword, filtered_keywords))
+    end = None if count is None else offset + count
+
+    # Searches with an explicit start time are rare, these are not cached.
+    keyword_index = _GetKeywordIndex()
+    if keyword_index is not None and not any(
+        k.startswith(self.START_TIME_PREFIX) for k in keywords
+    ):
+      posting_lists = keyword_index.Read(normalized_keywords, start_time)
+      if posting_lists is not None:
+        return [
+            _ClientID(value)
+            for value in _Intersect(posting_lists)[offset:end]
+        ]
 
     keyword_map = data_store.REL_DB.ListClientsForKeywords(
-        list(map(self._NormalizeKeyword, filtered_keywords)),
+        normalized_keywords,
         start_time=start_time,
     )
 
     relevant_set = functools.reduce(
         operator.and_, map(set, keyword_map.values())
     )
-    return sorted(relevant_set)
+    return sorted(relevant_set)[offset:end]
 
   def ReadClientPostingLists(
       self, keywords: Iterable[str]
@@ -221,6 +421,10 @@ class ClientIndex(object):
 
     data_store.REL_DB.AddClientKeywords(client.client_id, keywords)
 
+    keyword_index = _GetKeywordIndex()
+    if keyword_index is not None:
+      keyword_index.Add([client.client_id], keywords)
+
   def AddClientLabels(self, client_id: str, labels: Iterable[str]):
     self.MultiAddClientLabels([client_id], labels)
 
@@ -244,6 +448,10 @@ class ClientIndex(object):
 
     data_store.REL_DB.MultiAddClientKeywords(client_ids, keywords)
 
+    keyword_index = _GetKeywordIndex()
+    if keyword_index is not None:
+      keyword_index.Add(client_ids, keywords)
+
   def RemoveAllClientLabels(self, client_id: str):
     """Removes all labels for a given client.
 
@@ -262,9 +470,16 @@ class ClientIndex(object):
       client_id: The client_id.
       labels: A list of labels to remove.
     """
+    keywords = set()
     for label in labels:
       keyword = self._NormalizeKeyword(label)
       # This might actually delete a keyword with the same name as the label (if
       # there is one).
       data_store.REL_DB.RemoveClientKeyword(client_id, keyword)
       data_store.REL_DB.RemoveClientKeyword(client_id, "label:%s" % keyword)
+      keywords.add(keyword)
+      keywords.add("label:%s" % keyword)
+
+    keyword_index = _GetKeywordIndex()
+    if keyword_index is not None:
+      keyword_index.Remove([client_id], keywords)
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 import binascii
 import ipaddress
+from unittest import mock
 
 from absl import app
 
+from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.rdfvalues import client as rdf_client
 from grr_response_core.lib.rdfvalues import client_network as rdf_client_network
 from grr_response_server import client_index
@@ -223,6 +225,95 @@ class ClientIndexTest(test_lib.GRRBaseTest):
     self.assertCountEqual(expected_hosts, labelled_hosts)
 
 
+class ClientIndexWithKeywordIndexTest(ClientIndexTest):
+  """Runs client index tests with the in-memory keyword index enabled."""
+
+  def setUp(self):
+    super().setUp()
+
+    config_overrider = test_lib.ConfigOverrider({
+        "Server.client_index_cache_ttl": rdfvalue.Duration.From(
+            60, rdfvalue.SECONDS
+        ),
+    })
+    config_overrider.Start()
+    self.addCleanup(config_overrider.Stop)
+
+    # Every test gets an empty index.
+    index_patcher = mock.patch.object(client_index, "_keyword_index", None)
+    index_patcher.start()
+    self.addCleanup(index_patcher.stop)
+
+  def _AddClients(self, n):
+    index = client_index.ClientIndex()
+    clients = self._SetupClients(n)
+    for client_id, client in clients.items():
+      data_store.REL_DB.WriteClientMetadata(client_id)
+      index.AddClient(client)
+    return clients
+
+  def testLookupIsServedFromMemory(self):
+    clients = self._AddClients(3)
+    index = client_index.ClientIndex()
+    self.assertCountEqual(index.LookupClients(["windows"]), list(clients))
+
+    with mock.patch.object(
+        data_store.REL_DB,
+        "ListClientsForKeywords",
+        wraps=data_store.REL_DB.ListClientsForKeywords,
+    ) as list_clients:
+      self.assertCountEqual(index.LookupClients(["windows"]), list(clients))
+      self.assertEqual(
+          index.LookupClients(["windows", "host-2"]), ["C.1000000000000002"]
+      )
+
+    # Only the "host-2" list had to be read.
+    self.assertEqual(list_clients.call_count, 1)
+
+  def testLookupClientsPaginates(self):
+    clients = self._AddClients(5)
+    index = client_index.ClientIndex()
+
+    self.assertEqual(
+        index.LookupClients(["."], offset=1, count=2), sorted(clients)[1:3]
+    )
+    self.assertEqual(index.LookupClients(["."], offset=4), sorted(clients)[4:])
+
+  def testLabelChangesAreVisibleImmediately(self):
+    client_id = next(iter(self._AddClients(1)))
+    index = client_index.ClientIndex()
+    self.assertEmpty(index.LookupClients(["label:foo"]))
+
+    index.AddClientLabels(client_id, ["foo"])
+    self.assertEqual(index.LookupClients(["label:foo"]), [client_id])
+
+    index.RemoveClientLabels(client_id, ["foo"])
+    self.assertEmpty(index.LookupClients(["label:foo"]))
+
+  def testChangesFromOtherProcessesAreVisibleAfterTTL(self):
+    client_id = next(iter(self._AddClients(1)))
+    index = client_index.ClientIndex()
+    self.assertEmpty(index.LookupClients(["label:foo"]))
+
+    # Simulate another process writing directly to the database.
+    data_store.REL_DB.AddClientKeywords(client_id, ["label:foo"])
+    self.assertEmpty(index.LookupClients(["label:foo"]))
+
+    with test_lib.FakeTime(
+        rdfvalue.RDFDatetime.Now()
+        + rdfvalue.Duration.From(61, rdfvalue.SECONDS)
+    ):
+      self.assertEqual(index.LookupClients(["label:foo"]), [client_id])
+
+  def testNonCanonicalClientIdsAreReadFromDatabase(self):
+    client_id = "C.ABCDEF0123456789"
+    data_store.REL_DB.WriteClientMetadata(client_id)
+    index = client_index.ClientIndex()
+    index.AddClientLabels(client_id, ["foo"])
+
+    self.assertEqual(index.LookupClients(["foo"]), [client_id])
+
+
 def main(argv):
   test_lib.main(argv)
 
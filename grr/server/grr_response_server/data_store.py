@@ -94,4 +94,6 @@ def InitializeDataStore():
     cls = blob_store.REGISTRY[blobstore_name]
   except KeyError:
     raise ValueError("No blob store %s found." % blobstore_name)
-  BLOBS = blob_store.BlobStoreValidationWrapper(cls())
+  BLOBS = blob_store.BlobStoreValidationWrapper(
+      cls(), write_notifier=blob_store.BlobWriteNotifier()
+  )
@@ -10,6 +10,7 @@ import collections
 from collections.abc import Callable, Collection, Iterable, Iterator, Mapping, Sequence, Set
 import dataclasses
 import enum
+import itertools
 import re
 from typing import Literal, NamedTuple, Optional, Protocol, Union
 
@@ -58,6 +59,10 @@ _MAX_CLIENT_PLATFORM_LENGTH = 100
 # using a particular DB API call.
 MAX_COUNT = 1024**3
 
+# Staleness acceptable for reads that only serve the UI and the API (e.g. flow
+# results or hunt progress pages) and thus may be done on a read replica.
+UI_READ_MAX_STALENESS = rdfvalue.Duration.From(10, rdfvalue.SECONDS)
+
 CLIENT_IDS_BATCH_SIZE = 500000
 
 _EMAIL_REGEX = re.compile(r"[^@]+@([^@]+)$")
@@ -510,6 +515,16 @@ FlowStateAndTimestamps = collections.namedtuple(
     ],
 )
 
+HuntFlowsTimestampHistograms = collections.namedtuple(
+    "HuntFlowsTimestampHistograms",
+    [
+        "min_timestamp",
+        "max_timestamp",
+        "started_counts",
+        "completed_counts",
+    ],
+)
+
 
 @dataclasses.dataclass
 class FlowErrorInfo:
@@ -2134,6 +2149,45 @@ class Database(metaclass=abc.ABCMeta):
       this method will return false and the flow will not be written.
     """
 
+  @abc.abstractmethod
+  def CommitFlowStep(
+      self,
+      requests: Collection[flows_pb2.FlowRequest] = (),
+      responses: Sequence[
+          Union[
+              flows_pb2.FlowResponse,
+              flows_pb2.FlowStatus,
+              flows_pb2.FlowIterator,
+          ],
+      ] = (),
+      completed_requests: Sequence[flows_pb2.FlowRequest] = (),
+      results: Sequence[flows_pb2.FlowResult] = (),
+      flow_obj: Optional[flows_pb2.Flow] = None,
+  ) -> bool:
+    """Atomically stores everything a flow produced while being processed.
+
+    This is equivalent to calling `WriteFlowRequests`, `WriteFlowResponses`,
+    `DeleteFlowRequests`, `WriteFlowResults` and (if `flow_obj` is given)
+    `ReleaseProcessedFlow` in this order, except that all the writes happen in
+    a single transaction.
+
+    Note that if the flow can't be released because more requests became ready
+    for processing, the other writes are still applied.
+
+    Args:
+      requests: List of FlowRequest objects to write.
+      responses: List of FlowResponses, FlowStatuses or FlowIterators values to
+        write.
+      completed_requests: List of FlowRequest objects to delete (together with
+        their responses).
+      results: List of FlowResult objects to write.
+      flow_obj: If set, the Flow object to return to the database.
+
+    Returns:
+      False if `flow_obj` was given but could not be released because there are
+      more requests ready for processing, True otherwise.
+    """
+
   @abc.abstractmethod
   def UpdateFlow(
       self,
@@ -2385,6 +2439,7 @@ class Database(metaclass=abc.ABCMeta):
       with_type: Optional[str] = None,
       with_proto_type_url: Optional[str] = None,
       with_substring: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowResult]:
     """Reads flow results of a given flow using given query options.
 
@@ -2408,6 +2463,9 @@ class Database(metaclass=abc.ABCMeta):
       with_substring: (Optional) When specified, should be a string. Only
         results having the specified string as a substring in their serialized
         form will be returned.
+      max_staleness: (Optional) When specified, the results may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
 
     Returns:
       A list of FlowResult values sorted by timestamp in ascending order.
@@ -2420,6 +2478,7 @@ class Database(metaclass=abc.ABCMeta):
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     """Counts flow results of a given flow using given query options.
 
@@ -2433,6 +2492,9 @@ class Database(metaclass=abc.ABCMeta):
         having specified tag will be accounted for.
       with_type: (Optional) When specified, should be a string. Only results of
         a specified type will be accounted for.
+      max_staleness: (Optional) When specified, the results may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
 
     Returns:
       A number of flow results of a given flow matching given query options.
@@ -2497,6 +2559,7 @@ class Database(metaclass=abc.ABCMeta):
       count: int,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowError]:
     """Reads flow errors of a given flow using given query options.
 
@@ -2515,6 +2578,9 @@ class Database(metaclass=abc.ABCMeta):
         having specified tag will be returned.
       with_type: (Optional) When specified, should be a string. Only errors of a
         specified type will be returned.
+      max_staleness: (Optional) When specified, the errors may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
 
     Returns:
       A list of FlowError values sorted by timestamp in ascending order.
@@ -2527,6 +2593,7 @@ class Database(metaclass=abc.ABCMeta):
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     """Counts flow errors of a given flow using given query options.
 
@@ -2540,6 +2607,9 @@ class Database(metaclass=abc.ABCMeta):
         having specified tag will be accounted for.
       with_type: (Optional) When specified, should be a string. Only errors of a
         specified type will be accounted for.
+      max_staleness: (Optional) When specified, the errors may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
 
     Returns:
       A number of flow errors of a given flow matching given query options.
@@ -2773,6 +2843,7 @@ class Database(metaclass=abc.ABCMeta):
       with_type: Optional[
           flows_pb2.FlowOutputPluginLogEntry.LogEntryType.ValueType
       ] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ):
     """Reads hunt output plugin log entries.
 
@@ -2792,6 +2863,9 @@ class Database(metaclass=abc.ABCMeta):
       with_type: (Optional) When specified, should have a
         FlowOutputPluginLogEntry.LogEntryType value. Output will be limited to
         entries with a given type.
+      max_staleness: (Optional) When specified, the entries may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
 
     Returns:
       A list of FlowOutputPluginLogEntry values sorted by timestamp in ascending
@@ -3268,6 +3342,25 @@ class Database(metaclass=abc.ABCMeta):
       A mapping from hunt_ids to HuntCounters objects.
     """
 
+  @abc.abstractmethod
+  def RepairHuntCounters(
+      self,
+      hunt_ids: Collection[str],
+  ) -> Collection[str]:
+    """Recomputes hunt counters from hunt flows and fixes the ones that drifted.
+
+    Hunt counters are maintained incrementally as hunt flows are written, so
+    that reading them is cheap. This method recomputes them from scratch and
+    is meant to be run periodically to fix counters that got out of sync
+    (e.g. due to writes that bypassed the incremental updates).
+
+    Args:
+      hunt_ids: The ids of the hunts to repair counters for.
+
+    Returns:
+      Ids of the hunts whose counters were fixed.
+    """
+
   @abc.abstractmethod
   def ReadHuntClientResourcesStats(
       self, hunt_id: str
@@ -3285,17 +3378,48 @@ class Database(metaclass=abc.ABCMeta):
   def ReadHuntFlowsStatesAndTimestamps(
       self,
       hunt_id: str,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[FlowStateAndTimestamps]:
     """Reads hunt flows states and timestamps.
 
     Args:
       hunt_id: The id of the hunt to read counters for.
+      max_staleness: (Optional) When specified, the flows may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
 
     Returns:
       An iterable of FlowStateAndTimestamps objects (in no particular
       sorting order).
     """
 
+  @abc.abstractmethod
+  def ReadHuntFlowsTimestampHistograms(
+      self,
+      hunt_id: str,
+      num_buckets: int,
+      max_staleness: Optional[rdfvalue.Duration] = None,
+  ) -> Optional[HuntFlowsTimestampHistograms]:
+    """Reads histograms of hunt flows creation and completion times.
+
+    Timestamps are counted in whole seconds since epoch. Both histograms span
+    from the earliest flow creation time to the latest flow creation or
+    completion time and are split into `num_buckets` buckets as done by
+    `db_utils.BucketTimestamps`. Flows that are still running are not
+    counted as completed. Completion times preceding the earliest creation
+    time (which is only possible with clock skew) fall into the first bucket.
+
+    Args:
+      hunt_id: The id of the hunt to read histograms for.
+      num_buckets: The number of buckets in each histogram.
+      max_staleness: (Optional) When specified, the flows may be read from a
+        replica lagging behind the primary by at most this much. Must not be
+        used by callers that need to see their own recent writes.
+
+    Returns:
+      A HuntFlowsTimestampHistograms object or None if the hunt has no flows.
+    """
+
   @abc.abstractmethod
   def WriteSignedBinaryReferences(
       self,
@@ -3556,6 +3680,13 @@ class DatabaseValidationWrapper(Database):
   def __init__(self, delegate: Database):
     super().__init__()
     self.delegate = delegate
+    # Changes whenever foreman rules are modified through this wrapper, which
+    # lets in-process caches of the rules detect that they are outdated.
+    self._foreman_rules_versions = itertools.count(1)
+    self.foreman_rules_version = 0
+
+  def _BumpForemanRulesVersion(self) -> None:
+    self.foreman_rules_version = next(self._foreman_rules_versions)
 
   def Now(self) -> rdfvalue.RDFDatetime:
     return self.delegate.Now()
@@ -3863,17 +3994,26 @@ class DatabaseValidationWrapper(Database):
     if not rule.hunt_id:
       raise ValueError("Foreman rule has no hunt_id: %s" % rule)
 
-    return self.delegate.WriteForemanRule(rule)
+    try:
+      return self.delegate.WriteForemanRule(rule)
+    finally:
+      self._BumpForemanRulesVersion()
 
   def RemoveForemanRule(self, hunt_id: str) -> None:
     _ValidateHuntId(hunt_id)
-    return self.delegate.RemoveForemanRule(hunt_id)
+    try:
+      return self.delegate.RemoveForemanRule(hunt_id)
+    finally:
+      self._BumpForemanRulesVersion()
 
   def ReadAllForemanRules(self) -> Sequence[jobs_pb2.ForemanCondition]:
     return self.delegate.ReadAllForemanRules()
 
   def RemoveExpiredForemanRules(self) -> None:
-    return self.delegate.RemoveExpiredForemanRules()
+    try:
+      return self.delegate.RemoveExpiredForemanRules()
+    finally:
+      self._BumpForemanRulesVersion()
 
   def WriteGRRUser(
       self,
@@ -4383,6 +4523,43 @@ class DatabaseValidationWrapper(Database):
     precondition.AssertType(flow_obj, flows_pb2.Flow)
     return self.delegate.ReleaseProcessedFlow(flow_obj)
 
+  def CommitFlowStep(
+      self,
+      requests: Collection[flows_pb2.FlowRequest] = (),
+      responses: Sequence[
+          Union[
+              flows_pb2.FlowResponse,
+              flows_pb2.FlowStatus,
+              flows_pb2.FlowIterator,
+          ],
+      ] = (),
+      completed_requests: Sequence[flows_pb2.FlowRequest] = (),
+      results: Sequence[flows_pb2.FlowResult] = (),
+      flow_obj: Optional[flows_pb2.Flow] = None,
+  ) -> bool:
+    precondition.AssertIterableType(requests, flows_pb2.FlowRequest)
+    for r in responses:
+      precondition.AssertType(r.request_id, int)
+      precondition.AssertType(r.response_id, int)
+      precondition.AssertType(r.client_id, str)
+      precondition.AssertType(r.flow_id, str)
+    precondition.AssertIterableType(completed_requests, flows_pb2.FlowRequest)
+    for r in results:
+      precondition.AssertType(r, flows_pb2.FlowResult)
+      precondition.ValidateClientId(r.client_id)
+      precondition.ValidateFlowId(r.flow_id)
+      if r.HasField("hunt_id") and r.hunt_id:
+        _ValidateHuntId(r.hunt_id)
+    precondition.AssertOptionalType(flow_obj, flows_pb2.Flow)
+
+    return self.delegate.CommitFlowStep(
+        requests=requests,
+        responses=responses,
+        completed_requests=completed_requests,
+        results=results,
+        flow_obj=flow_obj,
+    )
+
   def UpdateFlow(
       self,
       client_id: str,
@@ -4585,6 +4762,7 @@ class DatabaseValidationWrapper(Database):
       with_type=None,
       with_proto_type_url=None,
       with_substring=None,
+      max_staleness=None,
   ):
     precondition.ValidateClientId(client_id)
     precondition.ValidateFlowId(flow_id)
@@ -4596,6 +4774,7 @@ class DatabaseValidationWrapper(Database):
           "Only one of `with_type` and `with_proto_type_url` can be set."
       )
     precondition.AssertOptionalType(with_substring, str)
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
 
     return self.delegate.ReadFlowResults(
         client_id,
@@ -4606,6 +4785,7 @@ class DatabaseValidationWrapper(Database):
         with_type=with_type,
         with_proto_type_url=with_proto_type_url,
         with_substring=with_substring,
+        max_staleness=max_staleness,
     )
 
   def CountFlowResults(
@@ -4614,14 +4794,20 @@ class DatabaseValidationWrapper(Database):
       flow_id,
       with_tag=None,
       with_type=None,
+      max_staleness=None,
   ):
     precondition.ValidateClientId(client_id)
     precondition.ValidateFlowId(flow_id)
     precondition.AssertOptionalType(with_tag, str)
     precondition.AssertOptionalType(with_type, str)
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
 
     return self.delegate.CountFlowResults(
-        client_id, flow_id, with_tag=with_tag, with_type=with_type
+        client_id,
+        flow_id,
+        with_tag=with_tag,
+        with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   def CountFlowResultsByType(
@@ -4670,11 +4856,13 @@ class DatabaseValidationWrapper(Database):
       count: int,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowError]:
     precondition.ValidateClientId(client_id)
     precondition.ValidateFlowId(flow_id)
     precondition.AssertOptionalType(with_tag, str)
     precondition.AssertOptionalType(with_type, str)
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
 
     return self.delegate.ReadFlowErrors(
         client_id,
@@ -4683,6 +4871,7 @@ class DatabaseValidationWrapper(Database):
         count,
         with_tag=with_tag,
         with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   def CountFlowErrors(
@@ -4691,14 +4880,20 @@ class DatabaseValidationWrapper(Database):
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     precondition.ValidateClientId(client_id)
     precondition.ValidateFlowId(flow_id)
     precondition.AssertOptionalType(with_tag, str)
     precondition.AssertOptionalType(with_type, str)
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
 
     return self.delegate.CountFlowErrors(
-        client_id, flow_id, with_tag=with_tag, with_type=with_type
+        client_id,
+        flow_id,
+        with_tag=with_tag,
+        with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   def WriteFlowLogEntry(self, entry: flows_pb2.FlowLogEntry) -> None:
@@ -4874,7 +5069,13 @@ class DatabaseValidationWrapper(Database):
     )
 
   def ReadHuntOutputPluginLogEntries(
-      self, hunt_id, output_plugin_id, offset, count, with_type=None
+      self,
+      hunt_id,
+      output_plugin_id,
+      offset,
+      count,
+      with_type=None,
+      max_staleness=None,
   ):
     _ValidateHuntId(hunt_id)
     _ValidateOutputPluginId(output_plugin_id)
@@ -4882,9 +5083,15 @@ class DatabaseValidationWrapper(Database):
       _ValidateProtoEnumType(
           with_type, flows_pb2.FlowOutputPluginLogEntry.LogEntryType
       )
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
 
     return self.delegate.ReadHuntOutputPluginLogEntries(
-        hunt_id, output_plugin_id, offset, count, with_type=with_type
+        hunt_id,
+        output_plugin_id,
+        offset,
+        count,
+        with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   def CountHuntOutputPluginLogEntries(
@@ -5183,6 +5390,14 @@ class DatabaseValidationWrapper(Database):
       _ValidateHuntId(hunt_id)
     return self.delegate.ReadHuntsCounters(hunt_ids)
 
+  def RepairHuntCounters(
+      self,
+      hunt_ids: Collection[str],
+  ) -> Collection[str]:
+    for hunt_id in hunt_ids:
+      _ValidateHuntId(hunt_id)
+    return self.delegate.RepairHuntCounters(hunt_ids)
+
   def ReadHuntClientResourcesStats(
       self, hunt_id: str
   ) -> jobs_pb2.ClientResourcesStats:
@@ -5192,9 +5407,28 @@ class DatabaseValidationWrapper(Database):
   def ReadHuntFlowsStatesAndTimestamps(
       self,
       hunt_id: str,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[FlowStateAndTimestamps]:
     _ValidateHuntId(hunt_id)
-    return self.delegate.ReadHuntFlowsStatesAndTimestamps(hunt_id)
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
+    return self.delegate.ReadHuntFlowsStatesAndTimestamps(
+        hunt_id, max_staleness=max_staleness
+    )
+
+  def ReadHuntFlowsTimestampHistograms(
+      self,
+      hunt_id: str,
+      num_buckets: int,
+      max_staleness: Optional[rdfvalue.Duration] = None,
+  ) -> Optional[HuntFlowsTimestampHistograms]:
+    _ValidateHuntId(hunt_id)
+    precondition.AssertType(num_buckets, int)
+    if num_buckets <= 0:
+      raise ValueError(f"Number of buckets must be positive: {num_buckets}")
+    precondition.AssertOptionalType(max_staleness, rdfvalue.Duration)
+    return self.delegate.ReadHuntFlowsTimestampHistograms(
+        hunt_id, num_buckets, max_staleness=max_staleness
+    )
 
   def WriteSignedBinaryReferences(
       self,
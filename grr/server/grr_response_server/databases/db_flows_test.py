@@ -1726,6 +1726,119 @@ class DatabaseTestFlowMixin(object):
     flow_obj.next_request_to_process = 1
     self.assertTrue(self.db.ReleaseProcessedFlow(flow_obj))
 
+  def testCommitFlowStep(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+    flow_id = db_test_utils.InitializeFlow(
+        self.db, client_id, next_request_to_process=1
+    )
+
+    completed_request = flows_pb2.FlowRequest(
+        client_id=client_id, flow_id=flow_id, request_id=1
+    )
+    self.db.WriteFlowRequests([completed_request])
+    self.db.WriteFlowResponses([
+        flows_pb2.FlowResponse(
+            client_id=client_id, flow_id=flow_id, request_id=1, response_id=1
+        )
+    ])
+
+    processed_flow = self.db.LeaseFlowForProcessing(
+        client_id, flow_id, rdfvalue.Duration.From(60, rdfvalue.SECONDS)
+    )
+    processed_flow.next_request_to_process = 2
+
+    released = self.db.CommitFlowStep(
+        requests=[
+            flows_pb2.FlowRequest(
+                client_id=client_id, flow_id=flow_id, request_id=2
+            )
+        ],
+        responses=[
+            flows_pb2.FlowResponse(
+                client_id=client_id,
+                flow_id=flow_id,
+                request_id=2,
+                response_id=1,
+            )
+        ],
+        completed_requests=[completed_request],
+        results=[
+            flows_pb2.FlowResult(client_id=client_id, flow_id=flow_id, tag="foo")
+        ],
+        flow_obj=processed_flow,
+    )
+    self.assertTrue(released)
+
+    requests_and_responses = self.db.ReadAllFlowRequestsAndResponses(
+        client_id, flow_id
+    )
+    self.assertLen(requests_and_responses, 1)
+    request, responses = requests_and_responses[0]
+    self.assertEqual(request.request_id, 2)
+    self.assertEqual(list(responses), [1])
+
+    results = self.db.ReadFlowResults(client_id, flow_id, 0, 10)
+    self.assertLen(results, 1)
+    self.assertEqual(results[0].tag, "foo")
+
+    read_flow = self.db.ReadFlowObject(client_id, flow_id)
+    self.assertEqual(read_flow.next_request_to_process, 2)
+    self.assertFalse(read_flow.processing_on)
+
+  def testCommitFlowStepWritesEvenIfFlowCannotBeReleased(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+    flow_id = db_test_utils.InitializeFlow(
+        self.db, client_id, next_request_to_process=1
+    )
+
+    processed_flow = self.db.LeaseFlowForProcessing(
+        client_id, flow_id, rdfvalue.Duration.From(60, rdfvalue.SECONDS)
+    )
+    processed_flow.next_request_to_process = 2
+
+    # Request 2 becomes ready for processing as part of the step itself.
+    released = self.db.CommitFlowStep(
+        requests=[
+            flows_pb2.FlowRequest(
+                client_id=client_id,
+                flow_id=flow_id,
+                request_id=2,
+                needs_processing=True,
+            )
+        ],
+        results=[flows_pb2.FlowResult(client_id=client_id, flow_id=flow_id)],
+        flow_obj=processed_flow,
+    )
+    self.assertFalse(released)
+
+    requests_and_responses = self.db.ReadAllFlowRequestsAndResponses(
+        client_id, flow_id
+    )
+    self.assertLen(requests_and_responses, 1)
+    self.assertLen(self.db.ReadFlowResults(client_id, flow_id, 0, 10), 1)
+
+    read_flow = self.db.ReadFlowObject(client_id, flow_id)
+    self.assertEqual(read_flow.next_request_to_process, 1)
+    self.assertTrue(read_flow.processing_on)
+
+  def testCommitFlowStepWithoutFlow(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+    flow_id = db_test_utils.InitializeFlow(self.db, client_id)
+
+    released = self.db.CommitFlowStep(
+        requests=[
+            flows_pb2.FlowRequest(
+                client_id=client_id, flow_id=flow_id, request_id=1
+            )
+        ],
+    )
+    self.assertTrue(released)
+
+    requests_and_responses = self.db.ReadAllFlowRequestsAndResponses(
+        client_id, flow_id
+    )
+    self.assertLen(requests_and_responses, 1)
+
   def testReadChildFlows(self):
     client_id = "C.1234567890123456"
     self.db.WriteClientMetadata(client_id)
@@ -2677,6 +2790,27 @@ class DatabaseTestFlowMixin(object):
     num_results = self.db.CountFlowResults(client_id, flow_id)
     self.assertEqual(num_results, len(sample_results))
 
+  def testReadAndCountFlowResultsWithMaxStaleness(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+    flow_id = db_test_utils.InitializeFlow(self.db, client_id)
+
+    sample_results = self._WriteFlowResults(
+        self._SampleResults(client_id, flow_id), multiple_timestamps=True
+    )
+
+    max_staleness = rdfvalue.Duration.From(10, rdfvalue.SECONDS)
+    results = self.db.ReadFlowResults(
+        client_id, flow_id, 0, 100, max_staleness=max_staleness
+    )
+    self.assertCountEqual(
+        [r.payload for r in results], [r.payload for r in sample_results]
+    )
+
+    num_results = self.db.CountFlowResults(
+        client_id, flow_id, max_staleness=max_staleness
+    )
+    self.assertEqual(num_results, len(sample_results))
+
   def testCountFlowResultsCorrectlyAppliesWithTagFilter(self):
     client_id = db_test_utils.InitializeClient(self.db)
     flow_id = db_test_utils.InitializeFlow(self.db, client_id)
@@ -17,6 +17,7 @@ from grr_response_proto import output_plugin_pb2
 from grr_response_server import flow
 from grr_response_server.databases import db
 from grr_response_server.databases import db_test_utils
+from grr_response_server.databases import db_utils
 from grr_response_server.models import hunts as models_hunts
 from grr_response_server.output_plugins import email_plugin
 from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
@@ -2359,6 +2360,65 @@ class DatabaseTestHuntMixin(object):
     self.assertAlmostEqual(hunt_counters.total_cpu_seconds, 14.5)
     self.assertEqual(hunt_counters.total_network_bytes_sent, 42)
 
+  def testReadHuntCountersReflectsFlowUpdates(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+    client_id = db_test_utils.InitializeClient(self.db)
+    db_test_utils.InitializeFlow(
+        self.db,
+        client_id,
+        flow_id=hunt_id,
+        parent_hunt_id=hunt_id,
+        flow_state=rdf_flow_objects.Flow.FlowState.RUNNING,
+    )
+
+    hunt_counters = self.db.ReadHuntCounters(hunt_id)
+    self.assertEqual(hunt_counters.num_clients, 1)
+    self.assertEqual(hunt_counters.num_running_clients, 1)
+    self.assertEqual(hunt_counters.num_successful_clients, 0)
+
+    flow_obj = self.db.ReadFlowObject(client_id, hunt_id)
+    flow_obj.flow_state = flows_pb2.Flow.FlowState.FINISHED
+    flow_obj.cpu_time_used.user_cpu_time = 1.5
+    flow_obj.cpu_time_used.system_cpu_time = 2
+    flow_obj.network_bytes_sent = 1024
+    self.db.UpdateFlow(client_id, hunt_id, flow_obj=flow_obj)
+
+    hunt_counters = self.db.ReadHuntCounters(hunt_id)
+    self.assertEqual(hunt_counters.num_clients, 1)
+    self.assertEqual(hunt_counters.num_running_clients, 0)
+    self.assertEqual(hunt_counters.num_successful_clients, 1)
+    self.assertAlmostEqual(hunt_counters.total_cpu_seconds, 3.5)
+    self.assertEqual(hunt_counters.total_network_bytes_sent, 1024)
+
+  def testReadHuntCountersIgnoresDeletedClients(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+    client_ids = [db_test_utils.InitializeClient(self.db) for _ in range(2)]
+    for client_id in client_ids:
+      db_test_utils.InitializeFlow(
+          self.db,
+          client_id,
+          flow_id=hunt_id,
+          parent_hunt_id=hunt_id,
+          network_bytes_sent=42,
+      )
+
+    self.db.DeleteClient(client_ids[0])
+
+    hunt_counters = self.db.ReadHuntCounters(hunt_id)
+    self.assertEqual(hunt_counters.num_clients, 1)
+    self.assertEqual(hunt_counters.total_network_bytes_sent, 42)
+
+  def testRepairHuntCountersForEmptyList(self):
+    self.assertEmpty(self.db.RepairHuntCounters([]))
+
+  def testRepairHuntCountersDoesNothingIfCountersAreConsistent(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+    self._BuildFilterConditionExpectations(hunt_id)
+    hunt_counters = self.db.ReadHuntCounters(hunt_id)
+
+    self.assertEmpty(self.db.RepairHuntCounters([hunt_id]))
+    self.assertEqual(self.db.ReadHuntCounters(hunt_id), hunt_counters)
+
   def testReadHuntClientResourcesStatsIgnoresSubflows(self):
     hunt_id = db_test_utils.InitializeHunt(self.db)
 
@@ -2700,6 +2760,68 @@ class DatabaseTestHuntMixin(object):
         ),
     )
 
+
+  def testReadHuntFlowsTimestampHistogramsReturnsNoneForEmptyHunt(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+
+    self.assertIsNone(self.db.ReadHuntFlowsTimestampHistograms(hunt_id, 10))
+
+  def testReadHuntFlowsTimestampHistogramsMatchesStatesAndTimestamps(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+
+    for i in range(10):
+      client_id, flow_id = self._SetupHuntClientAndFlow(hunt_id=hunt_id)
+      if i % 3 == 0:
+        flow_state = flows_pb2.Flow.FlowState.RUNNING
+      else:
+        flow_state = flows_pb2.Flow.FlowState.FINISHED
+      self.db.UpdateFlow(client_id, flow_id, flow_state=flow_state)
+
+    create_times = []
+    complete_times = []
+    for stat in self.db.ReadHuntFlowsStatesAndTimestamps(hunt_id):
+      create_times.append(stat.create_time.AsSecondsSinceEpoch())
+      if stat.flow_state != flows_pb2.Flow.FlowState.RUNNING:
+        complete_times.append(stat.last_update_time.AsSecondsSinceEpoch())
+    min_timestamp = min(create_times)
+    max_timestamp = max(create_times + complete_times)
+
+    histograms = self.db.ReadHuntFlowsTimestampHistograms(hunt_id, 5)
+
+    self.assertEqual(histograms.min_timestamp, min_timestamp)
+    self.assertEqual(histograms.max_timestamp, max_timestamp)
+    self.assertEqual(
+        histograms.started_counts,
+        db_utils.BucketTimestamps(create_times, min_timestamp, max_timestamp, 5),
+    )
+    self.assertEqual(
+        histograms.completed_counts,
+        db_utils.BucketTimestamps(
+            complete_times, min_timestamp, max_timestamp, 5
+        ),
+    )
+    self.assertEqual(sum(histograms.started_counts), 10)
+    self.assertEqual(sum(histograms.completed_counts), 6)
+
+  def testReadHuntFlowsTimestampHistogramsIgnoresNestedFlows(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+
+    client_id, flow_id = self._SetupHuntClientAndFlow(
+        hunt_id=hunt_id, flow_state=flows_pb2.Flow.FlowState.FINISHED
+    )
+    self._SetupHuntClientAndFlow(
+        hunt_id=hunt_id,
+        client_id=client_id,
+        flow_id=flow.RandomFlowId(),
+        parent_flow_id=flow_id,
+        flow_state=flows_pb2.Flow.FlowState.FINISHED,
+    )
+
+    histograms = self.db.ReadHuntFlowsTimestampHistograms(hunt_id, 3)
+
+    self.assertEqual(sum(histograms.started_counts), 1)
+    self.assertEqual(sum(histograms.completed_counts), 1)
+
   def testReadHuntOutputPluginLogEntriesReturnsEntryFromSingleHuntFlow(self):
     hunt_id = db_test_utils.InitializeHunt(self.db)
 
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 """Utility functions/decorators for DB implementations."""
 
-from collections.abc import Sequence
+import bisect
+from collections.abc import Iterable, Sequence
 import functools
 import logging
 import time
@@ -214,6 +215,54 @@ def MicrosToSeconds(ms):
   return ms / 1e6
 
 
+def BucketTimestamps(
+    timestamps: Iterable[int],
+    min_timestamp: int,
+    max_timestamp: int,
+    num_buckets: int,
+) -> list[int]:
+  """Counts timestamps falling into equally sized buckets.
+
+  A timestamp `ts` falls into the bucket with index
+  `(ts - min_timestamp) * num_buckets // (max_timestamp - min_timestamp)`.
+  Timestamps past `max_timestamp` are counted in the last bucket. If
+  `min_timestamp` equals `max_timestamp`, everything falls into the first one.
+
+  Instead of computing the index of every timestamp, timestamps are sorted and
+  bucket boundaries are looked up with a binary search.
+
+  Args:
+    timestamps: Timestamps (e.g. in seconds since epoch) to count.
+    min_timestamp: The lower boundary of the first bucket.
+    max_timestamp: The upper boundary of the last bucket.
+    num_buckets: The number of buckets.
+
+  Returns:
+    A list with a count for each bucket.
+
+  Raises:
+    ValueError: If some of the timestamps are smaller than `min_timestamp`.
+  """
+  values = sorted(timestamps)
+  if values and values[0] < min_timestamp:
+    raise ValueError(
+        f"Timestamp `{values[0]}` must be larger than `{min_timestamp}`"
+    )
+
+  span = max(max_timestamp - min_timestamp, 1)
+  counts = []
+  lower = 0
+  for i in range(1, num_buckets):
+    # The smallest timestamp that falls into the i-th bucket.
+    boundary = min_timestamp + (i * span + num_buckets - 1) // num_buckets
+    upper = bisect.bisect_left(values, boundary, lower)
+    counts.append(upper - lower)
+    lower = upper
+  counts.append(len(values) - lower)
+
+  return counts
+
+
 class BatchPlanner(Generic[_T]):
   """Helper class to batch operations based on affected rows limit.
 
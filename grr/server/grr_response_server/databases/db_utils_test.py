@@ -1,5 +1,7 @@
 #!/usr/bin/env python
+import array
 import logging
+import random
 
 from absl import app
 from absl.testing import absltest
@@ -180,6 +182,39 @@ class BatchPlannerTest(absltest.TestCase):
     )
 
 
+class BucketTimestampsTest(absltest.TestCase):
+
+  def testEqualBuckets(self):
+    counts = db_utils.BucketTimestamps(range(100), 0, 100, 5)
+    self.assertEqual(counts, [20, 20, 20, 20, 20])
+
+  def testMatchesPerTimestampIndex(self):
+    timestamps = [random.randint(1000, 1997) for _ in range(1000)]
+
+    counts = db_utils.BucketTimestamps(timestamps, 1000, 1997, 7)
+
+    expected = [0] * 7
+    for ts in timestamps:
+      expected[min((ts - 1000) * 7 // 997, 6)] += 1
+    self.assertEqual(counts, expected)
+
+  def testTimestampsPastMaxFallIntoLastBucket(self):
+    counts = db_utils.BucketTimestamps([0, 9, 10, 42], 0, 9, 3)
+    self.assertEqual(counts, [1, 0, 3])
+
+  def testAllTimestampsFallIntoFirstBucketIfMinEqualsMax(self):
+    counts = db_utils.BucketTimestamps([5, 5, 5], 5, 5, 3)
+    self.assertEqual(counts, [3, 0, 0])
+
+  def testAcceptsArrays(self):
+    counts = db_utils.BucketTimestamps(array.array("q", [3, 1, 2]), 0, 3, 3)
+    self.assertEqual(counts, [0, 1, 2])
+
+  def testRaisesOnTimestampsBeforeMin(self):
+    with self.assertRaises(ValueError):
+      db_utils.BucketTimestamps([-1], 0, 100, 5)
+
+
 class CallAccountedTest(stats_test_lib.StatsTestMixin, absltest.TestCase):
 
   @db_utils.CallAccounted
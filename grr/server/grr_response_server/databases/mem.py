@@ -145,6 +145,13 @@ class InMemoryDB(
     self.flow_handler_num_being_processed = 0
     self.api_audit_entries: list[objects_pb2.APIAuditEntry] = []
     self.hunts: dict[str, hunts_pb2.Hunt] = {}
+    # Maps hunt_id to the hunt counters, maintained incrementally.
+    self.hunt_counters: dict[str, collections.Counter[str]] = {}
+    # Maps (client_id, flow_id) of hunt flows to the hunt_id and the flow's
+    # contribution to the hunt counters.
+    self.hunt_flows_counters: dict[
+        tuple[str, str], tuple[str, collections.Counter[str]]
+    ] = {}
     # Maps hunt_id to a list of serialized output_plugin_pb2.OutputPluginState.
     self.hunt_output_plugins_states: dict[str, list[bytes]] = {}
     # Maps (binary-type, binary-path) to (objects_pb2.BlobReferences, timestamp)
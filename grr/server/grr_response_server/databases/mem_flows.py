@@ -221,6 +221,7 @@ class InMemoryDBFlowMixin(object):
     clone.create_time = now
 
     self.flows[key] = clone
+    self._UpdateHuntCounters(*key)
 
   @utils.Synchronized
   def ReadFlowObject(self, client_id: str, flow_id: str) -> flows_pb2.Flow:
@@ -376,6 +377,7 @@ class InMemoryDBFlowMixin(object):
     flow.last_update_time = int(rdfvalue.RDFDatetime.Now())
 
     self.flows[(ClientID(client_id), FlowID(flow_id))] = flow
+    self._UpdateHuntCounters(client_id, flow_id)
 
   @utils.Synchronized
   def WriteFlowRequests(
@@ -702,6 +704,34 @@ class InMemoryDBFlowMixin(object):
     )
     return True
 
+  @utils.Synchronized
+  def CommitFlowStep(
+      self,
+      requests: Collection[flows_pb2.FlowRequest] = (),
+      responses: Sequence[
+          Union[
+              flows_pb2.FlowResponse,
+              flows_pb2.FlowStatus,
+              flows_pb2.FlowIterator,
+          ],
+      ] = (),
+      completed_requests: Sequence[flows_pb2.FlowRequest] = (),
+      results: Sequence[flows_pb2.FlowResult] = (),
+      flow_obj: Optional[flows_pb2.Flow] = None,
+  ) -> bool:
+    """Atomically stores everything a flow produced while being processed."""
+    if requests:
+      self.WriteFlowRequests(requests)
+    if responses:
+      self.WriteFlowResponses(responses)
+    if completed_requests:
+      self.DeleteFlowRequests(completed_requests)
+    if results:
+      self.WriteFlowResults(results)
+    if flow_obj is not None:
+      return self.ReleaseProcessedFlow(flow_obj)
+    return True
+
   def _InlineProcessingOK(
       self, requests: Sequence[flows_pb2.FlowProcessingRequest]
   ) -> bool:
@@ -888,9 +918,12 @@ class InMemoryDBFlowMixin(object):
       to_write.timestamp = rdfvalue.RDFDatetime.Now().AsMicrosecondsSinceEpoch()
       dest.append(to_write)
 
+  @utils.Synchronized
   def WriteFlowResults(self, results: Sequence[flows_pb2.FlowResult]) -> None:
     """Writes flow results for a given flow."""
     self._WriteFlowResultsOrErrors(self.flow_results, results)
+    for client_id, flow_id in set((r.client_id, r.flow_id) for r in results):
+      self._UpdateHuntCounters(client_id, flow_id)
 
   @utils.Synchronized
   def _ReadFlowResultsOrErrors(
@@ -947,8 +980,10 @@ class InMemoryDBFlowMixin(object):
       with_type: Optional[str] = None,
       with_proto_type_url: Optional[str] = None,
       with_substring: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowResult]:
     """Reads flow results of a given flow using given query options."""
+    del max_staleness  # Unused.
     return self._ReadFlowResultsOrErrors(
         self.flow_results,
         client_id,
@@ -968,8 +1003,10 @@ class InMemoryDBFlowMixin(object):
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     """Counts flow results of a given flow using given query options."""
+    del max_staleness  # Unused.
     return len(
         self.ReadFlowResults(
             client_id,
@@ -1021,8 +1058,10 @@ class InMemoryDBFlowMixin(object):
       count: int,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowError]:
     """Reads flow errors of a given flow using given query options."""
+    del max_staleness  # Unused.
     # Errors are similar to results, as they represent a somewhat related
     # concept. Error is a kind of a negative result. Given the structural
     # similarity, we can share large chunks of implementation between
@@ -1044,8 +1083,10 @@ class InMemoryDBFlowMixin(object):
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     """Counts flow errors of a given flow using given query options."""
+    del max_staleness  # Unused.
     return len(
         self.ReadFlowErrors(
             client_id,
@@ -85,6 +85,54 @@ def InitializeClientResourcesStats(
   return stats
 
 
+def _HuntFlowCounters(
+    flow_obj: flows_pb2.Flow,
+    flow_results: Sequence[flows_pb2.FlowResult],
+) -> collections.Counter[str]:
+  """Returns the contribution of a single hunt flow to the hunt counters."""
+  return collections.Counter({
+      "num_clients": 1,
+      "num_successful_clients": int(
+          flow_obj.flow_state == flows_pb2.Flow.FlowState.FINISHED
+      ),
+      "num_failed_clients": int(
+          flow_obj.flow_state == flows_pb2.Flow.FlowState.ERROR
+      ),
+      "num_clients_with_results": int(bool(flow_results)),
+      "num_crashed_clients": int(
+          flow_obj.flow_state == flows_pb2.Flow.FlowState.CRASHED
+      ),
+      "num_running_clients": int(
+          flow_obj.flow_state == flows_pb2.Flow.FlowState.RUNNING
+      ),
+      "num_results": len(flow_results),
+      # CPU time is accounted in microseconds, so that the incremental updates
+      # don't accumulate floating point errors.
+      "total_cpu_micros": db_utils.SecondsToMicros(
+          flow_obj.cpu_time_used.user_cpu_time
+          + flow_obj.cpu_time_used.system_cpu_time
+      ),
+      "total_network_bytes_sent": flow_obj.network_bytes_sent,
+  })
+
+
+def _HuntCountersFromCounter(
+    counter: collections.Counter[str],
+) -> db.HuntCounters:
+  """Converts hunt counters accumulated in a `Counter` to `db.HuntCounters`."""
+  return db.HuntCounters(
+      num_clients=counter["num_clients"],
+      num_successful_clients=counter["num_successful_clients"],
+      num_failed_clients=counter["num_failed_clients"],
+      num_clients_with_results=counter["num_clients_with_results"],
+      num_crashed_clients=counter["num_crashed_clients"],
+      num_running_clients=counter["num_running_clients"],
+      num_results=counter["num_results"],
+      total_cpu_seconds=db_utils.MicrosToSeconds(counter["total_cpu_micros"]),
+      total_network_bytes_sent=counter["total_network_bytes_sent"],
+  )
+
+
 class InMemoryDBHuntMixin(object):
   """Hunts-related DB methods implementation."""
 
@@ -93,6 +141,40 @@ class InMemoryDBHuntMixin(object):
   hunt_output_plugins_states: dict[str, list[bytes]]
   approvals_by_username: dict[str, dict[str, objects_pb2.ApprovalRequest]]
   flow_results: dict[tuple[str, str], list[flows_pb2.FlowResult]]
+  hunt_counters: dict[str, collections.Counter[str]]
+  hunt_flows_counters: dict[
+      tuple[str, str], tuple[str, collections.Counter[str]]
+  ]
+
+  @utils.Synchronized
+  def _UpdateHuntCounters(self, client_id: str, flow_id: str) -> None:
+    """Updates hunt counters after a flow or its results were written.
+
+    The contribution of every hunt flow to its hunt counters is remembered, so
+    that the counters can be updated by applying the difference between the
+    old and the new contribution instead of recomputing them from scratch.
+
+    Args:
+      client_id: Client id of the flow that was modified.
+      flow_id: Id of the flow that was modified.
+    """
+    key = (client_id, flow_id)
+
+    old = self.hunt_flows_counters.pop(key, None)
+    if old is not None:
+      hunt_id, contribution = old
+      self.hunt_counters[hunt_id].subtract(contribution)
+
+    flow_obj = self.flows.get(key)
+    if flow_obj is None or flow_obj.parent_hunt_id != flow_obj.flow_id:
+      return
+
+    hunt_id = flow_obj.parent_hunt_id
+    contribution = _HuntFlowCounters(flow_obj, self.flow_results.get(key, []))
+    self.hunt_flows_counters[key] = (hunt_id, contribution)
+    self.hunt_counters.setdefault(hunt_id, collections.Counter()).update(
+        contribution
+    )
 
   def _GetHuntFlows(self, hunt_id: str) -> list[flows_pb2.Flow]:
     hunt_flows = [
@@ -217,6 +299,11 @@ class InMemoryDBHuntMixin(object):
     except KeyError:
       raise db.UnknownHuntError(hunt_id)
 
+    self.hunt_counters.pop(hunt_id, None)
+    for key, (flow_hunt_id, _) in list(self.hunt_flows_counters.items()):
+      if flow_hunt_id == hunt_id:
+        del self.hunt_flows_counters[key]
+
     for approvals in self.approvals_by_username.values():
       # We use `list` around dictionary items iterator to avoid errors about
       # dictionary modification during iteration.
@@ -498,50 +585,41 @@ class InMemoryDBHuntMixin(object):
       hunt_ids: Collection[str],
   ) -> Mapping[str, db.HuntCounters]:
     """Reads hunt counters for several hunt ids."""
-    hunt_counters = {}
-    for hunt_id in hunt_ids:
-      num_clients = self.CountHuntFlows(hunt_id)
-      num_successful_clients = self.CountHuntFlows(
-          hunt_id, filter_condition=db.HuntFlowsCondition.SUCCEEDED_FLOWS_ONLY
-      )
-      num_failed_clients = self.CountHuntFlows(
-          hunt_id, filter_condition=db.HuntFlowsCondition.FAILED_FLOWS_ONLY
-      )
-      num_clients_with_results = len(
-          set(
-              r[0].client_id
-              for r in self.flow_results.values()
-              if r and r[0].hunt_id == hunt_id
-          )
-      )
-      num_crashed_clients = self.CountHuntFlows(
-          hunt_id, filter_condition=db.HuntFlowsCondition.CRASHED_FLOWS_ONLY
-      )
-      num_running_clients = self.CountHuntFlows(
-          hunt_id, filter_condition=db.HuntFlowsCondition.FLOWS_IN_PROGRESS_ONLY
-      )
-      num_results = self.CountHuntResults(hunt_id)
+    return {
+        hunt_id: _HuntCountersFromCounter(
+            self.hunt_counters.get(hunt_id, collections.Counter())
+        )
+        for hunt_id in hunt_ids
+    }
 
-      total_cpu_seconds = 0
-      total_network_bytes_sent = 0
-      for f in self.ReadHuntFlows(hunt_id, 0, sys.maxsize):
-        total_cpu_seconds += (
-            f.cpu_time_used.user_cpu_time + f.cpu_time_used.system_cpu_time
+  @utils.Synchronized
+  def RepairHuntCounters(
+      self,
+      hunt_ids: Collection[str],
+  ) -> Collection[str]:
+    """Recomputes hunt counters and fixes the ones that drifted."""
+    drifted = []
+    for hunt_id in hunt_ids:
+      expected = collections.Counter()
+      for flow_obj in self._GetHuntFlows(hunt_id):
+        key = (flow_obj.client_id, flow_obj.flow_id)
+        expected.update(
+            _HuntFlowCounters(flow_obj, self.flow_results.get(key, []))
         )
-        total_network_bytes_sent += f.network_bytes_sent
-
-      hunt_counters[hunt_id] = db.HuntCounters(
-          num_clients=num_clients,
-          num_successful_clients=num_successful_clients,
-          num_failed_clients=num_failed_clients,
-          num_clients_with_results=num_clients_with_results,
-          num_crashed_clients=num_crashed_clients,
-          num_running_clients=num_running_clients,
-          num_results=num_results,
-          total_cpu_seconds=total_cpu_seconds,
-          total_network_bytes_sent=total_network_bytes_sent,
-      )
-    return hunt_counters
+
+      actual = self.hunt_counters.get(hunt_id, collections.Counter())
+      if _HuntCountersFromCounter(expected) == _HuntCountersFromCounter(actual):
+        continue
+
+      drifted.append(hunt_id)
+      self.hunt_counters.pop(hunt_id, None)
+      for key, (flow_hunt_id, _) in list(self.hunt_flows_counters.items()):
+        if flow_hunt_id == hunt_id:
+          del self.hunt_flows_counters[key]
+      for flow_obj in self._GetHuntFlows(hunt_id):
+        self._UpdateHuntCounters(flow_obj.client_id, flow_obj.flow_id)
+
+    return drifted
 
   @utils.Synchronized
   def ReadHuntClientResourcesStats(
@@ -569,8 +647,10 @@ class InMemoryDBHuntMixin(object):
   def ReadHuntFlowsStatesAndTimestamps(
       self,
       hunt_id: str,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[db.FlowStateAndTimestamps]:
     """Reads hunt flows states and timestamps."""
+    del max_staleness  # Unused.
 
     result = []
     for f in self._GetHuntFlows(hunt_id):
@@ -588,6 +668,39 @@ class InMemoryDBHuntMixin(object):
 
     return result
 
+  @utils.Synchronized
+  def ReadHuntFlowsTimestampHistograms(
+      self,
+      hunt_id: str,
+      num_buckets: int,
+      max_staleness: Optional[rdfvalue.Duration] = None,
+  ) -> Optional[db.HuntFlowsTimestampHistograms]:
+    """Reads histograms of hunt flows creation and completion times."""
+    del max_staleness  # Unused.
+    create_times = []
+    complete_times = []
+    for f in self._GetHuntFlows(hunt_id):
+      create_times.append(f.create_time // 1_000_000)
+      if f.flow_state != flows_pb2.Flow.FlowState.RUNNING:
+        complete_times.append(f.last_update_time // 1_000_000)
+
+    if not create_times:
+      return None
+
+    min_timestamp = min(create_times)
+    max_timestamp = max(create_times + complete_times)
+    complete_times = [max(t, min_timestamp) for t in complete_times]
+    return db.HuntFlowsTimestampHistograms(
+        min_timestamp=min_timestamp,
+        max_timestamp=max_timestamp,
+        started_counts=db_utils.BucketTimestamps(
+            create_times, min_timestamp, max_timestamp, num_buckets
+        ),
+        completed_counts=db_utils.BucketTimestamps(
+            complete_times, min_timestamp, max_timestamp, num_buckets
+        ),
+    )
+
   @utils.Synchronized
   def ReadHuntOutputPluginLogEntries(
       self,
@@ -598,8 +711,10 @@ class InMemoryDBHuntMixin(object):
       with_type: Optional[
           flows_pb2.FlowOutputPluginLogEntry.LogEntryType.ValueType
       ] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowOutputPluginLogEntry]:
     """Reads hunt output plugin log entries."""
+    del max_staleness  # Unused.
 
     all_entries = []
     for flow_obj in self._GetHuntFlows(hunt_id):
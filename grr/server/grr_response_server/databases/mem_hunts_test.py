@@ -14,7 +14,20 @@ class MemoryDBHuntTest(
     mem_test_base.MemoryDBTestBase,
     absltest.TestCase,
 ):
-  pass
+
+  def testRepairHuntCountersFixesDriftedCounters(self):
+    hunt_id = db_test_utils.InitializeHunt(self.db)
+    client_id = db_test_utils.InitializeClient(self.db)
+    db_test_utils.InitializeFlow(
+        self.db, client_id, flow_id=hunt_id, parent_hunt_id=hunt_id
+    )
+    hunt_counters = self.db.ReadHuntCounters(hunt_id)
+
+    self.db.delegate.hunt_counters[hunt_id]["num_clients"] += 5
+    self.assertNotEqual(self.db.ReadHuntCounters(hunt_id), hunt_counters)
+
+    self.assertEqual(self.db.RepairHuntCounters([hunt_id]), [hunt_id])
+    self.assertEqual(self.db.ReadHuntCounters(hunt_id), hunt_counters)
 
 
 if __name__ == "__main__":
@@ -9,8 +9,9 @@ import contextlib
 import logging
 import math
 import random
+import threading
 import time
-from typing import Union
+from typing import Optional, Union
 import warnings
 
 # Note: Please refer to server/setup.py for the MySQLdb version that is used.
@@ -36,6 +37,7 @@ from grr_response_server.databases import mysql_hunts
 from grr_response_server.databases import mysql_migration
 from grr_response_server.databases import mysql_paths
 from grr_response_server.databases import mysql_pool
+from grr_response_server.databases import mysql_replicas
 from grr_response_server.databases import mysql_signed_binaries
 from grr_response_server.databases import mysql_signed_commands
 from grr_response_server.databases import mysql_users
@@ -440,6 +442,10 @@ def _Connect(
   return conn
 
 
+# How often (in seconds) pools evict stale idle connections and open new ones
+# to keep the configured number of idle connections ready.
+_POOL_MAINTENANCE_INTERVAL = 10.0
+
 _TXN_RETRY_JITTER_MIN = 1.0
 _TXN_RETRY_JITTER_MAX = 2.0
 _TXN_RETRY_BACKOFF_BASE = 1.5
@@ -540,24 +546,124 @@ class MysqlDB(
     _SetupDatabase(**self._connect_args)
 
     self._max_pool_size = config.CONFIG["Mysql.conn_pool_max"]
-    self.pool = mysql_pool.Pool(self._Connect, max_size=self._max_pool_size)
+    self.pool = self._CreatePool("write", self._max_pool_size)
+
+    # Read-only transactions get their own pool if configured, so that heavy
+    # reads can't starve writers of connections.
+    read_pool_size = config.CONFIG["Mysql.read_pool_max"]
+    if read_pool_size:
+      self.read_pool = self._CreatePool("read", read_pool_size)
+    else:
+      self.read_pool = self.pool
+
+    self.replicas = None
+    replica_addresses = config.CONFIG["Mysql.replicas"]
+    if replica_addresses:
+      self.replicas = mysql_replicas.ReplicaSet(
+          [self._CreateReplica(address) for address in replica_addresses]
+      )
 
     self.handler_thread = None
     self.handler_stop = True
 
     self.flow_processing_request_handler_thread = None
     self.flow_processing_request_handler_stop = None
+    self.flow_processing_request_wakeup = threading.Event()
+    lanes = None
+    lane_queue_size = config.CONFIG["Mysql.flow_processing_lane_queue_size"]
+    if lane_queue_size:
+      lanes = [
+          (mysql_flows.FLOW_PROCESSING_INTERACTIVE_LANE, lane_queue_size),
+          (mysql_flows.FLOW_PROCESSING_HUNT_LANE, lane_queue_size),
+      ]
     self.flow_processing_request_handler_pool = threadpool.ThreadPool.Factory(
         "flow_processing_pool",
         min_threads=config.CONFIG["Mysql.flow_processing_threads_min"],
         max_threads=config.CONFIG["Mysql.flow_processing_threads_max"],
+        lanes=lanes,
     )
 
   def _Connect(self):
     return _Connect(**self._connect_args)
 
+  def _CreatePool(
+      self,
+      name: str,
+      max_size: int,
+      connect_func: Optional[Callable[[], MySQLdb.Connection]] = None,
+  ) -> mysql_pool.Pool:
+    """Creates a connection pool configured by the `Mysql.conn_*` options."""
+    max_age = config.CONFIG["Mysql.conn_max_age"]
+    idle_timeout = config.CONFIG["Mysql.conn_idle_timeout"]
+    pool = mysql_pool.Pool(
+        connect_func or self._Connect,
+        max_size=max_size,
+        min_idle=min(config.CONFIG["Mysql.conn_pool_min_idle"], max_size),
+        max_idle=min(
+            config.CONFIG["Mysql.conn_pool_max_idle"] or max_size, max_size
+        ),
+        max_age=max_age.ToFractional(rdfvalue.SECONDS) if max_age else None,
+        idle_timeout=(
+            idle_timeout.ToFractional(rdfvalue.SECONDS)
+            if idle_timeout
+            else None
+        ),
+        validate_on_borrow=config.CONFIG["Mysql.conn_validate_on_borrow"],
+        name=name,
+    )
+    if pool.min_idle or pool.idle_timeout is not None:
+      pool.StartMaintenance(_POOL_MAINTENANCE_INTERVAL)
+    return pool
+
+  def _CreateReplica(self, address: str) -> mysql_replicas.Replica:
+    """Creates a read replica reachable at a `host[:port]` address."""
+    host, _, port = address.rpartition(":")
+    if not host:
+      host, port = address, None
+
+    connect_args = dict(self._connect_args)
+    connect_args["host"] = host
+    if port:
+      connect_args["port"] = int(port)
+
+    def Connect():
+      return _Connect(**connect_args)
+
+    lag_check_interval = config.CONFIG["Mysql.replica_lag_check_interval"]
+    return mysql_replicas.Replica(
+        address,
+        self._CreatePool(
+            "replica:" + address,
+            config.CONFIG["Mysql.replica_pool_max"],
+            connect_func=Connect,
+        ),
+        lag_check_interval=lag_check_interval.ToFractional(rdfvalue.SECONDS),
+    )
+
   def Close(self):
     self.pool.close()
+    if self.read_pool is not self.pool:
+      self.read_pool.close()
+    if self.replicas is not None:
+      self.replicas.Close()
+
+  def _PickPool(
+      self,
+      readonly: bool,
+      max_staleness: Optional[rdfvalue.Duration],
+  ) -> tuple[mysql_pool.Pool, int]:
+    """Picks the pool to run a transaction on and returns it with its size."""
+    if not readonly:
+      return self.pool, self._max_pool_size
+
+    if max_staleness is not None and self.replicas is not None:
+      replica = self.replicas.Pick(max_staleness.ToFractional(rdfvalue.SECONDS))
+      if replica is not None:
+        return replica.pool, replica.pool.max_size
+
+    if self.read_pool is not self.pool:
+      return self.read_pool, self.read_pool.max_size
+    return self.pool, self._max_pool_size
 
   def _RunInTransaction(
       self,
@@ -566,6 +672,7 @@ class MysqlDB(
           None,
       ],
       readonly: bool = False,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> None:
     """Runs function within a transaction.
 
@@ -581,6 +688,9 @@ class MysqlDB(
       function: A function to be run.
       readonly: Indicates that only a readonly (snapshot) transaction is
         required.
+      max_staleness: If set, a readonly transaction may run on a read replica
+        that lags behind the primary by at most this much. Falls back to the
+        primary if no replica is fresh enough.
 
     Returns:
       The value returned by the last call to function.
@@ -591,10 +701,12 @@ class MysqlDB(
     if readonly:
       start_query = "START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY"
 
+    pool, max_pool_size = self._PickPool(readonly, max_staleness)
+
     broken_connections_seen = 0
     txn_execution_attempts = 0
     while True:
-      with contextlib.closing(self.pool.get()) as connection:
+      with contextlib.closing(pool.get()) as connection:
         try:
           with contextlib.closing(connection.cursor()) as cursor:
             cursor.execute(start_query)
@@ -621,8 +733,13 @@ class MysqlDB(
             # retry with all connections in the pool, expecting that they
             # will get removed from the pool when they error out. Eventually,
             # the pool will create new connections.
+            if pool is not self.pool and pool is not self.read_pool:
+              # Don't wait for a broken replica to recover, read from the
+              # primary instead.
+              pool, max_pool_size = self._PickPool(readonly, None)
+              continue
             broken_connections_seen += 1
-            if broken_connections_seen > self._max_pool_size:
+            if broken_connections_seen > max_pool_size:
               # All existing connections in the pool have been exhausted, and
               # we have tried to create at least one new connection.
               raise
@@ -1026,6 +1026,17 @@ class MySQLDBClientMixin(object):
         [db_utils.ClientIDToInt(client_id)],
     )
 
+    # Rows removed by `ON DELETE CASCADE` don't fire triggers, so hunt flows
+    # are deleted explicitly to keep the hunt counters up to date.
+    cursor.execute(
+        """
+    DELETE FROM flows
+     WHERE client_id = %s
+       AND parent_hunt_id IS NOT NULL
+       AND parent_flow_id IS NULL""",
+        [db_utils.ClientIDToInt(client_id)],
+    )
+
     cursor.execute(
         "DELETE FROM clients WHERE client_id = %s",
         [db_utils.ClientIDToInt(client_id)],
@@ -16,6 +16,7 @@ from grr_response_core.lib import rdfvalue
 from grr_response_core.lib import utils
 from grr_response_core.lib.util import collection
 from grr_response_core.lib.util import random
+from grr_response_core.stats import metrics
 from grr_response_proto import flows_pb2
 from grr_response_proto import jobs_pb2
 from grr_response_proto import objects_pb2
@@ -26,12 +27,51 @@ from grr_response_server.databases import mysql_utils
 from grr_response_server.models import hunts as models_hunts
 from grr_response_proto import rrg_pb2
 
+FLOW_PROCESSING_REQUEST_QUEUEING_TIME = metrics.Event(
+    "flow_processing_request_queueing_time",
+    bins=[0.01 * 1.5**x for x in range(20)],
+)  # 10ms to ~20 secs
+FLOW_PROCESSING_REQUEST_LEASE_ATTEMPTS = metrics.Counter(
+    "flow_processing_request_lease_attempts", fields=[("result", str)]
+)
+
+MYSQL_FLOW_STEP_ROUND_TRIPS = metrics.Event(
+    "mysql_flow_step_round_trips",
+    bins=[1, 2, 4, 8, 16, 32, 64, 128],
+)
+
+# Priority lanes of the flow processing thread pool (see
+# Mysql.flow_processing_lane_queue_size). Requests of flows started by hunts go
+# to the lower priority lane, so they don't delay interactive flows.
+FLOW_PROCESSING_INTERACTIVE_LANE = "interactive"
+FLOW_PROCESSING_HUNT_LANE = "hunt"
+
+
+class _CountingCursor:
+  """Cursor wrapper counting the statements sent to the server."""
+
+  def __init__(self, cursor: cursors.Cursor):
+    self._cursor = cursor
+    self.executed = 0
+
+  def execute(self, *args, **kwargs):  # pylint: disable=invalid-name
+    self.executed += 1
+    return self._cursor.execute(*args, **kwargs)
+
+  def executemany(self, *args, **kwargs):  # pylint: disable=invalid-name
+    self.executed += 1
+    return self._cursor.executemany(*args, **kwargs)
+
+  def __getattr__(self, name):
+    return getattr(self._cursor, name)
+
 
 class MySQLDBFlowMixin:
   """MySQLDB mixin for flow handling."""
 
   flow_processing_request_handler_pool: threadpool.ThreadPool
   flow_processing_request_handler_thread: threading.Thread
+  flow_processing_request_wakeup: threading.Event
   handler_thread: threading.Thread
   _WRITE_ROWS_BATCH_SIZE: int
   _DELETE_ROWS_BATCH_SIZE: int
@@ -140,6 +180,11 @@ class MySQLDBFlowMixin:
         raise RuntimeError("Message handler thread did not join in time.")
       self.handler_thread = None
 
+  # The batch size follows the observed backlog: it doubles (up to the limit
+  # passed by the caller) whenever a full batch is leased and shrinks back when
+  # the queue drains. The poll interval doubles on every empty lease attempt.
+  _MESSAGE_HANDLER_MIN_BATCH_SIZE = 10
+  _MESSAGE_HANDLER_MIN_POLL_TIME_SECS = 0.1
   _MESSAGE_HANDLER_POLL_TIME_SECS = 5
 
   def _MessageHandlerLoop(
@@ -149,13 +194,24 @@ class MySQLDBFlowMixin:
       limit: int = 1000,
   ) -> None:
     """Loop to handle outstanding requests."""
+    batch_size = min(limit, self._MESSAGE_HANDLER_MIN_BATCH_SIZE)
+    poll_time = self._MESSAGE_HANDLER_MIN_POLL_TIME_SECS
     while not self.handler_stop:
       try:
-        msgs = self._LeaseMessageHandlerRequests(lease_time, limit)
+        msgs = self._LeaseMessageHandlerRequests(lease_time, batch_size)
         if msgs:
+          if len(msgs) >= batch_size:
+            batch_size = min(batch_size * 2, limit)
+          else:
+            batch_size = max(
+                min(limit, self._MESSAGE_HANDLER_MIN_BATCH_SIZE),
+                batch_size // 2,
+            )
+          poll_time = self._MESSAGE_HANDLER_MIN_POLL_TIME_SECS
           handler(msgs)
         else:
-          time.sleep(self._MESSAGE_HANDLER_POLL_TIME_SECS)
+          time.sleep(poll_time)
+          poll_time = min(poll_time * 2, self._MESSAGE_HANDLER_POLL_TIME_SECS)
       except Exception as e:  # pylint: disable=broad-except
         logging.exception("_LeaseMessageHandlerRequests raised %s.", e)
 
@@ -640,6 +696,12 @@ class MySQLDBFlowMixin:
     query += ", ".join(templates)
     cursor.execute(query, args)
 
+    # The wakeup may happen before the surrounding transaction is committed. In
+    # that case the handler loop finds nothing to lease and retries after the
+    # minimum poll interval, so the delay is bounded by that interval.
+    if any(not req.delivery_time for req in requests):
+      self.flow_processing_request_wakeup.set()
+
   @db_utils.CallLogged
   @db_utils.CallAccounted
   @mysql_utils.WithTransaction()
@@ -1365,6 +1427,48 @@ class MySQLDBFlowMixin:
     rows_updated = cursor.execute(update_query, args)
     return rows_updated == 1
 
+  @db_utils.CallLogged
+  @db_utils.CallAccounted
+  @mysql_utils.WithTransaction()
+  def CommitFlowStep(
+      self,
+      requests: Collection[flows_pb2.FlowRequest] = (),
+      responses: Sequence[
+          Union[
+              flows_pb2.FlowResponse,
+              flows_pb2.FlowStatus,
+              flows_pb2.FlowIterator,
+          ],
+      ] = (),
+      completed_requests: Sequence[flows_pb2.FlowRequest] = (),
+      results: Sequence[flows_pb2.FlowResult] = (),
+      flow_obj: Optional[flows_pb2.Flow] = None,
+      cursor: Optional[cursors.Cursor] = None,
+  ) -> bool:
+    """Atomically stores everything a flow produced while being processed."""
+    assert cursor is not None
+    cursor = _CountingCursor(cursor)
+
+    if requests:
+      self.WriteFlowRequests(requests, cursor=cursor)
+
+    for batch in collection.Batch(responses, self._WRITE_ROWS_BATCH_SIZE):
+      self._WriteFlowResponsesAndExpectedUpdates(batch, cursor=cursor)
+      self._UpdateRequestsAndScheduleFPRs(batch, cursor=cursor)
+
+    if completed_requests:
+      self.DeleteFlowRequests(completed_requests, cursor=cursor)
+
+    if results:
+      self._WriteFlowResultsOrErrors("flow_results", results, cursor=cursor)
+
+    released = True
+    if flow_obj is not None:
+      released = self.ReleaseProcessedFlow(flow_obj, cursor=cursor)
+
+    MYSQL_FLOW_STEP_ROUND_TRIPS.RecordEvent(cursor.executed)
+    return released
+
   @db_utils.CallLogged
   @db_utils.CallAccounted
   @mysql_utils.WithTransaction()
@@ -1446,9 +1550,22 @@ class MySQLDBFlowMixin:
   @db_utils.CallAccounted
   @mysql_utils.WithTransaction()
   def _LeaseFlowProcessingRequests(
-      self, limit: int, cursor=None
-  ) -> Sequence[flows_pb2.FlowProcessingRequest]:
-    """Leases a number of flow processing requests."""
+      self, limit: int, with_hunt_flows: bool = False, cursor=None
+  ) -> Sequence[tuple[flows_pb2.FlowProcessingRequest, bool]]:
+    """Leases a number of flow processing requests.
+
+    Args:
+      limit: The maximum number of requests to lease.
+      with_hunt_flows: Whether to look up which of the requests belong to flows
+        started by hunts. This requires joining the flows table, so it is only
+        done when the flow processing thread pool has priority lanes.
+      cursor: MySQL cursor.
+
+    Returns:
+      A sequence of (request, is_hunt_flow) tuples, where is_hunt_flow tells
+      whether the request belongs to a flow started by a hunt. It is always
+      False if `with_hunt_flows` is not set.
+    """
     now = rdfvalue.RDFDatetime.Now()
     expiry = now + rdfvalue.Duration.From(10, rdfvalue.MINUTES)
 
@@ -1479,13 +1596,24 @@ class MySQLDBFlowMixin:
     if updated == 0:
       return []
 
-    query = """
-      SELECT UNIX_TIMESTAMP(timestamp), request
-      FROM flow_processing_requests
-      FORCE INDEX (flow_processing_requests_by_lease)
-      WHERE leased_by=%(id)s AND leased_until=FROM_UNIXTIME(%(expiry)s)
-      LIMIT %(updated)s
-    """
+    if with_hunt_flows:
+      query = """
+        SELECT UNIX_TIMESTAMP(r.timestamp), r.request, f.parent_hunt_id
+        FROM flow_processing_requests AS r
+        FORCE INDEX (flow_processing_requests_by_lease)
+        LEFT JOIN flows AS f
+          ON r.client_id = f.client_id AND r.flow_id = f.flow_id
+        WHERE r.leased_by=%(id)s AND r.leased_until=FROM_UNIXTIME(%(expiry)s)
+        LIMIT %(updated)s
+      """
+    else:
+      query = """
+        SELECT UNIX_TIMESTAMP(timestamp), request, NULL
+        FROM flow_processing_requests
+        FORCE INDEX (flow_processing_requests_by_lease)
+        WHERE leased_by=%(id)s AND leased_until=FROM_UNIXTIME(%(expiry)s)
+        LIMIT %(updated)s
+      """
 
     args = {
         "expiry": expiry_str,
@@ -1496,16 +1624,22 @@ class MySQLDBFlowMixin:
     cursor.execute(query, args)
 
     res = []
-    for timestamp, request in cursor.fetchall():
+    for timestamp, request, parent_hunt_id in cursor.fetchall():
       req = flows_pb2.FlowProcessingRequest()
       req.ParseFromString(request)
       req.creation_time = mysql_utils.TimestampToMicrosecondsSinceEpoch(
           timestamp
       )
-      res.append(req)
+      res.append((req, parent_hunt_id is not None))
 
     return res
 
+  # Flow processing requests are written by other processes too (e.g. by the
+  # frontend when client responses arrive), so polling is still needed. The
+  # poll interval starts at the minimum and doubles with every empty lease
+  # attempt up to the maximum. Writes made through this database object wake
+  # the handler loop up immediately.
+  _FLOW_REQUEST_MIN_POLL_TIME_SECS = 0.05
   _FLOW_REQUEST_POLL_TIME_SECS = 3
 
   def _FlowProcessingRequestHandlerLoop(
@@ -1514,21 +1648,54 @@ class MySQLDBFlowMixin:
     """The main loop for the flow processing request queue."""
     self.flow_processing_request_handler_pool.Start()
 
+    poll_time = self._FLOW_REQUEST_MIN_POLL_TIME_SECS
     while not self.flow_processing_request_handler_stop:
       thread_pool = self.flow_processing_request_handler_pool
-      free_threads = thread_pool.max_threads - thread_pool.busy_threads
-      if free_threads == 0:
-        time.sleep(self._FLOW_REQUEST_POLL_TIME_SECS)
+      if thread_pool.lanes:
+        # Any leased request can end up in any lane, so only as many requests
+        # are leased as the fullest lane can still take without blocking.
+        free_capacity = min(
+            thread_pool.FreeCapacity(lane=lane) for lane in thread_pool.lanes
+        )
+      else:
+        free_capacity = thread_pool.FreeCapacity()
+      if free_capacity == 0:
+        time.sleep(self._FLOW_REQUEST_MIN_POLL_TIME_SECS)
         continue
       try:
-        msgs = self._LeaseFlowProcessingRequests(free_threads)
+        # Clearing before leasing guarantees that writes that happen while
+        # leasing is in progress are not missed.
+        self.flow_processing_request_wakeup.clear()
+        msgs = self._LeaseFlowProcessingRequests(
+            free_capacity, with_hunt_flows=bool(thread_pool.lanes)
+        )
         if msgs:
-          for m in msgs:
-            self.flow_processing_request_handler_pool.AddTask(
-                target=handler, args=(m,)
+          FLOW_PROCESSING_REQUEST_LEASE_ATTEMPTS.Increment(fields=["leased"])
+          now = rdfvalue.RDFDatetime.Now().AsMicrosecondsSinceEpoch()
+          for m, is_hunt_flow in msgs:
+            queued_since = max(m.creation_time, m.delivery_time)
+            if queued_since:
+              FLOW_PROCESSING_REQUEST_QUEUEING_TIME.RecordEvent(
+                  max(0, now - queued_since) / 1e6
+              )
+            lane = None
+            if thread_pool.lanes:
+              lane = (
+                  FLOW_PROCESSING_HUNT_LANE
+                  if is_hunt_flow
+                  else FLOW_PROCESSING_INTERACTIVE_LANE
+              )
+            # Never process requests inline: that would stall the lease loop.
+            thread_pool.AddTask(
+                target=handler, args=(m,), inline=False, lane=lane
             )
+          poll_time = self._FLOW_REQUEST_MIN_POLL_TIME_SECS
         else:
-          time.sleep(self._FLOW_REQUEST_POLL_TIME_SECS)
+          FLOW_PROCESSING_REQUEST_LEASE_ATTEMPTS.Increment(fields=["empty"])
+          if self.flow_processing_request_wakeup.wait(poll_time):
+            poll_time = self._FLOW_REQUEST_MIN_POLL_TIME_SECS
+          else:
+            poll_time = min(poll_time * 2, self._FLOW_REQUEST_POLL_TIME_SECS)
 
       except Exception as e:  # pylint: disable=broad-except
         logging.exception("_FlowProcessingRequestHandlerLoop raised %s.", e)
@@ -1558,6 +1725,7 @@ class MySQLDBFlowMixin:
     """Unregisters any registered flow processing handler."""
     if self.flow_processing_request_handler_thread:
       self.flow_processing_request_handler_stop = True
+      self.flow_processing_request_wakeup.set()
       self.flow_processing_request_handler_thread.join(timeout)
       if self.flow_processing_request_handler_thread.is_alive():
         raise RuntimeError("Flow processing handler did not join in time.")
@@ -1628,10 +1796,12 @@ class MySQLDBFlowMixin:
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
       with_substring: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
       cursor: Optional[cursors.Cursor] = None,
   ) -> Union[Sequence[flows_pb2.FlowResult], Sequence[flows_pb2.FlowError]]:
     """Reads flow results/errors of a given flow using given query options."""
     assert cursor is not None
+    del max_staleness  # Used by `WithTransaction`.
 
     client_id_int = db_utils.ClientIDToInt(client_id)
     flow_id_int = db_utils.FlowIDToInt(flow_id)
@@ -1712,6 +1882,7 @@ class MySQLDBFlowMixin:
       with_type: Optional[str] = None,
       with_proto_type_url: Optional[str] = None,
       with_substring: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowResult]:
     """Reads flow results of a given flow using given query options."""
     if with_proto_type_url is not None:
@@ -1727,6 +1898,7 @@ class MySQLDBFlowMixin:
         with_tag=with_tag,
         with_type=with_type,
         with_substring=with_substring,
+        max_staleness=max_staleness,
     )
 
   @db_utils.CallLogged
@@ -1739,10 +1911,12 @@ class MySQLDBFlowMixin:
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
       cursor: Optional[cursors.Cursor] = None,
   ) -> int:
     """Counts flow results/errors of a given flow using given query options."""
     assert cursor is not None
+    del max_staleness  # Used by `WithTransaction`.
 
     query = (
         "SELECT COUNT(*) "
@@ -1769,6 +1943,7 @@ class MySQLDBFlowMixin:
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     """Counts flow results of a given flow using given query options."""
     return self._CountFlowResultsOrErrors(
@@ -1777,6 +1952,7 @@ class MySQLDBFlowMixin:
         flow_id,
         with_tag=with_tag,
         with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   @db_utils.CallLogged
@@ -1841,6 +2017,7 @@ class MySQLDBFlowMixin:
       count: int,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> Sequence[flows_pb2.FlowError]:
     """Reads flow errors of a given flow using given query options."""
     # Errors are similar to results, as they represent a somewhat related
@@ -1856,6 +2033,7 @@ class MySQLDBFlowMixin:
         count,
         with_tag=with_tag,
         with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   def CountFlowErrors(
@@ -1864,6 +2042,7 @@ class MySQLDBFlowMixin:
       flow_id: str,
       with_tag: Optional[str] = None,
       with_type: Optional[str] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
   ) -> int:
     """Counts flow errors of a given flow using given query options."""
     # Errors are similar to results, as they represent a somewhat related
@@ -1876,6 +2055,7 @@ class MySQLDBFlowMixin:
         flow_id,
         with_tag=with_tag,
         with_type=with_type,
+        max_staleness=max_staleness,
     )
 
   def CountFlowErrorsByType(
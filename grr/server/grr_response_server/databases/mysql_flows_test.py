@@ -1,8 +1,15 @@
 #!/usr/bin/env python
+import threading
+import time
+from unittest import mock
+
 from absl import app
 from absl.testing import absltest
 
+from grr_response_proto import flows_pb2
 from grr_response_server.databases import db_flows_test
+from grr_response_server.databases import db_test_utils
+from grr_response_server.databases import mysql_flows
 from grr_response_server.databases import mysql_test
 from grr.test_lib import test_lib
 
@@ -12,7 +19,25 @@ class MysqlFlowTest(
     mysql_test.MysqlTestBase,
     absltest.TestCase,
 ):
-  pass
+
+  @mock.patch.object(
+      mysql_flows.MySQLDBFlowMixin, "_FLOW_REQUEST_POLL_TIME_SECS", 60
+  )
+  def testFlowProcessingHandlerIsWokenUpByWrites(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+    flow_id = db_test_utils.InitializeFlow(self.db, client_id)
+
+    handled = threading.Event()
+    self.db.RegisterFlowProcessingHandler(lambda _: handled.set())
+    self.addCleanup(self.db.UnregisterFlowProcessingHandler)
+
+    # Give the handler loop time to back off well beyond the wait below.
+    time.sleep(5)
+
+    self.db.WriteFlowProcessingRequests(
+        [flows_pb2.FlowProcessingRequest(client_id=client_id, flow_id=flow_id)]
+    )
+    self.assertTrue(handled.wait(2))
 
 
 if __name__ == "__main__":
@@ -36,6 +36,49 @@ _HUNT_COLUMNS_SELECT = ", ".join((
     "hunt",
 ))
 
+# Columns of the `hunt_counters` table, in the order of `db.HuntCounters`
+# fields.
+_HUNT_COUNTERS_COLUMNS_LIST = (
+    "num_clients",
+    "num_successful_clients",
+    "num_failed_clients",
+    "num_clients_with_results",
+    "num_crashed_clients",
+    "num_running_clients",
+    "num_results",
+    "total_cpu_micros",
+    "total_network_bytes_sent",
+)
+
+_HUNT_COUNTERS_COLUMNS = ", ".join(_HUNT_COUNTERS_COLUMNS_LIST)
+
+# Sums of the `hunt_counters` columns over all shard rows of a hunt.
+_HUNT_COUNTERS_SUMS = ", ".join(
+    f"SUM({column})" for column in _HUNT_COUNTERS_COLUMNS_LIST
+)
+
+_EMPTY_HUNT_COUNTERS = db.HuntCounters(
+    num_clients=0,
+    num_successful_clients=0,
+    num_failed_clients=0,
+    num_clients_with_results=0,
+    num_crashed_clients=0,
+    num_running_clients=0,
+    num_results=0,
+    total_cpu_seconds=0,
+    total_network_bytes_sent=0,
+)
+
+
+def _HuntCountersFromRow(row: Sequence[int]) -> db.HuntCounters:
+  """Builds hunt counters from a `hunt_counters` row (without the hunt id)."""
+  values = dict(zip(_HUNT_COUNTERS_COLUMNS_LIST, map(int, row)))
+  total_cpu_micros = values.pop("total_cpu_micros")
+  return db.HuntCounters(
+      total_cpu_seconds=db_utils.MicrosToSeconds(total_cpu_micros), **values
+  )
+
+
 _HUNT_OUTPUT_PLUGINS_STATES_COLUMNS = (
     "plugin_name",
     "plugin_args",
@@ -177,6 +220,9 @@ class MySQLDBHuntMixin(object):
     query = "DELETE FROM hunt_output_plugins_states WHERE hunt_id = %s"
     cursor.execute(query, [hunt_id_int])
 
+    query = "DELETE FROM hunt_counters WHERE hunt_id = %s"
+    cursor.execute(query, [hunt_id_int])
+
     query = """
     DELETE
       FROM approval_request
@@ -987,86 +1033,124 @@ class MySQLDBHuntMixin(object):
 
     hunt_ids_ints = [db_utils.HuntIDToInt(hunt_id) for hunt_id in hunt_ids]
 
-    query = """
-      SELECT parent_hunt_id, flow_state, COUNT(*)
-          FROM flows
-          FORCE INDEX(flows_by_hunt)
-          WHERE parent_hunt_id IN %(hunt_ids)s
-            AND parent_flow_id IS NULL
-          GROUP BY parent_hunt_id, flow_state
+    # The counters are maintained by the triggers on the `flows` table (see
+    # the 0032 migration), so this only sums a few shard rows per hunt instead
+    # of aggregating over all the hunt flows.
+    query = f"""
+      SELECT hunt_id, {_HUNT_COUNTERS_SUMS}
+        FROM hunt_counters
+       WHERE hunt_id IN %(hunt_ids)s
+       GROUP BY hunt_id
     """
     cursor.execute(query, {"hunt_ids": tuple(hunt_ids_ints)})
 
-    counts_by_state_per_hunt = dict.fromkeys(hunt_ids_ints, {})
-    for hunt_id, state, count in cursor.fetchall():
-      counts_by_state_per_hunt[hunt_id][state] = count
-
-    hunt_counters = dict.fromkeys(
-        hunt_ids,
-        db.HuntCounters(
-            num_clients=0,
-            num_successful_clients=0,
-            num_failed_clients=0,
-            num_clients_with_results=0,
-            num_crashed_clients=0,
-            num_running_clients=0,
-            num_results=0,
-            total_cpu_seconds=0,
-            total_network_bytes_sent=0,
-        ),
-    )
+    hunt_counters = dict.fromkeys(hunt_ids, _EMPTY_HUNT_COUNTERS)
+    for hunt_id, *values in cursor.fetchall():
+      hunt_counters[db_utils.IntToHuntID(hunt_id)] = _HuntCountersFromRow(
+          values
+      )
+    return hunt_counters
 
+  def _ComputeHuntsCountersRows(
+      self,
+      hunt_ids_ints: Collection[int],
+      cursor: cursors.Cursor,
+  ) -> dict[int, tuple[int, ...]]:
+    """Aggregates hunt counters over the flows of the given hunts."""
+    # Note: `LOCK IN SHARE MODE` makes concurrent flow updates (and the
+    # triggers they fire) wait for the transaction to finish, so that the
+    # computed counters are not outdated by the time they are written.
     query = """
-        SELECT
-          parent_hunt_id,
-          SUM(user_cpu_time_used_micros + system_cpu_time_used_micros),
-          SUM(network_bytes_sent),
-          SUM(num_replies_sent),
-          COUNT(IF(num_replies_sent > 0, client_id, NULL))
-        FROM flows
-        FORCE INDEX(flows_by_hunt)
-        WHERE parent_hunt_id IN %(hunt_ids)s
-          AND parent_flow_id IS NULL
-        GROUP BY parent_hunt_id
+      SELECT
+        parent_hunt_id,
+        COUNT(*),
+        SUM(IFNULL(flow_state, 0) = %(finished)s),
+        SUM(IFNULL(flow_state, 0) = %(error)s),
+        SUM(IFNULL(num_replies_sent, 0) > 0),
+        SUM(IFNULL(flow_state, 0) = %(crashed)s),
+        SUM(IFNULL(flow_state, 0) = %(running)s),
+        SUM(IFNULL(num_replies_sent, 0)),
+        SUM(IFNULL(user_cpu_time_used_micros, 0) +
+            IFNULL(system_cpu_time_used_micros, 0)),
+        SUM(IFNULL(network_bytes_sent, 0))
+      FROM flows
+      FORCE INDEX(flows_by_hunt)
+      WHERE parent_hunt_id IN %(hunt_ids)s
+        AND parent_flow_id IS NULL
+      GROUP BY parent_hunt_id
+      LOCK IN SHARE MODE
+    """
+    args = {
+        "hunt_ids": tuple(hunt_ids_ints),
+        "finished": int(flows_pb2.Flow.FlowState.FINISHED),
+        "error": int(flows_pb2.Flow.FlowState.ERROR),
+        "crashed": int(flows_pb2.Flow.FlowState.CRASHED),
+        "running": int(flows_pb2.Flow.FlowState.RUNNING),
+    }
+    cursor.execute(query, args)
+
+    rows = dict.fromkeys(hunt_ids_ints, (0,) * len(db.HuntCounters._fields))
+    for hunt_id, *values in cursor.fetchall():
+      rows[hunt_id] = tuple(int(v or 0) for v in values)
+    return rows
+
+  @db_utils.CallLogged
+  @db_utils.CallAccounted
+  @mysql_utils.WithTransaction()
+  def RepairHuntCounters(
+      self,
+      hunt_ids: Collection[str],
+      cursor: Optional[cursors.Cursor] = None,
+  ) -> Collection[str]:
+    """Recomputes hunt counters and fixes the ones that drifted."""
+    assert cursor is not None
+    if not hunt_ids:
+      return []
+
+    hunt_ids_ints = [db_utils.HuntIDToInt(hunt_id) for hunt_id in hunt_ids]
+    expected = self._ComputeHuntsCountersRows(hunt_ids_ints, cursor)
+
+    query = f"""
+      SELECT hunt_id, {_HUNT_COUNTERS_SUMS}
+        FROM hunt_counters
+       WHERE hunt_id IN %(hunt_ids)s
+       GROUP BY hunt_id
+         FOR UPDATE
     """
     cursor.execute(query, {"hunt_ids": tuple(hunt_ids_ints)})
+    actual = {
+        hunt_id: tuple(int(v) for v in values)
+        for hunt_id, *values in cursor.fetchall()
+    }
 
-    for (
-        hunt_id,
-        total_cpu_seconds,
-        total_network_bytes_sent,
-        num_results,
-        num_clients_with_results,
-    ) in cursor.fetchall():
-      counts_by_state = counts_by_state_per_hunt[hunt_id]
-      num_successful_clients = counts_by_state.get(
-          int(flows_pb2.Flow.FlowState.FINISHED), 0
-      )
-      num_failed_clients = counts_by_state.get(
-          int(flows_pb2.Flow.FlowState.ERROR), 0
-      )
-      num_crashed_clients = counts_by_state.get(
-          int(flows_pb2.Flow.FlowState.CRASHED), 0
-      )
-      num_running_clients = counts_by_state.get(
-          int(flows_pb2.Flow.FlowState.RUNNING), 0
-      )
-      num_clients = sum(counts_by_state_per_hunt[hunt_id].values())
-
-      hunt_counters[db_utils.IntToHuntID(hunt_id)] = db.HuntCounters(
-          num_clients=num_clients,
-          num_successful_clients=num_successful_clients,
-          num_failed_clients=num_failed_clients,
-          num_clients_with_results=num_clients_with_results,
-          num_crashed_clients=num_crashed_clients,
-          num_running_clients=num_running_clients,
-          num_results=int(num_results or 0),
-          total_cpu_seconds=db_utils.MicrosToSeconds(
-              int(total_cpu_seconds or 0)
-          ),
-          total_network_bytes_sent=int(total_network_bytes_sent or 0),
-      )
-    return hunt_counters
+    drifted = [
+        hunt_id
+        for hunt_id, values in expected.items()
+        if actual.get(hunt_id, (0,) * len(values)) != values
+    ]
+    if not drifted:
+      return []
+
+    # The drifted counters are replaced by a single shard row holding the
+    # totals. The triggers keep adding to the other shards afterwards.
+    query = "DELETE FROM hunt_counters WHERE hunt_id IN %(hunt_ids)s"
+    cursor.execute(query, {"hunt_ids": tuple(drifted)})
+
+    row_placeholders = "({})".format(
+        ", ".join(["%s"] * (len(_HUNT_COUNTERS_COLUMNS_LIST) + 2))
+    )
+    query = f"""
+      INSERT INTO hunt_counters(hunt_id, shard, {_HUNT_COUNTERS_COLUMNS})
+      VALUES {", ".join([row_placeholders] * len(drifted))}
+    """
+    args = []
+    for hunt_id in drifted:
+      args.append(hunt_id)
+      args.append(0)
+      args.extend(expected[hunt_id])
+    cursor.execute(query, args)
+
+    return [db_utils.IntToHuntID(hunt_id) for hunt_id in drifted]
 
   def _BinsToQuery(self, bins: list[int], column_name: str) -> str:
     """Builds an SQL query part to fetch counts corresponding to given bins."""
@@ -1224,10 +1308,12 @@ class MySQLDBHuntMixin(object):
   def ReadHuntFlowsStatesAndTimestamps(
       self,
       hunt_id: str,
+      max_staleness: Optional[rdfvalue.Duration] = None,
       cursor: Optional[cursors.Cursor] = None,
   ) -> Sequence[db.FlowStateAndTimestamps]:
     """Reads hunt flows states and timestamps."""
     assert cursor is not None
+    del max_staleness  # Used by `WithTransaction`.
 
     query = """
       SELECT
@@ -1251,6 +1337,88 @@ class MySQLDBHuntMixin(object):
 
     return result
 
+  @db_utils.CallLogged
+  @db_utils.CallAccounted
+  @mysql_utils.WithTransaction(readonly=True)
+  def ReadHuntFlowsTimestampHistograms(
+      self,
+      hunt_id: str,
+      num_buckets: int,
+      max_staleness: Optional[rdfvalue.Duration] = None,
+      cursor: Optional[cursors.Cursor] = None,
+  ) -> Optional[db.HuntFlowsTimestampHistograms]:
+    """Reads histograms of hunt flows creation and completion times."""
+    assert cursor is not None
+    del max_staleness  # Used by `WithTransaction`.
+
+    args = {
+        "hunt_id": db_utils.HuntIDToInt(hunt_id),
+        "running": int(flows_pb2.Flow.FlowState.RUNNING),
+    }
+
+    query = """
+      SELECT
+        MIN(FLOOR(UNIX_TIMESTAMP(timestamp))),
+        MAX(FLOOR(UNIX_TIMESTAMP(timestamp))),
+        MAX(IF(flow_state != %(running)s,
+               FLOOR(UNIX_TIMESTAMP(last_update)), NULL))
+      FROM flows
+      FORCE INDEX(flows_by_hunt)
+      WHERE parent_hunt_id = %(hunt_id)s AND parent_flow_id IS NULL
+    """
+    cursor.execute(query, args)
+    min_create, max_create, max_complete = cursor.fetchone()
+    if min_create is None:
+      return None
+
+    min_timestamp = int(min_create)
+    max_timestamp = max(int(max_create), int(max_complete or 0))
+
+    # Same bucketing as `db_utils.BucketTimestamps`, done with integer
+    # arithmetic so that both agree on bucket boundaries.
+    args["min_timestamp"] = min_timestamp
+    args["num_buckets"] = num_buckets
+    args["span"] = max(max_timestamp - min_timestamp, 1)
+    args["last_bucket"] = num_buckets - 1
+
+    bucket_template = """
+      SELECT
+        GREATEST(0, LEAST(
+            (FLOOR(UNIX_TIMESTAMP({column})) - %(min_timestamp)s)
+            * %(num_buckets)s DIV %(span)s,
+            %(last_bucket)s)) AS bucket,
+        COUNT(*)
+      FROM flows
+      FORCE INDEX(flows_by_hunt)
+      WHERE parent_hunt_id = %(hunt_id)s AND parent_flow_id IS NULL
+        {condition}
+      GROUP BY bucket
+    """
+
+    cursor.execute(
+        bucket_template.format(column="timestamp", condition=""), args
+    )
+    started_counts = [0] * num_buckets
+    for bucket, count in cursor.fetchall():
+      started_counts[int(bucket)] = int(count)
+
+    cursor.execute(
+        bucket_template.format(
+            column="last_update", condition="AND flow_state != %(running)s"
+        ),
+        args,
+    )
+    completed_counts = [0] * num_buckets
+    for bucket, count in cursor.fetchall():
+      completed_counts[int(bucket)] = int(count)
+
+    return db.HuntFlowsTimestampHistograms(
+        min_timestamp=min_timestamp,
+        max_timestamp=max_timestamp,
+        started_counts=started_counts,
+        completed_counts=completed_counts,
+    )
+
   @db_utils.CallLogged
   @db_utils.CallAccounted
   @mysql_utils.WithTransaction(readonly=True)
@@ -1263,10 +1431,12 @@ class MySQLDBHuntMixin(object):
       with_type: Optional[
           flows_pb2.FlowOutputPluginLogEntry.LogEntryType.ValueType
       ] = None,
+      max_staleness: Optional[rdfvalue.Duration] = None,
       cursor: Optional[cursors.Cursor] = None,
   ) -> Sequence[flows_pb2.FlowOutputPluginLogEntry]:
     """Reads hunt output plugin log entries."""
     assert cursor is not None
+    del max_staleness  # Used by `WithTransaction`.
     query = (
         "SELECT client_id, flow_id, log_entry_type, message, "
         "UNIX_TIMESTAMP(timestamp) "
@@ -0,0 +1,204 @@
+-- Materialized per-hunt counters, so that reading hunt counters doesn't have
+-- to aggregate over all the hunt's flows.
+--
+-- The counters are kept up to date by the triggers on the `flows` table
+-- below. Note that the counter columns are signed, since the triggers apply
+-- (possibly negative) deltas.
+--
+-- Every hunt's counters are split into up to 16 shard rows (picked by the
+-- flow's client id), so that the flow writes of a large hunt don't all
+-- contend for the lock on a single row. The hunt's counters are the sums over
+-- its shard rows.
+CREATE TABLE IF NOT EXISTS hunt_counters(
+    hunt_id BIGINT UNSIGNED NOT NULL,
+    shard TINYINT UNSIGNED NOT NULL,
+    num_clients BIGINT NOT NULL DEFAULT 0,
+    num_successful_clients BIGINT NOT NULL DEFAULT 0,
+    num_failed_clients BIGINT NOT NULL DEFAULT 0,
+    num_crashed_clients BIGINT NOT NULL DEFAULT 0,
+    num_running_clients BIGINT NOT NULL DEFAULT 0,
+    num_clients_with_results BIGINT NOT NULL DEFAULT 0,
+    num_results BIGINT NOT NULL DEFAULT 0,
+    total_cpu_micros BIGINT NOT NULL DEFAULT 0,
+    total_network_bytes_sent BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (hunt_id, shard)
+);
+
+-- Initialize the counters of the existing hunts. Flows written between this
+-- statement and the creation of the triggers are picked up by the periodic
+-- counters repair (see `RepairHuntCounters`).
+INSERT INTO hunt_counters(
+  hunt_id,
+  shard,
+  num_clients,
+  num_successful_clients,
+  num_failed_clients,
+  num_crashed_clients,
+  num_running_clients,
+  num_clients_with_results,
+  num_results,
+  total_cpu_micros,
+  total_network_bytes_sent)
+SELECT
+  parent_hunt_id,
+  client_id % 16,
+  COUNT(*),
+  SUM(IFNULL(flow_state, 0) = 2),
+  SUM(IFNULL(flow_state, 0) = 3),
+  SUM(IFNULL(flow_state, 0) = 4),
+  SUM(IFNULL(flow_state, 0) = 1),
+  SUM(IFNULL(num_replies_sent, 0) > 0),
+  SUM(IFNULL(num_replies_sent, 0)),
+  SUM(IFNULL(user_cpu_time_used_micros, 0) +
+      IFNULL(system_cpu_time_used_micros, 0)),
+  SUM(IFNULL(network_bytes_sent, 0))
+FROM flows
+FORCE INDEX(flows_by_hunt)
+WHERE parent_hunt_id IS NOT NULL
+  AND parent_flow_id IS NULL
+GROUP BY parent_hunt_id, client_id % 16
+ON DUPLICATE KEY UPDATE hunt_id = hunt_id;
+
+-- Flow states (see `Flow.FlowState`) used below:
+-- 1 - RUNNING, 2 - FINISHED, 3 - ERROR, 4 - CRASHED.
+
+-- Account for a new hunt flow.
+CREATE
+  TRIGGER
+    hunt_counters_flow_insert
+      AFTER INSERT
+ON
+  flows
+    FOR EACH ROW INSERT INTO hunt_counters(
+      hunt_id,
+      shard,
+      num_clients,
+      num_successful_clients,
+      num_failed_clients,
+      num_crashed_clients,
+      num_running_clients,
+      num_clients_with_results,
+      num_results,
+      total_cpu_micros,
+      total_network_bytes_sent)
+SELECT
+  NEW.parent_hunt_id,
+  NEW.client_id % 16,
+  1,
+  IFNULL(NEW.flow_state, 0) = 2,
+  IFNULL(NEW.flow_state, 0) = 3,
+  IFNULL(NEW.flow_state, 0) = 4,
+  IFNULL(NEW.flow_state, 0) = 1,
+  IFNULL(NEW.num_replies_sent, 0) > 0,
+  IFNULL(NEW.num_replies_sent, 0),
+  IFNULL(NEW.user_cpu_time_used_micros, 0) +
+    IFNULL(NEW.system_cpu_time_used_micros, 0),
+  IFNULL(NEW.network_bytes_sent, 0)
+FROM DUAL
+WHERE NEW.parent_hunt_id IS NOT NULL
+  AND NEW.parent_flow_id IS NULL
+ON DUPLICATE KEY UPDATE
+  num_clients = num_clients + VALUES(num_clients),
+  num_successful_clients =
+    num_successful_clients + VALUES(num_successful_clients),
+  num_failed_clients = num_failed_clients + VALUES(num_failed_clients),
+  num_crashed_clients = num_crashed_clients + VALUES(num_crashed_clients),
+  num_running_clients = num_running_clients + VALUES(num_running_clients),
+  num_clients_with_results =
+    num_clients_with_results + VALUES(num_clients_with_results),
+  num_results = num_results + VALUES(num_results),
+  total_cpu_micros = total_cpu_micros + VALUES(total_cpu_micros),
+  total_network_bytes_sent =
+    total_network_bytes_sent + VALUES(total_network_bytes_sent);
+
+-- Apply the difference between the old and the new version of a hunt flow.
+-- Most flow updates (e.g. leasing the flow for processing) don't touch any
+-- of the counted columns and are filtered out, so that they don't contend
+-- for the lock on the hunt's counters shard row.
+CREATE
+  TRIGGER
+    hunt_counters_flow_update
+      AFTER UPDATE
+ON
+  flows
+    FOR EACH ROW INSERT INTO hunt_counters(
+      hunt_id,
+      shard,
+      num_clients,
+      num_successful_clients,
+      num_failed_clients,
+      num_crashed_clients,
+      num_running_clients,
+      num_clients_with_results,
+      num_results,
+      total_cpu_micros,
+      total_network_bytes_sent)
+SELECT
+  NEW.parent_hunt_id,
+  NEW.client_id % 16,
+  0,
+  (IFNULL(NEW.flow_state, 0) = 2) - (IFNULL(OLD.flow_state, 0) = 2),
+  (IFNULL(NEW.flow_state, 0) = 3) - (IFNULL(OLD.flow_state, 0) = 3),
+  (IFNULL(NEW.flow_state, 0) = 4) - (IFNULL(OLD.flow_state, 0) = 4),
+  (IFNULL(NEW.flow_state, 0) = 1) - (IFNULL(OLD.flow_state, 0) = 1),
+  (IFNULL(NEW.num_replies_sent, 0) > 0) -
+    (IFNULL(OLD.num_replies_sent, 0) > 0),
+  CAST(IFNULL(NEW.num_replies_sent, 0) AS SIGNED) -
+    CAST(IFNULL(OLD.num_replies_sent, 0) AS SIGNED),
+  CAST(IFNULL(NEW.user_cpu_time_used_micros, 0) +
+       IFNULL(NEW.system_cpu_time_used_micros, 0) AS SIGNED) -
+    CAST(IFNULL(OLD.user_cpu_time_used_micros, 0) +
+         IFNULL(OLD.system_cpu_time_used_micros, 0) AS SIGNED),
+  CAST(IFNULL(NEW.network_bytes_sent, 0) AS SIGNED) -
+    CAST(IFNULL(OLD.network_bytes_sent, 0) AS SIGNED)
+FROM DUAL
+WHERE NEW.parent_hunt_id IS NOT NULL
+  AND NEW.parent_flow_id IS NULL
+  AND NOT (
+    NEW.flow_state <=> OLD.flow_state
+    AND NEW.num_replies_sent <=> OLD.num_replies_sent
+    AND NEW.user_cpu_time_used_micros <=> OLD.user_cpu_time_used_micros
+    AND NEW.system_cpu_time_used_micros <=> OLD.system_cpu_time_used_micros
+    AND NEW.network_bytes_sent <=> OLD.network_bytes_sent
+  )
+ON DUPLICATE KEY UPDATE
+  num_successful_clients =
+    num_successful_clients + VALUES(num_successful_clients),
+  num_failed_clients = num_failed_clients + VALUES(num_failed_clients),
+  num_crashed_clients = num_crashed_clients + VALUES(num_crashed_clients),
+  num_running_clients = num_running_clients + VALUES(num_running_clients),
+  num_clients_with_results =
+    num_clients_with_results + VALUES(num_clients_with_results),
+  num_results = num_results + VALUES(num_results),
+  total_cpu_micros = total_cpu_micros + VALUES(total_cpu_micros),
+  total_network_bytes_sent =
+    total_network_bytes_sent + VALUES(total_network_bytes_sent);
+
+-- Remove a deleted hunt flow from the counters.
+-- Note: rows deleted by the `ON DELETE CASCADE` foreign key actions don't
+-- fire triggers, so `DeleteClient` deletes the client's hunt flows explicitly.
+CREATE
+  TRIGGER
+    hunt_counters_flow_delete
+      AFTER DELETE
+ON
+  flows
+    FOR EACH ROW UPDATE hunt_counters
+SET
+  num_clients = num_clients - 1,
+  num_successful_clients =
+    num_successful_clients - (IFNULL(OLD.flow_state, 0) = 2),
+  num_failed_clients = num_failed_clients - (IFNULL(OLD.flow_state, 0) = 3),
+  num_crashed_clients = num_crashed_clients - (IFNULL(OLD.flow_state, 0) = 4),
+  num_running_clients = num_running_clients - (IFNULL(OLD.flow_state, 0) = 1),
+  num_clients_with_results =
+    num_clients_with_results - (IFNULL(OLD.num_replies_sent, 0) > 0),
+  num_results = num_results - CAST(IFNULL(OLD.num_replies_sent, 0) AS SIGNED),
+  total_cpu_micros = total_cpu_micros -
+    CAST(IFNULL(OLD.user_cpu_time_used_micros, 0) +
+         IFNULL(OLD.system_cpu_time_used_micros, 0) AS SIGNED),
+  total_network_bytes_sent = total_network_bytes_sent -
+    CAST(IFNULL(OLD.network_bytes_sent, 0) AS SIGNED)
+WHERE hunt_id = OLD.parent_hunt_id
+  AND shard = OLD.client_id % 16
+  AND OLD.parent_flow_id IS NULL;
@@ -1,12 +1,43 @@
 #!/usr/bin/env python
 """Connection pooling for MySQLdb connections."""
 
+import collections
 import logging
 import threading
+import time
 import warnings
 
 import MySQLdb
 
+from grr_response_core.stats import metrics
+
+MYSQL_POOL_CHECKOUT_WAIT = metrics.Event(
+    "mysql_pool_checkout_wait",
+    fields=[("pool", str)],
+    bins=[0.001 * 2**x for x in range(15)],
+)  # 1ms to ~16 secs
+MYSQL_POOL_CONNECTIONS_IN_USE = metrics.Gauge(
+    "mysql_pool_connections_in_use", int, fields=[("pool", str)]
+)
+MYSQL_POOL_CONNECTIONS_IDLE = metrics.Gauge(
+    "mysql_pool_connections_idle", int, fields=[("pool", str)]
+)
+MYSQL_POOL_CONNECTIONS_OPENED = metrics.Counter(
+    "mysql_pool_connections_opened", fields=[("pool", str)]
+)
+MYSQL_POOL_CONNECTIONS_CLOSED = metrics.Counter(
+    "mysql_pool_connections_closed", fields=[("pool", str), ("reason", str)]
+)
+
+# Reasons for closing a pooled connection, used as the `reason` field of
+# MYSQL_POOL_CONNECTIONS_CLOSED.
+_CLOSED_ERRORED = "errored"
+_CLOSED_MAX_AGE = "max_age"
+_CLOSED_MAX_IDLE = "max_idle"
+_CLOSED_IDLE_TIMEOUT = "idle_timeout"
+_CLOSED_VALIDATION = "validation"
+_CLOSED_POOL_CLOSED = "pool_closed"
+
 
 class Error(Exception):
   pass
@@ -20,6 +51,13 @@ class SemicolonNotAllowedInQueryError(Error):
   pass
 
 
+# An open connection together with the (monotonic) time it was created at and
+# the time it was last returned to the pool.
+_IdleConnection = collections.namedtuple(
+    "_IdleConnection", ["con", "created_at", "idle_since"]
+)
+
+
 class Pool(object):
   """A Pool of database connections.
 
@@ -30,9 +68,26 @@ class Pool(object):
   Intends to be thread safe in that multiple connections can be requested and
   used by multiple threads without synchronization, but operations on each
   connection (and its associated cursors) are assumed to be serial.
+
+  Idle connections are health-checked: connections older than `max_age` are
+  retired instead of being reused, and, if `validate_on_borrow` is set, every
+  idle connection is pinged before being handed out. `Maintain` (run
+  periodically by `StartMaintenance`) closes connections that have been idle
+  for longer than `idle_timeout` and opens new ones to keep `min_idle`
+  connections ready.
   """
 
-  def __init__(self, connect_func, max_size=10):
+  def __init__(
+      self,
+      connect_func,
+      max_size=10,
+      min_idle=0,
+      max_idle=None,
+      max_age=None,
+      idle_timeout=None,
+      validate_on_borrow=False,
+      name="default",
+  ):
     """Creates a ConnectionPool.
 
     Args:
@@ -40,11 +95,43 @@ class Pool(object):
        database, i.e. a MySQLdb.Connection. Should raise or block if the
        database is unavailable.
      max_size: The maximum number of simultaneous connections.
+     min_idle: The number of idle connections `Maintain` keeps open.
+     max_idle: The maximum number of idle connections. Connections returned to
+       a pool that already has that many idle ones are closed. Defaults to
+       max_size.
+     max_age: If set, connections that are older than this number of seconds
+       are closed instead of being reused.
+     idle_timeout: If set, `Maintain` closes connections that have been idle
+       for longer than this number of seconds (keeping at least min_idle).
+     validate_on_borrow: Whether to ping idle connections before handing them
+       out. Connections failing the ping are closed and replaced.
+     name: Name of the pool, used as a field of the pool metrics.
     """
+    if max_idle is None:
+      max_idle = max_size
+    if min_idle > max_idle:
+      raise ValueError(
+          "min_idle (%d) can't be greater than max_idle (%d)."
+          % (min_idle, max_idle)
+      )
+
     self.connect_func = connect_func
+    self.max_size = max_size
     self.limiter = threading.BoundedSemaphore(max_size)
-    self.idle_conns = []  # Atomic access only!!
+    self.idle_conns = []  # Guarded by self.lock.
+    self.lock = threading.Lock()
     self.closed = False
+    self.in_use = 0  # Guarded by self.lock.
+
+    self.min_idle = min_idle
+    self.max_idle = max_idle
+    self.max_age = max_age
+    self.idle_timeout = idle_timeout
+    self.validate_on_borrow = validate_on_borrow
+    self.name = name
+
+    self._maintenance_thread = None
+    self._maintenance_stop = threading.Event()
 
   def get(self, blocking=True):
     """Gets a connection.
@@ -66,26 +153,215 @@ class Pool(object):
     # NOTE: Once we acquire capacity from the semaphore, it is essential that we
     # return it eventually. On success, this responsibility is delegated to
     # _ConnectionProxy.
+    wait_start = time.monotonic()
     if not self.limiter.acquire(blocking=blocking):
       return None
-    c = None
-    # pop is atomic, but if we did a check first, it would not be atomic with
-    # the pop.
+    MYSQL_POOL_CHECKOUT_WAIT.RecordEvent(
+        time.monotonic() - wait_start, fields=[self.name]
+    )
+
+    # The connection counts as in use while it is being checked out, so that
+    # `Maintain` doesn't open connections beyond max_size in the meantime.
+    with self.lock:
+      self.in_use += 1
+      self._UpdateGaugesLocked()
+
+    try:
+      con, created_at = self._GetIdleOrConnect()
+    except Exception:
+      with self.lock:
+        self.in_use -= 1
+        self._UpdateGaugesLocked()
+      self.limiter.release()
+      raise
+
+    return _ConnectionProxy(self, con, created_at)
+
+  def _GetIdleOrConnect(self):
+    """Returns a healthy idle connection or a new one if there is none."""
+    while True:
+      with self.lock:
+        if not self.idle_conns:
+          break
+        idle = self.idle_conns.pop()
+        self._UpdateGaugesLocked()
+
+      if self._IsExpired(idle.created_at, time.monotonic()):
+        self._CloseConnection(idle.con, _CLOSED_MAX_AGE)
+        continue
+
+      if self.validate_on_borrow and not self._Ping(idle.con):
+        self._CloseConnection(idle.con, _CLOSED_VALIDATION)
+        continue
+
+      return idle.con, idle.created_at
+
+    return self._Connect(), time.monotonic()
+
+  def _Connect(self):
+    con = self.connect_func()
+    MYSQL_POOL_CONNECTIONS_OPENED.Increment(fields=[self.name])
+    return con
+
+  def _CloseConnection(self, con, reason):
+    MYSQL_POOL_CONNECTIONS_CLOSED.Increment(fields=[self.name, reason])
     try:
-      c = self.idle_conns.pop()
-    except IndexError:
-      # Create a connection, release the pool allocation if it fails.
+      con.close()
+    except Exception as e:  # pylint: disable=broad-except
+      logging.warning("Failed to close a pooled MySQL connection: %s", e)
+
+  def _Ping(self, con):
+    try:
+      con.ping()
+      return True
+    except MySQLdb.Error as e:
+      logging.info("Pooled MySQL connection failed validation: %s", e)
+      return False
+
+  def _IsExpired(self, created_at, now):
+    return self.max_age is not None and now - created_at >= self.max_age
+
+  def _UpdateGaugesLocked(self):
+    MYSQL_POOL_CONNECTIONS_IN_USE.SetValue(self.in_use, fields=[self.name])
+    MYSQL_POOL_CONNECTIONS_IDLE.SetValue(
+        len(self.idle_conns), fields=[self.name]
+    )
+
+  def _Return(self, con, created_at, errored):
+    """Returns a connection to the pool or closes it if it can't be reused."""
+    try:
+      if errored:
+        self._CloseConnection(con, _CLOSED_ERRORED)
+        return
+      if self.closed:
+        self._CloseConnection(con, _CLOSED_POOL_CLOSED)
+        return
+
+      now = time.monotonic()
+      if self._IsExpired(created_at, now):
+        self._CloseConnection(con, _CLOSED_MAX_AGE)
+        return
+
       try:
-        c = self.connect_func()
+        con.rollback()
       except Exception:
-        self.limiter.release()
+        # rollback raised and the connection didn't make it into the idle
+        # list, so close it.
+        self._CloseConnection(con, _CLOSED_ERRORED)
         raise
-    return _ConnectionProxy(self, c)
+
+      with self.lock:
+        if len(self.idle_conns) < self.max_idle:
+          self.idle_conns.append(_IdleConnection(con, created_at, now))
+          con = None
+      if con is not None:
+        self._CloseConnection(con, _CLOSED_MAX_IDLE)
+    finally:
+      with self.lock:
+        self.in_use -= 1
+        self._UpdateGaugesLocked()
+      self.limiter.release()
+
+  def Maintain(self):
+    """Evicts stale idle connections and tops the pool up to min_idle."""
+    if self.closed:
+      return
+
+    now = time.monotonic()
+    to_close = []
+    with self.lock:
+      keep = []
+      # idle_conns is used as a stack, so the most recently used connections
+      # are at the end. Evict from the front, keeping at least min_idle.
+      for i, idle in enumerate(self.idle_conns):
+        remaining = len(self.idle_conns) - i
+        if self._IsExpired(idle.created_at, now):
+          to_close.append((idle.con, _CLOSED_MAX_AGE))
+        elif (
+            self.idle_timeout is not None
+            and now - idle.idle_since >= self.idle_timeout
+            and remaining + len(keep) > self.min_idle
+        ):
+          to_close.append((idle.con, _CLOSED_IDLE_TIMEOUT))
+        else:
+          keep.append(idle)
+      self.idle_conns[:] = keep
+      missing = self.min_idle - len(self.idle_conns)
+      self._UpdateGaugesLocked()
+
+    for con, reason in to_close:
+      self._CloseConnection(con, reason)
+
+    for _ in range(missing):
+      if not self._OpenIdleConnection():
+        return
+
+  def _OpenIdleConnection(self):
+    """Opens an idle connection if that doesn't exceed max_size connections.
+
+    Returns:
+      True if a connection was added to the idle ones, False otherwise.
+    """
+    # Idle connections count against max_size just like the ones in use. The
+    # limiter is held while connecting, so that no connection can be borrowed
+    # (and opened) beyond max_size in the meantime.
+    if not self.limiter.acquire(blocking=False):
+      return False
+
+    try:
+      with self.lock:
+        if self.in_use + len(self.idle_conns) >= self.max_size:
+          return False
+
+      try:
+        con = self._Connect()
+      except Exception as e:  # pylint: disable=broad-except
+        logging.warning("Failed to open an idle MySQL connection: %s", e)
+        return False
+
+      now = time.monotonic()
+      with self.lock:
+        if not self.closed and len(self.idle_conns) < self.max_idle:
+          self.idle_conns.append(_IdleConnection(con, now, now))
+          self._UpdateGaugesLocked()
+          return True
+
+      self._CloseConnection(con, _CLOSED_MAX_IDLE)
+      return False
+    finally:
+      self.limiter.release()
+
+  def StartMaintenance(self, interval):
+    """Starts a thread calling `Maintain` every `interval` seconds."""
+    if self._maintenance_thread is not None:
+      return
+
+    def _Loop():
+      while not self._maintenance_stop.wait(interval):
+        try:
+          self.Maintain()
+        except Exception as e:  # pylint: disable=broad-except
+          logging.exception("MySQL pool maintenance failed: %s", e)
+
+    self._maintenance_thread = threading.Thread(
+        name="MysqlPoolMaintenance-%s" % self.name, target=_Loop, daemon=True
+    )
+    self._maintenance_thread.start()
 
   def close(self):
+    """Closes the pool and all its idle connections."""
     self.closed = True
-    for conn in self.idle_conns:
-      conn.close()
+    self._maintenance_stop.set()
+    if self._maintenance_thread is not None:
+      self._maintenance_thread.join()
+      self._maintenance_thread = None
+
+    with self.lock:
+      idle_conns = self.idle_conns[:]
+      self.idle_conns[:] = []
+      self._UpdateGaugesLocked()
+    for idle in idle_conns:
+      self._CloseConnection(idle.con, _CLOSED_POOL_CLOSED)
 
 
 class _ConnectionProxy(object):
@@ -96,9 +372,10 @@ class _ConnectionProxy(object):
   connection when it may be in an errored state.
   """
 
-  def __init__(self, pool, con):
+  def __init__(self, pool, con, created_at):
     self.con = con
     self.pool = pool
+    self.created_at = created_at
     self.errored = False
 
   def __del__(self):
@@ -108,22 +385,9 @@ class _ConnectionProxy(object):
 
   def close(self):
     if self.con:
-      try:
-        if not self.errored and not self.pool.closed:
-          try:
-            self.con.rollback()
-            # append is atomic.
-            self.pool.idle_conns.append(self.con)
-          except Exception:
-            # rollback raised and the connection didn't make it into the idle
-            # list, so close it.
-            self.con.close()
-            raise
-        else:
-          self.con.close()
-      finally:
-        self.con = None
-        self.pool.limiter.release()
+      con = self.con
+      self.con = None
+      self.pool._Return(con, self.created_at, self.errored)  # pylint: disable=protected-access
 
   def commit(self):
     assert self.con is not None
@@ -148,6 +148,152 @@ class TestPool(absltest.TestCase):
         # whitebox: make sure the connection did end up on the idle list
         self.assertLen(pool.idle_conns, 1)
 
+  def testMaxAge(self):
+    mocks = []
+
+    def gen_mock():
+      c = mock.MagicMock()
+      mocks.append(c)
+      return c
+
+    pool = mysql_pool.Pool(gen_mock, max_size=5, max_age=60)
+
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=100):
+      pool.get().close()
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=159):
+      pool.get().close()
+    self.assertLen(mocks, 1)
+
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=160):
+      pool.get().close()
+    self.assertLen(mocks, 2)
+    mocks[0].close.assert_called_once()
+    mocks[1].close.assert_not_called()
+
+  def testMaxAgeOnReturn(self):
+    connection_mock = mock.MagicMock()
+    pool = mysql_pool.Pool(lambda: connection_mock, max_size=5, max_age=60)
+
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=100):
+      con = pool.get()
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=200):
+      con.close()
+
+    connection_mock.close.assert_called_once()
+    self.assertFalse(pool.idle_conns)
+
+  def testValidateOnBorrow(self):
+    mocks = []
+
+    def gen_mock():
+      c = mock.MagicMock()
+      mocks.append(c)
+      return c
+
+    pool = mysql_pool.Pool(gen_mock, max_size=5, validate_on_borrow=True)
+    pool.get().close()
+    pool.get().close()
+    self.assertLen(mocks, 1)
+    mocks[0].ping.assert_called_once()
+
+    mocks[0].ping.side_effect = MySQLdb.OperationalError('Gone away')
+    pool.get().close()
+    self.assertLen(mocks, 2)
+    mocks[0].close.assert_called_once()
+    self.assertLen(pool.idle_conns, 1)
+
+  def testMaxIdle(self):
+    mocks = []
+
+    def gen_mock():
+      c = mock.MagicMock()
+      mocks.append(c)
+      return c
+
+    pool = mysql_pool.Pool(gen_mock, max_size=5, max_idle=2)
+    proxies = [pool.get() for _ in range(5)]
+    for p in proxies:
+      p.close()
+
+    self.assertLen(pool.idle_conns, 2)
+    self.assertLen([m for m in mocks if m.close.called], 3)
+
+  def testMaintainKeepsMinIdle(self):
+    mocks = []
+
+    def gen_mock():
+      c = mock.MagicMock()
+      mocks.append(c)
+      return c
+
+    pool = mysql_pool.Pool(gen_mock, max_size=5, min_idle=2, idle_timeout=30)
+    pool.Maintain()
+    self.assertLen(pool.idle_conns, 2)
+    self.assertLen(mocks, 2)
+
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=0):
+      proxies = [pool.get() for _ in range(4)]
+      for p in proxies:
+        p.close()
+    self.assertLen(pool.idle_conns, 4)
+
+    with mock.patch.object(mysql_pool.time, 'monotonic', return_value=60):
+      pool.Maintain()
+    self.assertLen(pool.idle_conns, 2)
+    self.assertLen([m for m in mocks if m.close.called], 2)
+
+    pool.close()
+    self.assertFalse(pool.idle_conns)
+    self.assertTrue(all(m.close.called for m in mocks))
+
+  def testMaintainDoesNotExceedMaxSize(self):
+    mocks = []
+
+    def gen_mock():
+      c = mock.MagicMock()
+      mocks.append(c)
+      return c
+
+    pool = mysql_pool.Pool(gen_mock, max_size=3, min_idle=2)
+    proxies = [pool.get() for _ in range(2)]
+
+    pool.Maintain()
+    self.assertLen(pool.idle_conns, 1)
+    self.assertLen(mocks, 3)
+
+    proxies.append(pool.get())
+    self.assertLen(mocks, 3)
+    self.assertIsNone(pool.get(blocking=False))
+
+    pool.Maintain()
+    self.assertEmpty(pool.idle_conns)
+    self.assertLen(mocks, 3)
+
+    for p in proxies:
+      p.close()
+    pool.close()
+
+  def testMetrics(self):
+    pool = mysql_pool.Pool(
+        mock.MagicMock, max_size=5, max_idle=0, name='metrics_test'
+    )
+
+    opened = mysql_pool.MYSQL_POOL_CONNECTIONS_OPENED
+    closed = mysql_pool.MYSQL_POOL_CONNECTIONS_CLOSED
+    in_use = mysql_pool.MYSQL_POOL_CONNECTIONS_IN_USE
+    opened_before = opened.GetValue(fields=['metrics_test'])
+    closed_before = closed.GetValue(fields=['metrics_test', 'max_idle'])
+
+    con = pool.get()
+    self.assertEqual(in_use.GetValue(fields=['metrics_test']), 1)
+    con.close()
+    self.assertEqual(in_use.GetValue(fields=['metrics_test']), 0)
+
+    self.assertEqual(opened.GetValue(fields=['metrics_test']), opened_before + 1)
+    self.assertEqual(
+        closed.GetValue(fields=['metrics_test', 'max_idle']), closed_before + 1
+    )
+
 
 if __name__ == '__main__':
   app.run(test_lib.main)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Routing of read-only MySQL transactions to replicas."""
+
+import contextlib
+import logging
+import random
+import threading
+import time
+from typing import Optional, Sequence
+
+import MySQLdb
+
+from grr_response_core.stats import metrics
+from grr_response_server.databases import mysql_pool
+
+MYSQL_REPLICA_LAG = metrics.Gauge(
+    "mysql_replica_lag", float, fields=[("replica", str)]
+)
+MYSQL_REPLICA_READS = metrics.Counter(
+    "mysql_replica_reads", fields=[("replica", str)]
+)
+
+# Name used for the `replica` field of MYSQL_REPLICA_READS when a read is
+# served by the primary.
+PRIMARY = "primary"
+
+# Column names holding the replication lag in `SHOW REPLICA STATUS` (MySQL
+# 8.0.22+) and `SHOW SLAVE STATUS` (older MySQL and MariaDB) respectively.
+_LAG_COLUMNS = ("Seconds_Behind_Source", "Seconds_Behind_Master")
+
+
+def _QueryLag(cursor) -> Optional[float]:
+  """Returns the replication lag (in seconds) reported by the server.
+
+  Args:
+    cursor: A cursor connected to the replica.
+
+  Returns:
+    The lag or None if the server is not replicating (or the replication
+    threads are stopped).
+  """
+  try:
+    cursor.execute("SHOW REPLICA STATUS")
+  except MySQLdb.ProgrammingError:
+    # Servers that predate the REPLICA terminology.
+    cursor.execute("SHOW SLAVE STATUS")
+
+  rows = cursor.fetchall()
+  if not rows:
+    return None
+
+  columns = [d[0] for d in cursor.description]
+  for column in _LAG_COLUMNS:
+    if column in columns:
+      lag = rows[0][columns.index(column)]
+      return None if lag is None else float(lag)
+
+  return None
+
+
+class Replica(object):
+  """A read replica with its connection pool and last known replication lag."""
+
+  def __init__(
+      self,
+      name: str,
+      pool: mysql_pool.Pool,
+      lag_check_interval: float = 1.0,
+  ):
+    """Initializes the replica.
+
+    Args:
+      name: Name of the replica, used in logs and as a metric field.
+      pool: Pool of connections to the replica.
+      lag_check_interval: How often (in seconds) the replication lag is
+        queried. In between, the last known lag is used.
+    """
+    self.name = name
+    self.pool = pool
+    self.lag_check_interval = lag_check_interval
+
+    self._lock = threading.Lock()
+    self._lag = None
+    self._lag_checked_at = None
+    self._lag_check_in_flight = False
+
+  def _CheckLag(self) -> Optional[float]:
+    try:
+      with contextlib.closing(self.pool.get()) as connection:
+        with contextlib.closing(connection.cursor()) as cursor:
+          return _QueryLag(cursor)
+    except MySQLdb.Error as e:
+      logging.warning(
+          "Failed to check lag of MySQL replica %s: %s", self.name, e
+      )
+      return None
+
+  def Staleness(self) -> Optional[float]:
+    """Returns an upper bound of how stale (in seconds) the replica may be.
+
+    When the last lag check is older than `lag_check_interval`, the calling
+    thread checks the lag again. The check is done without holding the lock,
+    since it may have to connect to the replica. Meanwhile, other threads treat
+    the replica as unavailable instead of waiting for the check to finish.
+
+    Returns:
+      The last reported replication lag plus the time that passed since it was
+      queried or None if the replica is unavailable, not replicating or its lag
+      is being checked by another thread.
+    """
+    with self._lock:
+      if self._lag_check_in_flight:
+        return None
+
+      now = time.monotonic()
+      if (
+          self._lag_checked_at is not None
+          and now - self._lag_checked_at < self.lag_check_interval
+      ):
+        if self._lag is None:
+          return None
+        return self._lag + now - self._lag_checked_at
+
+      self._lag_check_in_flight = True
+
+    lag = None
+    try:
+      lag = self._CheckLag()
+    finally:
+      with self._lock:
+        self._lag = lag
+        self._lag_checked_at = time.monotonic()
+        self._lag_check_in_flight = False
+
+    MYSQL_REPLICA_LAG.SetValue(-1.0 if lag is None else lag, fields=[self.name])
+    return lag
+
+  def Close(self):
+    self.pool.close()
+
+
+class ReplicaSet(object):
+  """A set of read replicas read-only transactions can be routed to."""
+
+  def __init__(self, replicas: Sequence[Replica]):
+    self.replicas = list(replicas)
+
+  def Pick(self, max_staleness: float) -> Optional[Replica]:
+    """Picks a replica that is at most `max_staleness` seconds behind.
+
+    Args:
+      max_staleness: The maximum acceptable staleness in seconds.
+
+    Returns:
+      A random replica among those fresh enough or None if there is none, in
+      which case the read has to go to the primary.
+    """
+    fresh = []
+    for replica in self.replicas:
+      staleness = replica.Staleness()
+      if staleness is not None and staleness <= max_staleness:
+        fresh.append(replica)
+
+    if not fresh:
+      MYSQL_REPLICA_READS.Increment(fields=[PRIMARY])
+      return None
+
+    replica = random.choice(fresh)
+    MYSQL_REPLICA_READS.Increment(fields=[replica.name])
+    return replica
+
+  def Close(self):
+    for replica in self.replicas:
+      replica.Close()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+import threading
+from unittest import mock
+
+from absl import app
+from absl.testing import absltest
+import MySQLdb
+
+from grr_response_server.databases import mysql_pool
+from grr_response_server.databases import mysql_replicas
+from grr.test_lib import test_lib
+
+
+def _ReplicaConnection(lag, column="Seconds_Behind_Source"):
+  cursor = mock.MagicMock()
+  cursor.description = [("Replica_IO_State",), (column,)]
+  cursor.fetchall.return_value = [("Waiting for source", lag)]
+  cursor.execute.return_value = None
+  con = mock.MagicMock()
+  con.cursor.return_value = cursor
+  con.warning_count.return_value = 0
+  return con
+
+
+def _Replica(name, con, lag_check_interval=1.0):
+  pool = mysql_pool.Pool(lambda: con, max_size=2, name=name)
+  return mysql_replicas.Replica(
+      name, pool, lag_check_interval=lag_check_interval
+  )
+
+
+class ReplicaTest(absltest.TestCase):
+
+  def testStalenessIsReportedLag(self):
+    replica = _Replica("r1", _ReplicaConnection(3))
+    with mock.patch.object(mysql_replicas.time, "monotonic", return_value=100):
+      self.assertEqual(replica.Staleness(), 3)
+
+  def testStalenessGrowsUntilNextCheck(self):
+    con = _ReplicaConnection(3)
+    replica = _Replica("r1", con, lag_check_interval=10)
+    with mock.patch.object(mysql_replicas.time, "monotonic", return_value=100):
+      replica.Staleness()
+    with mock.patch.object(mysql_replicas.time, "monotonic", return_value=105):
+      self.assertEqual(replica.Staleness(), 8)
+    con.cursor.return_value.fetchall.assert_called_once()
+
+    with mock.patch.object(mysql_replicas.time, "monotonic", return_value=110):
+      self.assertEqual(replica.Staleness(), 3)
+    self.assertEqual(con.cursor.return_value.fetchall.call_count, 2)
+
+  def testFallsBackToLegacyStatusQuery(self):
+    con = _ReplicaConnection(7, column="Seconds_Behind_Master")
+    con.cursor.return_value.execute.side_effect = [
+        MySQLdb.ProgrammingError("syntax error"),
+        None,
+    ]
+    replica = _Replica("r1", con)
+    self.assertEqual(replica.Staleness(), 7)
+
+  def testNotReplicating(self):
+    con = _ReplicaConnection(None)
+    replica = _Replica("r1", con)
+    self.assertIsNone(replica.Staleness())
+
+    con.cursor.return_value.fetchall.return_value = []
+    replica = _Replica("r2", con, lag_check_interval=0)
+    self.assertIsNone(replica.Staleness())
+
+  def testUnavailable(self):
+
+    def Connect():
+      raise MySQLdb.OperationalError(2003, "Can't connect")
+
+    pool = mysql_pool.Pool(Connect, max_size=2, name="r1")
+    replica = mysql_replicas.Replica("r1", pool)
+    self.assertIsNone(replica.Staleness())
+
+  def testOtherThreadsDoNotWaitForLagCheck(self):
+    check_started = threading.Event()
+    release_check = threading.Event()
+
+    con = _ReplicaConnection(3)
+
+    def Execute(*args, **kwargs):
+      del args, kwargs  # Unused.
+      check_started.set()
+      release_check.wait(5)
+
+    con.cursor.return_value.execute.side_effect = Execute
+    replica = _Replica("r1", con)
+
+    checking_thread = threading.Thread(target=replica.Staleness)
+    checking_thread.start()
+    try:
+      self.assertTrue(check_started.wait(5))
+      # The lag is being checked by another thread, so the replica is treated
+      # as unavailable instead of blocking.
+      self.assertIsNone(replica.Staleness())
+    finally:
+      release_check.set()
+      checking_thread.join()
+
+    self.assertIsNotNone(replica.Staleness())
+    con.cursor.return_value.fetchall.assert_called_once()
+
+
+class ReplicaSetTest(absltest.TestCase):
+
+  def testPicksFreshReplica(self):
+    fresh = _Replica("fresh", _ReplicaConnection(1))
+    lagging = _Replica("lagging", _ReplicaConnection(60))
+    replicas = mysql_replicas.ReplicaSet([lagging, fresh])
+
+    for _ in range(10):
+      self.assertIs(replicas.Pick(10), fresh)
+
+  def testFallsBackToPrimaryWhenAllLag(self):
+    replicas = mysql_replicas.ReplicaSet([
+        _Replica("r1", _ReplicaConnection(60)),
+        _Replica("r2", _ReplicaConnection(None)),
+    ])
+
+    self.assertIsNone(replicas.Pick(10))
+
+  def testCountsReads(self):
+    replicas = mysql_replicas.ReplicaSet(
+        [_Replica("counted", _ReplicaConnection(1))]
+    )
+    reads = mysql_replicas.MYSQL_REPLICA_READS
+    replica_before = reads.GetValue(fields=["counted"])
+    primary_before = reads.GetValue(fields=[mysql_replicas.PRIMARY])
+
+    replicas.Pick(10)
+    replicas.Pick(0)
+
+    self.assertEqual(reads.GetValue(fields=["counted"]), replica_before + 1)
+    self.assertEqual(
+        reads.GetValue(fields=[mysql_replicas.PRIMARY]), primary_before + 1
+    )
+
+
+if __name__ == "__main__":
+  app.run(test_lib.main)
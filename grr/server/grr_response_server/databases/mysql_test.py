@@ -14,10 +14,12 @@ from absl.testing import absltest
 import MySQLdb  # TODO(hanuszczak): This should be imported conditionally.
 from MySQLdb.constants import CR as mysql_conn_errors
 
+from grr_response_core.lib import rdfvalue
 from grr_response_server.databases import db as abstract_db
 from grr_response_server.databases import db_test_mixin
 from grr_response_server.databases import db_utils
 from grr_response_server.databases import mysql
+from grr_response_server.databases import mysql_replicas
 from grr_response_server.databases import mysql_utils
 from grr.test_lib import stats_test_lib
 from grr.test_lib import test_lib
@@ -425,5 +427,104 @@ class TestMysqlDB(
     self.assertTrue(connections[0].close.called)
 
 
+class MysqlReplicaRoutingTest(absltest.TestCase):
+  """Tests routing of read-only transactions to a second MySQL instance.
+
+  The second instance doesn't have to replicate from the first one: the tests
+  override the replication lag where they need a fresh replica.
+  """
+
+  def setUp(self):
+    super().setUp()
+
+    user = _GetEnvironOrSkip("MYSQL_TEST_USER")
+    host = _GetEnvironOrSkip("MYSQL_TEST_HOST")
+    port = int(_GetEnvironOrSkip("MYSQL_TEST_PORT"))
+    password = _GetEnvironOrSkip("MYSQL_TEST_PASS")
+    replica_host = _GetEnvironOrSkip("MYSQL_TEST_REPLICA_HOST")
+    self.replica_port = int(_GetEnvironOrSkip("MYSQL_TEST_REPLICA_PORT"))
+    self.primary_port = port
+    if (host, port) == (replica_host, self.replica_port):
+      self.skipTest("The replica has to be a different MySQL instance.")
+
+    database = "grr-test-{}".format(str(uuid.uuid4())[-10:])
+    # Replicas are expected to have the same database as the primary.
+    mysql._SetupDatabase(
+        host=replica_host,
+        port=self.replica_port,
+        user=user,
+        password=password,
+        database=database,
+    )
+
+    config_overrider = test_lib.ConfigOverrider({
+        "Mysql.replicas": ["%s:%d" % (replica_host, self.replica_port)],
+        "Mysql.replica_lag_check_interval": rdfvalue.Duration(0),
+    })
+    config_overrider.Start()
+    self.addCleanup(config_overrider.Stop)
+
+    self.db = mysql.MysqlDB(
+        host=host, port=port, user=user, password=password, database=database
+    )
+    self.addCleanup(self._DropDatabases)
+
+  def _DropDatabases(self):
+
+    def Drop(connection):
+      with contextlib.closing(connection.cursor()) as cursor:
+        cursor.execute("SELECT DATABASE()")
+        dbname = cursor.fetchall()[0][0]
+        cursor.execute(f"DROP DATABASE `{dbname}`")
+
+    self.db._RunInTransaction(Drop)
+    [replica] = self.db.replicas.replicas
+    with contextlib.closing(replica.pool.get()) as connection:
+      Drop(connection)
+    self.db.Close()
+
+  def _ServerPort(self, **kwargs):
+
+    def Port(connection):
+      with contextlib.closing(connection.cursor()) as cursor:
+        cursor.execute("SELECT @@port")
+        return cursor.fetchall()[0][0]
+
+    return self.db._RunInTransaction(Port, **kwargs)
+
+  def testRoutesStaleReadsToFreshReplica(self):
+    max_staleness = rdfvalue.Duration.From(10, rdfvalue.SECONDS)
+    with mock.patch.object(
+        mysql_replicas.Replica, "Staleness", return_value=1.0
+    ):
+      self.assertEqual(
+          self._ServerPort(readonly=True, max_staleness=max_staleness),
+          self.replica_port,
+      )
+      self.assertEqual(self._ServerPort(readonly=True), self.primary_port)
+      self.assertEqual(self._ServerPort(), self.primary_port)
+
+  def testFallsBackToPrimaryWhenReplicaLags(self):
+    max_staleness = rdfvalue.Duration.From(10, rdfvalue.SECONDS)
+    with mock.patch.object(
+        mysql_replicas.Replica, "Staleness", return_value=60.0
+    ):
+      self.assertEqual(
+          self._ServerPort(readonly=True, max_staleness=max_staleness),
+          self.primary_port,
+      )
+
+  def testFallsBackToPrimaryWhenReplicaIsNotReplicating(self):
+    max_staleness = rdfvalue.Duration.From(10, rdfvalue.SECONDS)
+    [replica] = self.db.replicas.replicas
+    if replica.Staleness() is not None:
+      self.skipTest("The second instance is an actual replica.")
+
+    self.assertEqual(
+        self._ServerPort(readonly=True, max_staleness=max_staleness),
+        self.primary_port,
+    )
+
+
 if __name__ == "__main__":
   app.run(test_lib.main)
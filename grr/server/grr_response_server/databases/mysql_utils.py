@@ -210,9 +210,14 @@ class WithTransaction(object):
   Afterward, the transaction will be committed and the connection returned to
   the pool. Furthermore, if a retryable database error is raised during this
   process, the decorated function may be called again after a short delay.
+
+  If the caller of a readonly function provides a `max_staleness` keyword
+  argument, the transaction may run on a read replica that lags behind the
+  primary by at most this much. The argument is passed through to the decorated
+  function as well.
   """
 
-  def __init__(self, readonly=False):
+  def __init__(self, readonly: bool = False):
     """Constructs a decorator.
 
     Args:
@@ -231,13 +236,19 @@ class WithTransaction(object):
       if cursor:
         return func(self, *args, **kw)
 
+      max_staleness = kw.get("max_staleness", None)
+      if max_staleness is not None and not readonly:
+        raise ValueError("max_staleness requires a readonly transaction.")
+
       def Closure(connection):
         with contextlib.closing(connection.cursor()) as cursor:
           new_kw = kw.copy()
           new_kw["cursor"] = cursor
           return func(self, *args, **new_kw)
 
-      return self._RunInTransaction(Closure, readonly)
+      return self._RunInTransaction(
+          Closure, readonly, max_staleness=max_staleness
+      )
 
     return Decorated
 
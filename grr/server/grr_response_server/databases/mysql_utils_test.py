@@ -1,4 +1,6 @@
 #!/usr/bin/env python
+from unittest import mock
+
 from absl import app
 from absl.testing import absltest
 
@@ -106,6 +108,46 @@ class MicrosecondsSinceEpochToTimestampTest(absltest.TestCase):
     self.assertEqual(want_timestamp, got_timestamp)
 
 
+class _FakeDB:
+
+  def __init__(self):
+    self.calls = []
+
+  def _RunInTransaction(self, function, readonly, max_staleness=None):
+    self.calls.append((readonly, max_staleness))
+    return function(mock.MagicMock())
+
+  @mysql_utils.WithTransaction(readonly=True)
+  def Read(self, max_staleness=None, cursor=None):
+    del max_staleness, cursor  # Unused.
+    return 42
+
+  @mysql_utils.WithTransaction()
+  def Write(self, max_staleness=None, cursor=None):
+    del max_staleness, cursor  # Unused.
+
+
+class WithTransactionTest(absltest.TestCase):
+
+  def testReadsPrimaryByDefault(self):
+    db = _FakeDB()
+    self.assertEqual(db.Read(), 42)
+    self.assertEqual(db.calls, [(True, None)])
+
+  def testPassesMaxStaleness(self):
+    max_staleness = rdfvalue.Duration.From(5, rdfvalue.SECONDS)
+
+    db = _FakeDB()
+    self.assertEqual(db.Read(max_staleness=max_staleness), 42)
+    self.assertEqual(db.calls, [(True, max_staleness)])
+
+  def testMaxStalenessRequiresReadonly(self):
+    db = _FakeDB()
+    with self.assertRaises(ValueError):
+      db.Write(max_staleness=rdfvalue.Duration.From(5, rdfvalue.SECONDS))
+    self.assertEmpty(db.calls)
+
+
 def main(argv):
   test_lib.main(argv)
 
@@ -2,11 +2,15 @@
 """REL_DB-based file store implementation."""
 
 import abc
+import bisect
 import collections
 from collections.abc import Sequence
 import hashlib
 import io
+import logging
 import os
+import random
+import threading
 from typing import Collection, Dict, Iterable, NamedTuple, Optional
 
 from grr_response_core import config
@@ -14,6 +18,8 @@ from grr_response_core.lib import rdfvalue
 from grr_response_core.lib import utils
 from grr_response_core.lib.util import collection
 from grr_response_core.lib.util import precondition
+from grr_response_core.stats import metrics
+from grr_response_server import blob_store
 from grr_response_server import data_store
 from grr_response_server.databases import db
 from grr_response_server.models import blobs as models_blob
@@ -129,10 +135,46 @@ class CompositeExternalFileStore(ExternalFileStore):
 EXTERNAL_FILE_STORE = CompositeExternalFileStore()
 
 
-# TODO(user): this is a naive implementation as it reads one chunk
-# per REL_DB call. It has to be optimized.
+class _BlobPrefetch:
+  """Reads a batch of blobs on a background thread."""
+
+  def __init__(
+      self,
+      indices: range,
+      blob_ids: Sequence[models_blob.BlobID],
+  ) -> None:
+    self.indices = indices
+    self._blob_ids = blob_ids
+    self._blobs: Optional[Dict[models_blob.BlobID, Optional[bytes]]] = None
+    self._exception: Optional[Exception] = None
+
+    self._thread = threading.Thread(
+        name="BlobStreamPrefetch", target=self._Run, daemon=True
+    )
+    self._thread.start()
+
+  def _Run(self) -> None:
+    try:
+      self._blobs = data_store.BLOBS.ReadBlobs(self._blob_ids)
+    except Exception as e:  # pylint: disable=broad-except
+      self._exception = e
+
+  def Wait(self) -> Dict[models_blob.BlobID, Optional[bytes]]:
+    """Waits for the read to finish and returns its result."""
+    self._thread.join()
+    if self._exception is not None:
+      raise self._exception
+    return self._blobs
+
+
 class BlobStream:
-  """File-like object for reading from blobs."""
+  """File-like object for reading from blobs.
+
+  Blobs are fetched in batches of up to `Server.blob_stream_read_batch_size`
+  blobs per blob store call, bounded by `Server.blob_stream_read_ahead_bytes`.
+  When the stream is read sequentially, the next batch is prefetched on a
+  background thread while the current one is being consumed.
+  """
 
   def __init__(
       self,
@@ -145,41 +187,102 @@ class BlobStream:
     self._hash_id = hash_id
 
     self._max_unbound_read = config.CONFIG["Server.max_unbound_read_size"]
+    self._read_batch_size = max(
+        1, config.CONFIG["Server.blob_stream_read_batch_size"]
+    )
+    self._read_ahead_bytes = config.CONFIG["Server.blob_stream_read_ahead_bytes"]
+    self._background_prefetch = config.CONFIG[
+        "Server.blob_stream_background_prefetch"
+    ]
 
     self._offset = 0
     self._length = 0
     if self._blob_refs:
       self._length = self._blob_refs[-1].offset + self._blob_refs[-1].size
-
-    self._current_ref = None
-    self._current_chunk = None
+    self._ref_offsets = [ref.offset for ref in self._blob_refs]
+
+    # Indices of the blob refs covered by the currently loaded batch.
+    self._batch = range(0)
+    self._batch_chunks: Dict[int, Optional[bytes]] = {}
+    self._prefetch: Optional[_BlobPrefetch] = None
+    self._last_index: Optional[int] = None
+
+  def _FindRefIndex(self, offset: int) -> Optional[int]:
+    """Returns the index of the blob ref covering the given offset."""
+    index = bisect.bisect_right(self._ref_offsets, offset) - 1
+    if index < 0:
+      return None
+
+    ref = self._blob_refs[index]
+    if offset >= ref.offset + ref.size:
+      return None
+
+    return index
+
+  def _BatchStartingAt(self, index: int) -> range:
+    """Returns indices of blob refs of a batch starting at a given index."""
+    # Half of the budget is for the current batch, the other half is for the
+    # batch being prefetched.
+    budget = self._read_ahead_bytes // 2
+    end = index + 1
+    size = self._blob_refs[index].size
+    max_end = min(len(self._blob_refs), index + self._read_batch_size)
+    while end < max_end and size + self._blob_refs[end].size <= budget:
+      size += self._blob_refs[end].size
+      end += 1
+
+    return range(index, end)
+
+  def _BlobIDs(self, indices: Sequence[int]) -> list[models_blob.BlobID]:
+    return [models_blob.BlobID(self._blob_refs[i].blob_id) for i in indices]
+
+  def _LoadBatch(
+      self,
+      indices: range,
+      blobs: Dict[models_blob.BlobID, Optional[bytes]],
+  ) -> None:
+    self._batch = indices
+    self._batch_chunks = {
+        i: blobs.get(blob_id)
+        for i, blob_id in zip(indices, self._BlobIDs(indices))
+    }
 
   def _GetChunk(
       self,
   ) -> tuple[Optional[bytes], Optional[rdf_objects.BlobReference]]:
     """Fetches a chunk corresponding to the current offset."""
 
-    found_ref = None
-    for ref in self._blob_refs:
-      if self._offset >= ref.offset and self._offset < (ref.offset + ref.size):
-        found_ref = ref
-        break
-
-    if not found_ref:
+    index = self._FindRefIndex(self._offset)
+    if index is None:
       return None, None
 
-    # If self._current_ref == found_ref, then simply return previously found
-    # chunk. Otherwise, update self._current_chunk value.
-    if self._current_ref != found_ref:
-      self._current_ref = found_ref
-
-      blob_id = models_blob.BlobID(found_ref.blob_id)
-      data = data_store.BLOBS.ReadBlobs([blob_id])
-      if data[blob_id] is None:
-        raise BlobNotFoundError(blob_id)
-      self._current_chunk = data[blob_id]
-
-    return self._current_chunk, self._current_ref
+    if index not in self._batch:
+      prefetch = self._prefetch
+      self._prefetch = None
+      if prefetch is not None and index in prefetch.indices:
+        self._LoadBatch(prefetch.indices, prefetch.Wait())
+      else:
+        indices = self._BatchStartingAt(index)
+        blobs = data_store.BLOBS.ReadBlobs(self._BlobIDs(indices))
+        self._LoadBatch(indices, blobs)
+
+    chunk = self._batch_chunks[index]
+    if chunk is None:
+      blob_id = models_blob.BlobID(self._blob_refs[index].blob_id)
+      raise BlobNotFoundError(blob_id)
+
+    sequential = self._last_index is not None and index == self._last_index + 1
+    self._last_index = index
+    if (
+        sequential
+        and self._background_prefetch
+        and self._prefetch is None
+        and self._batch.stop < len(self._blob_refs)
+    ):
+      indices = self._BatchStartingAt(self._batch.stop)
+      self._prefetch = _BlobPrefetch(indices, self._BlobIDs(indices))
+
+    return chunk, self._blob_refs[index]
 
   def Read(self, length: Optional[int] = None) -> bytes:
     """Reads data."""
@@ -246,6 +349,10 @@ class BlobStream:
 
 _BLOBS_READ_BATCH_SIZE = 200
 
+TRUSTED_HASH_MISMATCHES = metrics.Counter(
+    "file_store_trusted_hash_mismatches"
+)
+
 BLOBS_READ_TIMEOUT = rdfvalue.Duration.From(120, rdfvalue.SECONDS)
 
 
@@ -367,6 +474,159 @@ def AddFileWithUnknownHash(
   )[client_path]
 
 
+def AddFilesWithTrustedHashes(
+    client_path_blob_refs: Dict[
+        db.ClientPath, Iterable[rdf_objects.BlobReference]
+    ],
+    client_path_hash_id: Dict[db.ClientPath, rdf_objects.SHA256HashID],
+    use_external_stores: bool = True,
+) -> Dict[db.ClientPath, rdf_objects.SHA256HashID]:
+  """Adds new files consisting of given blob references under given hashes.
+
+  Contrary to `AddFilesWithUnknownHashes`, the hashes (usually reported by the
+  client) are trusted, so most of the blobs are not read back. Only the
+  existence of the blobs is checked, a random sample of them (see
+  `Server.file_store_blob_verification_rate`) is read to verify their sizes
+  and a random sample of whole files (see
+  `Server.file_store_hash_verification_rate`) is read and hashed on the server.
+  A sampled file whose content does not match the given hash is added under
+  its actual hash instead.
+
+  Args:
+    client_path_blob_refs: A dictionary mapping `db.ClientPath` instances to
+      lists of blob references.
+    client_path_hash_id: A dictionary mapping `db.ClientPath` instances to
+      hash ids of the files.
+    use_external_stores: A flag indicating if the files should also be added to
+      external file stores.
+
+  Returns:
+    A dictionary mapping `db.ClientPath` to hash ids the files were added
+    under.
+
+  Raises:
+    BlobNotFoundError: If one of the referenced blobs cannot be found.
+    InvalidBlobSizeError: if reference's blob size is different from an
+        actual blob size of a verified blob.
+    InvalidBlobOffsetError: if reference's blob offset doesn't match the sizes
+        of the preceding blobs.
+  """
+  blob_verification_rate = config.CONFIG[
+      "Server.file_store_blob_verification_rate"
+  ]
+  hash_verification_rate = config.CONFIG[
+      "Server.file_store_hash_verification_rate"
+  ]
+
+  hash_id_blob_refs = dict()
+  metadatas = dict()
+  blob_ids = set()
+  sampled_blob_refs = list()
+  sampled_client_path_blob_refs = dict()
+  added_client_path_hash_id = dict()
+
+  for client_path, blob_refs in client_path_blob_refs.items():
+    blob_refs = list(blob_refs)
+
+    if random.random() < hash_verification_rate:
+      sampled_client_path_blob_refs[client_path] = blob_refs
+      continue
+
+    hash_id = client_path_hash_id[client_path]
+
+    proto_blob_refs = []
+    offset = 0
+    for blob_ref in blob_refs:
+      blob_ref = mig_objects.ToProtoBlobReference(blob_ref)
+      if blob_ref.offset != offset:
+        raise InvalidBlobOffsetError(
+            "Got conflicting offset information for blob %s: %d vs %d."
+            % (blob_ref.blob_id, blob_ref.offset, offset)
+        )
+
+      proto_blob_refs.append(blob_ref)
+      blob_ids.add(models_blob.BlobID(blob_ref.blob_id))
+      if random.random() < blob_verification_rate:
+        sampled_blob_refs.append(blob_ref)
+      offset += blob_ref.size
+
+    hash_id_blob_refs[hash_id] = proto_blob_refs
+    metadatas[hash_id] = FileMetadata(
+        client_path=client_path, blob_refs=blob_refs
+    )
+    added_client_path_hash_id[client_path] = hash_id
+
+  if sampled_client_path_blob_refs:
+    verified_client_path_hash_id = AddFilesWithUnknownHashes(
+        sampled_client_path_blob_refs, use_external_stores=use_external_stores
+    )
+    for client_path, hash_id in verified_client_path_hash_id.items():
+      if hash_id != client_path_hash_id[client_path]:
+        TRUSTED_HASH_MISMATCHES.Increment()
+        logging.warning(
+            "Hash of %s does not match the trusted hash: %s vs %s.",
+            client_path,
+            hash_id,
+            client_path_hash_id[client_path],
+        )
+    added_client_path_hash_id.update(verified_client_path_hash_id)
+
+  if not hash_id_blob_refs:
+    return added_client_path_hash_id
+
+  try:
+    data_store.BLOBS.WaitForBlobs(blob_ids, timeout=BLOBS_READ_TIMEOUT)
+  except blob_store.BlobStoreTimeoutError:
+    for blob_id, exists in data_store.BLOBS.CheckBlobsExist(blob_ids).items():
+      if not exists:
+        raise BlobNotFoundError(blob_id)
+
+  for blob_ref_batch in collection.Batch(
+      sampled_blob_refs, _BLOBS_READ_BATCH_SIZE
+  ):
+    blobs = data_store.BLOBS.ReadBlobs(
+        set(models_blob.BlobID(blob_ref.blob_id) for blob_ref in blob_ref_batch)
+    )
+    for blob_ref in blob_ref_batch:
+      blob = blobs[models_blob.BlobID(blob_ref.blob_id)]
+      if blob is None:
+        raise BlobNotFoundError(models_blob.BlobID(blob_ref.blob_id))
+      if blob_ref.size != len(blob):
+        raise InvalidBlobSizeError(
+            "Got conflicting size information for blob %s: %d vs %d."
+            % (blob_ref.blob_id, blob_ref.size, len(blob))
+        )
+
+  data_store.REL_DB.WriteHashBlobReferences(hash_id_blob_refs)
+
+  if use_external_stores:
+    EXTERNAL_FILE_STORE.AddFiles(metadatas)
+
+  return added_client_path_hash_id
+
+
+def AddFileWithTrustedHash(
+    client_path: db.ClientPath,
+    blob_refs: Sequence[rdf_objects.BlobReference],
+    hash_id: rdf_objects.SHA256HashID,
+    use_external_stores: bool = True,
+) -> rdf_objects.SHA256HashID:
+  """Add a new file consisting of given blob IDs under a given hash.
+
+  Returns:
+    The hash id the file was added under. It differs from `hash_id` if the file
+    was sampled for verification and its content does not match the hash.
+  """
+  precondition.AssertType(client_path, db.ClientPath)
+  precondition.AssertIterableType(blob_refs, rdf_objects.BlobReference)
+  precondition.AssertType(hash_id, rdf_objects.SHA256HashID)
+  return AddFilesWithTrustedHashes(
+      {client_path: blob_refs},
+      {client_path: hash_id},
+      use_external_stores=use_external_stores,
+  )[client_path]
+
+
 def CheckHashes(
     hash_ids: Collection[rdf_objects.SHA256HashID],
 ) -> Dict[rdf_objects.SHA256HashID, bool]:
@@ -2,6 +2,7 @@
 """Tests for REL_DB-based file store."""
 
 import itertools
+import threading
 from unittest import mock
 
 from absl import app
@@ -94,6 +95,65 @@ class BlobStreamTest(test_lib.GRRBaseTest):
       self.blob_stream = file_store.BlobStream(None, self.blob_refs, None)
       self.blob_stream.read(self.blob_size)
 
+  def testReadsBlobsInBatches(self):
+    with test_lib.ConfigOverrider({
+        "Server.blob_stream_read_batch_size": 3,
+        "Server.blob_stream_background_prefetch": False,
+    }):
+      blob_stream = file_store.BlobStream(None, self.blob_refs, None)
+
+    with mock.patch.object(
+        data_store.BLOBS, "ReadBlobs", wraps=data_store.BLOBS.ReadBlobs
+    ) as read_blobs:
+      self.assertEqual(blob_stream.read(), b"".join(self.blob_data))
+
+    self.assertEqual(read_blobs.call_count, 4)
+
+  def testReadBatchesRespectReadAheadBudget(self):
+    with test_lib.ConfigOverrider({
+        "Server.blob_stream_read_ahead_bytes": self.blob_size * 4,
+        "Server.blob_stream_background_prefetch": False,
+    }):
+      blob_stream = file_store.BlobStream(None, self.blob_refs, None)
+
+    with mock.patch.object(
+        data_store.BLOBS, "ReadBlobs", wraps=data_store.BLOBS.ReadBlobs
+    ) as read_blobs:
+      self.assertEqual(blob_stream.read(), b"".join(self.blob_data))
+
+    # Half of the budget is used for the current batch.
+    for call in read_blobs.call_args_list:
+      self.assertLessEqual(len(call[0][0]), 2)
+
+  def testPrefetchesNextBatchesWhenReadingSequentially(self):
+    with test_lib.ConfigOverrider({"Server.blob_stream_read_batch_size": 3}):
+      blob_stream = file_store.BlobStream(None, self.blob_refs, None)
+
+    read_blobs = data_store.BLOBS.ReadBlobs
+    thread_names = []
+
+    def ReadBlobs(blob_ids):
+      thread_names.append(threading.current_thread().name)
+      return read_blobs(blob_ids)
+
+    with mock.patch.object(data_store.BLOBS, "ReadBlobs", ReadBlobs):
+      self.assertEqual(blob_stream.read(), b"".join(self.blob_data))
+
+    self.assertEqual(
+        thread_names,
+        [threading.current_thread().name] + ["BlobStreamPrefetch"] * 3,
+    )
+
+  def testReadsCorrectDataAfterSeekingBackwards(self):
+    with test_lib.ConfigOverrider({"Server.blob_stream_read_batch_size": 2}):
+      blob_stream = file_store.BlobStream(None, self.blob_refs, None)
+
+    self.assertEqual(blob_stream.read(), b"".join(self.blob_data))
+    blob_stream.seek(self.blob_size * 3 + 1)
+    self.assertEqual(blob_stream.read(self.blob_size), b"d" * 9 + b"e")
+    blob_stream.seek(1)
+    self.assertEqual(blob_stream.read(self.blob_size), b"a" * 9 + b"b")
+
 
 class AddFileWithUnknownHashTest(test_lib.GRRBaseTest):
   """Tests for AddFileWithUnknownHash."""
@@ -213,6 +273,117 @@ class AddFileWithUnknownHashTest(test_lib.GRRBaseTest):
     self.assertEqual(args[0][hash_id].blob_refs, self.blob_refs)
 
 
+class AddFileWithTrustedHashTest(test_lib.GRRBaseTest):
+  """Tests for AddFileWithTrustedHash."""
+
+  def setUp(self):
+    super().setUp()
+
+    self.blob_size = 10
+    self.blob_data, self.blob_refs = vfs_test_lib.GenerateBlobRefs(
+        self.blob_size, "abcd"
+    )
+    blob_ids = [models_blobs.BlobID(ref.blob_id) for ref in self.blob_refs]
+    data_store.BLOBS.WriteBlobs(dict(zip(blob_ids, self.blob_data)))
+
+    self.client_id = "C.0000111122223333"
+    self.client_path = db.ClientPath.OS(self.client_id, ["foo", "bar"])
+    self.hash_id = rdf_objects.SHA256HashID.FromData(b"".join(self.blob_data))
+
+  def testAddsFileWithoutReadingBlobs(self):
+    with test_lib.ConfigOverrider({
+        "Server.file_store_blob_verification_rate": 0.0,
+        "Server.file_store_hash_verification_rate": 0.0,
+    }):
+      with mock.patch.object(
+          data_store.BLOBS, "ReadBlobs", wraps=data_store.BLOBS.ReadBlobs
+      ) as p:
+        hash_id = file_store.AddFileWithTrustedHash(
+            self.client_path, self.blob_refs, self.hash_id
+        )
+        p.assert_not_called()
+
+    self.assertEqual(hash_id, self.hash_id)
+
+    refs = data_store.REL_DB.ReadHashBlobReferences([self.hash_id])
+    self.assertEqual(
+        refs[self.hash_id],
+        [mig_objects.ToProtoBlobReference(r) for r in self.blob_refs],
+    )
+
+  def testVerifiesSampledBlobs(self):
+    blob_refs = [r.Copy() for r in self.blob_refs]
+    blob_refs[-1].size += 1
+
+    with test_lib.ConfigOverrider(
+        {"Server.file_store_blob_verification_rate": 1.0}
+    ):
+      with self.assertRaises(file_store.InvalidBlobSizeError):
+        file_store.AddFileWithTrustedHash(
+            self.client_path, blob_refs, self.hash_id
+        )
+
+  def testStoresSampledFileWithWrongHashUnderActualHash(self):
+    wrong_hash_id = rdf_objects.SHA256HashID.FromData(b"foo")
+    mismatches = file_store.TRUSTED_HASH_MISMATCHES.GetValue()
+
+    with test_lib.ConfigOverrider(
+        {"Server.file_store_hash_verification_rate": 1.0}
+    ):
+      hash_id = file_store.AddFileWithTrustedHash(
+          self.client_path, self.blob_refs, wrong_hash_id
+      )
+
+    self.assertEqual(hash_id, self.hash_id)
+    self.assertEqual(
+        file_store.TRUSTED_HASH_MISMATCHES.GetValue(), mismatches + 1
+    )
+    refs = data_store.REL_DB.ReadHashBlobReferences(
+        [self.hash_id, wrong_hash_id]
+    )
+    self.assertIsNone(refs[wrong_hash_id])
+    self.assertEqual(
+        refs[self.hash_id],
+        [mig_objects.ToProtoBlobReference(r) for r in self.blob_refs],
+    )
+
+  def testRaisesIfOffsetsAreNotContiguous(self):
+    blob_refs = [r.Copy() for r in self.blob_refs]
+    blob_refs[-1].offset += 1
+
+    with self.assertRaises(file_store.InvalidBlobOffsetError):
+      file_store.AddFileWithTrustedHash(
+          self.client_path, blob_refs, self.hash_id
+      )
+
+  @mock.patch.object(
+      file_store,
+      "BLOBS_READ_TIMEOUT",
+      rdfvalue.Duration.From(1, rdfvalue.MICROSECONDS),
+  )
+  def testRaisesIfBlobIsNotFound(self):
+    blob_ref = rdf_objects.BlobReference(
+        offset=self.blob_size * len(self.blob_refs),
+        size=0,
+        blob_id=bytes(models_blobs.BlobID.Of(b"")),
+    )
+    with self.assertRaises(file_store.BlobNotFoundError):
+      file_store.AddFileWithTrustedHash(
+          self.client_path, self.blob_refs + [blob_ref], self.hash_id
+      )
+
+  @mock.patch.object(file_store.EXTERNAL_FILE_STORE, "AddFiles")
+  def testAddsFileToExternalFileStore(self, add_file_mock):
+    file_store.AddFileWithTrustedHash(
+        self.client_path, self.blob_refs, self.hash_id
+    )
+
+    add_file_mock.assert_called_once()
+    args = add_file_mock.call_args_list[0][0]
+    self.assertEqual(args[0][self.hash_id].client_path, self.client_path)
+    self.assertEqual(args[0][self.hash_id].blob_refs, self.blob_refs)
+
+
 def _BlobRefsFromByteArray(data_array):
   offset = 0
   blob_refs = []
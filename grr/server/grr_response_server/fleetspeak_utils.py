@@ -2,8 +2,10 @@
 """FS GRR server side integration utility functions."""
 
 import binascii
+from concurrent import futures
 import datetime
-from typing import Collection, List
+import threading
+from typing import Collection, List, NamedTuple, Optional, Sequence
 
 from google.protobuf import timestamp_pb2
 from grr_response_core import config
@@ -41,6 +43,82 @@ RRG_REQUEST_COUNT = metrics.Counter(
 )
 
 
+def _InsertMessage(fs_msg: fs_common_pb2.Message) -> None:
+  fleetspeak_connector.CONN.outgoing.InsertMessage(
+      fs_msg,
+      single_try_timeout=WRITE_SINGLE_TRY_TIMEOUT,
+      timeout=WRITE_TOTAL_TIMEOUT,
+  )
+
+
+def _GrrMessageToFleetspeak(
+    grr_id: str,
+    grr_msg: rdf_flows.GrrMessage,
+) -> fs_common_pb2.Message:
+  """Wraps the given GrrMessage into a Fleetspeak message."""
+  fs_msg = fs_common_pb2.Message(
+      message_type="GrrMessage",
+      destination=fs_common_pb2.Address(
+          client_id=GRRIDToFleetspeakID(grr_id), service_name="GRR"
+      ),
+  )
+  fs_msg.data.Pack(grr_msg.AsPrimitiveProto())
+  if grr_msg.session_id is not None:
+    annotation = fs_msg.annotations.entries.add()
+    annotation.key, annotation.value = "flow_id", grr_msg.session_id.Basename()
+  if grr_msg.request_id is not None:
+    annotation = fs_msg.annotations.entries.add()
+    annotation.key, annotation.value = "request_id", str(grr_msg.request_id)
+  return fs_msg
+
+
+def _GrrMessageProtoToFleetspeak(
+    grr_id: str,
+    grr_msg: jobs_pb2.GrrMessage,
+) -> fs_common_pb2.Message:
+  """Wraps the given GrrMessage proto into a Fleetspeak message."""
+  fs_msg = fs_common_pb2.Message(
+      message_type="GrrMessage",
+      destination=fs_common_pb2.Address(
+          client_id=GRRIDToFleetspeakID(grr_id), service_name="GRR"
+      ),
+  )
+  fs_msg.data.Pack(grr_msg)
+  if grr_msg.session_id is not None:
+    annotation = fs_msg.annotations.entries.add()
+    annotation.key = "flow_id"
+    annotation.value = rdfvalue.FlowSessionID(grr_msg.session_id).Basename()
+  if grr_msg.request_id is not None:
+    annotation = fs_msg.annotations.entries.add()
+    annotation.key = "request_id"
+    annotation.value = str(grr_msg.request_id)
+  return fs_msg
+
+
+def _RrgRequestToFleetspeak(
+    client_id: str,
+    request: rrg_pb2.Request,
+) -> fs_common_pb2.Message:
+  """Wraps the given RRG action request into a Fleetspeak message."""
+  message = fs_common_pb2.Message()
+  message.message_type = "rrg.Request"
+  message.destination.service_name = "RRG"
+  message.destination.client_id = GRRIDToFleetspeakID(client_id)
+  message.data.Pack(request)
+
+  # It is not entirely clear to me why we set these annotations below, but
+  # messages sent to Python agents do it, so we should do it as well.
+  message.annotations.entries.add(
+      key="flow_id",
+      value=str(request.flow_id),
+  )
+  message.annotations.entries.add(
+      key="request_id",
+      value=str(request.request_id),
+  )
+  return message
+
+
 @FLEETSPEAK_CALL_LATENCY.Timed(fields=["InsertMessage"])
 def SendGrrMessageThroughFleetspeak(
     grr_id: str,
@@ -62,24 +140,7 @@ def SendGrrMessageThroughFleetspeak(
     grr_msg: GRR message to send.
     labels: Labels of the endpoint to send the message to.
   """
-  fs_msg = fs_common_pb2.Message(
-      message_type="GrrMessage",
-      destination=fs_common_pb2.Address(
-          client_id=GRRIDToFleetspeakID(grr_id), service_name="GRR"
-      ),
-  )
-  fs_msg.data.Pack(grr_msg.AsPrimitiveProto())
-  if grr_msg.session_id is not None:
-    annotation = fs_msg.annotations.entries.add()
-    annotation.key, annotation.value = "flow_id", grr_msg.session_id.Basename()
-  if grr_msg.request_id is not None:
-    annotation = fs_msg.annotations.entries.add()
-    annotation.key, annotation.value = "request_id", str(grr_msg.request_id)
-  fleetspeak_connector.CONN.outgoing.InsertMessage(
-      fs_msg,
-      single_try_timeout=WRITE_SINGLE_TRY_TIMEOUT,
-      timeout=WRITE_TOTAL_TIMEOUT,
-  )
+  _InsertMessage(_GrrMessageToFleetspeak(grr_id, grr_msg))
 
   GRR_REQUEST_COUNT.Increment(
       fields=[
@@ -110,26 +171,7 @@ def SendGrrMessageProtoThroughFleetspeak(
     grr_msg: GRR message to send.
     labels: Labels of the endpoint to send the message to.
   """
-  fs_msg = fs_common_pb2.Message(
-      message_type="GrrMessage",
-      destination=fs_common_pb2.Address(
-          client_id=GRRIDToFleetspeakID(grr_id), service_name="GRR"
-      ),
-  )
-  fs_msg.data.Pack(grr_msg)
-  if grr_msg.session_id is not None:
-    annotation = fs_msg.annotations.entries.add()
-    annotation.key = "flow_id"
-    annotation.value = rdfvalue.FlowSessionID(grr_msg.session_id).Basename()
-  if grr_msg.request_id is not None:
-    annotation = fs_msg.annotations.entries.add()
-    annotation.key = "request_id"
-    annotation.value = str(grr_msg.request_id)
-  fleetspeak_connector.CONN.outgoing.InsertMessage(
-      fs_msg,
-      single_try_timeout=WRITE_SINGLE_TRY_TIMEOUT,
-      timeout=WRITE_TOTAL_TIMEOUT,
-  )
+  _InsertMessage(_GrrMessageProtoToFleetspeak(grr_id, grr_msg))
 
   GRR_REQUEST_COUNT.Increment(
       fields=[
@@ -152,28 +194,7 @@ def SendRrgRequest(
     request: A request to send to the endpoint.
     labels: Labels of the endpoint to send the message to.
   """
-  message = fs_common_pb2.Message()
-  message.message_type = "rrg.Request"
-  message.destination.service_name = "RRG"
-  message.destination.client_id = GRRIDToFleetspeakID(client_id)
-  message.data.Pack(request)
-
-  # It is not entirely clear to me why we set these annotations below, but
-  # messages sent to Python agents do it, so we should do it as well.
-  message.annotations.entries.add(
-      key="flow_id",
-      value=str(request.flow_id),
-  )
-  message.annotations.entries.add(
-      key="request_id",
-      value=str(request.request_id),
-  )
-
-  fleetspeak_connector.CONN.outgoing.InsertMessage(
-      message,
-      single_try_timeout=WRITE_SINGLE_TRY_TIMEOUT,
-      timeout=WRITE_TOTAL_TIMEOUT,
-  )
+  _InsertMessage(_RrgRequestToFleetspeak(client_id, request))
 
   RRG_REQUEST_COUNT.Increment(
       fields=[
@@ -183,6 +204,148 @@ def SendRrgRequest(
   )
 
 
+class _OutgoingMessage(NamedTuple):
+  fs_msg: fs_common_pb2.Message
+  counter: metrics.Counter
+  counter_fields: List[str]
+
+
+class OutgoingBatch:
+  """A batch of messages for Fleetspeak agents that are sent together.
+
+  Fleetspeak has no API to insert multiple messages at once, so the messages
+  of a batch are inserted using concurrent `InsertMessage` calls instead. The
+  calls are made on a process-wide pool of `Server.fleetspeak_send_parallelism`
+  threads, so the number of concurrent calls stays bounded no matter how many
+  batches are sent at the same time.
+  """
+
+  def __init__(self):
+    self._messages: List[_OutgoingMessage] = []
+
+  def AddGrrMessage(
+      self,
+      grr_id: str,
+      grr_msg: rdf_flows.GrrMessage,
+      labels: Collection[str],  # TODO: Remove once RRG rollout done.
+  ) -> None:
+    """Adds a GrrMessage to the batch.
+
+    Args:
+      grr_id: ID of grr client to send message to.
+      grr_msg: GRR message to send.
+      labels: Labels of the endpoint to send the message to.
+    """
+    self._messages.append(
+        _OutgoingMessage(
+            _GrrMessageToFleetspeak(grr_id, grr_msg),
+            GRR_REQUEST_COUNT,
+            [grr_msg.name, ",".join(sorted(labels))],
+        )
+    )
+
+  def AddGrrMessageProto(
+      self,
+      grr_id: str,
+      grr_msg: jobs_pb2.GrrMessage,
+      labels: Collection[str],  # TODO: Remove once RRG rollout done.
+  ) -> None:
+    """Adds a GrrMessage proto to the batch.
+
+    Args:
+      grr_id: ID of grr client to send message to.
+      grr_msg: GRR message to send.
+      labels: Labels of the endpoint to send the message to.
+    """
+    self._messages.append(
+        _OutgoingMessage(
+            _GrrMessageProtoToFleetspeak(grr_id, grr_msg),
+            GRR_REQUEST_COUNT,
+            [grr_msg.name, ",".join(sorted(labels))],
+        )
+    )
+
+  def AddRrgRequest(
+      self,
+      client_id: str,
+      request: rrg_pb2.Request,
+      labels: Collection[str],  # TODO: Remove once RRG rollout done.
+  ) -> None:
+    """Adds a RRG action request to the batch.
+
+    Args:
+      client_id: A unique endpoint identifier as recognized by GRR.
+      request: A request to send to the endpoint.
+      labels: Labels of the endpoint to send the message to.
+    """
+    self._messages.append(
+        _OutgoingMessage(
+            _RrgRequestToFleetspeak(client_id, request),
+            RRG_REQUEST_COUNT,
+            [rrg_pb2.Action.Name(request.action), ",".join(sorted(labels))],
+        )
+    )
+
+  def Send(self) -> None:
+    """Sends all messages of the batch and empties it.
+
+    Raises:
+      grpc.RpcError: If any of the messages could not be sent (after retrying).
+        Other messages of the batch may have been sent nevertheless.
+    """
+    messages = self._messages
+    self._messages = []
+    if not messages:
+      return
+
+    _InsertMessages(messages)
+
+
+def _InsertOutgoingMessage(message: _OutgoingMessage) -> None:
+  _InsertMessage(message.fs_msg)
+  message.counter.Increment(fields=message.counter_fields)
+
+
+_SEND_EXECUTOR_LOCK = threading.Lock()
+_SEND_EXECUTOR: Optional[futures.ThreadPoolExecutor] = None
+_SEND_EXECUTOR_SIZE: Optional[int] = None
+
+
+def _SendExecutor(size: int) -> futures.ThreadPoolExecutor:
+  """Returns the process-wide executor used to send outgoing batches."""
+  global _SEND_EXECUTOR, _SEND_EXECUTOR_SIZE
+
+  with _SEND_EXECUTOR_LOCK:
+    if _SEND_EXECUTOR is None or _SEND_EXECUTOR_SIZE != size:
+      if _SEND_EXECUTOR is not None:
+        # Only happens if the config changes (e.g. in tests). Calls already
+        # submitted to the old executor still complete.
+        _SEND_EXECUTOR.shutdown(wait=False)
+      _SEND_EXECUTOR = futures.ThreadPoolExecutor(
+          max_workers=size, thread_name_prefix="FleetspeakSend"
+      )
+      _SEND_EXECUTOR_SIZE = size
+
+    return _SEND_EXECUTOR
+
+
+@FLEETSPEAK_CALL_LATENCY.Timed(fields=["InsertMessageBatch"])
+def _InsertMessages(messages: Sequence[_OutgoingMessage]) -> None:
+  """Inserts the given messages using the shared, bounded executor."""
+  parallelism = config.CONFIG["Server.fleetspeak_send_parallelism"]
+  if parallelism <= 1 or len(messages) <= 1:
+    for message in messages:
+      _InsertOutgoingMessage(message)
+    return
+
+  executor = _SendExecutor(parallelism)
+  fs = [executor.submit(_InsertOutgoingMessage, m) for m in messages]
+  futures.wait(fs)
+  # Re-raises the first error, if any, once all the calls are done.
+  for f in fs:
+    f.result()
+
+
 @FLEETSPEAK_CALL_LATENCY.Timed(fields=["InsertMessage"])
 def KillFleetspeak(grr_id: str, force: bool) -> None:
   """Kills Fleespeak on the given client."""
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 """Tests for fleetspeak_utils module."""
 
+import threading
+import time
 from unittest import mock
 
 from absl import app
@@ -15,6 +17,7 @@ from fleetspeak.src.common.proto.fleetspeak import common_pb2
 from fleetspeak.src.common.proto.fleetspeak import system_pb2 as fs_system_pb2
 from fleetspeak.src.server.proto.fleetspeak_server import admin_pb2
 from fleetspeak.src.server.proto.fleetspeak_server import resource_pb2
+from grr_response_proto import rrg_pb2
 
 
 _TEST_CLIENT_ID = "C.0000000000000001"
@@ -146,6 +149,127 @@ class FleetspeakUtilsTest(test_lib.GRRBaseTest):
     self.assertEqual(fs_message.annotations, expected_annotations)
     self.assertEqual(grr_message, unpacked_message)
 
+  def _AddMessagesToBatch(self, batch):
+    for request_id in range(1, 4):
+      batch.AddGrrMessage(
+          _TEST_CLIENT_ID,
+          rdf_flows.GrrMessage(
+              session_id=f"{_TEST_CLIENT_ID}/01234567",
+              name="TestClientAction",
+              request_id=request_id,
+          ),
+          [],
+      )
+      batch.AddGrrMessageProto(
+          _TEST_CLIENT_ID,
+          jobs_pb2.GrrMessage(
+              session_id=f"{_TEST_CLIENT_ID}/01234567",
+              name="TestClientAction",
+              request_id=request_id + 10,
+          ),
+          [],
+      )
+      batch.AddRrgRequest(
+          _TEST_CLIENT_ID,
+          rrg_pb2.Request(flow_id=1, request_id=request_id + 20),
+          [],
+      )
+
+  def _SentRequestIds(self, mock_conn):
+    request_ids = []
+    for args, _ in mock_conn.outgoing.InsertMessage.call_args_list:
+      fs_message = args[0]
+      for annotation in fs_message.annotations.entries:
+        if annotation.key == "request_id":
+          request_ids.append(int(annotation.value))
+    return request_ids
+
+  @mock.patch.object(fleetspeak_connector, "CONN")
+  def testOutgoingBatch(self, mock_conn):
+    batch = fleetspeak_utils.OutgoingBatch()
+    self._AddMessagesToBatch(batch)
+    mock_conn.outgoing.InsertMessage.assert_not_called()
+
+    batch.Send()
+    self.assertCountEqual(
+        self._SentRequestIds(mock_conn), [1, 2, 3, 11, 12, 13, 21, 22, 23]
+    )
+
+    # Sent messages are removed from the batch.
+    batch.Send()
+    self.assertEqual(mock_conn.outgoing.InsertMessage.call_count, 9)
+
+  @mock.patch.object(fleetspeak_connector, "CONN")
+  def testOutgoingBatchSequential(self, mock_conn):
+    batch = fleetspeak_utils.OutgoingBatch()
+    self._AddMessagesToBatch(batch)
+
+    with test_lib.ConfigOverrider({"Server.fleetspeak_send_parallelism": 1}):
+      batch.Send()
+
+    self.assertEqual(
+        self._SentRequestIds(mock_conn), [1, 11, 21, 2, 12, 22, 3, 13, 23]
+    )
+
+  @mock.patch.object(fleetspeak_connector, "CONN")
+  def testOutgoingBatchesShareBoundedExecutor(self, mock_conn):
+    lock = threading.Lock()
+    concurrent_calls = 0
+    max_concurrent_calls = 0
+
+    def InsertMessage(*args, **kwargs):
+      del args, kwargs  # Unused.
+      nonlocal concurrent_calls, max_concurrent_calls
+      with lock:
+        concurrent_calls += 1
+        max_concurrent_calls = max(max_concurrent_calls, concurrent_calls)
+      time.sleep(0.01)
+      with lock:
+        concurrent_calls -= 1
+
+    mock_conn.outgoing.InsertMessage.side_effect = InsertMessage
+
+    batches = []
+    for _ in range(4):
+      batch = fleetspeak_utils.OutgoingBatch()
+      self._AddMessagesToBatch(batch)
+      batches.append(batch)
+
+    with test_lib.ConfigOverrider({"Server.fleetspeak_send_parallelism": 2}):
+      threads = [threading.Thread(target=batch.Send) for batch in batches]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+    self.assertEqual(mock_conn.outgoing.InsertMessage.call_count, 36)
+    self.assertLessEqual(max_concurrent_calls, 2)
+
+  @mock.patch.object(fleetspeak_connector, "CONN")
+  def testOutgoingBatchRaisesIfSendingFails(self, mock_conn):
+    mock_conn.outgoing.InsertMessage.side_effect = RuntimeError("foo")
+
+    batch = fleetspeak_utils.OutgoingBatch()
+    self._AddMessagesToBatch(batch)
+
+    with self.assertRaisesRegex(RuntimeError, "foo"):
+      batch.Send()
+
+  @mock.patch.object(fleetspeak_connector, "CONN")
+  def testOutgoingBatchRecordsLatency(self, mock_conn):
+    del mock_conn  # Unused.
+
+    latency = fleetspeak_utils.FLEETSPEAK_CALL_LATENCY
+    count = latency.GetValue(fields=["InsertMessageBatch"]).count
+
+    batch = fleetspeak_utils.OutgoingBatch()
+    self._AddMessagesToBatch(batch)
+    batch.Send()
+
+    self.assertEqual(
+        latency.GetValue(fields=["InsertMessageBatch"]).count, count + 1
+    )
+
   @mock.patch.object(fleetspeak_connector, "CONN")
   def testKillFleetspeak(self, mock_conn):
     fleetspeak_utils.KillFleetspeak("C.1000000000000000", True)
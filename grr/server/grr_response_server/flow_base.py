@@ -6,6 +6,7 @@ import dataclasses
 import functools
 import logging
 import re
+import time
 import traceback
 import types
 from typing import Any, Callable, Collection, Dict, Generic, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Type, TypeVar, Union
@@ -58,6 +59,10 @@ FLOW_ERRORS = metrics.Counter(
 )
 FLOW_COMPLETIONS = metrics.Counter("flow_completions", fields=[("flow", str)])
 GRR_WORKER_STATES_RUN = metrics.Counter("grr_worker_states_run")
+FLOW_STEP_COMMIT_LATENCY = metrics.Event(
+    "flow_step_commit_latency",
+    bins=[0.001 * 2**x for x in range(16)],
+)  # 1ms to ~30 secs
 HUNT_OUTPUT_PLUGIN_ERRORS = metrics.Counter(
     "hunt_output_plugin_errors", fields=[("plugin", str)]
 )
@@ -1540,14 +1545,7 @@ class FlowBase(
 
       # Responses have to be processed in the correct order, no response
       # can be skipped.
-      rdf_responses = []
-      for r in responses:
-        if isinstance(r, flows_pb2.FlowResponse):
-          rdf_responses.append(mig_flow_objects.ToRDFFlowResponse(r))
-        if isinstance(r, flows_pb2.FlowStatus):
-          rdf_responses.append(mig_flow_objects.ToRDFFlowStatus(r))
-        if isinstance(r, flows_pb2.FlowIterator):
-          rdf_responses.append(mig_flow_objects.ToRDFFlowIterator(r))
+      rdf_responses = mig_flow_objects.ToRDFFlowResponses(responses)
 
       if rdf_responses:
         # We do not sent incremental updates for FlowStatus updates.
@@ -1584,14 +1582,7 @@ class FlowBase(
         break
 
       rdf_request = mig_flow_objects.ToRDFFlowRequest(request)
-      rdf_responses = []
-      for r in responses:
-        if isinstance(r, flows_pb2.FlowResponse):
-          rdf_responses.append(mig_flow_objects.ToRDFFlowResponse(r))
-        if isinstance(r, flows_pb2.FlowStatus):
-          rdf_responses.append(mig_flow_objects.ToRDFFlowStatus(r))
-        if isinstance(r, flows_pb2.FlowIterator):
-          rdf_responses.append(mig_flow_objects.ToRDFFlowIterator(r))
+      rdf_responses = mig_flow_objects.ToRDFFlowResponses(responses)
       # If there's not even a `Status` response, we send `None` as response.
       if not rdf_responses:
         rdf_responses = None
@@ -1644,84 +1635,86 @@ class FlowBase(
     self.rdf_flow.response_count += 1
     return self.rdf_flow.response_count
 
-  def FlushQueuedMessages(self) -> None:
-    """Flushes queued messages."""
-    # TODO(amoser): This could be done in a single db call, might be worth
-    # optimizing.
-
-    if self.flow_requests or self.proto_flow_requests:
-      all_requests = [
-          mig_flow_objects.ToProtoFlowRequest(r) for r in self.flow_requests
-      ] + self.proto_flow_requests
-      # We make a single DB call to write all requests. Contrary to what the
-      # name suggests, this method does more than writing the requests to the
-      # DB. It also tallies the flows that need processing and updates the
-      # next request to process. Writing the requests in separate calls can
-      # interfere with this process.
-      data_store.REL_DB.WriteFlowRequests(all_requests)
-      self.flow_requests = []
-      self.proto_flow_requests = []
-
-    if self.flow_responses:
-      flow_responses_proto = []
-      for r in self.flow_responses:
-        if isinstance(r, rdf_flow_objects.FlowResponse):
-          flow_responses_proto.append(mig_flow_objects.ToProtoFlowResponse(r))
-        if isinstance(r, rdf_flow_objects.FlowStatus):
-          flow_responses_proto.append(mig_flow_objects.ToProtoFlowStatus(r))
-        if isinstance(r, rdf_flow_objects.FlowIterator):
-          flow_responses_proto.append(mig_flow_objects.ToProtoFlowIterator(r))
-      data_store.REL_DB.WriteFlowResponses(flow_responses_proto)
-      self.flow_responses = []
-
-    if self.proto_flow_responses:
-      data_store.REL_DB.WriteFlowResponses(self.proto_flow_responses)
-      self.proto_flow_responses = []
-
-    if self.client_action_requests:
-      client_id = self.rdf_flow.client_id
-      for request in self.client_action_requests:
-        fleetspeak_utils.SendGrrMessageThroughFleetspeak(
-            client_id,
-            request,
-            self.client_labels,
-        )
+  def FlushQueuedMessages(
+      self, flow_to_release: Optional[flows_pb2.Flow] = None
+  ) -> bool:
+    """Flushes queued messages.
 
-      self.client_action_requests = []
+    All database writes queued while processing the flow are committed in a
+    single transaction. Messages for the client are only sent afterwards, so
+    the corresponding requests are guaranteed to be stored by then.
 
-    if self.proto_client_action_requests:
-      client_id = self.rdf_flow.client_id
-      for request in self.proto_client_action_requests:
-        fleetspeak_utils.SendGrrMessageProtoThroughFleetspeak(
-            client_id,
-            request,
-            self.client_labels,
-        )
-      self.proto_client_action_requests = []
+    Args:
+      flow_to_release: If set, the flow is released to the database in the
+        same transaction (see `Database.ReleaseProcessedFlow`).
 
-    for request in self.rrg_requests:
-      fleetspeak_utils.SendRrgRequest(
-          self.rdf_flow.client_id,
-          request,
-          self.client_labels,
+    Returns:
+      False if the flow could not be released because more requests became
+      ready for processing, True otherwise.
+    """
+    # We make a single DB call to write all requests. Contrary to what the
+    # name suggests, writing requests does more than writing them to the DB.
+    # It also tallies the flows that need processing and updates the next
+    # request to process. Writing the requests in separate calls can interfere
+    # with this process.
+    requests = [
+        mig_flow_objects.ToProtoFlowRequest(r) for r in self.flow_requests
+    ] + self.proto_flow_requests
+    responses = (
+        mig_flow_objects.ToProtoFlowResponses(self.flow_responses)
+        + self.proto_flow_responses
+    )
+    # Write flow results to REL_DB, even if the flow is a nested flow.
+    results = self.proto_replies_to_write + [
+        mig_flow_objects.ToProtoFlowResult(r) for r in self.replies_to_write
+    ]
+    completed_requests = self.completed_requests
+
+    released = True
+    if (
+        requests
+        or responses
+        or completed_requests
+        or results
+        or flow_to_release is not None
+    ):
+      start_time = time.time()
+      released = data_store.REL_DB.CommitFlowStep(
+          requests=requests,
+          responses=responses,
+          completed_requests=completed_requests,
+          results=results,
+          flow_obj=flow_to_release,
       )
+      FLOW_STEP_COMMIT_LATENCY.RecordEvent(time.time() - start_time)
 
+    self.flow_requests = []
+    self.proto_flow_requests = []
+    self.flow_responses = []
+    self.proto_flow_responses = []
+    self.completed_requests = []
+    self.proto_replies_to_write = []
+    self.replies_to_write = []
+
+    outgoing = fleetspeak_utils.OutgoingBatch()
+    client_id = self.rdf_flow.client_id
+    for request in self.client_action_requests:
+      outgoing.AddGrrMessage(client_id, request, self.client_labels)
+    for request in self.proto_client_action_requests:
+      outgoing.AddGrrMessageProto(client_id, request, self.client_labels)
+    for request in self.rrg_requests:
+      outgoing.AddRrgRequest(client_id, request, self.client_labels)
+
+    self.client_action_requests = []
+    self.proto_client_action_requests = []
     self.rrg_requests = []
 
-    if self.completed_requests:
-      data_store.REL_DB.DeleteFlowRequests(self.completed_requests)
-      self.completed_requests = []
-
-    if self.proto_replies_to_write or self.replies_to_write:
-      all_results = self.proto_replies_to_write + [
-          mig_flow_objects.ToProtoFlowResult(r) for r in self.replies_to_write
-      ]
-      # Write flow results to REL_DB, even if the flow is a nested flow.
-      data_store.REL_DB.WriteFlowResults(all_results)
-      if self.rdf_flow.parent_hunt_id:
-        hunt.StopHuntIfCPUOrNetworkLimitsExceeded(self.rdf_flow.parent_hunt_id)
-      self.proto_replies_to_write = []
-      self.replies_to_write = []
+    outgoing.Send()
+
+    if results and self.rdf_flow.parent_hunt_id:
+      hunt.StopHuntIfCPUOrNetworkLimitsExceeded(self.rdf_flow.parent_hunt_id)
+
+    return released
 
   def _ProcessRepliesWithOutputPluginProto(
       self, replies: Sequence[flows_pb2.FlowResult]
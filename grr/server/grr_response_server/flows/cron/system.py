@@ -4,8 +4,12 @@
 
 from grr_response_core import config
 from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.util import collection
+from grr_response_proto import hunts_pb2
 from grr_response_server import cronjobs
+from grr_response_server import data_store
 from grr_response_server import hunt
+from grr_response_server.databases import db
 from grr_response_server.flows.general import discovery as flows_discovery
 
 
@@ -56,3 +60,33 @@ class InterrogateClientsCronJob(cronjobs.SystemCronJobBase,
 
   def Run(self):
     self.StartInterrogationHunt()
+
+
+class HuntCountersRepairCronJob(cronjobs.SystemCronJobBase):
+  """A cron job which fixes drifted counters of active hunts.
+
+  Hunt counters are maintained incrementally as hunt flows are written. This
+  job periodically recomputes them for started and paused hunts and fixes the
+  ones that got out of sync.
+  """
+
+  frequency = rdfvalue.Duration.From(1, rdfvalue.HOURS)
+  lifetime = rdfvalue.Duration.From(30, rdfvalue.MINUTES)
+
+  _BATCH_SIZE = 100
+
+  def Run(self):
+    hunt_objs = data_store.REL_DB.ReadHuntObjects(
+        offset=0,
+        count=db.MAX_COUNT,
+        with_states=[
+            hunts_pb2.Hunt.HuntState.STARTED,
+            hunts_pb2.Hunt.HuntState.PAUSED,
+        ],
+    )
+    hunt_ids = [hunt_obj.hunt_id for hunt_obj in hunt_objs]
+
+    for batch in collection.Batch(hunt_ids, self._BATCH_SIZE):
+      self.HeartBeat()
+      for hunt_id in data_store.REL_DB.RepairHuntCounters(batch):
+        self.Log("Repaired drifted counters of hunt %s.", hunt_id)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Tests for system cron jobs."""
+
+from absl import app
+
+from grr_response_proto import hunts_pb2
+from grr_response_server import data_store
+from grr_response_server.databases import db_test_utils
+from grr_response_server.flows.cron import system
+from grr_response_server.rdfvalues import cronjobs as rdf_cronjobs
+from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
+from grr.test_lib import test_lib
+
+
+class HuntCountersRepairCronJobTest(test_lib.GRRBaseTest):
+
+  def _RunCronJob(self):
+    run_state = rdf_cronjobs.CronJobRun()
+    job = rdf_cronjobs.CronJob()
+    system.HuntCountersRepairCronJob(run_state, job).Run()
+    return run_state
+
+  def testRepairsDriftedCounters(self):
+    rel_db = data_store.REL_DB
+    hunt_id = db_test_utils.InitializeHunt(rel_db)
+    rel_db.UpdateHuntObject(
+        hunt_id, hunt_state=hunts_pb2.Hunt.HuntState.STARTED
+    )
+    for _ in range(3):
+      client_id = db_test_utils.InitializeClient(rel_db)
+      db_test_utils.InitializeFlow(
+          rel_db,
+          client_id,
+          flow_id=hunt_id,
+          flow_state=rdf_flow_objects.Flow.FlowState.FINISHED,
+          parent_hunt_id=hunt_id,
+          network_bytes_sent=42,
+      )
+    counters = rel_db.ReadHuntCounters(hunt_id)
+    self.assertEqual(counters.num_clients, 3)
+
+    # Simulate the counters getting out of sync with the hunt flows.
+    hunt_counters = rel_db.delegate.hunt_counters[hunt_id]
+    hunt_counters["num_clients"] += 5
+    hunt_counters["total_network_bytes_sent"] -= 42
+    self.assertNotEqual(rel_db.ReadHuntCounters(hunt_id), counters)
+
+    run = self._RunCronJob()
+
+    self.assertEqual(rel_db.ReadHuntCounters(hunt_id), counters)
+    self.assertIn(hunt_id, run.log_message)
+
+  def testIgnoresHuntsThatAreNotActive(self):
+    rel_db = data_store.REL_DB
+    hunt_id = db_test_utils.InitializeHunt(rel_db)
+    rel_db.UpdateHuntObject(
+        hunt_id, hunt_state=hunts_pb2.Hunt.HuntState.COMPLETED
+    )
+    client_id = db_test_utils.InitializeClient(rel_db)
+    db_test_utils.InitializeFlow(
+        rel_db, client_id, flow_id=hunt_id, parent_hunt_id=hunt_id
+    )
+    rel_db.delegate.hunt_counters[hunt_id]["num_clients"] += 5
+
+    self._RunCronJob()
+
+    self.assertEqual(rel_db.ReadHuntCounters(hunt_id).num_clients, 6)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -8,6 +8,8 @@ from google.protobuf import any_pb2
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.rdfvalues import mig_timeline
 from grr_response_core.lib.rdfvalues import timeline as rdf_timeline
+from grr_response_core.lib.util import collection
+from grr_response_core.lib.util import iterator
 from grr_response_core.lib.util import timeline
 from grr_response_proto import flows_pb2
 from grr_response_proto import timeline_pb2
@@ -176,6 +178,10 @@ def Blobs(
 ) -> Iterator[bytes]:
   """Retrieves timeline blobs for the specified flow.
 
+  Flow results are read page by page and the blobs they reference are fetched
+  in batches, with several batches being fetched concurrently ahead of the
+  consumer.
+
   Args:
     client_id: An identifier of a client of the flow to retrieve the blobs for.
     flow_id: An identifier of the flow to retrieve the blobs for.
@@ -183,37 +189,68 @@ def Blobs(
   Yields:
     Blobs of the timeline data in the gzchunked format for the specified flow.
   """
-  results = data_store.REL_DB.ReadFlowResults(
-      client_id=client_id,
-      flow_id=flow_id,
-      offset=0,
-      count=_READ_FLOW_MAX_RESULTS_COUNT,
-  )
-  results = [mig_flow_objects.ToRDFFlowResult(r) for r in results]
-
-  # `_READ_FLOW_MAX_RESULTS_COUNT` is far too much than we should ever get. If
-  # we really got this many results that it means this assumption is not correct
-  # and we should fail loudly to investigate this issue.
-  if len(results) >= _READ_FLOW_MAX_RESULTS_COUNT:
-    message = f"Unexpected number of timeline results: {len(results)}"
-    raise AssertionError(message)
-
-  for result in results:
-    payload = result.payload
+  blob_ids = _EntryBatchBlobIDs(client_id, flow_id)
+  blob_id_batches = collection.Batch(blob_ids, _READ_BLOBS_BATCH_SIZE)
 
-    if not isinstance(payload, rdf_timeline.TimelineResult):
-      message = "Unexpected timeline result of type '{}'".format(type(payload))
-      raise TypeError(message)
+  for blobs in iterator.ParallelMap(
+      _ReadBlobs, blob_id_batches, max_workers=_READ_BLOBS_CONCURRENCY
+  ):
+    yield from blobs
 
-    for entry_batch_blob_id in payload.entry_batch_blob_ids:
-      blob_id = models_blobs.BlobID(entry_batch_blob_id)
-      blob = data_store.BLOBS.ReadBlob(blob_id)
 
-      if blob is None:
-        message = "Reference to non-existing blob: '{}'".format(blob_id)
-        raise AssertionError(message)
-
-      yield blob
+def _EntryBatchBlobIDs(
+    client_id: str,
+    flow_id: str,
+) -> Iterator[models_blobs.BlobID]:
+  """Yields ids of blobs with timeline entries of the specified flow."""
+  offset = 0
+  while True:
+    results = data_store.REL_DB.ReadFlowResults(
+        client_id=client_id,
+        flow_id=flow_id,
+        offset=offset,
+        count=_READ_FLOW_RESULTS_PAGE_SIZE,
+    )
+    offset += len(results)
+
+    # `_READ_FLOW_MAX_RESULTS_COUNT` is far too much than we should ever get.
+    # If we really got this many results that it means this assumption is not
+    # correct and we should fail loudly to investigate this issue.
+    if offset >= _READ_FLOW_MAX_RESULTS_COUNT:
+      message = f"Unexpected number of timeline results: {offset}"
+      raise AssertionError(message)
+
+    for result in results:
+      if not result.payload.Is(timeline_pb2.TimelineResult.DESCRIPTOR):
+        message = "Unexpected timeline result of type '{}'".format(
+            result.payload.type_url
+        )
+        raise TypeError(message)
+
+      payload = timeline_pb2.TimelineResult()
+      result.payload.Unpack(payload)
+
+      for entry_batch_blob_id in payload.entry_batch_blob_ids:
+        yield models_blobs.BlobID(entry_batch_blob_id)
+
+    if len(results) < _READ_FLOW_RESULTS_PAGE_SIZE:
+      break
+
+
+def _ReadBlobs(blob_ids: list[models_blobs.BlobID]) -> list[bytes]:
+  """Reads the given blobs, failing if any of them doesn't exist."""
+  blobs_by_id = data_store.BLOBS.ReadBlobs(blob_ids)
+
+  blobs = []
+  for blob_id in blob_ids:
+    blob = blobs_by_id.get(blob_id)
+    if blob is None:
+      message = "Reference to non-existing blob: '{}'".format(blob_id)
+      raise AssertionError(message)
+
+    blobs.append(blob)
+
+  return blobs
 
 
 def FilesystemType(client_id: str, flow_id: str) -> Optional[str]:
@@ -247,6 +284,16 @@ def FilesystemType(client_id: str, flow_id: str) -> Optional[str]:
 # bigger.
 _READ_FLOW_MAX_RESULTS_COUNT = 1024
 
+# A number of flow results to read in a single database call.
+_READ_FLOW_RESULTS_PAGE_SIZE = 64
+
+# A number of blobs to read in a single blob store call and a number of such
+# calls to run concurrently. Blobs with timeline entries are (at most) a few
+# megabytes each, so this bounds the amount of blob data read ahead of the
+# consumer to a few hundred megabytes at worst.
+_READ_BLOBS_BATCH_SIZE = 8
+_READ_BLOBS_CONCURRENCY = 4
+
 # An amount of time to wait for the blobs with timeline entries to appear in the
 # blob store. This is needed, because blobs are not guaranteed to be processed
 # before the flow receives results from the client. This delay should usually be
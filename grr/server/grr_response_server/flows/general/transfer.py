@@ -1,14 +1,19 @@
 #!/usr/bin/env python
 """These flows are designed for high performance transfers."""
 
-from collections.abc import MutableSequence, Sequence
+from collections.abc import Iterator, MutableSequence, Sequence
+from concurrent import futures
 import logging
+import threading
+import time
 from typing import Optional
 import zlib
 
 from google.protobuf import any_pb2
+from grr_response_core import config
 from grr_response_core.lib import constants
 from grr_response_core.lib import rdfvalue
+from grr_response_core.lib import utils
 from grr_response_core.lib.rdfvalues import client as rdf_client
 from grr_response_core.lib.rdfvalues import client_fs as rdf_client_fs
 from grr_response_core.lib.rdfvalues import crypto as rdf_crypto
@@ -22,7 +27,6 @@ from grr_response_core.lib.rdfvalues import structs as rdf_structs
 from grr_response_core.stats import metrics
 from grr_response_proto import flows_pb2
 from grr_response_proto import jobs_pb2
-from grr_response_proto import objects_pb2
 from grr_response_proto.api import config_pb2
 from grr_response_server import data_store
 from grr_response_server import file_store
@@ -35,6 +39,7 @@ from grr_response_server import server_stubs
 from grr_response_server.databases import db
 from grr_response_server.flows.general import filesystem
 from grr_response_server.models import blobs as models_blobs
+from grr_response_server.models import paths as models_paths
 from grr_response_server.rdfvalues import mig_objects
 from grr_response_server.rdfvalues import objects as rdf_objects
 from grr_response_server.rdfvalues import wrappers as rdf_wrappers
@@ -48,6 +53,17 @@ from grr_response_proto.rrg.action import get_file_sha256_pb2 as rrg_get_file_sh
 _BLOBSTORE_HIT = metrics.Counter(name="multi_get_file_blobstore_hit")
 _BLOBSTORE_MISS = metrics.Counter(name="multi_get_file_blobstore_miss")
 
+_BLOB_HANDLER_DECODED_BYTES = metrics.Counter(
+    name="blob_handler_decoded_bytes"
+)
+_BLOB_HANDLER_DECODING_LATENCY = metrics.Event(
+    name="blob_handler_decoding_latency",
+    bins=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1],
+)
+_BLOB_HANDLER_SKIPPED_WRITES = metrics.Counter(
+    name="blob_handler_skipped_writes"
+)
+
 
 class MultiGetFileArgs(rdf_structs.RDFProtoStruct):
   protobuf = flows_pb2.MultiGetFileArgs
@@ -680,20 +696,27 @@ class MultiGetFile(
 
     # Now that the check is done, reset our counter
     self.store.num_files_hashed_since_check = 0
-    # Now copy all existing files to the client aff4 space.
+    # Now copy all existing files to the client aff4 space. Path infos of all
+    # the deduplicated files are written at once to avoid a database round trip
+    # per file.
+    deduplicated_trackers = []
+    proto_path_infos = []
     for hash_id in files_in_filestore:
 
       for file_tracker in hash_to_tracker.get(hash_id, []):
-        stat_entry = file_tracker.stat_entry
-        path_info = rdf_objects.PathInfo.FromStatEntry(
-            mig_client_fs.ToRDFStatEntry(stat_entry)
+        proto_path_info = models_paths.PathInfoFromStatEntry(
+            file_tracker.stat_entry
         )
-        proto_path_info = mig_objects.ToProtoPathInfo(path_info)
         proto_path_info.hash_entry.CopyFrom(file_tracker.hash_obj)
-        data_store.REL_DB.WritePathInfos(self.client_id, [proto_path_info])
+        proto_path_infos.append(proto_path_info)
+        deduplicated_trackers.append(file_tracker)
+
+    if proto_path_infos:
+      data_store.REL_DB.WritePathInfos(self.client_id, proto_path_infos)
 
-        # Report this hit to the flow's caller.
-        self._ReceiveFetchedFile(file_tracker, is_duplicate=True)
+    for file_tracker in deduplicated_trackers:
+      # Report this hit to the flow's caller.
+      self._ReceiveFetchedFile(file_tracker, is_duplicate=True)
 
     # Now we iterate over all the files which are not in the store and arrange
     # for them to be copied.
@@ -967,65 +990,16 @@ class MultiGetFile(
     blob_dict = _BuildBlobDict(index_to_tracker.tracker.index_to_buffers)
     blob_dict[int(responses.request_data["blob_index"])] = blob_ref
 
-    if len(blob_dict) != index_to_tracker.tracker.expected_chunks:
-      # TODO: Replace with `clear()` once upgraded in open-source.
-      del index_to_tracker.tracker.index_to_buffers[:]
-      index_to_tracker.tracker.index_to_buffers.extend(
-          _BuildIndexToBuffers(blob_dict)
-      )
-      return
-
-    blob_refs = []
-    for index in sorted(blob_dict):
-      blob_ref = objects_pb2.BlobReference()
-      blob_ref.blob_id = blob_dict[index].data
-      blob_ref.offset = blob_dict[index].offset
-      blob_ref.size = blob_dict[index].length
-
-      blob_refs.append(mig_objects.ToRDFBlobReference(blob_ref))
-
-    path_info = rdf_objects.PathInfo.FromStatEntry(
-        mig_client_fs.ToRDFStatEntry(index_to_tracker.tracker.stat_entry)
-    )
-    client_path = db.ClientPath.FromPathInfo(self.client_id, path_info)
-    path_info = mig_objects.ToProtoPathInfo(path_info)
-
-    if self.proto_args.HasField("use_external_stores"):
-      use_external_stores = self.proto_args.use_external_stores
-    else:
-      use_external_stores = True
-
-    hash_id = file_store.AddFileWithUnknownHash(
-        client_path,
-        blob_refs,
-        use_external_stores=use_external_stores,
-    )
-    hash_id_bytes = hash_id.AsBytes()
-
-    if hash_id_bytes == index_to_tracker.tracker.hash_obj.sha256:
-      path_info.hash_entry.CopyFrom(index_to_tracker.tracker.hash_obj)
-    else:
-      self.Log(
-          "File SHA-256 mismatch: %s and %s",
-          hash_id_bytes,
-          index_to_tracker.tracker.hash_obj.sha256,
-      )
-      path_info.hash_entry.sha256 = hash_id_bytes
-
-    data_store.REL_DB.WritePathInfos(self.client_id, [path_info])
-
     # TODO: Replace with `clear()` once upgraded in open-source.
     del index_to_tracker.tracker.index_to_buffers[:]
-    del index_to_tracker.tracker.hash_list[:]
+    index_to_tracker.tracker.index_to_buffers.extend(
+        _BuildIndexToBuffers(blob_dict)
+    )
 
-    self._ReceiveFetchedFile(index_to_tracker.tracker)
-    self.store.num_files_fetched += 1
-    if self.store.num_files_fetched % 100 == 0:
-      self.Log(
-          "Fetched %d of %d files",
-          self.store.num_files_fetched,
-          self.store.num_files_to_fetch,
-      )
+    if len(blob_dict) != index_to_tracker.tracker.expected_chunks:
+      return
+
+    self._FileContentCollected(index_to_tracker.tracker)
 
   @flow_base.UseProto2AnyResponses
   def _WriteBuffer(self, responses: flow_responses.Responses[any_pb2.Any]):
@@ -1053,16 +1027,138 @@ class MultiGetFile(
     blob_index = responses.request_data["blob_index"]
     blob_dict[blob_index] = response
 
+    # TODO: Replace with `clear()` once upgraded in OpenSource.
+    del file_tracker.index_to_buffers[:]
+    file_tracker.index_to_buffers.extend(_BuildIndexToBuffers(blob_dict))
+
     if len(blob_dict) != file_tracker.expected_chunks:
       # We need more data before we can write the file.
-      # TODO: Replace with `clear()` once upgraded in OpenSource.
-      del file_tracker.index_to_buffers[:]
-      file_tracker.index_to_buffers.extend(_BuildIndexToBuffers(blob_dict))
       return
 
-    # Write the file to the data store.
-    stat_entry = mig_client_fs.ToRDFStatEntry(file_tracker.stat_entry)
-    path_info = rdf_objects.PathInfo.FromStatEntry(stat_entry)
+    self._FileContentCollected(file_tracker)
+
+  def _FileContentCollected(self, tracker: flows_pb2.MultiGetFileTracker):
+    """Stores a file once all of its chunks are in the blob store."""
+    # All chunks are collected, so none of them needs to be requested again.
+    tracker.ClearField("hash_list")
+
+    if not self._IsClientHashUsable(tracker):
+      self._StoreFetchedFile(tracker, trust_client_hash=False)
+      return
+
+    # The client hash is only trusted if the file did not change between
+    # hashing and fetching it, so the file is stat-ed once more before it is
+    # stored (see `_ReceiveFetchedFileStat`).
+    pathspec = tracker.stat_entry.pathspec
+    if self.rrg_support and pathspec.pathtype in [
+        jobs_pb2.PathSpec.OS,
+        jobs_pb2.PathSpec.TMPFILE,
+    ]:
+      get_file_metadata = rrg_stubs.GetFileMetadata()
+
+      path = get_file_metadata.args.paths.add()
+      path.raw_bytes = pathspec.path.encode()
+      # TODO: Sometimes GRR "fixes" Windows paths and inserts a
+      # leading '/' in front (e.g. to have `/C:/Windows`). RRG does not treat it
+      # as a valid absolute path and so we need to "unfix" it here.
+      #
+      # We should fix GRR not to do this path fixing.
+      if self.rrg_os_type == rrg_os_pb2.WINDOWS:
+        path.raw_bytes = path.raw_bytes.removeprefix(b"/")
+
+      get_file_metadata.context["index"] = str(tracker.index)
+      get_file_metadata.Call(self._ProcessFetchedFileMetadata)
+    else:
+      self.CallClientProto(
+          server_stubs.GetFileStat,
+          jobs_pb2.GetFileStatRequest(pathspec=pathspec, follow_symlink=True),
+          next_state=self._ReceiveFetchedFileStat.__name__,
+          request_data=dict(index=tracker.index),
+      )
+
+  def _IsClientHashUsable(
+      self,
+      tracker: flows_pb2.MultiGetFileTracker,
+  ) -> bool:
+    """Checks whether the file can be stored under the client hash."""
+    if not config.CONFIG["Server.file_store_trust_client_hashes"]:
+      return False
+
+    if not tracker.hash_obj.sha256:
+      return False
+
+    # The hash reported by the client can only be trusted if it was computed
+    # over exactly as many bytes as were fetched.
+    size = sum(
+        index_to_buffer.buffer_reference.length
+        for index_to_buffer in tracker.index_to_buffers
+    )
+    return tracker.bytes_read == size
+
+  @flow_base.UseProto2AnyResponses
+  def _ReceiveFetchedFileStat(
+      self,
+      responses: flow_responses.Responses[any_pb2.Any],
+  ) -> None:
+    """Stores a fetched file after checking it did not change since hashing."""
+    index = responses.request_data["index"]
+
+    index_to_tracker = _FindIndexToTracker(self.store.pending_files, index)
+    if index_to_tracker is None:
+      return
+
+    stat_entry = None
+    if responses.success and responses:
+      stat_entry = jobs_pb2.StatEntry()
+      stat_entry.ParseFromString(list(responses)[0].value)
+
+    self._StoreFetchedFileIfUnchanged(index_to_tracker.tracker, stat_entry)
+
+  @flow_base.UseProto2AnyResponses
+  def _ProcessFetchedFileMetadata(
+      self,
+      responses: flow_responses.Responses[any_pb2.Any],
+  ) -> None:
+    """Stores a fetched file after checking it did not change since hashing."""
+    index = int(responses.request_data["index"])
+
+    index_to_tracker = _FindIndexToTracker(self.store.pending_files, index)
+    if index_to_tracker is None:
+      return
+
+    stat_entry = None
+    if responses.success and responses:
+      response = rrg_get_file_metadata_pb2.Result()
+      response.ParseFromString(list(responses)[0].value)
+      stat_entry = rrg_fs.StatEntry(response.metadata)
+
+    self._StoreFetchedFileIfUnchanged(index_to_tracker.tracker, stat_entry)
+
+  def _StoreFetchedFileIfUnchanged(
+      self,
+      tracker: flows_pb2.MultiGetFileTracker,
+      stat_entry: Optional[jobs_pb2.StatEntry],
+  ) -> None:
+    """Stores a file under the client hash if its stat did not change."""
+    unchanged = stat_entry is not None and _IsSameFileVersion(
+        tracker.stat_entry, stat_entry
+    )
+    if not unchanged:
+      self.Log(
+          "File %s might have changed since it was hashed, verifying its "
+          "content on the server.",
+          tracker.stat_entry.pathspec.path,
+      )
+
+    self._StoreFetchedFile(tracker, trust_client_hash=unchanged)
+
+  def _StoreFetchedFile(
+      self,
+      tracker: flows_pb2.MultiGetFileTracker,
+      trust_client_hash: bool,
+  ) -> None:
+    """Writes a file with all chunks collected to the file store."""
+    blob_dict = _BuildBlobDict(tracker.index_to_buffers)
 
     blob_refs = []
     offset = 0
@@ -1073,36 +1169,37 @@ class MultiGetFile(
       )
       offset += size
 
-    hash_obj = mig_crypto.ToRDFHash(file_tracker.hash_obj)
-
+    stat_entry = mig_client_fs.ToRDFStatEntry(tracker.stat_entry)
+    path_info = rdf_objects.PathInfo.FromStatEntry(stat_entry)
     client_path = db.ClientPath.FromPathInfo(self.client_id, path_info)
-    if self.proto_args.HasField("use_external_stores"):
-      use_external_stores = self.proto_args.use_external_stores
-    else:
-      use_external_stores = True
-    hash_id = file_store.AddFileWithUnknownHash(
-        client_path,
-        blob_refs,
-        use_external_stores=use_external_stores,
+
+    hash_id = self._AddFileToFileStore(
+        client_path, blob_refs, tracker.hash_obj, trust_client_hash
     )
     # If the hash that we've calculated matches what we got from the
     # client, then simply store the full hash entry.
     # Otherwise store just the hash that we've calculated.
-    if hash_id.AsBytes() == hash_obj.sha256:
-      path_info.hash_entry = hash_obj
+    hash_id_bytes = hash_id.AsBytes()
+    if hash_id_bytes == tracker.hash_obj.sha256:
+      path_info.hash_entry = mig_crypto.ToRDFHash(tracker.hash_obj)
     else:
-      path_info.hash_entry.sha256 = hash_id.AsBytes()
+      self.Log(
+          "File SHA-256 mismatch: %s and %s",
+          hash_id_bytes,
+          tracker.hash_obj.sha256,
+      )
+      path_info.hash_entry.sha256 = hash_id_bytes
       path_info.hash_entry.num_bytes = offset
 
     proto_path_info = mig_objects.ToProtoPathInfo(path_info)
     data_store.REL_DB.WritePathInfos(self.client_id, [proto_path_info])
 
     # Save some space.
-    file_tracker.ClearField("index_to_buffers")
-    file_tracker.ClearField("hash_list")
+    tracker.ClearField("index_to_buffers")
+    tracker.ClearField("hash_list")
 
     # File done, remove from the store and close it.
-    self._ReceiveFetchedFile(file_tracker)
+    self._ReceiveFetchedFile(tracker)
 
     self.store.num_files_fetched += 1
 
@@ -1113,6 +1210,33 @@ class MultiGetFile(
           self.store.num_files_to_fetch,
       )
 
+  def _AddFileToFileStore(
+      self,
+      client_path: db.ClientPath,
+      blob_refs: Sequence[rdf_objects.BlobReference],
+      hash_obj: jobs_pb2.Hash,
+      trust_client_hash: bool,
+  ) -> rdf_objects.SHA256HashID:
+    """Adds a fetched file to the file store and returns its hash id."""
+    if self.proto_args.HasField("use_external_stores"):
+      use_external_stores = self.proto_args.use_external_stores
+    else:
+      use_external_stores = True
+
+    if trust_client_hash:
+      return file_store.AddFileWithTrustedHash(
+          client_path,
+          blob_refs,
+          rdf_objects.SHA256HashID(hash_obj.sha256),
+          use_external_stores=use_external_stores,
+      )
+
+    return file_store.AddFileWithUnknownHash(
+        client_path,
+        blob_refs,
+        use_external_stores=use_external_stores,
+    )
+
   def _ReceiveFetchedFile(self, tracker, is_duplicate=False):
     """Remove pathspec for this index and call the ReceiveFetchedFile method."""
     index = tracker.index
@@ -1174,6 +1298,18 @@ class MultiGetFile(
       super().End()
 
 
+def _IsSameFileVersion(
+    before: jobs_pb2.StatEntry,
+    after: jobs_pb2.StatEntry,
+) -> bool:
+  """Checks whether two stat entries describe the same version of a file."""
+  return (
+      before.st_size == after.st_size
+      and before.st_mtime == after.st_mtime
+      and before.st_ctime == after.st_ctime
+  )
+
+
 def _BuildBlobDict(
     index_to_buffers: flows_pb2.IndexToBufferReference,
 ) -> dict[int, jobs_pb2.BufferReference]:
@@ -1286,6 +1422,127 @@ class GetMBR(
       self.SendReplyProto(config_pb2.BytesValue(value=mbr_data))
 
 
+class _KnownBlobIDs:
+  """Remembers ids of the blobs recently written to the blob store.
+
+  The cache is process-local and the blob store can lose blobs behind its back
+  (e.g. when it is restored or migrated), so it only tells which blobs are
+  worth checking for existence instead of writing them. The cache is tied to
+  the blob store instance it was filled for and starts from scratch if the
+  blob store is replaced.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._blob_store = None
+    self._max_size = None
+    self._cache = None
+
+  def _Cache(self) -> Optional[utils.FastStore]:
+    with self._lock:
+      max_size = config.CONFIG["Server.blob_handler_known_blob_cache_size"]
+      if self._blob_store is not data_store.BLOBS or self._max_size != max_size:
+        self._blob_store = data_store.BLOBS
+        self._max_size = max_size
+        self._cache = utils.FastStore(max_size=max_size) if max_size else None
+      return self._cache
+
+  def Contains(self, blob_id: models_blobs.BlobID) -> bool:
+    cache = self._Cache()
+    return cache is not None and blob_id in cache
+
+  def Add(self, blob_ids: Sequence[models_blobs.BlobID]) -> None:
+    cache = self._Cache()
+    if cache is None:
+      return
+
+    for blob_id in blob_ids:
+      cache.Put(blob_id, True)
+
+
+_KNOWN_BLOB_IDS = _KnownBlobIDs()
+
+
+def _DecodeBlob(
+    blob: rdf_protodict.DataBlob,
+) -> tuple[models_blobs.BlobID, bytes]:
+  """Decompresses the uploaded blob and computes its id.
+
+  Both zlib and hashlib release the GIL while processing large buffers, so this
+  function can be run on multiple threads concurrently.
+
+  Args:
+    blob: A blob uploaded by the client.
+
+  Returns:
+    A tuple of the blob id and the uncompressed blob data.
+
+  Raises:
+    ValueError: If the blob uses an unsupported compression.
+  """
+  start_time = time.time()
+
+  data = blob.data
+  ct = rdf_protodict.DataBlob.CompressionType
+  if blob.compression == ct.ZCOMPRESSION:
+    data = zlib.decompress(data)
+  elif blob.compression == ct.UNCOMPRESSED:
+    pass
+  else:
+    raise ValueError("Unsupported compression")
+
+  blob_id = models_blobs.BlobID.Of(data)
+
+  _BLOB_HANDLER_DECODING_LATENCY.RecordEvent(time.time() - start_time)
+  _BLOB_HANDLER_DECODED_BYTES.Increment(len(data))
+  return blob_id, data
+
+
+_DECODE_EXECUTOR_LOCK = threading.Lock()
+_DECODE_EXECUTOR: Optional[futures.ThreadPoolExecutor] = None
+_DECODE_EXECUTOR_SIZE: Optional[int] = None
+
+
+def _DecodeExecutor(size: int) -> futures.ThreadPoolExecutor:
+  """Returns the process-wide executor used to decode uploaded blobs."""
+  global _DECODE_EXECUTOR, _DECODE_EXECUTOR_SIZE
+
+  with _DECODE_EXECUTOR_LOCK:
+    if _DECODE_EXECUTOR is None or _DECODE_EXECUTOR_SIZE != size:
+      if _DECODE_EXECUTOR is not None:
+        # Only happens if the config changes (e.g. in tests). Blobs already
+        # submitted to the old executor are still decoded.
+        _DECODE_EXECUTOR.shutdown(wait=False)
+      _DECODE_EXECUTOR = futures.ThreadPoolExecutor(
+          max_workers=size, thread_name_prefix="BlobHandler"
+      )
+      _DECODE_EXECUTOR_SIZE = size
+
+    return _DECODE_EXECUTOR
+
+
+def _DecodeBlobs(
+    blobs: Sequence[rdf_protodict.DataBlob],
+) -> Iterator[tuple[models_blobs.BlobID, bytes]]:
+  """Yields decoded blobs in order, decoding them on a shared thread pool.
+
+  The pool is shared by all concurrently processed messages, so that at most
+  `Server.blob_handler_threads` blobs are decoded at once in the process.
+
+  Args:
+    blobs: Blobs uploaded by clients.
+
+  Yields:
+    Tuples of the blob id and the uncompressed blob data.
+  """
+  num_threads = config.CONFIG["Server.blob_handler_threads"]
+  if num_threads <= 1 or len(blobs) <= 1:
+    yield from map(_DecodeBlob, blobs)
+    return
+
+  yield from _DecodeExecutor(num_threads).map(_DecodeBlob, blobs)
+
+
 class BlobHandler(message_handlers.MessageHandler):
   """Message handler to store blobs."""
 
@@ -1305,14 +1562,45 @@ class BlobHandler(message_handlers.MessageHandler):
       if not data:
         continue
 
-      ct = rdf_protodict.DataBlob.CompressionType
-      if blob.compression == ct.ZCOMPRESSION:
-        data = zlib.decompress(data)
-      elif blob.compression == ct.UNCOMPRESSED:
-        pass
-      else:
-        raise ValueError("Unsupported compression")
+      blobs.append(blob)
+
+    # Blobs are decoded concurrently and written to the blob store in batches
+    # as soon as enough of them are ready.
+    batch_bytes = config.CONFIG["Server.blob_handler_write_batch_bytes"]
 
-      blobs.append(data)
+    batch = {}
+    batch_size = 0
+    for blob_id, data in _DecodeBlobs(blobs):
+      if blob_id in batch:
+        _BLOB_HANDLER_SKIPPED_WRITES.Increment()
+        continue
+
+      batch[blob_id] = data
+      batch_size += len(data)
+      if batch_size >= batch_bytes:
+        self._WriteBlobs(batch)
+        batch = {}
+        batch_size = 0
+
+    if batch:
+      self._WriteBlobs(batch)
+
+  def _WriteBlobs(self, batch: dict[models_blobs.BlobID, bytes]) -> None:
+    """Writes the blobs of the batch that are not in the blob store yet."""
+    known_blob_ids = [
+        blob_id for blob_id in batch if _KNOWN_BLOB_IDS.Contains(blob_id)
+    ]
+    if known_blob_ids:
+      # Checking for existence is much cheaper than writing the blobs again,
+      # but the cache alone can't be trusted (see `_KnownBlobIDs`).
+      existing = data_store.BLOBS.CheckBlobsExist(known_blob_ids)
+      for blob_id, exists in existing.items():
+        if exists:
+          del batch[blob_id]
+          _BLOB_HANDLER_SKIPPED_WRITES.Increment()
+
+    if not batch:
+      return
 
-    data_store.BLOBS.WriteBlobsWithUnknownHashes(blobs)
+    data_store.BLOBS.WriteBlobs(batch)
+    _KNOWN_BLOB_IDS.Add(list(batch))
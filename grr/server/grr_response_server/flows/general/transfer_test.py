@@ -9,6 +9,7 @@ import stat
 import struct
 import unittest
 from unittest import mock
+import zlib
 
 from absl import app
 
@@ -16,6 +17,7 @@ from grr_response_core.lib import constants
 from grr_response_core.lib.rdfvalues import client as rdf_client
 from grr_response_core.lib.rdfvalues import mig_client_fs
 from grr_response_core.lib.rdfvalues import paths as rdf_paths
+from grr_response_core.lib.rdfvalues import protodict as rdf_protodict
 from grr_response_core.lib.util import temp
 from grr_response_core.lib.util import text
 from grr_response_proto import flows_pb2
@@ -30,6 +32,7 @@ from grr_response_server.databases import db
 from grr_response_server.databases import db_test_utils
 from grr_response_server.flows.general import mig_transfer
 from grr_response_server.flows.general import transfer
+from grr_response_server.models import blobs as models_blobs
 from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
 from grr_response_server.rdfvalues import objects as rdf_objects
 from grr.test_lib import action_mocks
@@ -556,6 +559,83 @@ class MultiGetFileFlowTest(CompareFDsMixin, flow_test_lib.FlowTestsBaseclass):
       self.assertIsNotNone(history[-1].hash_entry.sha1)
       self.assertIsNotNone(history[-1].hash_entry.md5)
 
+  def testMultiGetFileWithTrustedClientHashes(self):
+    client_mock = action_mocks.MultiGetFileClientMock()
+
+    path = os.path.join(self.temp_dir, "test.txt")
+    with io.open(path, "wb") as fd:
+      fd.write(b"Hello" * 1024)
+    pathspec = rdf_paths.PathSpec(
+        pathtype=rdf_paths.PathSpec.PathType.OS, path=path
+    )
+
+    with test_lib.ConfigOverrider({
+        "Server.file_store_trust_client_hashes": True,
+        "Server.file_store_blob_verification_rate": 0.0,
+        "Server.file_store_hash_verification_rate": 0.0,
+    }):
+      with mock.patch.object(
+          file_store,
+          "AddFilesWithUnknownHashes",
+          wraps=file_store.AddFilesWithUnknownHashes,
+      ) as add_files_mock:
+        flow_test_lib.StartAndRunFlow(
+            transfer.MultiGetFile,
+            client_mock,
+            creator=self.test_username,
+            client_id=self.client_id,
+            flow_args=transfer.MultiGetFileArgs(pathspecs=[pathspec]),
+        )
+        add_files_mock.assert_not_called()
+
+    cp = db.ClientPath.FromPathSpec(self.client_id, pathspec)
+    fd_rel_db = file_store.OpenFile(cp)
+    self.assertEqual(fd_rel_db.read(), b"Hello" * 1024)
+    self.assertEqual(
+        fd_rel_db.hash_id,
+        rdf_objects.SHA256HashID.FromData(b"Hello" * 1024),
+    )
+
+  def testMultiGetFileDoesNotTrustClientHashesOfChangedFiles(self):
+    path = os.path.join(self.temp_dir, "test.txt")
+    with io.open(path, "wb") as fd:
+      fd.write(b"Hello" * 1024)
+    pathspec = rdf_paths.PathSpec(
+        pathtype=rdf_paths.PathSpec.PathType.OS, path=path
+    )
+
+    class ChangingFileClientMock(action_mocks.MultiGetFileClientMock):
+      """Changes the file (but not its size) right after it is hashed."""
+
+      def HandleMessage(self, message):
+        responses = super().HandleMessage(message)
+        if message.name == "HashFile":
+          with io.open(path, "wb") as fd:
+            fd.write(b"World" * 1024)
+          mtime = os.stat(path).st_mtime + 10
+          os.utime(path, (mtime, mtime))
+        return responses
+
+    with test_lib.ConfigOverrider({
+        "Server.file_store_trust_client_hashes": True,
+        "Server.file_store_hash_verification_rate": 0.0,
+    }):
+      flow_test_lib.StartAndRunFlow(
+          transfer.MultiGetFile,
+          ChangingFileClientMock(),
+          creator=self.test_username,
+          client_id=self.client_id,
+          flow_args=transfer.MultiGetFileArgs(pathspecs=[pathspec]),
+      )
+
+    cp = db.ClientPath.FromPathSpec(self.client_id, pathspec)
+    fd_rel_db = file_store.OpenFile(cp)
+    self.assertEqual(fd_rel_db.read(), b"World" * 1024)
+    self.assertEqual(
+        fd_rel_db.hash_id,
+        rdf_objects.SHA256HashID.FromData(b"World" * 1024),
+    )
+
   def testMultiGetFileDeduplication(self):
     client_mock = action_mocks.MultiGetFileClientMock()
 
@@ -1501,6 +1581,147 @@ class MultiGetFileFlowTest(CompareFDsMixin, flow_test_lib.FlowTestsBaseclass):
     self.assertIn("Unexpected file type for '/tmp': DIR", flow_log_messages)
 
 
+class BlobHandlerTest(test_lib.GRRBaseTest):
+
+  def _Requests(self, blobs, compress=True):
+    requests = []
+    for data in blobs:
+      if compress:
+        blob = rdf_protodict.DataBlob(
+            data=zlib.compress(data),
+            compression=rdf_protodict.DataBlob.CompressionType.ZCOMPRESSION,
+        )
+      else:
+        blob = rdf_protodict.DataBlob(
+            data=data,
+            compression=rdf_protodict.DataBlob.CompressionType.UNCOMPRESSED,
+        )
+      requests.append(
+          rdf_objects.MessageHandlerRequest(
+              client_id="C.1234567890123456",
+              handler_name=transfer.BlobHandler.handler_name,
+              request=rdf_protodict.EmbeddedRDFValue(blob),
+          )
+      )
+    return requests
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testWritesBlobs(self, db, bs):
+    del db  # Unused.
+    blobs = [f"blob{i}".encode() * 100 for i in range(10)]
+
+    transfer.BlobHandler().ProcessMessages(
+        self._Requests(blobs[:5]) + self._Requests(blobs[5:], compress=False)
+    )
+
+    blob_ids = [models_blobs.BlobID.Of(data) for data in blobs]
+    self.assertEqual(bs.ReadBlobs(blob_ids), dict(zip(blob_ids, blobs)))
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testWritesBlobsSequentially(self, db, bs):
+    del db  # Unused.
+    blobs = [f"blob{i}".encode() for i in range(3)]
+
+    with test_lib.ConfigOverrider({"Server.blob_handler_threads": 1}):
+      transfer.BlobHandler().ProcessMessages(self._Requests(blobs))
+
+    blob_ids = [models_blobs.BlobID.Of(data) for data in blobs]
+    self.assertEqual(bs.ReadBlobs(blob_ids), dict(zip(blob_ids, blobs)))
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testWritesKnownBlobsIfCacheIsDisabled(self, db, bs):
+    del db  # Unused.
+
+    with test_lib.ConfigOverrider(
+        {"Server.blob_handler_known_blob_cache_size": 0}
+    ):
+      with mock.patch.object(bs, "WriteBlobs", wraps=bs.WriteBlobs) as write:
+        transfer.BlobHandler().ProcessMessages(self._Requests([b"foo"]))
+        transfer.BlobHandler().ProcessMessages(self._Requests([b"foo"]))
+
+    self.assertEqual(write.call_count, 2)
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testWritesBlobsInBatches(self, db, bs):
+    del db  # Unused.
+    blobs = [f"blob{i}".encode() * 10 for i in range(5)]
+
+    with test_lib.ConfigOverrider(
+        {"Server.blob_handler_write_batch_bytes": 100}
+    ):
+      with mock.patch.object(bs, "WriteBlobs", wraps=bs.WriteBlobs) as write:
+        transfer.BlobHandler().ProcessMessages(self._Requests(blobs))
+
+    self.assertEqual(write.call_count, 3)
+    blob_ids = [models_blobs.BlobID.Of(data) for data in blobs]
+    self.assertEqual(bs.ReadBlobs(blob_ids), dict(zip(blob_ids, blobs)))
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testSkipsKnownBlobs(self, db, bs):
+    del db  # Unused.
+
+    with test_lib.ConfigOverrider(
+        {"Server.blob_handler_known_blob_cache_size": 100}
+    ):
+      with mock.patch.object(bs, "WriteBlobs", wraps=bs.WriteBlobs) as write:
+        transfer.BlobHandler().ProcessMessages(
+            self._Requests([b"foo", b"bar", b"foo"])
+        )
+        transfer.BlobHandler().ProcessMessages(
+            self._Requests([b"foo", b"baz"])
+        )
+
+    self.assertEqual(write.call_count, 2)
+    self.assertCountEqual(
+        write.call_args_list[0].args[0],
+        [models_blobs.BlobID.Of(b"foo"), models_blobs.BlobID.Of(b"bar")],
+    )
+    self.assertCountEqual(
+        write.call_args_list[1].args[0], [models_blobs.BlobID.Of(b"baz")]
+    )
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testWritesKnownBlobsMissingFromBlobStore(self, db, bs):
+    del db  # Unused.
+    foo_id = models_blobs.BlobID.Of(b"foo")
+
+    with test_lib.ConfigOverrider(
+        {"Server.blob_handler_known_blob_cache_size": 100}
+    ):
+      transfer.BlobHandler().ProcessMessages(self._Requests([b"foo"]))
+
+      # Simulate the blob store losing the blob, e.g. after a restore.
+      with mock.patch.object(
+          bs, "CheckBlobsExist", return_value={foo_id: False}
+      ):
+        with mock.patch.object(bs, "WriteBlobs", wraps=bs.WriteBlobs) as write:
+          transfer.BlobHandler().ProcessMessages(self._Requests([b"foo"]))
+
+    write.assert_called_once()
+    self.assertCountEqual(write.call_args.args[0], [foo_id])
+
+  @db_test_lib.WithDatabase
+  @db_test_lib.WithDatabaseBlobstore
+  def testDecodesBlobsOnSharedExecutor(self, db, bs):
+    del db  # Unused.
+    blobs = [f"blob{i}".encode() for i in range(3)]
+
+    transfer.BlobHandler().ProcessMessages(self._Requests(blobs[:2]))
+    executor = transfer._DECODE_EXECUTOR
+    self.assertIsNotNone(executor)
+    transfer.BlobHandler().ProcessMessages(self._Requests(blobs[1:]))
+    self.assertIs(transfer._DECODE_EXECUTOR, executor)
+
+    blob_ids = [models_blobs.BlobID.Of(data) for data in blobs]
+    self.assertEqual(bs.ReadBlobs(blob_ids), dict(zip(blob_ids, blobs)))
+
+
 def main(argv):
   # Run the full test suite
   test_lib.main(argv)
@@ -1,16 +1,29 @@
 #!/usr/bin/env python
 """The GRR Foreman."""
 
+import bisect
+from collections.abc import Callable, Sequence
 import logging
+import threading
+from typing import Any, Hashable
 
+from grr_response_core import config
 from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.util import cache
+from grr_response_core.stats import metrics
 from grr_response_server import data_store
 from grr_response_server import flow
+from grr_response_server import foreman_rules
 from grr_response_server import hunt
 from grr_response_server import message_handlers
 from grr_response_server import mig_foreman_rules
 from grr_response_server.databases import db
 from grr_response_server.rdfvalues import mig_objects
+from grr_response_server.rdfvalues import objects as rdf_objects
+
+FOREMAN_RULES_CACHE_LOOKUPS = metrics.Counter(
+    "foreman_rules_cache_lookups", fields=[("result", str)]
+)
 
 
 class Error(Exception):
@@ -21,6 +34,277 @@ class UnknownHuntTypeError(Error):
   pass
 
 
+class _ClientAttributes:
+  """Client attributes tested by foreman rules.
+
+  Every attribute is resolved at most once, no matter how many rules test it.
+  """
+
+  def __init__(self, client_info: rdf_objects.ClientFullInfo) -> None:
+    self.client_info = client_info
+    self._values = {}
+
+  def Get(
+      self,
+      key: Hashable,
+      resolve_fn: Callable[[rdf_objects.ClientFullInfo], Any],
+  ) -> Any:
+    try:
+      return self._values[key]
+    except KeyError:
+      value = resolve_fn(self.client_info)
+      self._values[key] = value
+      return value
+
+
+_Predicate = Callable[[_ClientAttributes], bool]
+
+
+def _ResolveOs(client_info: rdf_objects.ClientFullInfo) -> str:
+  return client_info.last_snapshot.knowledge_base.os
+
+
+def _ResolveLabelNames(
+    client_info: rdf_objects.ClientFullInfo,
+) -> frozenset[str]:
+  return frozenset(label.name for label in client_info.labels)
+
+
+def _CompileOsRule(rule: foreman_rules.ForemanOsClientRule) -> _Predicate:
+  """Compiles an OS rule into a predicate."""
+  prefixes = tuple(
+      prefix
+      for prefix, enabled in [
+          ("Windows", rule.os_windows),
+          ("Linux", rule.os_linux),
+          ("Darwin", rule.os_darwin),
+      ]
+      if enabled
+  )
+
+  def Predicate(client: _ClientAttributes) -> bool:
+    value = client.Get("os", _ResolveOs)
+    return bool(value) and value.startswith(prefixes)
+
+  return Predicate
+
+
+def _CompileLabelRule(rule: foreman_rules.ForemanLabelClientRule) -> _Predicate:
+  """Compiles a label rule into a predicate."""
+  match_mode = foreman_rules.ForemanLabelClientRule.MatchMode
+  label_names = frozenset(rule.label_names)
+
+  if rule.match_mode == match_mode.MATCH_ALL:
+    matches = lambda client_labels: label_names <= client_labels
+  elif rule.match_mode == match_mode.MATCH_ANY:
+    matches = lambda client_labels: not label_names.isdisjoint(client_labels)
+  elif rule.match_mode == match_mode.DOES_NOT_MATCH_ALL:
+    matches = lambda client_labels: not label_names <= client_labels
+  elif rule.match_mode == match_mode.DOES_NOT_MATCH_ANY:
+    matches = lambda client_labels: label_names.isdisjoint(client_labels)
+  else:
+    # Unknown match modes fail the same way as during regular evaluation.
+    return lambda client: rule.Evaluate(client.client_info)
+
+  def Predicate(client: _ClientAttributes) -> bool:
+    return matches(client.Get("labels", _ResolveLabelNames))
+
+  return Predicate
+
+
+def _CompileFieldRule(
+    rule: foreman_rules.ForemanClientRuleBase,
+    match_fn: Callable[[Any], bool],
+) -> _Predicate:
+  """Compiles a rule testing a single (regex or integer) client field."""
+  key = (type(rule), rule.field)
+  resolve_fn = lambda client_info: rule.ResolveField(rule.field, client_info)
+
+  def Predicate(client: _ClientAttributes) -> bool:
+    return match_fn(client.Get(key, resolve_fn))
+
+  return Predicate
+
+
+def _CompileRegexRule(rule: foreman_rules.ForemanRegexClientRule) -> _Predicate:
+  return _CompileFieldRule(
+      rule, lambda value: bool(rule.attribute_regex.Search(value))
+  )
+
+
+def _CompileIntegerRule(
+    rule: foreman_rules.ForemanIntegerClientRule,
+) -> _Predicate:
+  """Compiles an integer rule into a predicate."""
+  operator = foreman_rules.ForemanIntegerClientRule.Operator
+  expected = rule.value
+
+  if rule.operator == operator.LESS_THAN:
+    compare = lambda value: value < expected
+  elif rule.operator == operator.GREATER_THAN:
+    compare = lambda value: value > expected
+  elif rule.operator == operator.EQUAL:
+    compare = lambda value: value == expected
+  else:
+    return lambda client: rule.Evaluate(client.client_info)
+
+  return _CompileFieldRule(
+      rule, lambda value: value is not None and compare(value)
+  )
+
+
+_RULE_COMPILERS: dict[int, Callable[[Any], _Predicate]] = {
+    foreman_rules.ForemanClientRule.Type.OS: _CompileOsRule,
+    foreman_rules.ForemanClientRule.Type.LABEL: _CompileLabelRule,
+    foreman_rules.ForemanClientRule.Type.REGEX: _CompileRegexRule,
+    foreman_rules.ForemanClientRule.Type.INTEGER: _CompileIntegerRule,
+}
+
+
+def _CompileClientRule(rule: foreman_rules.ForemanClientRule) -> _Predicate:
+  """Compiles a single client rule into a predicate.
+
+  Rules that can't be compiled (e.g. of a type unknown to this server) never
+  match, so that a single bad rule doesn't break every client check-in.
+
+  Args:
+    rule: The rule to compile.
+
+  Returns:
+    A predicate evaluating the rule against a client.
+  """
+  compiler = _RULE_COMPILERS.get(rule.rule_type)
+  if compiler is None:
+    logging.warning(
+        "Ignoring foreman client rule of unknown type: %s", rule.rule_type
+    )
+    return lambda client: False
+
+  try:
+    return compiler(rule.UnionCast())
+  except Exception:  # pylint: disable=broad-except
+    logging.exception("Ignoring invalid foreman client rule: %s", rule)
+    return lambda client: False
+
+
+def _CompileClientRuleSet(
+    rule_set: foreman_rules.ForemanClientRuleSet,
+) -> _Predicate:
+  """Compiles a client rule set into a single predicate."""
+  predicates = [_CompileClientRule(rule) for rule in rule_set.rules]
+
+  match_mode = foreman_rules.ForemanClientRuleSet.MatchMode
+  if rule_set.match_mode == match_mode.MATCH_ALL:
+    quantifier = all
+  elif rule_set.match_mode == match_mode.MATCH_ANY:
+    quantifier = any
+  else:
+    return lambda client: rule_set.Evaluate(client.client_info)
+
+  return lambda client: quantifier(p(client) for p in predicates)
+
+
+class _CompiledForemanCondition:
+  """A foreman condition with its client rule set compiled into a predicate."""
+
+  def __init__(self, condition: foreman_rules.ForemanCondition) -> None:
+    self.hunt_id = condition.hunt_id
+    self.creation_time = condition.creation_time
+    self.expiration_time = condition.expiration_time
+    self._predicate = _CompileClientRuleSet(condition.client_rule_set)
+
+  def Evaluate(self, client: _ClientAttributes) -> bool:
+    return self._predicate(client)
+
+
+class _ForemanRules:
+  """An immutable snapshot of compiled foreman rules.
+
+  Rules are indexed by their creation time, which is what every check-in is
+  filtered on first: only rules created after the client's last foreman run are
+  relevant to it.
+  """
+
+  def __init__(self, rules: Sequence[_CompiledForemanCondition]) -> None:
+    self.rules = sorted(rules, key=lambda rule: rule.creation_time)
+    self._creation_times = [rule.creation_time for rule in self.rules]
+    self._min_expiration_time = min(
+        (rule.expiration_time for rule in self.rules), default=None
+    )
+
+  @property
+  def latest_creation_time(self) -> rdfvalue.RDFDatetime:
+    return self._creation_times[-1]
+
+  def CreatedAfter(
+      self, time: rdfvalue.RDFDatetime
+  ) -> Sequence[_CompiledForemanCondition]:
+    return self.rules[bisect.bisect_right(self._creation_times, time) :]
+
+  def AnyExpired(self, now: rdfvalue.RDFDatetime) -> bool:
+    return (
+        self._min_expiration_time is not None
+        and self._min_expiration_time < now
+    )
+
+
+class _ForemanRulesCache:
+  """A process-wide cache of the foreman rules.
+
+  Rules are reread from the database once `Worker.foreman_rules_cache_ttl`
+  passes or as soon as they are modified through the database object of this
+  process (see `DatabaseValidationWrapper.foreman_rules_version`).
+
+  Similarly to `cache.WithLimitedCallFrequency`, caching is turned off when
+  `cache.WITH_LIMITED_CALL_FREQUENCY_PASS_THROUGH` is set (as it is in tests).
+  """
+
+  def __init__(self) -> None:
+    self._lock = threading.Lock()
+    self._rules = None
+    self._db = None
+    self._version = None
+    self._expiration_time = None
+
+  def Get(self) -> _ForemanRules:
+    """Returns current foreman rules."""
+    rel_db = data_store.REL_DB
+    version = getattr(rel_db, "foreman_rules_version", None)
+    now = rdfvalue.RDFDatetime.Now()
+
+    with self._lock:
+      if (
+          not cache.WITH_LIMITED_CALL_FREQUENCY_PASS_THROUGH
+          and self._rules is not None
+          and self._db is rel_db
+          and version is not None
+          and self._version == version
+          and now < self._expiration_time
+      ):
+        FOREMAN_RULES_CACHE_LOOKUPS.Increment(fields=["hit"])
+        return self._rules
+
+    FOREMAN_RULES_CACHE_LOOKUPS.Increment(fields=["miss"])
+    rules = _ForemanRules([
+        _CompiledForemanCondition(mig_foreman_rules.ToRDFForemanCondition(r))
+        for r in rel_db.ReadAllForemanRules()
+    ])
+
+    with self._lock:
+      self._rules = rules
+      self._db = rel_db
+      # The version was read before reading the rules: if the rules are
+      # modified in the meantime, they will be reread on the next call.
+      self._version = version
+      self._expiration_time = now + config.CONFIG[
+          "Worker.foreman_rules_cache_ttl"
+      ]
+    return rules
+
+
+_RULES_CACHE = _ForemanRulesCache()
+
+
 # TODO(amoser): Now that Foreman rules are directly stored in the db,
 # consider removing this class altogether once the AFF4 Foreman has
 # been removed.
@@ -97,31 +381,23 @@ class Foreman(object):
     Returns:
       Number of assigned tasks.
     """
-    proto_rules = data_store.REL_DB.ReadAllForemanRules()
-    rules = [
-        mig_foreman_rules.ToRDFForemanCondition(cond) for cond in proto_rules
-    ]
-    if not rules:
+    rules = _RULES_CACHE.Get()
+    if not rules.rules:
       return 0
 
     last_foreman_run = self._GetLastForemanRunTime(client_id)
 
-    latest_rule_creation_time = max(rule.creation_time for rule in rules)
-
-    if latest_rule_creation_time > last_foreman_run:
+    if rules.latest_creation_time > last_foreman_run:
       # Update the latest checked rule on the client.
-      self._SetLastForemanRunTime(client_id, latest_rule_creation_time)
-
-    relevant_rules = []
-    expired_rules = []
+      self._SetLastForemanRunTime(client_id, rules.latest_creation_time)
 
     now = rdfvalue.RDFDatetime.Now()
 
-    for rule in rules:
-      if rule.expiration_time < now:
-        expired_rules.append(rule)
-      elif rule.creation_time > last_foreman_run:
-        relevant_rules.append(rule)
+    relevant_rules = [
+        rule
+        for rule in rules.CreatedAfter(last_foreman_run)
+        if rule.expiration_time >= now
+    ]
 
     actions_count = 0
     if relevant_rules:
@@ -129,14 +405,15 @@ class Foreman(object):
       if client_data is None:
         return
 
-      client_data = mig_objects.ToRDFClientFullInfo(client_data)
+      client = _ClientAttributes(mig_objects.ToRDFClientFullInfo(client_data))
       for rule in relevant_rules:
-        if rule.Evaluate(client_data):
+        if rule.Evaluate(client):
           actions_count += self._RunAction(rule, client_id)
 
-    if expired_rules:
-      for rule in expired_rules:
-        hunt.CompleteHuntIfExpirationTimeReached(rule.hunt_id)
+    if rules.AnyExpired(now):
+      for rule in rules.rules:
+        if rule.expiration_time < now:
+          hunt.CompleteHuntIfExpirationTimeReached(rule.hunt_id)
       data_store.REL_DB.RemoveExpiredForemanRules()
 
     return actions_count
@@ -148,10 +425,6 @@ class ForemanMessageHandler(message_handlers.MessageHandler):
   handler_name = "ForemanHandler"
 
   def ProcessMessages(self, msgs):
-    # TODO(amoser): The foreman reads the rules from the database for each
-    # client. In the old implementation we used to have a cache. If this is a
-    # performance hit, lets consider putting the cache back.
-
     foreman_obj = Foreman()
     for msg in msgs:
       foreman_obj.AssignTasksToClient(msg.client_id)
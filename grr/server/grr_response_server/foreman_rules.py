@@ -82,7 +82,7 @@ class ForemanRegexClientRule(ForemanClientRuleBase):
       rdf_standard.RegularExpression,
   ]
 
-  def _ResolveField(self, field, client_info):
+  def ResolveField(self, field, client_info):
 
     fsf = ForemanRegexClientRule.ForemanStringField
     snapshot = client_info.last_snapshot
@@ -128,7 +128,7 @@ class ForemanRegexClientRule(ForemanClientRuleBase):
       raise ValueError("Unexpected foreman field: %s." % field)
 
   def Evaluate(self, client_info):
-    value = self._ResolveField(self.field, client_info)
+    value = self.ResolveField(self.field, client_info)
 
     return self.attribute_regex.Search(value)
 
@@ -143,7 +143,7 @@ class ForemanIntegerClientRule(ForemanClientRuleBase):
   protobuf = jobs_pb2.ForemanIntegerClientRule
   rdf_deps = []
 
-  def _ResolveField(self, field, client_info):
+  def ResolveField(self, field, client_info):
     if field == ForemanIntegerClientRule.ForemanIntegerField.UNSET:
       raise ValueError(
           "Received integer rule without a valid field specification."
@@ -166,7 +166,7 @@ class ForemanIntegerClientRule(ForemanClientRuleBase):
       raise ValueError("Unexpected foreman integer field: %s." % field)
 
   def Evaluate(self, client_info):
-    value = self._ResolveField(self.field, client_info)
+    value = self.ResolveField(self.field, client_info)
 
     if value is None:
       return False
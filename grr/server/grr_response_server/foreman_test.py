@@ -6,6 +6,7 @@ from unittest import mock
 from absl import app
 
 from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.util import cache
 from grr_response_server import data_store
 from grr_response_server import foreman
 from grr_response_server import foreman_rules
@@ -301,6 +302,179 @@ class ForemanTests(test_lib.GRRBaseTest):
         self.assertLen(rules, num_rules)
 
 
+class ForemanRulesCacheTest(test_lib.GRRBaseTest):
+  """Tests caching of the foreman rules."""
+
+  def setUp(self):
+    super().setUp()
+
+    # Caching is turned off in tests by default.
+    cache_patcher = mock.patch.object(
+        cache, "WITH_LIMITED_CALL_FREQUENCY_PASS_THROUGH", False
+    )
+    cache_patcher.start()
+    self.addCleanup(cache_patcher.stop)
+
+    rules_cache_patcher = mock.patch.object(
+        foreman, "_RULES_CACHE", foreman._ForemanRulesCache()
+    )
+    rules_cache_patcher.start()
+    self.addCleanup(rules_cache_patcher.stop)
+
+    self.clients_started = []
+    start_patcher = mock.patch.object(
+        hunt, "StartHuntFlowOnClient", self._StartHuntFlowOnClient
+    )
+    start_patcher.start()
+    self.addCleanup(start_patcher.stop)
+
+  def _StartHuntFlowOnClient(self, client_id, hunt_id):
+    self.clients_started.append((hunt_id, client_id))
+
+  def _MakeLabelRule(self, hunt_id, label):
+    now = rdfvalue.RDFDatetime.Now()
+    return foreman_rules.ForemanCondition(
+        creation_time=now,
+        expiration_time=now + rdfvalue.Duration.From(1, rdfvalue.HOURS),
+        description="Test rule",
+        hunt_id=hunt_id,
+        client_rule_set=foreman_rules.ForemanClientRuleSet(
+            rules=[
+                foreman_rules.ForemanClientRule(
+                    rule_type=foreman_rules.ForemanClientRule.Type.LABEL,
+                    label=foreman_rules.ForemanLabelClientRule(
+                        label_names=[label]
+                    ),
+                )
+            ]
+        ),
+    )
+
+  def _WriteRule(self, rule):
+    data_store.REL_DB.WriteForemanRule(
+        mig_foreman_rules.ToProtoForemanCondition(rule)
+    )
+
+  def testRulesAreReadOnceForManyClients(self):
+    client_ids = [self.SetupClient(i, labels=["foo"]) for i in range(5)]
+    self._WriteRule(self._MakeLabelRule("11111111", "foo"))
+
+    foreman_obj = foreman.Foreman()
+    with mock.patch.object(
+        data_store.REL_DB,
+        "ReadAllForemanRules",
+        wraps=data_store.REL_DB.ReadAllForemanRules,
+    ) as read_mock:
+      for client_id in client_ids:
+        foreman_obj.AssignTasksToClient(client_id)
+
+    read_mock.assert_called_once()
+    self.assertCountEqual(
+        self.clients_started,
+        [("11111111", client_id) for client_id in client_ids],
+    )
+
+  def testRuleWritesInvalidateCache(self):
+    client_id = self.SetupClient(0, labels=["foo", "bar"])
+    self._WriteRule(self._MakeLabelRule("11111111", "foo"))
+
+    foreman_obj = foreman.Foreman()
+    foreman_obj.AssignTasksToClient(client_id)
+    self.assertEqual(self.clients_started, [("11111111", client_id)])
+
+    self._WriteRule(self._MakeLabelRule("22222222", "bar"))
+    foreman_obj.AssignTasksToClient(client_id)
+    self.assertEqual(
+        self.clients_started,
+        [("11111111", client_id), ("22222222", client_id)],
+    )
+
+  def testRulesWrittenElsewhereArePickedUpAfterTtl(self):
+    client_id = self.SetupClient(0, labels=["foo"])
+    foreman_obj = foreman.Foreman()
+
+    with test_lib.ConfigOverrider({
+        "Worker.foreman_rules_cache_ttl": rdfvalue.Duration.From(
+            1, rdfvalue.MINUTES
+        ),
+    }):
+      with test_lib.FakeTime(rdfvalue.RDFDatetime.FromSecondsSinceEpoch(1000)):
+        rule = self._MakeLabelRule("11111111", "foo")
+        foreman_obj.AssignTasksToClient(client_id)
+
+        # Simulate another process writing the rule (bypassing the version
+        # bump done by the database wrapper of this process).
+        data_store.REL_DB.delegate.WriteForemanRule(
+            mig_foreman_rules.ToProtoForemanCondition(rule)
+        )
+        foreman_obj.AssignTasksToClient(client_id)
+        self.assertEmpty(self.clients_started)
+
+      with test_lib.FakeTime(rdfvalue.RDFDatetime.FromSecondsSinceEpoch(1061)):
+        foreman_obj.AssignTasksToClient(client_id)
+        self.assertEqual(self.clients_started, [("11111111", client_id)])
+
+  def testCompiledLabelRules(self):
+    match_mode = foreman_rules.ForemanLabelClientRule.MatchMode
+    client_id = self.SetupClient(0, labels=["foo", "bar"])
+
+    for hunt_id, label_names, mode in [
+        ("11111111", ["foo", "bar"], match_mode.MATCH_ALL),
+        ("22222222", ["foo", "baz"], match_mode.MATCH_ALL),
+        ("33333333", ["foo", "baz"], match_mode.MATCH_ANY),
+        ("44444444", ["baz", "quux"], match_mode.MATCH_ANY),
+        ("55555555", ["foo", "baz"], match_mode.DOES_NOT_MATCH_ALL),
+        ("66666666", ["foo", "bar"], match_mode.DOES_NOT_MATCH_ALL),
+        ("77777777", ["baz", "quux"], match_mode.DOES_NOT_MATCH_ANY),
+        ("88888888", ["foo", "quux"], match_mode.DOES_NOT_MATCH_ANY),
+    ]:
+      rule = self._MakeLabelRule(hunt_id, "")
+      rule.client_rule_set.rules[0].label = (
+          foreman_rules.ForemanLabelClientRule(
+              label_names=label_names, match_mode=mode
+          )
+      )
+      self._WriteRule(rule)
+
+    foreman.Foreman().AssignTasksToClient(client_id)
+
+    self.assertCountEqual(
+        [hunt_id for hunt_id, _ in self.clients_started],
+        ["11111111", "33333333", "55555555", "77777777"],
+    )
+
+  def testRulesOfUnknownTypeNeverMatch(self):
+    client_id = self.SetupClient(0, labels=["foo"])
+    regex_rule = foreman_rules.ForemanClientRule(
+        rule_type=foreman_rules.ForemanClientRule.Type.REGEX,
+        regex=foreman_rules.ForemanRegexClientRule(
+            field="SYSTEM", attribute_regex="."
+        ),
+    )
+
+    self._WriteRule(self._MakeLabelRule("11111111", "foo"))
+    rule = self._MakeLabelRule("22222222", "foo")
+    rule.client_rule_set.rules.Append(regex_rule)
+    self._WriteRule(rule)
+    rule = self._MakeLabelRule("33333333", "foo")
+    rule.client_rule_set.rules.Append(regex_rule)
+    rule.client_rule_set.match_mode = (
+        foreman_rules.ForemanClientRuleSet.MatchMode.MATCH_ANY
+    )
+    self._WriteRule(rule)
+
+    # Make the regex rule type unknown to the foreman.
+    rule_compilers = foreman._RULE_COMPILERS  # pylint: disable=protected-access
+    with mock.patch.dict(rule_compilers):
+      del rule_compilers[regex_rule.rule_type]
+      foreman.Foreman().AssignTasksToClient(client_id)
+
+    self.assertCountEqual(
+        [hunt_id for hunt_id, _ in self.clients_started],
+        ["11111111", "33333333"],
+    )
+
+
 def main(argv):
   # Run the full test suite
   test_lib.main(argv)
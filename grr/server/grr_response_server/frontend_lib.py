@@ -1,17 +1,24 @@
 #!/usr/bin/env python
 """The GRR frontend server."""
 
+import collections
 import logging
+import re
+import threading
 import time
 from typing import Mapping, Optional, Sequence, Union
 
+from grr_response_core import config
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.rdfvalues import client as rdf_client
 from grr_response_core.lib.rdfvalues import flows as rdf_flows
+from grr_response_core.lib.rdfvalues import mig_flows
+from grr_response_core.lib.util import cache
 from grr_response_core.lib.util import collection
 from grr_response_core.lib.util import random
 from grr_response_core.stats import metrics
 from grr_response_proto import flows_pb2
+from grr_response_proto import jobs_pb2
 from grr_response_proto import objects_pb2
 from grr_response_server import data_store
 from grr_response_server import events
@@ -20,10 +27,9 @@ from grr_response_server import sinks
 from grr_response_server import worker_lib
 from grr_response_server.databases import db
 from grr_response_server.flows.general import transfer
+from grr_response_server.models import flows as models_flows
 from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
 from grr_response_server.rdfvalues import mig_flow_objects
-from grr_response_server.rdfvalues import mig_objects
-from grr_response_server.rdfvalues import objects as rdf_objects
 from grr_response_proto import rrg_pb2
 
 
@@ -36,9 +42,89 @@ RRG_PARCEL_ACCEPT_ERRORS = metrics.Counter(
     fields=[("sink", str)],
 )
 
+CLIENT_METADATA_CACHE_LOOKUPS = metrics.Counter(
+    "frontend_client_metadata_cache_lookups", fields=[("result", str)]
+)
+
 FRONTEND_USERNAME = "GRRFrontEnd"
 
 
+class _ClientMetadataCache:
+  """A bounded cache of client metadata read by the frontend.
+
+  Entries expire `Frontend.client_metadata_cache_ttl` after they were read
+  from the database. Once the cache holds `max_size` entries, the least
+  recently used ones are evicted.
+
+  Similarly to `cache.WithLimitedCallFrequency`, caching is turned off when
+  `cache.WITH_LIMITED_CALL_FREQUENCY_PASS_THROUGH` is set (as it is in tests).
+  """
+
+  def __init__(self, max_size: int) -> None:
+    self._max_size = max_size
+    self._lock = threading.Lock()
+    self._entries: collections.OrderedDict[
+        str, tuple[objects_pb2.ClientMetadata, rdfvalue.RDFDatetime]
+    ] = collections.OrderedDict()
+
+  @property
+  def enabled(self) -> bool:
+    return (
+        self._max_size > 0
+        and not cache.WITH_LIMITED_CALL_FREQUENCY_PASS_THROUGH
+    )
+
+  def Get(self, client_id: str) -> Optional[objects_pb2.ClientMetadata]:
+    """Returns cached metadata of the client or `None` if there is none."""
+    if not self.enabled:
+      return None
+
+    now = rdfvalue.RDFDatetime.Now()
+    with self._lock:
+      entry = self._entries.get(client_id)
+      if entry is not None and now < entry[1]:
+        self._entries.move_to_end(client_id)
+        CLIENT_METADATA_CACHE_LOOKUPS.Increment(fields=["hit"])
+        return entry[0]
+
+      self._entries.pop(client_id, None)
+
+    CLIENT_METADATA_CACHE_LOOKUPS.Increment(fields=["miss"])
+    return None
+
+  def Put(self, client_id: str, metadata: objects_pb2.ClientMetadata) -> None:
+    """Caches metadata of the client read from the database."""
+    if not self.enabled:
+      return
+
+    expiration_time = (
+        rdfvalue.RDFDatetime.Now()
+        + config.CONFIG["Frontend.client_metadata_cache_ttl"]
+    )
+    with self._lock:
+      self._entries[client_id] = (metadata, expiration_time)
+      self._entries.move_to_end(client_id)
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+
+  def UpdatePing(self, client_id: str, ping: rdfvalue.RDFDatetime) -> None:
+    """Updates the last ping of the cached client metadata, if any."""
+    with self._lock:
+      entry = self._entries.get(client_id)
+      if entry is None:
+        return
+
+      metadata = objects_pb2.ClientMetadata()
+      metadata.CopyFrom(entry[0])
+      metadata.ping = int(ping)
+      # Cached messages are shared with callers, so they are never modified.
+      self._entries[client_id] = (metadata, entry[1])
+
+  def Invalidate(self, client_id: str) -> None:
+    with self._lock:
+      self._entries.pop(client_id, None)
+
+
 class FrontEndServer(object):
   """This is the front end server.
 
@@ -62,6 +148,9 @@ class FrontEndServer(object):
     self.message_expiry_time = message_expiry_time
     self.max_retransmission_time = max_retransmission_time
     self.max_queue_size = max_queue_size
+    self._client_metadata_cache = _ClientMetadataCache(
+        max_size=config.CONFIG["Frontend.client_metadata_cache_size"]
+    )
 
   # TODO: Inline this function and simplify code.
   def EnrollFleetspeakClientIfNeeded(
@@ -78,13 +167,22 @@ class FrontEndServer(object):
     Returns:
       None if the client is new, and actually got enrolled. This method
       is a no-op if the client already exists (in which case the existing
-      client metadata is returned).
+      client metadata is returned). The returned metadata may come from a
+      per-process cache (see `Frontend.client_metadata_cache_ttl`) and must
+      not be modified.
     """
+    metadata = self._client_metadata_cache.Get(client_id)
+    if metadata is not None:
+      return metadata
+
     # If already enrolled, return.
     try:
-      return data_store.REL_DB.ReadClientMetadata(client_id)
+      metadata = data_store.REL_DB.ReadClientMetadata(client_id)
     except db.UnknownClientError:
       pass
+    else:
+      self._client_metadata_cache.Put(client_id, metadata)
+      return metadata
 
     logging.info("Enrolling a new Fleetspeak client: %r", client_id)
 
@@ -95,9 +193,24 @@ class FrontEndServer(object):
         last_ping=now,
         fleetspeak_validation_info=fleetspeak_validation_tags,
     )
+    self._client_metadata_cache.Invalidate(client_id)
 
     return None
 
+  def UpdateCachedClientPing(
+      self,
+      client_id: str,
+      ping: rdfvalue.RDFDatetime,
+  ) -> None:
+    """Updates the last ping of the client in the client metadata cache.
+
+    Args:
+      client_id: An id of the client.
+      ping: The new last ping time (it may not have been written to the
+        database yet).
+    """
+    self._client_metadata_cache.UpdatePing(client_id, ping)
+
   legacy_well_known_session_ids = set([
       str(rdfvalue.SessionID(flow_name="Foreman", queue=rdfvalue.RDFURN("W"))),
       str(rdfvalue.SessionID(flow_name="Stats", queue=rdfvalue.RDFURN("W"))),
@@ -117,65 +230,62 @@ class FrontEndServer(object):
   ) -> None:
     """Receives and processes the messages.
 
+    This is an RDF wrapper around `ReceiveMessageProtos`.
+
+    Args:
+      client_id: The client which sent the messages.
+      messages: A list of GrrMessage RDFValues.
+    """
+    self.ReceiveMessageProtos(
+        client_id, [mig_flows.ToProtoGrrMessage(m) for m in messages]
+    )
+
+  def ReceiveMessageProtos(
+      self,
+      client_id: str,
+      messages: Sequence[jobs_pb2.GrrMessage],
+  ) -> None:
+    """Receives and processes the messages.
+
     For each message we update the request object, and place the
     response in that request's queue. If the request is complete, we
     send a message to the worker.
 
+    Messages are processed as protos all the way to the database: payloads
+    are passed on in their serialized form and are never parsed into RDF
+    values (except for the rare payloads that have no proto representation).
+
     Args:
       client_id: The client which sent the messages.
-      messages: A list of GrrMessage RDFValues.
+      messages: A list of GrrMessage protos.
     """
     now = time.time()
-    unprocessed_msgs = []
+    unprocessed_msgs: list[tuple[jobs_pb2.GrrMessage, rdfvalue.SessionID]] = []
     worker_message_handler_requests = []
     frontend_message_handler_requests = []
     dropped_count = 0
 
-    # TODO: Remove `fixed_messages` once old clients
-    # have been migrated.
-    fixed_messages = []
+    # TODO: Remove once old clients have been migrated.
     for message in messages:
-      if message.type != rdf_flows.GrrMessage.Type.STATUS:
-        fixed_messages.append(message)
-        continue
-
-      stat = rdf_flows.GrrStatus(message.payload)
-      if not stat.HasField("cpu_time_used"):
-        fixed_messages.append(message)
-        continue
-
-      if stat.cpu_time_used.HasField("deprecated_user_cpu_time"):
-        stat.cpu_time_used.user_cpu_time = (
-            stat.cpu_time_used.deprecated_user_cpu_time
-        )
-        stat.cpu_time_used.deprecated_user_cpu_time = None
-      if stat.cpu_time_used.HasField("deprecated_system_cpu_time"):
-        stat.cpu_time_used.system_cpu_time = (
-            stat.cpu_time_used.deprecated_system_cpu_time
-        )
-        stat.cpu_time_used.deprecated_system_cpu_time = None
-      message.payload = stat
-      fixed_messages.append(message)
-
-    messages = fixed_messages
+      models_flows.MigrateDeprecatedCpuTime(message)
 
     msgs_by_session_id = collection.Group(messages, lambda m: m.session_id)
-    for session_id, msgs in msgs_by_session_id.items():
+    for raw_session_id, msgs in msgs_by_session_id.items():
       try:
+        # Session ids are parsed once per session, not once per message.
+        session_id = rdfvalue.FlowSessionID(raw_session_id)
+        session_id_str = str(session_id)
         for msg in msgs:
-          if (
-              msg.auth_state != msg.AuthorizationState.AUTHENTICATED
-          ):
+          if msg.auth_state != jobs_pb2.GrrMessage.AUTHENTICATED:
             dropped_count += 1
             continue
 
-          session_id_str = str(session_id)
           if session_id_str in message_handlers.session_id_map:
-            request = rdf_objects.MessageHandlerRequest(
-                client_id=msg.source.Basename(),
-                handler_name=message_handlers.session_id_map[session_id],
+            request = models_flows.MessageHandlerRequestForLegacyMessage(
+                msg,
+                client_id=rdfvalue.RDFURN(msg.source).Basename(),
+                handler_name=message_handlers.session_id_map[session_id_str],
                 request_id=msg.response_id or random.UInt32(),
-                request=msg.payload,
             )
             if request.handler_name in self._SHORTCUT_HANDLERS:
               frontend_message_handler_requests.append(request)
@@ -187,12 +297,12 @@ class FrontEndServer(object):
                 session_id,
             )
           else:
-            unprocessed_msgs.append(msg)
+            unprocessed_msgs.append((msg, session_id))
       except ValueError:
         logging.exception(
             "Unpacking error in at least one of %d messages for session id %s",
             len(msgs),
-            session_id,
+            raw_session_id,
         )
         raise
 
@@ -203,28 +313,22 @@ class FrontEndServer(object):
 
     if unprocessed_msgs:
       flow_responses = []
-      for message in unprocessed_msgs:
+      for message, session_id in unprocessed_msgs:
         try:
-          response = rdf_flow_objects.FlowResponseForLegacyResponse(message)
+          response = self._FlowResponseForLegacyResponse(message, session_id)
         except ValueError as e:
           logging.warning(
               "Failed to parse legacy FlowResponse:\n%s\n%s", e, message
           )
         else:
-          if isinstance(response, rdf_flow_objects.FlowStatus):
-            response = mig_flow_objects.ToProtoFlowStatus(response)
-          if isinstance(response, rdf_flow_objects.FlowIterator):
-            response = mig_flow_objects.ToProtoFlowIterator(response)
-          if isinstance(response, rdf_flow_objects.FlowResponse):
-            response = mig_flow_objects.ToProtoFlowResponse(response)
           flow_responses.append(response)
 
       data_store.REL_DB.WriteFlowResponses(flow_responses)
 
-      for msg in unprocessed_msgs:
-        if msg.type == rdf_flows.GrrMessage.Type.STATUS:
-          stat = rdf_flows.GrrStatus(msg.payload)
-          if stat.status == rdf_flows.GrrStatus.ReturnedStatus.CLIENT_KILLED:
+      for msg, _ in unprocessed_msgs:
+        if msg.type == jobs_pb2.GrrMessage.STATUS:
+          stat = models_flows.GetGrrStatus(msg)
+          if stat.status == jobs_pb2.GrrStatus.CLIENT_KILLED:
             # A client crashed while performing an action, fire an event.
             crash_details = rdf_client.ClientCrash(
                 client_id=client_id,
@@ -238,19 +342,11 @@ class FrontEndServer(object):
             )
 
     if worker_message_handler_requests:
-      worker_message_handler_requests = [
-          mig_objects.ToProtoMessageHandlerRequest(r)
-          for r in worker_message_handler_requests
-      ]
       data_store.REL_DB.WriteMessageHandlerRequests(
           worker_message_handler_requests
       )
 
     if frontend_message_handler_requests:
-      frontend_message_handler_requests = [
-          mig_objects.ToProtoMessageHandlerRequest(r)
-          for r in frontend_message_handler_requests
-      ]
       worker_lib.ProcessMessageHandlerRequests(
           frontend_message_handler_requests
       )
@@ -262,6 +358,34 @@ class FrontEndServer(object):
         time.time() - now,
     )
 
+  def _FlowResponseForLegacyResponse(
+      self,
+      message: jobs_pb2.GrrMessage,
+      session_id: rdfvalue.SessionID,
+  ) -> models_flows.FlowResponseProto:
+    """Converts a client reply to a flow response proto."""
+    client_id = session_id.Split(4)[0]
+    if not re.match(r"C\.[0-9a-f]{16}", client_id):
+      raise ValueError(
+          "Unable to parse client id from session_id: %s" % session_id
+      )
+
+    response = models_flows.FlowResponseForLegacyResponse(
+        message, client_id=client_id, flow_id=session_id.Basename()
+    )
+    if response is not None:
+      return response
+
+    # The payload has no proto representation, fall back to the RDF helper.
+    response = rdf_flow_objects.FlowResponseForLegacyResponse(
+        mig_flows.ToRDFGrrMessage(message)
+    )
+    if isinstance(response, rdf_flow_objects.FlowStatus):
+      return mig_flow_objects.ToProtoFlowStatus(response)
+    if isinstance(response, rdf_flow_objects.FlowIterator):
+      return mig_flow_objects.ToProtoFlowIterator(response)
+    return mig_flow_objects.ToProtoFlowResponse(response)
+
   # TODO: Remove once no longer needed.
   def ReceiveRRGResponse(
       self,
@@ -13,7 +13,9 @@ from google.protobuf import wrappers_pb2
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib.rdfvalues import flows as rdf_flows
 from grr_response_core.lib.rdfvalues import protodict as rdf_protodict
+from grr_response_core.lib.util import cache
 from grr_response_proto import flows_pb2
+from grr_response_proto import jobs_pb2
 from grr_response_server import data_store
 from grr_response_server import frontend_lib
 from grr_response_server import sinks
@@ -95,6 +97,55 @@ class GRRFEServerTestRelational(flow_test_lib.FlowTestsBaseclass):
     )
     self.assertLen(received[0][1], 9)
 
+  def testReceiveMessageProtos(self):
+    client_id = "C.1234567890123456"
+    flow_id = "12345678"
+    data_store.REL_DB.WriteClientMetadata(client_id)
+    self._FlowSetup(client_id, flow_id)
+
+    session_id = "%s/%s" % (client_id, flow_id)
+    stat_entry = jobs_pb2.StatEntry(st_size=42)
+    status = jobs_pb2.GrrStatus()
+    status.cpu_time_used.deprecated_user_cpu_time = 1.5
+    messages = [
+        jobs_pb2.GrrMessage(
+            request_id=1,
+            response_id=1,
+            session_id=session_id,
+            auth_state=jobs_pb2.GrrMessage.AUTHENTICATED,
+            args_rdf_name="StatEntry",
+            args=stat_entry.SerializeToString(),
+        ),
+        jobs_pb2.GrrMessage(
+            request_id=1,
+            response_id=2,
+            session_id=session_id,
+            auth_state=jobs_pb2.GrrMessage.AUTHENTICATED,
+            type=jobs_pb2.GrrMessage.STATUS,
+            args_rdf_name="GrrStatus",
+            args=status.SerializeToString(),
+        ),
+    ]
+
+    TestServer().ReceiveMessageProtos(client_id, messages)
+
+    received = data_store.REL_DB.ReadAllFlowRequestsAndResponses(
+        client_id, flow_id
+    )
+    self.assertLen(received, 1)
+    responses = received[0][1]
+    self.assertLen(responses, 2)
+
+    response = responses[1]
+    self.assertIsInstance(response, flows_pb2.FlowResponse)
+    unpacked = jobs_pb2.StatEntry()
+    self.assertTrue(response.any_payload.Unpack(unpacked))
+    self.assertEqual(unpacked, stat_entry)
+
+    response_status = responses[2]
+    self.assertIsInstance(response_status, flows_pb2.FlowStatus)
+    self.assertEqual(response_status.cpu_time_used.user_cpu_time, 1.5)
+
   def testBlobHandlerMessagesAreHandledOnTheFrontend(self):
     client_id = "C.1234567890123456"
     data_store.REL_DB.WriteClientMetadata(client_id)
@@ -486,6 +537,100 @@ class FrontEndServerTest(absltest.TestCase):
     self.server.ReceiveRRGParcels(client_id, [])
 
 
+class ClientMetadataCacheTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+
+    # Caching is turned off in tests by default.
+    cache_patcher = mock.patch.object(
+        cache, "WITH_LIMITED_CALL_FREQUENCY_PASS_THROUGH", False
+    )
+    cache_patcher.start()
+    self.addCleanup(cache_patcher.stop)
+
+  @db_test_lib.WithDatabase
+  def testMetadataIsReadOnceWithinTTL(self, db: abstract_db.Database):
+    client_id = db_test_utils.InitializeClient(db)
+    server = frontend_lib.FrontEndServer()
+
+    with mock.patch.object(
+        db, "ReadClientMetadata", wraps=db.ReadClientMetadata
+    ) as read_metadata_fn:
+      first = server.EnrollFleetspeakClientIfNeeded(client_id, {})
+      second = server.EnrollFleetspeakClientIfNeeded(client_id, {})
+
+      self.assertEqual(read_metadata_fn.call_count, 1)
+      self.assertEqual(first, second)
+
+      with test_lib.FakeTime(
+          rdfvalue.RDFDatetime.Now() + rdfvalue.Duration.From(1, rdfvalue.DAYS)
+      ):
+        server.EnrollFleetspeakClientIfNeeded(client_id, {})
+
+      self.assertEqual(read_metadata_fn.call_count, 2)
+
+  @db_test_lib.WithDatabase
+  def testNewClientsAreNotCached(self, db: abstract_db.Database):
+    del db  # Unused.
+    client_id = "C.0123456789abcdef"
+    server = frontend_lib.FrontEndServer()
+
+    self.assertIsNone(server.EnrollFleetspeakClientIfNeeded(client_id, {}))
+    self.assertIsNotNone(server.EnrollFleetspeakClientIfNeeded(client_id, {}))
+
+  @db_test_lib.WithDatabase
+  def testUpdateCachedClientPing(self, db: abstract_db.Database):
+    client_id = db_test_utils.InitializeClient(db)
+    server = frontend_lib.FrontEndServer()
+    metadata = server.EnrollFleetspeakClientIfNeeded(client_id, {})
+
+    ping = rdfvalue.RDFDatetime.FromSecondsSinceEpoch(1337)
+    server.UpdateCachedClientPing(client_id, ping)
+
+    with mock.patch.object(db, "ReadClientMetadata") as read_metadata_fn:
+      updated = server.EnrollFleetspeakClientIfNeeded(client_id, {})
+
+    read_metadata_fn.assert_not_called()
+    self.assertEqual(updated.ping, int(ping))
+    # Previously returned metadata is not modified.
+    self.assertNotEqual(metadata.ping, int(ping))
+
+  @db_test_lib.WithDatabase
+  def testLeastRecentlyUsedEntriesAreEvicted(self, db: abstract_db.Database):
+    client_id_1 = db_test_utils.InitializeClient(db)
+    client_id_2 = db_test_utils.InitializeClient(db)
+
+    with test_lib.ConfigOverrider({"Frontend.client_metadata_cache_size": 1}):
+      server = frontend_lib.FrontEndServer()
+
+    with mock.patch.object(
+        db, "ReadClientMetadata", wraps=db.ReadClientMetadata
+    ) as read_metadata_fn:
+      server.EnrollFleetspeakClientIfNeeded(client_id_1, {})
+      server.EnrollFleetspeakClientIfNeeded(client_id_2, {})
+      server.EnrollFleetspeakClientIfNeeded(client_id_2, {})
+      self.assertEqual(read_metadata_fn.call_count, 2)
+
+      server.EnrollFleetspeakClientIfNeeded(client_id_1, {})
+      self.assertEqual(read_metadata_fn.call_count, 3)
+
+  @db_test_lib.WithDatabase
+  def testCacheCanBeDisabled(self, db: abstract_db.Database):
+    client_id = db_test_utils.InitializeClient(db)
+
+    with test_lib.ConfigOverrider({"Frontend.client_metadata_cache_size": 0}):
+      server = frontend_lib.FrontEndServer()
+
+    with mock.patch.object(
+        db, "ReadClientMetadata", wraps=db.ReadClientMetadata
+    ) as read_metadata_fn:
+      server.EnrollFleetspeakClientIfNeeded(client_id, {})
+      server.EnrollFleetspeakClientIfNeeded(client_id, {})
+
+    self.assertEqual(read_metadata_fn.call_count, 2)
+
+
 def main(args):
   test_lib.main(args)
 
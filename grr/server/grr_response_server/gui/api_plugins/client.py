@@ -130,7 +130,7 @@ class ApiSearchClientsHandler(api_call_handler_base.ApiCallHandler):
     index = client_index.ClientIndex()
 
     # LookupClients returns a sorted list of client ids.
-    clients = index.LookupClients(keywords)[args.offset : args.offset + end]
+    clients = index.LookupClients(keywords, offset=args.offset, count=end)
 
     client_infos = data_store.REL_DB.MultiReadClientFullInfo(clients)
     for client_id, client_info in client_infos.items():
@@ -547,6 +547,7 @@ class ApiListFlowResultsHandler(api_call_handler_base.ApiCallHandler):
         with_substring=args.filter or None,
         with_tag=args.with_tag or None,
         with_type=args.with_type or None,
+        max_staleness=db.UI_READ_MAX_STALENESS,
     )
 
     if args.filter:
@@ -563,6 +564,7 @@ class ApiListFlowResultsHandler(api_call_handler_base.ApiCallHandler):
           # TODO: Add with_substring to CountFlowResults().
           with_tag=args.with_tag or None,
           with_type=args.with_type or None,
+          max_staleness=db.UI_READ_MAX_STALENESS,
       )
 
     wrapped_items = [InitApiFlowResultFromFlowResult(r) for r in results]
@@ -3,7 +3,6 @@
 
 import collections
 from collections.abc import Iterable, Iterator, Sequence
-import math
 import os
 import re
 from typing import Optional, Union
@@ -31,6 +30,7 @@ from grr_response_server import instant_output_plugin
 from grr_response_server import instant_output_plugin_registry
 from grr_response_server import notification
 from grr_response_server.databases import db
+from grr_response_server.databases import db_utils
 from grr_response_server.flows.general import export
 from grr_response_server.gui import api_call_context
 from grr_response_server.gui import api_call_handler_base
@@ -341,36 +341,33 @@ class Histogram:
       min_timestamp: int,
       max_timestamp: int,
       num_buckets: int,
-      values: list[int],
+      values: Iterable[int],
   ):
     self.min_timestamp = min_timestamp
     self.max_timestamp = max_timestamp
     self.num_buckets = num_buckets
     self.bucket_size = (max_timestamp - min_timestamp) / num_buckets
 
+    counts = db_utils.BucketTimestamps(
+        values, min_timestamp, max_timestamp, num_buckets
+    )
     self.buckets = []
-    for i in range(num_buckets):
+    for i, count in enumerate(counts):
       lower = min_timestamp + i * self.bucket_size
-      self.buckets.append(Bucket(lower_boundary_ts=lower))
-
-    for value in values:
-      self._Insert(value)
-
-  def _GetBucketIndex(self, timestamp: int) -> int:
-    if self.bucket_size == 0:
-      return 0
-    index = math.floor((timestamp - self.min_timestamp) / self.bucket_size)
-    if index < 0:
-      raise ValueError(
-          f"Timestamp `{timestamp}` must be larger than `{self.min_timestamp}`"
-      )
-    if index >= self.num_buckets:
-      index = self.num_buckets - 1
-
-    return index
+      self.buckets.append(Bucket(lower_boundary_ts=lower, count=count))
 
-  def _Insert(self, timestamp: int) -> None:
-    self.buckets[self._GetBucketIndex(timestamp)].count += 1
+  @classmethod
+  def FromCounts(
+      cls,
+      min_timestamp: int,
+      max_timestamp: int,
+      counts: Sequence[int],
+  ) -> "Histogram":
+    """Creates a histogram from already bucketed timestamp counts."""
+    histogram = cls(min_timestamp, max_timestamp, len(counts), values=[])
+    for bucket, count in zip(histogram.buckets, counts):
+      bucket.count = count
+    return histogram
 
   def GetCumulativeHistogram(self) -> "Histogram":
     """Returns the cumulative histogram."""
@@ -855,6 +852,7 @@ class ApiListHuntOutputPluginLogsHandlerBase(
         args.offset,
         args.count or db.MAX_COUNT,
         with_type=self.__class__.log_entry_type,
+        max_staleness=db.UI_READ_MAX_STALENESS,
     )
     total_count = data_store.REL_DB.CountHuntOutputPluginLogEntries(
         str(args.hunt_id),
@@ -991,31 +989,24 @@ class ApiGetHuntClientCompletionStatsHandler(
       context: Optional[api_call_context.ApiCallContext] = None,
   ) -> api_hunt_pb2.ApiGetHuntClientCompletionStatsResult:
 
-    states_and_timestamps = data_store.REL_DB.ReadHuntFlowsStatesAndTimestamps(
-        str(args.hunt_id)
-    )
     num_buckets = max(100, args.size)
-    flow_creation_times, flow_completion_times = [], []
-
-    for stat in states_and_timestamps:
-      flow_creation_times.append(stat.create_time.AsSecondsSinceEpoch())
-      if stat.flow_state != flows_pb2.Flow.FlowState.RUNNING:
-        flow_completion_times.append(
-            stat.last_update_time.AsSecondsSinceEpoch()
-        )
-
-    if not flow_creation_times:
+    histograms = data_store.REL_DB.ReadHuntFlowsTimestampHistograms(
+        str(args.hunt_id),
+        num_buckets,
+        max_staleness=db.UI_READ_MAX_STALENESS,
+    )
+    if histograms is None:
       return api_hunt_pb2.ApiGetHuntClientCompletionStatsResult()
 
-    min_timestamp = min(flow_creation_times)
-    max_timestamp = max(flow_creation_times + flow_completion_times)
-
-    started_histogram = Histogram(
-        min_timestamp, max_timestamp, num_buckets, values=flow_creation_times
+    started_histogram = Histogram.FromCounts(
+        histograms.min_timestamp,
+        histograms.max_timestamp,
+        histograms.started_counts,
     )
-
-    completed_histogram = Histogram(
-        min_timestamp, max_timestamp, num_buckets, values=flow_completion_times
+    completed_histogram = Histogram.FromCounts(
+        histograms.min_timestamp,
+        histograms.max_timestamp,
+        histograms.completed_counts,
     )
 
     return InitApiGetHuntClientCompletionStatsResultFromHistograms(
@@ -1573,6 +1573,19 @@ class TestHistogram(absltest.TestCase):
         expected_bucket_counts,
     )
 
+  def testHistogramFromCounts(self):
+    histogram = hunt_plugin.Histogram.FromCounts(
+        min_timestamp=0, max_timestamp=9, counts=[3, 0, 1]
+    )
+
+    self.assertEqual(histogram.num_buckets, 3)
+    self.assertEqual([b.lower_boundary_ts for b in histogram.buckets], [0, 3, 6])
+    self.assertEqual([b.count for b in histogram.buckets], [3, 0, 1])
+    self.assertEqual(
+        [b.count for b in histogram.GetCumulativeHistogram().buckets],
+        [3, 3, 4],
+    )
+
   def testCumulativeHistogramContainsIncludesEmptyHistogramBuckets(self):
     histogram = hunt_plugin.Histogram(
         min_timestamp=0,
@@ -1,12 +1,16 @@
 #!/usr/bin/env python
 """A module with API handlers related to the timeline colllection."""
+import collections
 from collections.abc import Iterator
+import functools
 from typing import Optional
 
 from grr_response_core.lib import utils
 from grr_response_core.lib.rdfvalues import structs as rdf_structs
 from grr_response_core.lib.util import body
 from grr_response_core.lib.util import chunked
+from grr_response_core.lib.util import iterator
+from grr_response_core.lib.util import timeline as timeline_lib
 from grr_response_proto import objects_pb2
 from grr_response_proto.api import timeline_pb2
 from grr_response_server import data_store
@@ -96,8 +100,16 @@ class ApiGetCollectedTimelineHandler(api_call_handler_base.ApiCallHandler):
       if fstype is not None and fstype.lower() == "ntfs":
         opts.inode_format = body.Opts.InodeFormat.NTFS_FILE_REFERENCE
 
-    entries = timeline.ProtoEntries(client_id=client_id, flow_id=flow_id)
-    content = body.Stream(entries, opts=opts)
+    # Every blob is a self-contained gzchunked stream, so blobs can be
+    # decompressed and converted to the body format independently (and thus
+    # concurrently).
+    blobs = timeline.Blobs(client_id=client_id, flow_id=flow_id)
+    content = iterator.ParallelMap(
+        functools.partial(_BlobToBody, opts=opts),
+        blobs,
+        max_workers=_BODY_CONVERSION_CONCURRENCY,
+    )
+    content = filter(None, content)
 
     filename = "timeline_{}.body".format(flow_id)
     return api_call_handler_base.ApiBinaryStream(filename, content)
@@ -161,12 +173,39 @@ class ApiGetCollectedHuntTimelinesHandler(api_call_handler_base.ApiCallHandler):
       args: timeline_pb2.ApiGetCollectedHuntTimelinesArgs,
       zipgen: utils.StreamingZipGenerator,
   ) -> Iterator[bytes]:
-
+    # Timelines of the next few clients are generated in the background while
+    # the current one is being written to the archive.
+    timelines: collections.deque[tuple[str, iterator.Prefetched[bytes]]] = (
+        collections.deque()
+    )
+    try:
+      for filename, subargs in self._HuntTimelinesArgs(args):
+        content = iterator.Prefetched(
+            self._GenerateTimeline(subargs),
+            max_buffered=_HUNT_TIMELINE_PREFETCH_CHUNKS,
+        )
+        timelines.append((filename, content))
+
+        if len(timelines) > _HUNT_TIMELINES_CONCURRENCY:
+          yield from self._WriteTimeline(zipgen, *timelines.popleft())
+
+      while timelines:
+        yield from self._WriteTimeline(zipgen, *timelines.popleft())
+    finally:
+      for _, content in timelines:
+        content.Close()
+
+  def _HuntTimelinesArgs(
+      self,
+      args: timeline_pb2.ApiGetCollectedHuntTimelinesArgs,
+  ) -> Iterator[tuple[str, timeline_pb2.ApiGetCollectedTimelineArgs]]:
+    """Yields archive filenames and export arguments of hunt timelines."""
     offset = 0
     while True:
       flows = data_store.REL_DB.ReadHuntFlows(
           args.hunt_id, offset, _FLOW_BATCH_SIZE
       )
+      offset += len(flows)
 
       client_ids = [flow.client_id for flow in flows]
       client_snapshots = data_store.REL_DB.MultiReadClientSnapshot(client_ids)
@@ -181,13 +220,21 @@ class ApiGetCollectedHuntTimelinesHandler(api_call_handler_base.ApiCallHandler):
         subargs.format = args.format
         subargs.body_opts.CopyFrom(args.body_opts)
 
-        yield zipgen.WriteFileHeader(filename)
-        yield from map(zipgen.WriteFileChunk, self._GenerateTimeline(subargs))
-        yield zipgen.WriteFileFooter()
+        yield filename, subargs
 
       if len(flows) < _FLOW_BATCH_SIZE:
         break
 
+  def _WriteTimeline(
+      self,
+      zipgen: utils.StreamingZipGenerator,
+      filename: str,
+      content: iterator.Prefetched[bytes],
+  ) -> Iterator[bytes]:
+    yield zipgen.WriteFileHeader(filename)
+    yield from map(zipgen.WriteFileChunk, content)
+    yield zipgen.WriteFileFooter()
+
   def _GenerateTimeline(
       self,
       args: timeline_pb2.ApiGetCollectedTimelineArgs,
@@ -211,4 +258,18 @@ def _GetHuntTimelineFilename(
   raise ValueError(f"Unsupported file format: '{fmt}'")
 
 
+def _BlobToBody(blob: bytes, opts: body.Opts) -> bytes:
+  """Converts a blob with gzchunked timeline entries to the body format."""
+  entries = timeline_lib.DeserializeTimelineEntryProtoStream(iter([blob]))
+  return b"".join(body.Stream(entries, opts=opts))
+
+
 _FLOW_BATCH_SIZE = 32_768  # A number of flows to fetch in a database call.
+
+# A number of threads converting timeline blobs to the body format.
+_BODY_CONVERSION_CONCURRENCY = 4
+
+# A number of hunt timelines generated ahead of the one being archived and a
+# number of chunks each of them can buffer.
+_HUNT_TIMELINES_CONCURRENCY = 4
+_HUNT_TIMELINE_PREFETCH_CHUNKS = 8
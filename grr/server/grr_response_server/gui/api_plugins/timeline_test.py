@@ -326,6 +326,49 @@ class ApiGetCollectedTimelineHandlerTest(api_test_lib.ApiCallHandlerTest):
     self.assertIn("|/foo|", content)
     self.assertIn("|/bar|", content)
 
+  def testBodyManyResultsPreservesOrder(self):
+    client_id = db_test_utils.InitializeClient(data_store.REL_DB)
+    flow_id = "ABCDEF42"
+
+    flow_obj = flows_pb2.Flow()
+    flow_obj.client_id = client_id
+    flow_obj.flow_id = flow_id
+    flow_obj.flow_class_name = timeline.TimelineFlow.__name__
+    data_store.REL_DB.WriteFlowObject(flow_obj)
+
+    # Enough results to span several pages and several blob batches.
+    flow_results = []
+    for i in range(100):
+      entry = timeline_pb2.TimelineEntry()
+      entry.path = f"/foo/{i}".encode("utf-8")
+
+      blobs = list(rdf_timeline.SerializeTimelineEntryStream([entry]))
+      (blob_id,) = data_store.BLOBS.WriteBlobsWithUnknownHashes(blobs)
+
+      result = timeline_pb2.TimelineResult()
+      result.entry_batch_blob_ids.append(bytes(blob_id))
+
+      flow_result = flows_pb2.FlowResult()
+      flow_result.client_id = client_id
+      flow_result.flow_id = flow_id
+      flow_result.payload.Pack(result)
+      flow_results.append(flow_result)
+
+    for flow_result in flow_results:
+      data_store.REL_DB.WriteFlowResults([flow_result])
+
+    args = api_timeline_pb2.ApiGetCollectedTimelineArgs()
+    args.client_id = client_id
+    args.flow_id = flow_id
+    args.format = api_timeline_pb2.ApiGetCollectedTimelineArgs.Format.BODY
+
+    result = self.handler.Handle(args)
+    content = b"".join(result.GenerateContent()).decode("utf-8")
+
+    rows = list(csv.reader(io.StringIO(content), delimiter="|"))
+    paths = [row[1] for row in rows]
+    self.assertEqual(paths, [f"/foo/{i}" for i in range(100)])
+
   def testRawGzchunkedEmpty(self):
     client_id = db_test_utils.InitializeClient(data_store.REL_DB)
     flow_id = timeline_test_lib.WriteTimeline(client_id, [])
@@ -499,6 +542,79 @@ class ApiGetCollectedHuntTimelinesHandlerTest(api_test_lib.ApiCallHandlerTest):
         self.assertEqual(rows[0][8], "888")
         self.assertEqual(rows[0][9], "999")
 
+  def testBodyManyClients(self):
+    hunt_id = "B1C2E3D4"
+
+    hunt_obj = hunts_pb2.Hunt()
+    hunt_obj.hunt_id = hunt_id
+    hunt_obj.args.standard.flow_name = timeline.TimelineFlow.__name__
+    hunt_obj.hunt_state = hunts_pb2.Hunt.HuntState.PAUSED
+    data_store.REL_DB.WriteHuntObject(hunt_obj)
+
+    # More clients than the number of timelines generated concurrently.
+    paths_by_client_id = {}
+    for i in range(10):
+      client_id = db_test_utils.InitializeClient(data_store.REL_DB)
+
+      snapshot = objects_pb2.ClientSnapshot()
+      snapshot.client_id = client_id
+      snapshot.knowledge_base.fqdn = f"host{i}.example.com"
+      data_store.REL_DB.WriteClientSnapshot(snapshot)
+
+      entry = timeline_pb2.TimelineEntry()
+      entry.path = f"/foo/{i}".encode("utf-8")
+      timeline_test_lib.WriteTimeline(client_id, [entry], hunt_id=hunt_id)
+
+      paths_by_client_id[client_id] = f"/foo/{i}"
+
+    args = api_timeline_pb2.ApiGetCollectedHuntTimelinesArgs()
+    args.hunt_id = hunt_id
+    args.format = api_timeline_pb2.ApiGetCollectedTimelineArgs.Format.BODY
+
+    content = b"".join(self.handler.Handle(args).GenerateContent())
+
+    with zipfile.ZipFile(io.BytesIO(content), mode="r") as archive:
+      self.assertLen(archive.namelist(), 10)
+
+      for i, (client_id, path) in enumerate(paths_by_client_id.items()):
+        filename = f"{client_id}_host{i}.example.com.body"
+        with archive.open(filename, mode="r") as file:
+          content_file = file.read().decode("utf-8")
+
+        rows = list(csv.reader(io.StringIO(content_file), delimiter="|"))
+        self.assertLen(rows, 1)
+        self.assertEqual(rows[0][1], path)
+
+  def testPartiallyConsumedArchiveCanBeClosed(self):
+    hunt_id = "B1C2E3D4"
+
+    hunt_obj = hunts_pb2.Hunt()
+    hunt_obj.hunt_id = hunt_id
+    hunt_obj.args.standard.flow_name = timeline.TimelineFlow.__name__
+    hunt_obj.hunt_state = hunts_pb2.Hunt.HuntState.PAUSED
+    data_store.REL_DB.WriteHuntObject(hunt_obj)
+
+    for _ in range(10):
+      client_id = db_test_utils.InitializeClient(data_store.REL_DB)
+
+      snapshot = objects_pb2.ClientSnapshot()
+      snapshot.client_id = client_id
+      data_store.REL_DB.WriteClientSnapshot(snapshot)
+
+      entry = timeline_pb2.TimelineEntry()
+      entry.path = "/foo".encode("utf-8")
+      timeline_test_lib.WriteTimeline(client_id, [entry], hunt_id=hunt_id)
+
+    args = api_timeline_pb2.ApiGetCollectedHuntTimelinesArgs()
+    args.hunt_id = hunt_id
+    args.format = api_timeline_pb2.ApiGetCollectedTimelineArgs.Format.BODY
+
+    content = self.handler.Handle(args).GenerateContent()
+    next(content)
+    # Closing the stream stops all the timelines generated in the background
+    # (the test would fail on leaked threads otherwise).
+    content.close()
+
   def testRawGzchunkedMultipleClients(self):
     client_id_1 = db_test_utils.InitializeClient(data_store.REL_DB)
     client_id_2 = db_test_utils.InitializeClient(data_store.REL_DB)
@@ -146,6 +146,18 @@ def StopHuntIfCPUOrNetworkLimitsExceeded(hunt_id):
   if hunt_obj.hunt_state == rdf_hunt_objects.Hunt.HuntState.STOPPED:
     return hunt_obj
 
+  # Most hunts don't have any of these limits set, there is no need to read
+  # the counters then.
+  if not (
+      hunt_obj.total_network_bytes_limit
+      or hunt_obj.avg_results_per_client_limit
+      or hunt_obj.avg_cpu_seconds_per_client_limit
+      or hunt_obj.avg_network_bytes_per_client_limit
+  ):
+    return hunt_obj
+
+  # Hunt counters are maintained incrementally by the database, so reading
+  # them doesn't depend on the number of hunt flows.
   hunt_counters = data_store.REL_DB.ReadHuntCounters(hunt_id)
 
   # Check global hunt network bytes limit first.
@@ -2,6 +2,8 @@
 """Plugin that exports results as SQLite db scripts."""
 
 import io
+import itertools
+import operator
 import os
 import sqlite3
 from typing import Any, Callable, Iterator
@@ -61,6 +63,72 @@ PROTO_SQLITE_CONVERTERS = {
 }
 
 
+class _FlatteningPlan:
+  """Flattens messages of a single type into rows of SQLite column values.
+
+  The plan is compiled once from the message descriptor: nested messages are
+  flattened into dot-separated column names and every column gets a getter and
+  a conversion function, so flattening a message doesn't need to walk the
+  descriptor again.
+
+  Attributes:
+    schema: A mapping of SQLite column names to Converter objects, in the order
+      of the values in the rows.
+  """
+
+  def __init__(self, message_descriptor: descriptor.Descriptor) -> None:
+    self.schema: dict[str, Converter] = {}
+    self._convert_fns: list[Callable[[Any], Any]] = []
+
+    self._Compile(message_descriptor, prefix="")
+
+    columns = list(self.schema)
+    if len(columns) == 1:
+      # With a single attribute `attrgetter` doesn't return a tuple.
+      getter = operator.attrgetter(columns[0])
+      self._getter = lambda msg: (getter(msg),)
+    elif columns:
+      self._getter = operator.attrgetter(*columns)
+    else:
+      self._getter = lambda msg: ()
+
+  def _Compile(self, message_descriptor: descriptor.Descriptor, prefix: str):
+    """Adds columns for all (possibly nested) fields of the descriptor."""
+    fields = message_descriptor.fields_by_name.items()
+    for field_name, field_descriptor in fields:
+      column = prefix + field_name
+
+      if field_descriptor.type == descriptor.FieldDescriptor.TYPE_MESSAGE:
+        self._Compile(field_descriptor.message_type, prefix=column + ".")
+        continue
+
+      if field_descriptor.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+        converter = Converter("TEXT", str)
+        convert_fn = lambda val: str(list(val))
+      elif field_descriptor.type == descriptor.FieldDescriptor.TYPE_ENUM:
+        converter = PROTO_SQLITE_CONVERTERS[field_descriptor.type]
+        enum_values = field_descriptor.enum_type.values_by_number
+        names = {number: value.name for number, value in enum_values.items()}
+        convert_fn = names.__getitem__
+      else:
+        converter = PROTO_SQLITE_CONVERTERS[field_descriptor.type]
+        convert_fn = converter.convert_fn
+
+      self.schema[column] = converter
+      self._convert_fns.append(convert_fn)
+
+  def Row(self, msg: message.Message) -> tuple[Any, ...]:
+    """Returns values of the SQLite columns for the given message."""
+    return tuple(
+        convert_fn(value)
+        for convert_fn, value in zip(self._convert_fns, self._getter(msg))
+    )
+
+
+def _QuoteIdentifier(name: str) -> str:
+  return '"%s"' % name.replace('"', '""')
+
+
 class SqliteInstantOutputPluginProto(
     instant_output_plugin.InstantOutputPluginWithExportConversionProto
 ):
@@ -73,8 +141,9 @@ class SqliteInstantOutputPluginProto(
 
   archive_generator: utils.StreamingZipGenerator
   export_counts: dict[str, dict[str, int]]
+  _flattening_plans: dict[str, _FlatteningPlan]
 
-  ROW_BATCH = 100
+  ROW_BATCH = 1000
 
   @property
   def path_prefix(self):
@@ -86,6 +155,7 @@ class SqliteInstantOutputPluginProto(
         compression=zipfile.ZIP_DEFLATED
     )
     self.export_counts = {}
+    self._flattening_plans = {}
     return []
 
   def ProcessUniqueOriginalExportedTypePair(
@@ -110,43 +180,39 @@ class SqliteInstantOutputPluginProto(
         exported_value_class_name,
         original_rdf_type_name,
     )
-    schema = self._GetSqliteSchema(first_value.DESCRIPTOR)
+    plan = self._GetFlatteningPlan(first_value.DESCRIPTOR)
 
-    # We will buffer the sql statements into an in-memory sql database before
-    # dumping them to the zip archive. We rely on the PySQLite library for
-    # string escaping.
+    # We will buffer the rows in an in-memory sql database before dumping them
+    # as SQL statements to the zip archive. We rely on SQLite's `quote` function
+    # for string escaping.
     db_connection = sqlite3.connect(":memory:")
-    db_cursor = db_connection.cursor()
+    try:
+      create_table = self._CreateTableStatement(table_name, plan)
+      db_connection.execute(create_table)
+
+      yield self.archive_generator.WriteFileChunk(
+          ("BEGIN TRANSACTION;\n%s\n" % create_table).encode("utf-8")
+      )
+
+      insert_sql, dump_sql, delete_sql = self._RowStatements(table_name, plan)
+
+      counter = 0
+      values = itertools.chain([first_value], exported_values)
+      for batch in collection.Batch(values, self.ROW_BATCH):
+        counter += len(batch)
+        # A single prepared statement is used for all rows of the batch.
+        db_connection.executemany(insert_sql, map(plan.Row, batch))
+
+        statements = [row[0] for row in db_connection.execute(dump_sql)]
+        statements.append("")
+        yield self.archive_generator.WriteFileChunk(
+            "\n".join(statements).encode("utf-8")
+        )
 
-    yield self.archive_generator.WriteFileChunk(
-        "BEGIN TRANSACTION;\n".encode("utf-8")
-    )
+        db_connection.execute(delete_sql)
+    finally:
+      db_connection.close()
 
-    with db_connection:
-      buf = io.StringIO()
-      buf.write('CREATE TABLE "%s" (\n  ' % table_name)
-      column_types = [(k, v.sqlite_type) for k, v in schema.items()]
-      buf.write(",\n  ".join(['"%s" %s' % (k, v) for k, v in column_types]))
-      buf.write("\n);")
-      db_cursor.execute(buf.getvalue())
-
-      chunk = (buf.getvalue() + "\n").encode("utf-8")
-      yield self.archive_generator.WriteFileChunk(chunk)
-
-      self._InsertValueIntoDb(table_name, schema, first_value, db_cursor)
-
-    for sql in self._FlushAllRows(db_connection, table_name):
-      yield sql
-    counter = 1
-    for batch in collection.Batch(exported_values, self.ROW_BATCH):
-      counter += len(batch)
-      with db_connection:
-        for value in batch:
-          self._InsertValueIntoDb(table_name, schema, value, db_cursor)
-      for sql in self._FlushAllRows(db_connection, table_name):
-        yield sql
-
-    db_connection.close()
     yield self.archive_generator.WriteFileChunk("COMMIT;\n".encode("utf-8"))
     yield self.archive_generator.WriteFileFooter()
 
@@ -155,80 +221,58 @@ class SqliteInstantOutputPluginProto(
     )
     counts_for_original_type[exported_value_class_name] = counter
 
-  def _GetSqliteSchema(self, message_descriptor, prefix=""):
-    """Returns a mapping of SQLite column names to Converter objects."""
-    schema = dict()
-    for (
-        field_name,
-        field_descriptor,
-    ) in message_descriptor.fields_by_name.items():
-      if field_descriptor.type == descriptor.FieldDescriptor.TYPE_MESSAGE:
-        schema.update(
-            self._GetSqliteSchema(
-                field_descriptor.message_type,
-                prefix="%s%s." % (prefix, field_name),
-            )
-        )
-      else:
-        field_name = prefix + field_name
-        if field_descriptor.label == descriptor.FieldDescriptor.LABEL_REPEATED:
-          schema[field_name] = Converter("TEXT", str)
-        else:
-          schema[field_name] = PROTO_SQLITE_CONVERTERS[field_descriptor.type]
-    return schema
-
-  def _InsertValueIntoDb(self, table_name, schema, value, db_cursor):
-    sql_dict = self._ConvertToCanonicalSqlDict(schema, value)
+  def _GetFlatteningPlan(
+      self, message_descriptor: descriptor.Descriptor
+  ) -> _FlatteningPlan:
+    try:
+      return self._flattening_plans[message_descriptor.full_name]
+    except KeyError:
+      plan = _FlatteningPlan(message_descriptor)
+      self._flattening_plans[message_descriptor.full_name] = plan
+      return plan
+
+  def _CreateTableStatement(self, table_name: str, plan: _FlatteningPlan):
     buf = io.StringIO()
-    buf.write('INSERT INTO "%s" (\n  ' % table_name)
-    buf.write(",\n  ".join(['"%s"' % k for k in sql_dict.keys()]))
-    buf.write("\n)")
-    buf.write("VALUES (%s);" % ",".join(["?"] * len(sql_dict)))
-    db_cursor.execute(buf.getvalue(), list(sql_dict.values()))
-
-  def _ConvertToCanonicalSqlDict(self, schema, msg, prefix=""):
-    """Converts a proto message into a SQL-ready form."""
-    flattened_dict = {}
-    for (
-        field_name,
-        field_descriptor,
-    ) in msg.DESCRIPTOR.fields_by_name.items():
-      if field_descriptor.type == descriptor.FieldDescriptor.TYPE_MESSAGE:
-        flattened_dict.update(
-            self._ConvertToCanonicalSqlDict(
-                schema,
-                getattr(msg, field_name),
-                prefix="%s%s." % (prefix, field_name),
-            )
-        )
-      else:
-        key = prefix + field_name
-        converter = schema[key]
-
-        val = getattr(msg, field_name)
-        if field_descriptor.label == descriptor.FieldDescriptor.LABEL_REPEATED:
-          val = list(val)
-        elif field_descriptor.type == descriptor.FieldDescriptor.TYPE_ENUM:
-          val = field_descriptor.enum_type.values_by_number[val].name
-
-        flattened_dict[key] = converter.convert_fn(val)
-    return flattened_dict
-
-  def _FlushAllRows(self, db_connection, table_name):
-    """Copies rows from the given db into the output file then deletes them."""
-    for sql in db_connection.iterdump():
-      if (
-          sql.startswith("CREATE TABLE")
-          or sql.startswith("BEGIN TRANSACTION")
-          or sql.startswith("COMMIT")
-      ):
-        # These statements only need to be written once.
-        continue
-      # The archive generator expects strings (not Unicode objects returned by
-      # the pysqlite library).
-      yield self.archive_generator.WriteFileChunk((sql + "\n").encode("utf-8"))
-    with db_connection:
-      db_connection.cursor().execute('DELETE FROM "%s";' % table_name)
+    buf.write("CREATE TABLE %s (\n  " % _QuoteIdentifier(table_name))
+    columns = [
+        "%s %s" % (_QuoteIdentifier(column), converter.sqlite_type)
+        for column, converter in plan.schema.items()
+    ]
+    buf.write(",\n  ".join(columns))
+    buf.write("\n);")
+    return buf.getvalue()
+
+  def _RowStatements(
+      self, table_name: str, plan: _FlatteningPlan
+  ) -> tuple[str, str, str]:
+    """Returns statements to insert, dump and delete rows of the table.
+
+    The dump statement produces the same `INSERT` statements as
+    `sqlite3.Connection.iterdump` would, but without dumping the schema.
+
+    Args:
+      table_name: A name of the table.
+      plan: A flattening plan of the values stored in the table.
+
+    Returns:
+      A tuple of the insert, dump and delete statements.
+    """
+    table = _QuoteIdentifier(table_name)
+    columns = [_QuoteIdentifier(column) for column in plan.schema]
+
+    insert_sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        table,
+        ", ".join(columns),
+        ", ".join(["?"] * len(columns)),
+    )
+    dump_sql = "SELECT 'INSERT INTO %s VALUES(' || %s || ');' FROM %s" % (
+        table.replace("'", "''"),
+        " || ',' || ".join("quote(%s)" % column for column in columns),
+        table,
+    )
+    delete_sql = "DELETE FROM %s" % table
+
+    return insert_sql, dump_sql, delete_sql
 
   def Finish(self):
     manifest = {"export_stats": self.export_counts}
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""Benchmarks for the SQLite instant output plugin."""
+
+import io
+import sqlite3
+
+from absl import app
+
+from google.protobuf import descriptor
+from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.util import collection
+from grr_response_proto import export_pb2
+from grr_response_server.instant_output_plugins import sqlite_instant_plugin
+from grr.test_lib import benchmark_test_lib
+from grr.test_lib import test_lib
+
+
+class _RowAtATimeSqlitePlugin(
+    sqlite_instant_plugin.SqliteInstantOutputPluginProto
+):
+  """The plugin inserting and dumping rows one statement at a time.
+
+  This is how the plugin used to work before rows were flattened with
+  precompiled plans and inserted in bulk. It is kept here as a baseline.
+  """
+
+  ROW_BATCH = 100
+
+  def ProcessUniqueOriginalExportedTypePair(
+      self, original_rdf_type_name, exported_values
+  ):
+    first_value = next(exported_values, None)
+    if not first_value:
+      return
+
+    yield self.archive_generator.WriteFileHeader("legacy.sql")
+    table_name = "%s.from_%s" % (
+        first_value.__class__.__name__,
+        original_rdf_type_name,
+    )
+    schema = self._GetSqliteSchema(first_value.DESCRIPTOR)
+
+    db_connection = sqlite3.connect(":memory:")
+    db_cursor = db_connection.cursor()
+
+    yield self.archive_generator.WriteFileChunk(b"BEGIN TRANSACTION;\n")
+
+    with db_connection:
+      buf = io.StringIO()
+      buf.write('CREATE TABLE "%s" (\n  ' % table_name)
+      column_types = [(k, v.sqlite_type) for k, v in schema.items()]
+      buf.write(",\n  ".join(['"%s" %s' % (k, v) for k, v in column_types]))
+      buf.write("\n);")
+      db_cursor.execute(buf.getvalue())
+      yield self.archive_generator.WriteFileChunk(
+          (buf.getvalue() + "\n").encode("utf-8")
+      )
+      self._InsertValueIntoDb(table_name, schema, first_value, db_cursor)
+
+    yield from self._FlushAllRows(db_connection, table_name)
+    for batch in collection.Batch(exported_values, self.ROW_BATCH):
+      with db_connection:
+        for value in batch:
+          self._InsertValueIntoDb(table_name, schema, value, db_cursor)
+      yield from self._FlushAllRows(db_connection, table_name)
+
+    db_connection.close()
+    yield self.archive_generator.WriteFileChunk(b"COMMIT;\n")
+    yield self.archive_generator.WriteFileFooter()
+
+  def _GetSqliteSchema(self, message_descriptor, prefix=""):
+    schema = dict()
+    fields = message_descriptor.fields_by_name.items()
+    for field_name, field_descriptor in fields:
+      if field_descriptor.type == descriptor.FieldDescriptor.TYPE_MESSAGE:
+        schema.update(
+            self._GetSqliteSchema(
+                field_descriptor.message_type,
+                prefix="%s%s." % (prefix, field_name),
+            )
+        )
+      else:
+        field_name = prefix + field_name
+        if field_descriptor.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+          schema[field_name] = sqlite_instant_plugin.Converter("TEXT", str)
+        else:
+          schema[field_name] = sqlite_instant_plugin.PROTO_SQLITE_CONVERTERS[
+              field_descriptor.type
+          ]
+    return schema
+
+  def _InsertValueIntoDb(self, table_name, schema, value, db_cursor):
+    sql_dict = self._ConvertToCanonicalSqlDict(schema, value)
+    buf = io.StringIO()
+    buf.write('INSERT INTO "%s" (\n  ' % table_name)
+    buf.write(",\n  ".join(['"%s"' % k for k in sql_dict.keys()]))
+    buf.write("\n)")
+    buf.write("VALUES (%s);" % ",".join(["?"] * len(sql_dict)))
+    db_cursor.execute(buf.getvalue(), list(sql_dict.values()))
+
+  def _ConvertToCanonicalSqlDict(self, schema, msg, prefix=""):
+    flattened_dict = {}
+    for field_name, field_descriptor in msg.DESCRIPTOR.fields_by_name.items():
+      if field_descriptor.type == descriptor.FieldDescriptor.TYPE_MESSAGE:
+        flattened_dict.update(
+            self._ConvertToCanonicalSqlDict(
+                schema,
+                getattr(msg, field_name),
+                prefix="%s%s." % (prefix, field_name),
+            )
+        )
+      else:
+        key = prefix + field_name
+        val = getattr(msg, field_name)
+        if field_descriptor.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+          val = list(val)
+        elif field_descriptor.type == descriptor.FieldDescriptor.TYPE_ENUM:
+          val = field_descriptor.enum_type.values_by_number[val].name
+        flattened_dict[key] = schema[key].convert_fn(val)
+    return flattened_dict
+
+  def _FlushAllRows(self, db_connection, table_name):
+    for sql in db_connection.iterdump():
+      if (
+          sql.startswith("CREATE TABLE")
+          or sql.startswith("BEGIN TRANSACTION")
+          or sql.startswith("COMMIT")
+      ):
+        continue
+      yield self.archive_generator.WriteFileChunk((sql + "\n").encode("utf-8"))
+    with db_connection:
+      db_connection.cursor().execute('DELETE FROM "%s";' % table_name)
+
+
+class SqliteInstantOutputPluginBenchmark(
+    benchmark_test_lib.AverageMicroBenchmarks
+):
+  """Compares the bulk SQLite export to the row-at-a-time one."""
+
+  REPEATS = 3
+  NUM_VALUES = 5000
+
+  def _Values(self):
+    for i in range(self.NUM_VALUES):
+      yield export_pb2.ExportedFile(
+          metadata=export_pb2.ExportedMetadata(
+              client_urn="aff4:/C.%016X" % i,
+              hostname="host-%d.example.com" % i,
+              os="Linux",
+          ),
+          urn="aff4:/C.%016X/fs/os/tmp/file'%d" % (i, i),
+          basename="file'%d" % i,
+          st_mode=0o100644,
+          st_size=i * 1024,
+          st_mtime=1_600_000_000 + i,
+          content_sha256="%064x" % i,
+      )
+
+  def _Export(self, plugin_cls):
+    plugin = plugin_cls(source_urn=rdfvalue.RDFURN("aff4:/foo/bar"))
+    list(plugin.Start())
+    size = 0
+    for chunk in plugin.ProcessUniqueOriginalExportedTypePair(
+        "StatEntry", self._Values()
+    ):
+      size += len(chunk)
+    list(plugin.Finish())
+    return size
+
+  def testExport(self):
+    """Exports a few thousand ExportedFile values."""
+    self.TimeIt(
+        lambda: self._Export(_RowAtATimeSqlitePlugin),
+        name="Row-at-a-time inserts, iterdump",
+    )
+    self.TimeIt(
+        lambda: self._Export(
+            sqlite_instant_plugin.SqliteInstantOutputPluginProto
+        ),
+        name="Flattening plan, executemany, dump query",
+    )
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  app.run(main)
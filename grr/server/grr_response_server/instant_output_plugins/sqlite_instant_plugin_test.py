@@ -37,10 +37,6 @@ class SqliteInstantOutputPluginProtoTest(
     self.addCleanup(self.db_connection.close)
 
   def testConversionToCanonicalSqlDictWithVariousTypes(self):
-    plugin = sqlite_instant_plugin.SqliteInstantOutputPluginProto(
-        source_urn="aff4:/C.1000000000000000"
-    )
-
     input_proto = tests_pb2.SampleGetHandlerArgs(
         path="foo",
         foo="bar",
@@ -56,8 +52,8 @@ class SqliteInstantOutputPluginProtoTest(
         ),
     )
 
-    schema = plugin._GetSqliteSchema(input_proto.DESCRIPTOR)
-    sql_dict = plugin._ConvertToCanonicalSqlDict(schema, input_proto)
+    plan = sqlite_instant_plugin._FlatteningPlan(input_proto.DESCRIPTOR)
+    sql_dict = dict(zip(plan.schema, plan.Row(input_proto)))
 
     self.assertEqual(
         sql_dict,
@@ -73,10 +69,6 @@ class SqliteInstantOutputPluginProtoTest(
     )
 
   def testConversionToCanonicalSqlDictWithCyclicalStructures(self):
-    plugin = sqlite_instant_plugin.SqliteInstantOutputPluginProto(
-        source_urn="aff4:/C.1000000000000000"
-    )
-
     input_proto = tests_pb2.MetadataTypesHierarchyRoot()
     input_proto.field_int64 = 123
     input_proto.child_2.field_string = "e"
@@ -88,8 +80,8 @@ class SqliteInstantOutputPluginProtoTest(
     input_proto.child_1.root.child_1.root.child_2.field_string = "a"
 
     with self.assertRaises(RecursionError):
-      schema = plugin._GetSqliteSchema(input_proto.DESCRIPTOR)
-      plugin._ConvertToCanonicalSqlDict(schema, input_proto)
+      plan = sqlite_instant_plugin._FlatteningPlan(input_proto.DESCRIPTOR)
+      plan.Row(input_proto)
 
   @export_test_lib.WithAllExportConverters
   def testExportedFilenamesAndManifestForValuesOfSameType(self):
@@ -442,6 +434,32 @@ class SqliteInstantOutputPluginProtoTest(
       )
 
 
+  @export_test_lib.WithAllExportConverters
+  def testExportedScriptMatchesSqliteDump(self):
+    responses = [
+        jobs_pb2.StatEntry(
+            pathspec=jobs_pb2.PathSpec(path="/foo/'quoted'", pathtype="OS"),
+            st_size=42,
+            st_atime=1493596800,
+        ),
+        jobs_pb2.StatEntry(
+            pathspec=jobs_pb2.PathSpec(path="/bar\nbaz", pathtype="TSK"),
+        ),
+    ]
+
+    zip_fd, prefix = self.ProcessValuesToZip({jobs_pb2.StatEntry: responses})
+    sqlite_dump_path = f"{prefix}/ExportedFile_from_StatEntry.sql"
+    sqlite_dump = zip_fd.read(sqlite_dump_path).decode("utf-8")
+
+    with self.db_connection:
+      self.db_cursor.executescript(sqlite_dump)
+
+    # The script should be exactly what SQLite itself would dump.
+    self.assertEqual(
+        sqlite_dump, "\n".join(self.db_connection.iterdump()) + "\n"
+    )
+
+
 def main(argv):
   test_lib.main(argv)
 
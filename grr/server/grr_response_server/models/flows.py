@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""Module with data models and helpers related to flows."""
+
+import logging
+import zlib
+from typing import Optional, Union
+
+from google.protobuf import message as pb_message
+from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.rdfvalues import structs as rdf_structs
+from grr_response_proto import flows_pb2
+from grr_response_proto import jobs_pb2
+from grr_response_proto import objects_pb2
+
+_STATUS_MAP: dict[int, int] = {
+    jobs_pb2.GrrStatus.OK: flows_pb2.FlowStatus.OK,
+    jobs_pb2.GrrStatus.IOERROR: flows_pb2.FlowStatus.IOERROR,
+    jobs_pb2.GrrStatus.CLIENT_KILLED: flows_pb2.FlowStatus.CLIENT_KILLED,
+    jobs_pb2.GrrStatus.NETWORK_LIMIT_EXCEEDED: (
+        flows_pb2.FlowStatus.NETWORK_LIMIT_EXCEEDED
+    ),
+    jobs_pb2.GrrStatus.RUNTIME_LIMIT_EXCEEDED: (
+        flows_pb2.FlowStatus.RUNTIME_LIMIT_EXCEEDED
+    ),
+    jobs_pb2.GrrStatus.CPU_LIMIT_EXCEEDED: (
+        flows_pb2.FlowStatus.CPU_LIMIT_EXCEEDED
+    ),
+    jobs_pb2.GrrStatus.GENERIC_ERROR: flows_pb2.FlowStatus.ERROR,
+}
+
+_GRR_STATUS_RDF_NAME = "GrrStatus"
+
+FlowResponseProto = Union[
+    flows_pb2.FlowResponse,
+    flows_pb2.FlowStatus,
+    flows_pb2.FlowIterator,
+]
+
+
+class DecompressionError(ValueError):
+  """Raised when a packed message list can't be decompressed."""
+
+
+def DecompressMessageList(
+    packed_message_list: jobs_pb2.PackedMessageList,
+) -> jobs_pb2.MessageList:
+  """Decompresses the messages packed in the given `PackedMessageList`.
+
+  Args:
+    packed_message_list: A packed message list.
+
+  Returns:
+    The unpacked message list.
+
+  Raises:
+    DecompressionError: If the message list can't be decompressed or parsed.
+  """
+  compression = packed_message_list.compression
+  if compression == jobs_pb2.PackedMessageList.UNCOMPRESSED:
+    data = packed_message_list.message_list
+  elif compression == jobs_pb2.PackedMessageList.ZCOMPRESSION:
+    try:
+      data = zlib.decompress(packed_message_list.message_list)
+    except zlib.error as e:
+      raise DecompressionError(f"Failed to decompress: {e}") from e
+  else:
+    raise DecompressionError(f"Compression scheme not supported: {compression}")
+
+  message_list = jobs_pb2.MessageList()
+  try:
+    message_list.ParseFromString(data)
+  except pb_message.DecodeError as e:
+    raise DecompressionError(f"Failed to parse message list: {e}") from e
+
+  return message_list
+
+
+def GetGrrStatus(message: jobs_pb2.GrrMessage) -> jobs_pb2.GrrStatus:
+  """Returns the `GrrStatus` payload of a status message.
+
+  Args:
+    message: A `GrrMessage` of the `STATUS` type.
+
+  Returns:
+    The status carried by the message.
+
+  Raises:
+    ValueError: If the message doesn't carry a `GrrStatus` payload.
+  """
+  if message.args_rdf_name != _GRR_STATUS_RDF_NAME:
+    raise ValueError(
+        f"Expected a {_GRR_STATUS_RDF_NAME} payload, got: "
+        f"{message.args_rdf_name!r}"
+    )
+  return jobs_pb2.GrrStatus.FromString(message.args)
+
+
+def MigrateDeprecatedCpuTime(message: jobs_pb2.GrrMessage) -> None:
+  """Moves deprecated CPU time fields of a status message to the new ones.
+
+  Old clients report the CPU time used in the `deprecated_*_cpu_time` fields
+  of `CpuSeconds`. Messages that don't carry a status or that don't use the
+  deprecated fields are left untouched.
+
+  Args:
+    message: A `GrrMessage` to update in place.
+  """
+  if message.type != jobs_pb2.GrrMessage.STATUS:
+    return
+  if message.args_rdf_name != _GRR_STATUS_RDF_NAME:
+    return
+
+  status = jobs_pb2.GrrStatus.FromString(message.args)
+  cpu_time_used = status.cpu_time_used
+
+  changed = False
+  if cpu_time_used.HasField("deprecated_user_cpu_time"):
+    cpu_time_used.user_cpu_time = cpu_time_used.deprecated_user_cpu_time
+    cpu_time_used.ClearField("deprecated_user_cpu_time")
+    changed = True
+  if cpu_time_used.HasField("deprecated_system_cpu_time"):
+    cpu_time_used.system_cpu_time = cpu_time_used.deprecated_system_cpu_time
+    cpu_time_used.ClearField("deprecated_system_cpu_time")
+    changed = True
+
+  if changed:
+    message.args = status.SerializeToString()
+
+
+def _PayloadTypeURL(rdf_name: str) -> Optional[str]:
+  """Returns the `Any` type URL of a payload with the given RDF class name."""
+  cls = rdfvalue.RDFValue.classes.get(rdf_name)
+  if cls is None or not issubclass(cls, rdf_structs.RDFProtoStruct):
+    return None
+  if issubclass(cls, rdf_structs.AnyValue) or cls.protobuf is None:
+    return None
+  return rdf_structs.TypeURL(cls)
+
+
+def FlowResponseForLegacyResponse(
+    message: jobs_pb2.GrrMessage,
+    client_id: str,
+    flow_id: str,
+) -> Optional[FlowResponseProto]:
+  """Converts a legacy client reply to a flow response without RDF values.
+
+  This is the proto counterpart of `flow_objects.FlowResponseForLegacyResponse`.
+  Replies with payloads that aren't backed by a proto message (e.g. plain RDF
+  integers) have no proto-native representation and have to be converted with
+  the RDF helper instead.
+
+  Args:
+    message: A reply received from the client.
+    client_id: An id of the client the reply belongs to.
+    flow_id: An id of the flow the reply belongs to.
+
+  Returns:
+    A flow response, status or iterator proto or `None` if the payload of the
+    reply has no proto-native representation.
+
+  Raises:
+    ValueError: If the reply can't be converted.
+  """
+  if message.type == jobs_pb2.GrrMessage.MESSAGE:
+    response = flows_pb2.FlowResponse(
+        client_id=client_id,
+        flow_id=flow_id,
+        request_id=message.request_id,
+        response_id=message.response_id,
+    )
+    if not message.args_rdf_name:
+      logging.warning("Unexpected payload type: %s", type(None))
+      return response
+
+    type_url = _PayloadTypeURL(message.args_rdf_name)
+    if type_url is None:
+      return None
+
+    response.payload.type_url = type_url
+    response.payload.value = message.args
+    response.any_payload.CopyFrom(response.payload)
+    return response
+
+  if message.type == jobs_pb2.GrrMessage.STATUS:
+    status = GetGrrStatus(message)
+    if status.status not in _STATUS_MAP:
+      raise ValueError(f"Unable to convert returned status: {status.status}")
+
+    response = flows_pb2.FlowStatus(
+        client_id=client_id,
+        flow_id=flow_id,
+        request_id=message.request_id,
+        response_id=message.response_id,
+        status=_STATUS_MAP[status.status],
+        error_message=status.error_message,
+        backtrace=status.backtrace,
+        network_bytes_sent=status.network_bytes_sent,
+    )
+    response.cpu_time_used.CopyFrom(status.cpu_time_used)
+    if status.HasField("runtime_us"):
+      response.runtime_us = status.runtime_us
+    return response
+
+  if message.type == jobs_pb2.GrrMessage.ITERATOR:
+    return flows_pb2.FlowIterator(
+        client_id=client_id,
+        flow_id=flow_id,
+        request_id=message.request_id,
+        response_id=message.response_id,
+    )
+
+  raise ValueError(f"Unknown message type: {message.type}")
+
+
+def MessageHandlerRequestForLegacyMessage(
+    message: jobs_pb2.GrrMessage,
+    client_id: str,
+    handler_name: str,
+    request_id: int,
+) -> objects_pb2.MessageHandlerRequest:
+  """Wraps a message addressed to a well-known session into a handler request.
+
+  Args:
+    message: A message received from the client.
+    client_id: An id of the client that sent the message.
+    handler_name: A name of the handler to process the message.
+    request_id: An id of the request.
+
+  Returns:
+    A message handler request carrying the payload of the message.
+  """
+  request = objects_pb2.MessageHandlerRequest(
+      client_id=client_id,
+      handler_name=handler_name,
+      request_id=request_id,
+  )
+  if message.args_rdf_name:
+    request.request.name = message.args_rdf_name
+    request.request.data = message.args
+  return request
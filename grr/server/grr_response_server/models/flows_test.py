@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+import zlib
+
+from absl.testing import absltest
+
+from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.rdfvalues import client_fs as rdf_client_fs
+from grr_response_core.lib.rdfvalues import client_stats as rdf_client_stats
+from grr_response_core.lib.rdfvalues import flows as rdf_flows
+from grr_response_core.lib.rdfvalues import mig_flows
+from grr_response_proto import jobs_pb2
+from grr_response_server.models import flows as models_flows
+from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
+from grr_response_server.rdfvalues import mig_flow_objects
+
+_CLIENT_ID = "C.1234567890123456"
+_FLOW_ID = "ABCDEF12"
+_SESSION_ID = f"aff4:/{_CLIENT_ID}/{_FLOW_ID}"
+
+
+def _LegacyFlowResponse(message: rdf_flows.GrrMessage):
+  response = rdf_flow_objects.FlowResponseForLegacyResponse(message)
+  if isinstance(response, rdf_flow_objects.FlowStatus):
+    return mig_flow_objects.ToProtoFlowStatus(response)
+  if isinstance(response, rdf_flow_objects.FlowIterator):
+    return mig_flow_objects.ToProtoFlowIterator(response)
+  return mig_flow_objects.ToProtoFlowResponse(response)
+
+
+class FlowResponseForLegacyResponseTest(absltest.TestCase):
+
+  def _AssertSameAsLegacy(self, message: rdf_flows.GrrMessage):
+    response = models_flows.FlowResponseForLegacyResponse(
+        mig_flows.ToProtoGrrMessage(message),
+        client_id=_CLIENT_ID,
+        flow_id=_FLOW_ID,
+    )
+    self.assertEqual(response, _LegacyFlowResponse(message))
+
+  def testMessage(self):
+    self._AssertSameAsLegacy(
+        rdf_flows.GrrMessage(
+            session_id=_SESSION_ID,
+            request_id=1,
+            response_id=2,
+            payload=rdf_client_fs.StatEntry(st_size=42, st_mode=0o644),
+        )
+    )
+
+  def testMessageWithoutPayload(self):
+    self._AssertSameAsLegacy(
+        rdf_flows.GrrMessage(session_id=_SESSION_ID, request_id=1)
+    )
+
+  def testStatus(self):
+    self._AssertSameAsLegacy(
+        rdf_flows.GrrMessage(
+            session_id=_SESSION_ID,
+            request_id=1,
+            response_id=3,
+            type=rdf_flows.GrrMessage.Type.STATUS,
+            payload=rdf_flows.GrrStatus(
+                status=rdf_flows.GrrStatus.ReturnedStatus.GENERIC_ERROR,
+                error_message="foo",
+                backtrace="bar",
+                network_bytes_sent=1024,
+                runtime_us=rdfvalue.Duration.From(5, rdfvalue.SECONDS),
+                cpu_time_used=rdf_client_stats.CpuSeconds(
+                    user_cpu_time=1.5, system_cpu_time=0.5
+                ),
+            ),
+        )
+    )
+
+  def testEmptyStatus(self):
+    self._AssertSameAsLegacy(
+        rdf_flows.GrrMessage(
+            session_id=_SESSION_ID,
+            request_id=1,
+            type=rdf_flows.GrrMessage.Type.STATUS,
+            payload=rdf_flows.GrrStatus(),
+        )
+    )
+
+  def testIterator(self):
+    self._AssertSameAsLegacy(
+        rdf_flows.GrrMessage(
+            session_id=_SESSION_ID,
+            request_id=1,
+            response_id=4,
+            type=rdf_flows.GrrMessage.Type.ITERATOR,
+        )
+    )
+
+  def testPrimitivePayloadHasNoProtoRepresentation(self):
+    message = rdf_flows.GrrMessage(
+        session_id=_SESSION_ID, payload=rdfvalue.RDFInteger(42)
+    )
+    response = models_flows.FlowResponseForLegacyResponse(
+        mig_flows.ToProtoGrrMessage(message),
+        client_id=_CLIENT_ID,
+        flow_id=_FLOW_ID,
+    )
+    self.assertIsNone(response)
+
+  def testUnsupportedStatusRaises(self):
+    message = rdf_flows.GrrMessage(
+        session_id=_SESSION_ID,
+        type=rdf_flows.GrrMessage.Type.STATUS,
+        payload=rdf_flows.GrrStatus(
+            status=rdf_flows.GrrStatus.ReturnedStatus.WORKER_STUCK
+        ),
+    )
+    with self.assertRaises(ValueError):
+      models_flows.FlowResponseForLegacyResponse(
+          mig_flows.ToProtoGrrMessage(message),
+          client_id=_CLIENT_ID,
+          flow_id=_FLOW_ID,
+      )
+
+
+class MigrateDeprecatedCpuTimeTest(absltest.TestCase):
+
+  def testMovesDeprecatedFields(self):
+    status = jobs_pb2.GrrStatus()
+    status.cpu_time_used.deprecated_user_cpu_time = 1.5
+    status.cpu_time_used.deprecated_system_cpu_time = 0.5
+    message = jobs_pb2.GrrMessage(
+        type=jobs_pb2.GrrMessage.STATUS,
+        args_rdf_name="GrrStatus",
+        args=status.SerializeToString(),
+    )
+
+    models_flows.MigrateDeprecatedCpuTime(message)
+
+    cpu_time_used = models_flows.GetGrrStatus(message).cpu_time_used
+    self.assertEqual(cpu_time_used.user_cpu_time, 1.5)
+    self.assertEqual(cpu_time_used.system_cpu_time, 0.5)
+    self.assertFalse(cpu_time_used.HasField("deprecated_user_cpu_time"))
+    self.assertFalse(cpu_time_used.HasField("deprecated_system_cpu_time"))
+
+  def testLeavesCurrentFieldsIntact(self):
+    status = jobs_pb2.GrrStatus()
+    status.cpu_time_used.user_cpu_time = 1.5
+    message = jobs_pb2.GrrMessage(
+        type=jobs_pb2.GrrMessage.STATUS,
+        args_rdf_name="GrrStatus",
+        args=status.SerializeToString(),
+    )
+    args = message.args
+
+    models_flows.MigrateDeprecatedCpuTime(message)
+
+    self.assertEqual(message.args, args)
+
+
+class DecompressMessageListTest(absltest.TestCase):
+
+  def _MessageList(self) -> jobs_pb2.MessageList:
+    return jobs_pb2.MessageList(
+        job=[
+            jobs_pb2.GrrMessage(session_id=_SESSION_ID, request_id=i)
+            for i in range(3)
+        ]
+    )
+
+  def testUncompressed(self):
+    message_list = self._MessageList()
+    packed = jobs_pb2.PackedMessageList(
+        message_list=message_list.SerializeToString(),
+        compression=jobs_pb2.PackedMessageList.UNCOMPRESSED,
+    )
+
+    self.assertEqual(models_flows.DecompressMessageList(packed), message_list)
+
+  def testZCompressed(self):
+    message_list = self._MessageList()
+    packed = jobs_pb2.PackedMessageList(
+        message_list=zlib.compress(message_list.SerializeToString()),
+        compression=jobs_pb2.PackedMessageList.ZCOMPRESSION,
+    )
+
+    self.assertEqual(models_flows.DecompressMessageList(packed), message_list)
+
+  def testCorruptedDataRaises(self):
+    packed = jobs_pb2.PackedMessageList(
+        message_list=b"foobar",
+        compression=jobs_pb2.PackedMessageList.ZCOMPRESSION,
+    )
+
+    with self.assertRaises(models_flows.DecompressionError):
+      models_flows.DecompressMessageList(packed)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -2,9 +2,20 @@
 """Provides path-related data models and helpers."""
 
 from collections.abc import Iterable
+import stat
 from typing import Optional
+
+from grr_response_proto import jobs_pb2
 from grr_response_proto import objects_pb2
 
+_PATH_TYPE_BY_PATHSPEC_PATH_TYPE = {
+    jobs_pb2.PathSpec.PathType.OS: objects_pb2.PathInfo.PathType.OS,
+    jobs_pb2.PathSpec.PathType.TSK: objects_pb2.PathInfo.PathType.TSK,
+    jobs_pb2.PathSpec.PathType.REGISTRY: objects_pb2.PathInfo.PathType.REGISTRY,
+    jobs_pb2.PathSpec.PathType.TMPFILE: objects_pb2.PathInfo.PathType.TEMP,
+    jobs_pb2.PathSpec.PathType.NTFS: objects_pb2.PathInfo.PathType.NTFS,
+}
+
 
 def IsRootPathInfo(path_info: objects_pb2.PathInfo) -> bool:
   return not bool(path_info.components)
@@ -53,3 +64,71 @@ def GetAncestorPathInfos(
     if current is None:
       return
     yield current
+
+
+def _PathSpecElements(
+    pathspec: jobs_pb2.PathSpec,
+) -> Iterable[jobs_pb2.PathSpec]:
+  element = pathspec
+  while element.HasField("pathtype"):
+    yield element
+
+    if element.HasField("nested_path"):
+      element = element.nested_path
+    else:
+      break
+
+
+def PathInfoFromPathSpec(pathspec: jobs_pb2.PathSpec) -> objects_pb2.PathInfo:
+  """Creates a path info corresponding to the given pathspec.
+
+  Args:
+    pathspec: Pathspec to create the path info for.
+
+  Returns:
+    Instance of `PathInfo`.
+
+  Raises:
+    ValueError: If the type of the innermost pathspec is not supported.
+  """
+  elements = list(_PathSpecElements(pathspec))
+
+  last = pathspec
+  if elements and pathspec.pathtype != jobs_pb2.PathSpec.PathType.UNSET:
+    last = elements[-1]
+
+  try:
+    path_type = _PATH_TYPE_BY_PATHSPEC_PATH_TYPE[last.pathtype]
+  except KeyError:
+    raise ValueError(f"Unexpected path type: {last.pathtype}") from None
+
+  components = []
+  for element in elements:
+    path = element.path
+    if element.offset:
+      path += f":{element.offset}"
+    if element.stream_name:
+      path += f":{element.stream_name}"
+
+    # Paths may or may not start with `/` and may contain repeated `/`, see
+    # `rdf_objects.PathInfo.FromPathSpec`.
+    components.extend(component for component in path.split("/") if component)
+
+  return objects_pb2.PathInfo(path_type=path_type, components=components)
+
+
+def PathInfoFromStatEntry(
+    stat_entry: jobs_pb2.StatEntry,
+) -> objects_pb2.PathInfo:
+  """Creates a path info corresponding to the given stat entry.
+
+  Args:
+    stat_entry: Stat entry to create the path info for.
+
+  Returns:
+    Instance of `PathInfo` with the stat entry attached.
+  """
+  path_info = PathInfoFromPathSpec(stat_entry.pathspec)
+  path_info.directory = stat.S_ISDIR(stat_entry.st_mode)
+  path_info.stat_entry.CopyFrom(stat_entry)
+  return path_info
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 from absl.testing import absltest
 
+from grr_response_core.lib.rdfvalues import mig_client_fs
+from grr_response_proto import jobs_pb2
 from grr_response_proto import objects_pb2
 from grr_response_server.models import paths as models_paths
 from grr_response_server.rdfvalues import mig_objects
+from grr_response_server.rdfvalues import objects as rdf_objects
 
 
 class IsRootPathInfoTest(absltest.TestCase):
@@ -135,5 +138,99 @@ class GetAncestorPathInfosTest(absltest.TestCase):
       self.assertEqual(results[i].path_type, rdf_results[i].path_type)
 
 
+class PathInfoFromStatEntryTest(absltest.TestCase):
+
+  def _AssertMatchesRDF(self, stat_entry: jobs_pb2.StatEntry):
+    path_info = models_paths.PathInfoFromStatEntry(stat_entry)
+
+    # TODO: Remove when rdf_objects.PathInfo is removed.
+    rdf_path_info = rdf_objects.PathInfo.FromStatEntry(
+        mig_client_fs.ToRDFStatEntry(stat_entry)
+    )
+    self.assertEqual(path_info, mig_objects.ToProtoPathInfo(rdf_path_info))
+
+    return path_info
+
+  def testOS(self):
+    stat_entry = jobs_pb2.StatEntry(
+        pathspec=jobs_pb2.PathSpec(
+            pathtype=jobs_pb2.PathSpec.PathType.OS, path="/foo/bar//baz"
+        ),
+        st_mode=0o100644,
+        st_size=42,
+    )
+
+    path_info = self._AssertMatchesRDF(stat_entry)
+    self.assertEqual(path_info.path_type, objects_pb2.PathInfo.PathType.OS)
+    self.assertEqual(path_info.components, ["foo", "bar", "baz"])
+    self.assertFalse(path_info.directory)
+    self.assertEqual(path_info.stat_entry, stat_entry)
+
+  def testDirectory(self):
+    stat_entry = jobs_pb2.StatEntry(
+        pathspec=jobs_pb2.PathSpec(
+            pathtype=jobs_pb2.PathSpec.PathType.OS, path="/foo"
+        ),
+        st_mode=0o40755,
+    )
+
+    path_info = self._AssertMatchesRDF(stat_entry)
+    self.assertTrue(path_info.directory)
+
+  def testTmpFile(self):
+    stat_entry = jobs_pb2.StatEntry(
+        pathspec=jobs_pb2.PathSpec(
+            pathtype=jobs_pb2.PathSpec.PathType.TMPFILE, path="/tmp/foo"
+        ),
+    )
+
+    path_info = self._AssertMatchesRDF(stat_entry)
+    self.assertEqual(path_info.path_type, objects_pb2.PathInfo.PathType.TEMP)
+
+  def testNested(self):
+    stat_entry = jobs_pb2.StatEntry(
+        pathspec=jobs_pb2.PathSpec(
+            pathtype=jobs_pb2.PathSpec.PathType.OS,
+            path="/dev/sda1",
+            nested_path=jobs_pb2.PathSpec(
+                pathtype=jobs_pb2.PathSpec.PathType.TSK,
+                path="/foo/bar",
+                stream_name="baz",
+            ),
+        ),
+    )
+
+    path_info = self._AssertMatchesRDF(stat_entry)
+    self.assertEqual(path_info.path_type, objects_pb2.PathInfo.PathType.TSK)
+    self.assertEqual(path_info.components, ["dev", "sda1", "foo", "bar:baz"])
+
+  def testOffset(self):
+    stat_entry = jobs_pb2.StatEntry(
+        pathspec=jobs_pb2.PathSpec(
+            pathtype=jobs_pb2.PathSpec.PathType.OS,
+            path="/dev/sda",
+            offset=1024,
+            nested_path=jobs_pb2.PathSpec(
+                pathtype=jobs_pb2.PathSpec.PathType.NTFS,
+                path="/foo",
+            ),
+        ),
+    )
+
+    path_info = self._AssertMatchesRDF(stat_entry)
+    self.assertEqual(path_info.path_type, objects_pb2.PathInfo.PathType.NTFS)
+    self.assertEqual(path_info.components, ["dev", "sda:1024", "foo"])
+
+  def testUnsupportedPathType(self):
+    stat_entry = jobs_pb2.StatEntry(
+        pathspec=jobs_pb2.PathSpec(
+            pathtype=jobs_pb2.PathSpec.PathType.UNSET, path="/foo"
+        ),
+    )
+
+    with self.assertRaises(ValueError):
+      models_paths.PathInfoFromStatEntry(stat_entry)
+
+
 if __name__ == "__main__":
   absltest.main()
@@ -1,10 +1,40 @@
 #!/usr/bin/env python
 """Provides conversion functions to be used during RDFProtoStruct migration."""
 
+from typing import Any, Iterable, Optional, Union
+
 from grr_response_proto import flows_pb2
 from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
 
 
+_RDF_FLOW_RESPONSE_CLASSES = {
+    flows_pb2.FlowResponse: rdf_flow_objects.FlowResponse,
+    flows_pb2.FlowStatus: rdf_flow_objects.FlowStatus,
+    flows_pb2.FlowIterator: rdf_flow_objects.FlowIterator,
+}
+
+_PROTO_FLOW_RESPONSE_CLASSES = {
+    rdf_cls: proto_cls
+    for proto_cls, rdf_cls in _RDF_FLOW_RESPONSE_CLASSES.items()
+}
+
+
+def _ConverterClass(
+    classes: dict[type[Any], type[Any]], value: Any
+) -> Optional[type[Any]]:
+  """Returns the class to convert the value to or None for unknown types."""
+  # Exact type lookup is the fast path, subclasses fall back to isinstance.
+  result = classes.get(type(value))
+  if result is not None:
+    return result
+
+  for cls, result in classes.items():
+    if isinstance(value, cls):
+      return result
+
+  return None
+
+
 def ToProtoFlowRequest(
     rdf: rdf_flow_objects.FlowRequest,
 ) -> flows_pb2.FlowRequest:
@@ -14,7 +44,7 @@ def ToProtoFlowRequest(
 def ToRDFFlowRequest(
     proto: flows_pb2.FlowRequest,
 ) -> rdf_flow_objects.FlowRequest:
-  return rdf_flow_objects.FlowRequest.FromSerializedBytes(
+  return rdf_flow_objects.FlowRequest.FromSerializedBytesLazy(
       proto.SerializeToString()
   )
 
@@ -28,7 +58,7 @@ def ToProtoFlowResponse(
 def ToRDFFlowResponse(
     proto: flows_pb2.FlowResponse,
 ) -> rdf_flow_objects.FlowResponse:
-  return rdf_flow_objects.FlowResponse.FromSerializedBytes(
+  return rdf_flow_objects.FlowResponse.FromSerializedBytesLazy(
       proto.SerializeToString()
   )
 
@@ -42,7 +72,7 @@ def ToProtoFlowIterator(
 def ToRDFFlowIterator(
     proto: flows_pb2.FlowIterator,
 ) -> rdf_flow_objects.FlowIterator:
-  return rdf_flow_objects.FlowIterator.FromSerializedBytes(
+  return rdf_flow_objects.FlowIterator.FromSerializedBytesLazy(
       proto.SerializeToString()
   )
 
@@ -52,17 +82,57 @@ def ToProtoFlowStatus(rdf: rdf_flow_objects.FlowStatus) -> flows_pb2.FlowStatus:
 
 
 def ToRDFFlowStatus(proto: flows_pb2.FlowStatus) -> rdf_flow_objects.FlowStatus:
-  return rdf_flow_objects.FlowStatus.FromSerializedBytes(
+  return rdf_flow_objects.FlowStatus.FromSerializedBytesLazy(
       proto.SerializeToString()
   )
 
 
+def ToRDFFlowResponses(
+    protos: Iterable[
+        Union[flows_pb2.FlowResponse, flows_pb2.FlowStatus, flows_pb2.FlowIterator]
+    ],
+) -> list[
+    Union[
+        rdf_flow_objects.FlowResponse,
+        rdf_flow_objects.FlowStatus,
+        rdf_flow_objects.FlowIterator,
+    ]
+]:
+  """Converts a list of flow responses, statuses and iterators in bulk."""
+  result = []
+  for proto in protos:
+    rdf_cls = _ConverterClass(_RDF_FLOW_RESPONSE_CLASSES, proto)
+    if rdf_cls is not None:
+      result.append(rdf_cls.FromSerializedBytesLazy(proto.SerializeToString()))
+  return result
+
+
+def ToProtoFlowResponses(
+    rdfs: Iterable[
+        Union[
+            rdf_flow_objects.FlowResponse,
+            rdf_flow_objects.FlowStatus,
+            rdf_flow_objects.FlowIterator,
+        ]
+    ],
+) -> list[
+    Union[flows_pb2.FlowResponse, flows_pb2.FlowStatus, flows_pb2.FlowIterator]
+]:
+  """Converts a list of RDF flow responses, statuses and iterators in bulk."""
+  result = []
+  for rdf in rdfs:
+    proto_cls = _ConverterClass(_PROTO_FLOW_RESPONSE_CLASSES, rdf)
+    if proto_cls is not None:
+      result.append(proto_cls.FromString(rdf.SerializeToBytes()))
+  return result
+
+
 def ToProtoFlowResult(rdf: rdf_flow_objects.FlowResult) -> flows_pb2.FlowResult:
   return rdf.AsPrimitiveProto()
 
 
 def ToRDFFlowResult(proto: flows_pb2.FlowResult) -> rdf_flow_objects.FlowResult:
-  return rdf_flow_objects.FlowResult.FromSerializedBytes(
+  return rdf_flow_objects.FlowResult.FromSerializedBytesLazy(
       proto.SerializeToString()
   )
 
@@ -110,7 +180,9 @@ def ToProtoFlow(rdf: rdf_flow_objects.Flow) -> flows_pb2.Flow:
 
 
 def ToRDFFlow(proto: flows_pb2.Flow) -> rdf_flow_objects.Flow:
-  return rdf_flow_objects.Flow.FromSerializedBytes(proto.SerializeToString())
+  return rdf_flow_objects.Flow.FromSerializedBytesLazy(
+      proto.SerializeToString()
+  )
 
 
 def ToProtoScheduledFlow(
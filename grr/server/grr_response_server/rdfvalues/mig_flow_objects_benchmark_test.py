@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""Benchmarks for conversions between flow protos and RDF values."""
+
+from absl import app
+
+from grr_response_core.lib.rdfvalues import client_fs as rdf_client_fs
+from grr_response_core.lib.rdfvalues import flows as rdf_flows
+from grr_response_core.lib.rdfvalues import mig_flows
+from grr_response_core.lib.rdfvalues import paths as rdf_paths
+from grr_response_proto import flows_pb2
+from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
+from grr_response_server.rdfvalues import mig_flow_objects
+from grr.test_lib import benchmark_test_lib
+from grr.test_lib import test_lib
+
+
+def _EagerToRDF(rdf_cls, proto):
+  """Converts the proto the way all `mig_*.ToRDF*` helpers used to."""
+  return rdf_cls.FromSerializedBytes(proto.SerializeToString())
+
+
+class MigFlowObjectsBenchmark(benchmark_test_lib.AverageMicroBenchmarks):
+  """Compares eager, lazy and bulk RDF<->proto conversions."""
+
+  REPEATS = 20
+  NUM_VALUES = 1000
+
+  def _StatEntry(self, i):
+    return rdf_client_fs.StatEntry(
+        pathspec=rdf_paths.PathSpec.OS(path="/home/user/file%d" % i),
+        st_mode=0o100644,
+        st_size=i * 1024,
+        st_mtime=1_600_000_000 + i,
+    )
+
+  def _GrrMessages(self):
+    return [
+        mig_flows.ToProtoGrrMessage(
+            rdf_flows.GrrMessage(
+                session_id="aff4:/C.1234567890123456/ABCDEF12",
+                request_id=1,
+                response_id=i,
+                payload=self._StatEntry(i),
+            )
+        )
+        for i in range(self.NUM_VALUES)
+    ]
+
+  def _FlowResponses(self):
+    responses = []
+    for i in range(self.NUM_VALUES):
+      response = rdf_flow_objects.FlowResponse(
+          client_id="C.1234567890123456",
+          flow_id="ABCDEF12",
+          request_id=1,
+          response_id=i,
+      )
+      response.payload = self._StatEntry(i)
+      responses.append(mig_flow_objects.ToProtoFlowResponse(response))
+
+    responses.append(
+        flows_pb2.FlowStatus(
+            client_id="C.1234567890123456",
+            flow_id="ABCDEF12",
+            request_id=1,
+            response_id=self.NUM_VALUES,
+            status=flows_pb2.FlowStatus.OK,
+        )
+    )
+    return responses
+
+  def _FlowResults(self):
+    results = []
+    for i in range(self.NUM_VALUES):
+      result = rdf_flow_objects.FlowResult(
+          client_id="C.1234567890123456", flow_id="ABCDEF12", tag="tag"
+      )
+      result.payload = self._StatEntry(i)
+      results.append(mig_flow_objects.ToProtoFlowResult(result))
+    return results
+
+  def testGrrMessages(self):
+    """Converts client messages to RDF values, as the frontend does."""
+    messages = self._GrrMessages()
+
+    self.TimeIt(
+        lambda: [_EagerToRDF(rdf_flows.GrrMessage, m) for m in messages],
+        name="GrrMessage: eager",
+    )
+    self.TimeIt(
+        lambda: [mig_flows.ToRDFGrrMessage(m) for m in messages],
+        name="GrrMessage: lazy",
+    )
+    self.TimeIt(
+        lambda: [mig_flows.ToRDFGrrMessage(m).request_id for m in messages],
+        name="GrrMessage: lazy, accessed",
+    )
+
+  def testFlowResponses(self):
+    """Converts flow responses to RDF values, as flow processing does."""
+    responses = self._FlowResponses()
+
+    def Eager():
+      result = []
+      for r in responses:
+        if isinstance(r, flows_pb2.FlowResponse):
+          result.append(_EagerToRDF(rdf_flow_objects.FlowResponse, r))
+        if isinstance(r, flows_pb2.FlowStatus):
+          result.append(_EagerToRDF(rdf_flow_objects.FlowStatus, r))
+      return result
+
+    self.TimeIt(Eager, name="FlowResponse: eager")
+    self.TimeIt(
+        lambda: mig_flow_objects.ToRDFFlowResponses(responses),
+        name="FlowResponse: bulk",
+    )
+
+  def testFlowResponsesRoundTrip(self):
+    """Converts flow responses to RDF values and writes them back."""
+    responses = self._FlowResponses()
+
+    self.TimeIt(
+        lambda: [
+            _EagerToRDF(rdf_flow_objects.FlowResponse, r).AsPrimitiveProto()
+            for r in responses[:-1]
+        ],
+        name="FlowResponse round trip: eager",
+    )
+    self.TimeIt(
+        lambda: mig_flow_objects.ToProtoFlowResponses(
+            mig_flow_objects.ToRDFFlowResponses(responses)
+        ),
+        name="FlowResponse round trip: bulk",
+    )
+
+  def testFlowResults(self):
+    """Converts flow results to RDF values, as output plugins need."""
+    results = self._FlowResults()
+
+    self.TimeIt(
+        lambda: [_EagerToRDF(rdf_flow_objects.FlowResult, r) for r in results],
+        name="FlowResult: eager",
+    )
+    self.TimeIt(
+        lambda: [mig_flow_objects.ToRDFFlowResult(r) for r in results],
+        name="FlowResult: lazy",
+    )
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+from absl.testing import absltest
+
+from grr_response_core.lib.rdfvalues import client_fs as rdf_client_fs
+from grr_response_proto import flows_pb2
+from grr_response_server.rdfvalues import flow_objects as rdf_flow_objects
+from grr_response_server.rdfvalues import mig_flow_objects
+
+
+class ToRDFFlowResponsesTest(absltest.TestCase):
+
+  def testConvertsAllResponseTypes(self):
+    protos = [
+        flows_pb2.FlowResponse(flow_id="ABCDEF12", request_id=1, response_id=1),
+        flows_pb2.FlowIterator(flow_id="ABCDEF12", request_id=1, response_id=2),
+        flows_pb2.FlowStatus(
+            flow_id="ABCDEF12",
+            request_id=1,
+            response_id=3,
+            status=flows_pb2.FlowStatus.ERROR,
+            error_message="foo",
+        ),
+    ]
+
+    rdfs = mig_flow_objects.ToRDFFlowResponses(protos)
+
+    self.assertEqual(
+        rdfs,
+        [
+            mig_flow_objects.ToRDFFlowResponse(protos[0]),
+            mig_flow_objects.ToRDFFlowIterator(protos[1]),
+            mig_flow_objects.ToRDFFlowStatus(protos[2]),
+        ],
+    )
+    self.assertIsInstance(rdfs[2], rdf_flow_objects.FlowStatus)
+    self.assertEqual(rdfs[2].error_message, "foo")
+
+  def testSkipsUnknownTypes(self):
+    protos = [flows_pb2.FlowRequest(), flows_pb2.FlowResponse(request_id=1)]
+
+    rdfs = mig_flow_objects.ToRDFFlowResponses(protos)
+
+    self.assertLen(rdfs, 1)
+    self.assertEqual(rdfs[0].request_id, 1)
+
+
+class ToProtoFlowResponsesTest(absltest.TestCase):
+
+  def testRoundTrip(self):
+    response = rdf_flow_objects.FlowResponse(
+        flow_id="ABCDEF12", request_id=1, response_id=1
+    )
+    response.payload = rdf_client_fs.StatEntry(st_size=42)
+    rdfs = [
+        response,
+        rdf_flow_objects.FlowIterator(request_id=1, response_id=2),
+        rdf_flow_objects.FlowStatus(
+            request_id=1,
+            response_id=3,
+            status=rdf_flow_objects.FlowStatus.Status.OK,
+        ),
+    ]
+
+    protos = mig_flow_objects.ToProtoFlowResponses(rdfs)
+
+    self.assertEqual(
+        protos,
+        [
+            mig_flow_objects.ToProtoFlowResponse(rdfs[0]),
+            mig_flow_objects.ToProtoFlowIterator(rdfs[1]),
+            mig_flow_objects.ToProtoFlowStatus(rdfs[2]),
+        ],
+    )
+    self.assertEqual(mig_flow_objects.ToRDFFlowResponses(protos), rdfs)
+
+  def testConvertsSubclasses(self):
+
+    class FlowStatusSubclass(rdf_flow_objects.FlowStatus):
+      pass
+
+    rdf = FlowStatusSubclass(request_id=1, error_message="foo")
+
+    protos = mig_flow_objects.ToProtoFlowResponses([rdf])
+
+    self.assertEqual(
+        protos, [flows_pb2.FlowStatus(request_id=1, error_message="foo")]
+    )
+
+  def testLazyValuesAreNotReparsed(self):
+    proto = flows_pb2.FlowResponse(flow_id="ABCDEF12", request_id=1)
+    rdf = mig_flow_objects.ToRDFFlowResponse(proto)
+
+    self.assertEqual(mig_flow_objects.ToProtoFlowResponses([rdf]), [proto])
+    self.assertNotIn("_data", rdf.__dict__)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -21,6 +21,8 @@ Example usage:
 >>> SharedPool().Join()
 """
 
+import collections
+import functools
 import itertools
 import logging
 import queue
@@ -51,6 +53,14 @@ THREADPOOL_WORKING_TIME = metrics.Event(
 THREADPOOL_QUEUEING_TIME = metrics.Event(
     "threadpool_queueing_time", fields=[("pool_name", str)]
 )
+THREADPOOL_LANE_OUTSTANDING_TASKS = metrics.Gauge(
+    "threadpool_lane_outstanding_tasks",
+    int,
+    fields=[("pool_name", str), ("lane", str)],
+)
+THREADPOOL_LANE_QUEUEING_TIME = metrics.Event(
+    "threadpool_lane_queueing_time", fields=[("pool_name", str), ("lane", str)]
+)
 
 
 class Error(Exception):
@@ -69,6 +79,97 @@ class Full(Error):
   """Raised when the threadpool is full."""
 
 
+class _LaneQueue(object):
+  """A queue with bounded lanes that are served in the order of priority.
+
+  The queue implements the subset of the queue.Queue interface used by
+  ThreadPool and its workers. Tasks are put into the lane given as their last
+  element; `get` always returns the oldest task of the first non-empty lane.
+  STOP_MESSAGEs are not bounded and only returned once all lanes are drained.
+  """
+
+  def __init__(self, lanes):
+    """Initializer.
+
+    Args:
+      lanes: A sequence of (lane name, maximum queue size) tuples, from the
+        highest to the lowest priority.
+    """
+    if not lanes:
+      raise ValueError("At least one lane is required.")
+
+    self.lane_names = [name for name, _ in lanes]
+    self._maxsizes = dict(lanes)
+    self._lanes = {name: collections.deque() for name in self.lane_names}
+    self._size = 0
+    self._stop_messages = 0
+
+    self._mutex = threading.Lock()
+    self._not_empty = threading.Condition(self._mutex)
+    self._not_full = threading.Condition(self._mutex)
+
+  def put(self, item, block=True, timeout=None):
+    """Puts a task into its lane, see queue.Queue.put."""
+    with self._not_full:
+      if item == STOP_MESSAGE:
+        self._stop_messages += 1
+        self._not_empty.notify()
+        return
+
+      lane = self._lanes[item[-1]]
+      maxsize = self._maxsizes[item[-1]]
+      if len(lane) >= maxsize:
+        if not block:
+          raise queue.Full()
+        if not self._not_full.wait_for(
+            lambda: len(lane) < maxsize, timeout=timeout
+        ):
+          raise queue.Full()
+
+      lane.append(item)
+      self._size += 1
+      self._not_empty.notify()
+
+  def get(self, block=True, timeout=None):
+    """Gets a task from the first non-empty lane, see queue.Queue.get."""
+    with self._not_empty:
+      if not self._not_empty.wait_for(
+          lambda: self._size or self._stop_messages,
+          timeout=timeout if block else 0,
+      ):
+        raise queue.Empty()
+
+      for lane in self._lanes.values():
+        if lane:
+          self._size -= 1
+          # Producers wait for a specific lane, so all of them are woken up.
+          self._not_full.notify_all()
+          return lane.popleft()
+
+      self._stop_messages -= 1
+      return STOP_MESSAGE
+
+  def task_done(self):
+    pass
+
+  def qsize(self):
+    return self._size + self._stop_messages
+
+  def empty(self):
+    return not self.qsize()
+
+  def lane_qsize(self, lane):
+    return len(self._lanes[lane])
+
+  def lane_free_slots(self, lane):
+    with self._mutex:
+      return self._maxsizes[lane] - len(self._lanes[lane])
+
+  @property
+  def maxsize(self):
+    return sum(self._maxsizes.values())
+
+
 class _WorkerThread(threading.Thread):
   """The workers used in the ThreadPool class."""
 
@@ -82,7 +183,7 @@ class _WorkerThread(threading.Thread):
       message_queue: A queue.Queue object used by the ThreadPool class to
         communicate with the workers. When a new task arrives, the ThreadPool
         notifies the workers by putting a message into this queue that has the
-        format (target, args, name, queueing_time).
+        format (target, args, name, queueing_time, lane).
 
         target - A callable, the function to call.
         args - A tuple of positional arguments to target. Keyword arguments
@@ -91,6 +192,8 @@ class _WorkerThread(threading.Thread):
                the threading library.
         queueing_time - The timestamp when this task was queued as returned by
                         time.time().
+        lane - The lane the task was queued in or None if the pool has no
+               lanes.
 
         Or, alternatively, the message in the queue can be STOP_MESSAGE
         which indicates that the worker should terminate.
@@ -107,7 +210,7 @@ class _WorkerThread(threading.Thread):
     self.idle = True
     self.started = time.time()
 
-  def ProcessTask(self, target, args, name, queueing_time):
+  def ProcessTask(self, target, args, name, queueing_time, lane=None):
     """Processes the tasks."""
 
     if self.pool.name:
@@ -115,6 +218,10 @@ class _WorkerThread(threading.Thread):
       THREADPOOL_QUEUEING_TIME.RecordEvent(
           time_in_queue, fields=[self.pool.name]
       )
+      if lane is not None:
+        THREADPOOL_LANE_QUEUEING_TIME.RecordEvent(
+            time_in_queue, fields=[self.pool.name, lane]
+        )
 
       start_time = time.time()
     try:
@@ -175,7 +282,10 @@ class _WorkerThread(threading.Thread):
           if task == STOP_MESSAGE:
             return
 
-          self.ProcessTask(*task)
+          try:
+            self.ProcessTask(*task)
+          finally:
+            self.pool._TaskDone()  # pylint: disable=protected-access
         finally:
           self._queue.task_done()
 
@@ -209,6 +319,11 @@ class ThreadPool(object):
   When threads are idle longer than 60 seconds they automatically exit. This
   ensures that our memory footprint is reduced when load is light.
 
+  A pool can optionally be created with priority lanes. Every lane has its own
+  bounded queue and idle workers always pick the oldest task of the highest
+  priority non-empty lane, so e.g. interactive work isn't stuck behind a long
+  backlog of batch work.
+
   Note that this class should not be instantiated directly, but the Factory
   should be used.
   """
@@ -220,7 +335,7 @@ class ThreadPool(object):
   JOIN_TIMEOUT_DECISECONDS = 600
 
   @classmethod
-  def Factory(cls, name, min_threads, max_threads=None):
+  def Factory(cls, name, min_threads, max_threads=None, lanes=None):
     """Creates a new thread pool with the given name.
 
     If the thread pool of this name already exist, we just return the existing
@@ -232,6 +347,8 @@ class ThreadPool(object):
       min_threads: The number of threads in the pool.
       max_threads: The maximum number of threads to grow the pool to. If not set
         we do not grow the pool.
+      lanes: If set, a sequence of (lane name, maximum queue size) tuples, from
+        the highest to the lowest priority.
 
     Returns:
       A threadpool instance.
@@ -240,12 +357,12 @@ class ThreadPool(object):
       result = cls.POOLS.get(name)
       if result is None:
         cls.POOLS[name] = result = cls(
-            name, min_threads, max_threads=max_threads
+            name, min_threads, max_threads=max_threads, lanes=lanes
         )
 
       return result
 
-  def __init__(self, name, min_threads, max_threads=None):
+  def __init__(self, name, min_threads, max_threads=None, lanes=None):
     """This creates a new thread pool using min_threads workers.
 
     Args:
@@ -253,6 +370,9 @@ class ThreadPool(object):
       min_threads: The minimum number of worker threads this pool should have.
       max_threads: The maximum number of threads to grow the pool to. If not set
         we do not grow the pool.
+      lanes: If set, a sequence of (lane name, maximum queue size) tuples, from
+        the highest to the lowest priority. Tasks are queued in per-lane queues
+        instead of a single FIFO queue of max_threads tasks.
 
     Raises:
       threading.ThreadError: If no threads can be spawned at all, ThreadError
@@ -265,7 +385,12 @@ class ThreadPool(object):
       max_threads = min_threads
 
     self.max_threads = max_threads
-    self._queue = queue.Queue(maxsize=max_threads)
+    if lanes:
+      self._queue = _LaneQueue(lanes)
+      self.lanes = self._queue.lane_names
+    else:
+      self._queue = queue.Queue(maxsize=max_threads)
+      self.lanes = None
     self.name = name
     self.started = False
     self.process = psutil.Process()
@@ -277,6 +402,10 @@ class ThreadPool(object):
     self._workers_ro_copy = {}
     self.lock = threading.RLock()
 
+    # Number of tasks that are queued or being processed.
+    self._outstanding_tasks = 0
+    self._outstanding_tasks_lock = threading.Lock()
+
     if not self.name:
       raise ValueError("Unnamed thread pools not allowed.")
 
@@ -289,6 +418,11 @@ class ThreadPool(object):
         self._queue.qsize, fields=[self.name]
     )
     THREADPOOL_THREADS.SetCallback(lambda: len(self), fields=[self.name])
+    for lane in self.lanes or ():
+      THREADPOOL_LANE_OUTSTANDING_TASKS.SetCallback(
+          functools.partial(self._queue.lane_qsize, lane),
+          fields=[self.name, lane],
+      )
 
   def __del__(self):
     if self.started:
@@ -303,6 +437,52 @@ class ThreadPool(object):
   def busy_threads(self):
     return len([x for x in self._workers_ro_copy.values() if not x.idle])
 
+  def FreeCapacity(self, lane=None):
+    """Returns how many more tasks the pool can take without blocking.
+
+    This counts tasks that are queued but not yet picked up by a worker, so
+    unlike `max_threads - busy_threads` it doesn't overestimate the capacity
+    right after tasks were added. Pools with lanes also count the free space
+    of the lane queues; tasks added to a full lane still block.
+
+    Args:
+      lane: If set, the number of tasks that can be added to this lane without
+        blocking is returned instead.
+
+    Returns:
+      The number of tasks that can be added without blocking.
+
+    Raises:
+      ValueError: if the lane is unknown.
+    """
+    capacity = self.max_threads
+    if self.lanes:
+      capacity += self._queue.maxsize
+
+    with self._outstanding_tasks_lock:
+      free_capacity = max(0, capacity - self._outstanding_tasks)
+
+    if lane is not None:
+      if not self.lanes or lane not in self.lanes:
+        raise ValueError("Unknown lane %r in pool %s." % (lane, self.name))
+      free_capacity = min(free_capacity, self._queue.lane_free_slots(lane))
+
+    return free_capacity
+
+  def _TaskDone(self):
+    with self._outstanding_tasks_lock:
+      self._outstanding_tasks -= 1
+
+  def _Put(self, task, block, timeout=None):
+    """Puts a task on the queue and accounts it as outstanding."""
+    with self._outstanding_tasks_lock:
+      self._outstanding_tasks += 1
+    try:
+      self._queue.put(task, block=block, timeout=timeout)
+    except queue.Full:
+      self._TaskDone()
+      raise
+
   def __len__(self):
     return len(self._workers_ro_copy)
 
@@ -368,6 +548,7 @@ class ThreadPool(object):
       name="Unnamed task",
       blocking=True,
       inline=True,
+      lane=None,
   ):
     """Adds a task to be processed later.
 
@@ -382,14 +563,25 @@ class ThreadPool(object):
         blocked because it still ensures some progress is made. However, this
         can generally block the calling thread even after the threadpool is
         available again and therefore decrease efficiency.
+      lane: The lane to queue the task in. Defaults to the highest priority
+        lane. Must not be set for pools without lanes.
 
     Raises:
       ThreadPoolNotStartedError: if the pool was not started yet.
       queue.Full: if the pool is full and can not accept new jobs.
+      ValueError: if the lane is unknown.
     """
     if not self.started:
       raise ThreadPoolNotStartedError(self.name)
 
+    if self.lanes:
+      if lane is None:
+        lane = self.lanes[0]
+      elif lane not in self.lanes:
+        raise ValueError("Unknown lane %r in pool %s." % (lane, self.name))
+    elif lane is not None:
+      raise ValueError("Thread pool %s has no lanes." % self.name)
+
     # This pool should have no worker threads - just run the task inline.
     if self.max_threads == 0:
       target(*args)
@@ -415,7 +607,7 @@ class ThreadPool(object):
 
         try:
           # Push the task on the queue but raise if unsuccessful.
-          self._queue.put((target, args, name, time.time()), block=False)
+          self._Put((target, args, name, time.time(), lane), block=False)
           return
         except queue.Full:
           # We increase the number of active threads if we do not exceed the
@@ -441,8 +633,8 @@ class ThreadPool(object):
           # We should block and try again soon.
           elif blocking:
             try:
-              self._queue.put(
-                  (target, args, name, time.time()), block=True, timeout=1
+              self._Put(
+                  (target, args, name, time.time(), lane), block=True, timeout=1
               )
               return
             except queue.Full:
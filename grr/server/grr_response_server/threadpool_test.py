@@ -355,6 +355,92 @@ class ThreadPoolTest(stats_test_lib.StatsTestMixin, test_lib.GRRBaseTest):
     with self.assertRaises(ValueError):
       threadpool.ThreadPool.Factory(prefix, 10)
 
+  def _StartPool(self, name, max_threads, lanes=None):
+    pool = threadpool.ThreadPool.Factory(
+        name, 1, max_threads=max_threads, lanes=lanes
+    )
+    pool.Start()
+    self.addCleanup(pool.Stop)
+    return pool
+
+  def testFreeCapacityCountsQueuedTasks(self):
+    pool = self._StartPool("free_capacity", 2)
+    done_event = threading.Event()
+    self.assertEqual(pool.FreeCapacity(), 2)
+
+    pool.AddTask(done_event.wait, (), inline=False)
+    pool.AddTask(done_event.wait, (), inline=False)
+    # No need to wait for workers to pick the tasks up.
+    self.assertEqual(pool.FreeCapacity(), 0)
+
+    done_event.set()
+    pool.Join()
+    self.assertEqual(pool.FreeCapacity(), 2)
+
+  def testFreeCapacityIncludesLaneQueues(self):
+    pool = self._StartPool(
+        "free_capacity_lanes", 2, lanes=[("high", 3), ("low", 5)]
+    )
+    self.assertEqual(pool.FreeCapacity(), 10)
+
+  def testFreeCapacityOfLane(self):
+    pool = self._StartPool(
+        "free_capacity_of_lane", 1, lanes=[("high", 3), ("low", 2)]
+    )
+    done_event = threading.Event()
+    self.addCleanup(done_event.set)
+
+    pool.AddTask(done_event.wait, (), inline=False)
+    self.WaitUntil(lambda: pool.busy_threads == 1)
+    pool.AddTask(lambda: None, (), inline=False, lane="low")
+
+    self.assertEqual(pool.FreeCapacity(lane="high"), 3)
+    self.assertEqual(pool.FreeCapacity(lane="low"), 1)
+
+    with self.assertRaises(ValueError):
+      pool.FreeCapacity(lane="unknown")
+
+  def testLanesArePrioritized(self):
+    pool = self._StartPool("prioritized", 1, lanes=[("high", 10), ("low", 10)])
+    done_event = threading.Event()
+    res = []
+
+    pool.AddTask(done_event.wait, (), inline=False)
+    self.WaitUntil(lambda: pool.busy_threads == 1)
+
+    for i in range(3):
+      pool.AddTask(res.append, ("low%d" % i,), inline=False, lane="low")
+    for i in range(3):
+      pool.AddTask(res.append, ("high%d" % i,), inline=False, lane="high")
+    self.assertEqual(pool.pending_tasks, 6)
+
+    done_event.set()
+    pool.Join()
+    self.assertEqual(res, ["high0", "high1", "high2", "low0", "low1", "low2"])
+
+  def testLanesAreBounded(self):
+    pool = self._StartPool("bounded", 1, lanes=[("high", 1), ("low", 1)])
+    done_event = threading.Event()
+    self.addCleanup(done_event.set)
+
+    pool.AddTask(done_event.wait, (), inline=False)
+    self.WaitUntil(lambda: pool.busy_threads == 1)
+
+    pool.AddTask(lambda: None, (), inline=False, lane="low")
+    with self.assertRaises(threadpool.Full):
+      pool.AddTask(lambda: None, (), blocking=False, inline=False, lane="low")
+    # The other lane still has room.
+    pool.AddTask(lambda: None, (), blocking=False, inline=False, lane="high")
+    self.assertEqual(pool.FreeCapacity(), 0)
+
+  def testUnknownLaneRaises(self):
+    pool = self._StartPool("unknown_lane", 1, lanes=[("high", 1)])
+    with self.assertRaises(ValueError):
+      pool.AddTask(lambda: None, (), lane="low")
+
+    with self.assertRaises(ValueError):
+      self.test_pool.AddTask(lambda: None, (), lane="high")
+
 
 class DummyConverter(threadpool.BatchConverter):
 
@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 """Module with GRRWorker implementation."""
 
+import functools
 import logging
+import threading
 import time
-from typing import Sequence
+from typing import Optional, Sequence
 
+from grr_response_core import config
 from grr_response_core.lib import rdfvalue
 from grr_response_core.lib import registry
 from grr_response_core.lib.util import collection
@@ -14,6 +17,7 @@ from grr_response_proto import objects_pb2
 from grr_response_server import data_store
 from grr_response_server import flow_base
 from grr_response_server import handler_registry
+from grr_response_server import threadpool
 # pylint: disable=unused-import
 from grr_response_server import server_stubs
 # pylint: enable=unused-import
@@ -26,6 +30,11 @@ from grr_response_server.rdfvalues import mig_objects
 WELL_KNOWN_FLOW_REQUESTS = metrics.Counter(
     "well_known_flow_requests", fields=[("flow", str)]
 )
+MESSAGE_HANDLER_LATENCY = metrics.Event(
+    "message_handler_latency",
+    fields=[("handler", str)],
+    bins=[0.05 * 1.3**x for x in range(30)],
+)  # 50ms to ~20 minutes
 
 
 class Error(Exception):
@@ -36,39 +45,84 @@ class FlowHasNothingToProcessError(Error):
   """Raised when a flow is expected to have work to do, but doesn't."""
 
 
+def _ProcessMessageHandlerRequestsForHandler(
+    handler_name: str,
+    requests: Sequence[objects_pb2.MessageHandlerRequest],
+    leased_at: float,
+) -> None:
+  """Processes message handler requests belonging to a single handler."""
+  handler_cls = handler_registry.handler_name_map.get(handler_name)
+  if not handler_cls:
+    logging.error("Unknown message handler: %s", handler_name)
+    return
+
+  num_requests = len(requests)
+  WELL_KNOWN_FLOW_REQUESTS.Increment(fields=[handler_name], delta=num_requests)
+
+  try:
+    logging.debug(
+        "Running %d messages for handler %s", num_requests, handler_name
+    )
+    handler_cls().ProcessMessages(
+        [mig_objects.ToRDFMessageHandlerRequest(r) for r in requests]
+    )
+  except Exception as e:  # pylint: disable=broad-except
+    logging.exception(
+        "Exception while processing message handler %s: %s", handler_name, e
+    )
+
+  MESSAGE_HANDLER_LATENCY.RecordEvent(
+      time.time() - leased_at, fields=[handler_name]
+  )
+
+
 def ProcessMessageHandlerRequests(
     requests: Sequence[objects_pb2.MessageHandlerRequest],
+    pool: Optional[threadpool.ThreadPool] = None,
 ) -> None:
-  """Processes message handler requests."""
+  """Processes message handler requests.
+
+  Args:
+    requests: Leased message handler requests to process.
+    pool: If set, requests of different handlers are processed in parallel
+      using this (started) thread pool, so that a slow handler doesn't delay
+      the others. Otherwise all the requests are processed sequentially.
+  """
   logging.info(
       "Leased message handler request ids: %s",
       ",".join(str(r.request_id) for r in requests),
   )
+  leased_at = time.time()
   grouped_requests = collection.Group(requests, lambda r: r.handler_name)
-  for handler_name, requests_for_handler in grouped_requests.items():
-    requests_for_handler = [
-        mig_objects.ToRDFMessageHandlerRequest(r) for r in requests_for_handler
-    ]
-    handler_cls = handler_registry.handler_name_map.get(handler_name)
-    if not handler_cls:
-      logging.error("Unknown message handler: %s", handler_name)
-      continue
-
-    num_requests = len(requests_for_handler)
-    WELL_KNOWN_FLOW_REQUESTS.Increment(
-        fields=[handler_name], delta=num_requests
-    )
 
-    try:
-      logging.debug(
-          "Running %d messages for handler %s", num_requests, handler_name
+  if pool is None or len(grouped_requests) <= 1:
+    for handler_name, requests_for_handler in grouped_requests.items():
+      _ProcessMessageHandlerRequestsForHandler(
+          handler_name, requests_for_handler, leased_at
       )
-      handler_cls().ProcessMessages(requests_for_handler)
-    except Exception as e:  # pylint: disable=broad-except
-      logging.exception(
-          "Exception while processing message handler %s: %s", handler_name, e
+  else:
+
+    def Process(handler_name, requests_for_handler, done):
+      try:
+        _ProcessMessageHandlerRequestsForHandler(
+            handler_name, requests_for_handler, leased_at
+        )
+      finally:
+        done.set()
+
+    done_events = []
+    for handler_name, requests_for_handler in grouped_requests.items():
+      done = threading.Event()
+      done_events.append(done)
+      pool.AddTask(
+          target=Process,
+          args=(handler_name, requests_for_handler, done),
+          name=handler_name,
       )
 
+    for done in done_events:
+      done.wait()
+
   logging.info(
       "Deleting message handler request ids: %s",
       ",".join(str(r.request_id) for r in requests),
@@ -84,17 +138,26 @@ class GRRWorker(object):
   def __init__(self):
     """Constructor."""
     logging.info("Started GRR worker.")
+    self.message_handler_pool = threadpool.ThreadPool.Factory(
+        "message_handler_pool",
+        min_threads=1,
+        max_threads=config.CONFIG["Worker.message_handler_threads"],
+    )
 
   def Shutdown(self) -> None:
     data_store.REL_DB.UnregisterMessageHandler()
     data_store.REL_DB.UnregisterFlowProcessingHandler()
+    self.message_handler_pool.Stop()
 
   def Run(self) -> None:
     """Event loop."""
+    self.message_handler_pool.Start()
     data_store.REL_DB.RegisterMessageHandler(
-        ProcessMessageHandlerRequests,
+        functools.partial(
+            ProcessMessageHandlerRequests, pool=self.message_handler_pool
+        ),
         self.message_handler_lease_time,
-        limit=100,
+        limit=config.CONFIG["Worker.message_handler_lease_limit"],
     )
     data_store.REL_DB.RegisterFlowProcessingHandler(self.ProcessFlow)
 
@@ -119,10 +182,8 @@ class GRRWorker(object):
               rdf_flow.processing_deadline,
           ),
       )
-    flow_obj.FlushQueuedMessages()
-
     proto_flow = mig_flow_objects.ToProtoFlow(rdf_flow)
-    return data_store.REL_DB.ReleaseProcessedFlow(proto_flow)
+    return flow_obj.FlushQueuedMessages(flow_to_release=proto_flow)
 
   def ProcessFlow(
       self, flow_processing_request: flows_pb2.FlowProcessingRequest